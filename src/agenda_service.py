@@ -1,8 +1,22 @@
 from datetime import datetime, timedelta, time, date, timezone  # importa tipos de data e hora da biblioteca padrão
-import gspread                                         # importa gspread para integração com Google Sheets
-from google.oauth2.service_account import Credentials  # importa credenciais do service account do Google
+import json                                            # persistência do índice de linhas da Agenda
 import logging                                         # importa logging para registros de eventos
+import os
 import re
+import threading                                       # protege a reconstrução do bitmap de disponibilidade
+from bisect import bisect_left, insort                 # busca binária no bitmap e no índice de slots livres
+from collections.abc import Sequence                   # visão de linhas do snapshot colunar da Agenda
+from contextlib import contextmanager                  # modos compartilhado/exclusivo de _TravaLinhasAgenda
+from functools import lru_cache, wraps                 # memoização do parse das células de data/hora
+from itertools import zip_longest                      # transposição linhas -> colunas do snapshot
+from src.lazy_imports import lazy_import               # importação tardia de módulos pesados
+from src import call_budget                            # contagem de leituras/escritas por mensagem
+from src import metrics                                # latência do Sheets e hit/miss dos caches
+from src import tracing                                # spans por função pública (ver final do módulo)
+from src.constants import ScheduleConfig               # janelas de atendimento por dia da semana
+
+gspread = lazy_import("gspread")                       # gspread (e google-auth) só carregam no primeiro acesso à planilha
+np = lazy_import("numpy")                              # numpy só carrega na geração de slots em lote
 
 logger = logging.getLogger(__name__)                   # obtém logger do módulo
 
@@ -36,21 +50,24 @@ GOOGLE_SCOPES = [                                      # lista de escopos necess
 SPREADSHEET_ID = "1KATQvSyKPrCxAPdDDZk70IbfaKk2a1fxSx9Rk0R1h-Y"  # ID da planilha que armazena agenda e cadastros
 NOME_ABA_AGENDA = "Agenda"                             # nome da aba onde ficam os slots da agenda
 NOME_ABA_CADASTROS = "Cadastros"                       # nome da aba onde ficam os cadastros de pacientes
+NOME_ABA_HISTORICO = "Historico"                       # linhas antigas da Agenda (ver src/historico_agenda.py)
 
 # -------------------------------------------------------
 # Parâmetros da agenda / horários (fácil de ajustar)
 # -------------------------------------------------------
 
-HORA_INICIO_MANHA = time(hour=8, minute=0)             # início da janela da manhã (08:00)
-HORA_FIM_MANHA = time(hour=12, minute=0)               # fim da janela da manhã (12:00)
-HORA_INICIO_TARDE = time(hour=14, minute=0)            # início da janela da tarde (14:00)
-HORA_FIM_TARDE = time(hour=17, minute=0)               # fim da janela da tarde (17:00)
+# Valores vêm de constants.ScheduleConfig (janelas por dia da semana, pausas e exceções por data);
+# compilar_horarios() transforma a configuração em templates de slots no startup.
+HORA_INICIO_MANHA = time(*ScheduleConfig.HORA_INICIO_MANHA)  # início da janela da manhã padrão (08:00)
+HORA_FIM_MANHA = time(*ScheduleConfig.HORA_FIM_MANHA)        # fim da janela da manhã padrão (12:00)
+HORA_INICIO_TARDE = time(*ScheduleConfig.HORA_INICIO_TARDE)  # início da janela da tarde padrão (14:00)
+HORA_FIM_TARDE = time(*ScheduleConfig.HORA_FIM_TARDE)        # fim da janela da tarde padrão (17:00)
 
-DURACAO_CONSULTA_MIN = 50                              # duração da consulta em minutos
-INTERVALO_DESCANSO_MIN = 10                            # intervalo entre consultas em minutos
+DURACAO_CONSULTA_MIN = ScheduleConfig.DURACAO_CONSULTA_MIN     # duração da consulta em minutos
+INTERVALO_DESCANSO_MIN = ScheduleConfig.INTERVALO_DESCANSO_MIN  # intervalo entre consultas em minutos
 PASSO_SLOT_MIN = DURACAO_CONSULTA_MIN + INTERVALO_DESCANSO_MIN  # passo entre inícios de slots (consulta + intervalo)
 
-DIAS_UTEIS = {0, 1, 2, 3, 4}                           # dias úteis: 0=segunda, 1=terça, ..., 4=sexta
+DIAS_UTEIS = set(ScheduleConfig.DIAS_UTEIS)            # dias com atendimento: 0=segunda, 1=terça, ..., 4=sexta
 NUM_DIAS_GERAR_SLOTS = 30                              # número de dias a partir de hoje para gerar slots (valor padrão)
 
 # Lista de nomes de dias em português, índice 0=segunda, ..., 6=domingo
@@ -72,6 +89,84 @@ _gspread_client = None                                 # cache do cliente gsprea
 _worksheet_agenda = None                               # cache da worksheet (aba Agenda)
 _cache = {}
 
+_CHAVE_CACHE_CADASTROS = 'cadastros_nomes'             # chave do mapa telefone -> nome em _cache
+CADASTROS_CACHE_TTL = 300                              # segundos de validade do mapa de cadastros
+_CHAVE_CACHE_AGENDA = 'agenda_all_values'              # snapshot da aba Agenda em _cache
+_CHAVE_CACHE_DISPONIBILIDADE = 'agenda_disponibilidade'  # (snapshot de origem, DisponibilidadeAgenda) em _cache
+_lock_disponibilidade = threading.Lock()
+_CHAVE_CACHE_AGENDA_FUTURA = 'agenda_futura'           # (instante, data de referência, AgendaSnapshot de hoje em diante)
+
+# Índice data -> faixas de linhas da Agenda, para ler só as faixas A1 de um período (ver ler_agenda_por_datas)
+#   AGENDA_ROW_INDEX=true/false (padrão: true; false = sempre get_all_values)
+#   AGENDA_ROW_INDEX_FILE=logs/agenda_indice_linhas.json (vazio = não persiste entre reinícios)
+INDICE_LINHAS = os.getenv('AGENDA_ROW_INDEX', 'true').lower() == 'true'
+INDICE_LINHAS_ARQUIVO = os.getenv('AGENDA_ROW_INDEX_FILE', os.path.join('logs', 'agenda_indice_linhas.json'))
+CABECALHO_AGENDA = ["dia_semana", "data", "hora", "nome_paciente", "telefone", "status", "origem", "observacoes"]
+_indice_linhas = None                                  # IndiceLinhasAgenda carregado/construído sob demanda
+_lock_indice_linhas = threading.Lock()
+
+
+class _TravaLinhasAgenda:
+    """
+    Trava leitura/escrita sobre os índices de linha da Agenda: registros e
+    cancelamentos entram no modo compartilhado (não esperam uns pelos outros) e
+    só a remoção de linhas do arquivamento é exclusiva. Sem arquivamento em
+    andamento, o modo compartilhado nunca bloqueia.
+
+    Reentrante no modo compartilhado, e quem tem o modo exclusivo também entra no
+    compartilhado; sem preferência para o exclusivo (o arquivamento roda de madrugada).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._compartilhados = 0
+        self._dono_exclusivo = None
+
+    @contextmanager
+    def compartilhada(self):
+        eu = threading.get_ident()
+        with self._cond:
+            while self._dono_exclusivo not in (None, eu):
+                self._cond.wait()
+            self._compartilhados += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._compartilhados -= 1
+                if not self._compartilhados:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusiva(self):
+        with self._cond:
+            while self._dono_exclusivo is not None or self._compartilhados:
+                self._cond.wait()
+            self._dono_exclusivo = threading.get_ident()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._dono_exclusivo = None
+                self._cond.notify_all()
+
+
+_lock_linhas_agenda = _TravaLinhasAgenda()             # leitura -> escrita por nº de linha vs. remoção de linhas
+
+
+def _serializar_linhas_agenda(func):
+    """
+    Funções que leem a Agenda e depois escrevem numa linha pelo índice não podem
+    intercalar com a remoção de linhas do arquivamento (src/historico_agenda.py),
+    que desloca os índices. Vale dentro do processo; entre processos, o arquivamento
+    roda só no líder e de madrugada.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock_linhas_agenda.compartilhada():
+            return func(*args, **kwargs)
+    return wrapper
+
 
 # -------------------------------------------------------
 # Funções auxiliares de acesso ao Google Sheets
@@ -87,6 +182,7 @@ def obter_cliente_gspread():
     if _gspread_client is not None:                     # se já existe um cliente em cache
         return _gspread_client                          # retorna o cliente existente
 
+    from google.oauth2.service_account import Credentials  # importa credenciais do service account (import tardio)
     creds = Credentials.from_service_account_file(      # cria credenciais a partir do JSON do service account
         GOOGLE_SERVICE_ACCOUNT_FILE,                    # caminho do arquivo de credenciais
         scopes=GOOGLE_SCOPES                            # escopos necessários para acesso às planilhas
@@ -102,8 +198,10 @@ def _obter_planilha():
     Separado para reutilização interna.
     """
     cliente = obter_cliente_gspread()                   # obtém o cliente gspread autenticado
-    planilha = cliente.open_by_key(SPREADSHEET_ID)      # abre a planilha pelo ID
-    return planilha                                     # retorna a planilha aberta
+    call_budget.registrar('sheets_leituras', 'open_by_key')  # abrir a planilha busca os metadados (1 leitura)
+    with metrics.cronometro(metrics.SHEETS_LATENCIA, funcao='open_by_key'):
+        planilha = cliente.open_by_key(SPREADSHEET_ID)  # abre a planilha pelo ID
+    return call_budget.instrumentar_planilha(planilha)  # abas obtidas dela contam leituras/escritas
 
 
 def obter_worksheet_agenda():
@@ -180,16 +278,19 @@ def obter_worksheet_agenda():
 def obter_todos_agenda_cached(ttl_seconds: int = 5):
     """Retorna todas as linhas da aba Agenda usando cache em memória por alguns segundos.
     Isso ajuda a reduzir leituras repetidas e evitar estourar o quota do Google Sheets.
+    O retorno é um AgendaSnapshot (colunar), que também se comporta como a lista de linhas.
     """
-    key = 'agenda_all_values'
+    key = _CHAVE_CACHE_AGENDA
     import time
     now = time.time()
     entry = _cache.get(key)
     if entry and now - entry[0] < ttl_seconds:
+        metrics.CACHE_CONSULTAS.inc(cache='agenda', resultado='hit')
         return entry[1]
+    metrics.CACHE_CONSULTAS.inc(cache='agenda', resultado='miss')
     ws = obter_worksheet_agenda()
     try:
-        vals = ws.get_all_values()
+        vals = AgendaSnapshot.de_valores(ws.get_all_values())  # colunar: ver AgendaSnapshot
     except Exception:
         # se falhar e houver cache anterior, retorna fallback
         if entry:
@@ -198,6 +299,21 @@ def obter_todos_agenda_cached(ttl_seconds: int = 5):
     _cache[key] = (now, vals)
     return vals
 
+def obter_worksheet_historico():
+    """
+    Retorna a worksheet (aba) 'Historico', para onde o arquivamento move as linhas
+    antigas da Agenda. Se não existir, cria com o mesmo cabeçalho da Agenda.
+    """
+    planilha = _obter_planilha()
+    try:
+        ws = planilha.worksheet(NOME_ABA_HISTORICO)
+    except gspread.WorksheetNotFound:
+        ws = planilha.add_worksheet(title=NOME_ABA_HISTORICO, rows=1000, cols=8)
+        ws.update("A1:H1", [[
+            "dia_semana", "data", "hora", "nome_paciente", "telefone", "status", "origem", "observacoes"
+        ]])
+    return ws
+
 def obter_worksheet_cadastros():
     """
     Retorna a worksheet (aba) 'Cadastros'.
@@ -268,6 +384,67 @@ def buscar_perfil_por_telefone(telefone: str):
     return None                                          # indica que não achou nenhum registro
 
 
+def obter_mapa_nomes_cadastros():
+    """
+    Lê a aba 'Cadastros' uma única vez e retorna um dicionário {telefone: nome}.
+    Útil para operações em lote (ex.: reidratação de lembretes no startup),
+    evitando uma leitura completa da aba para cada telefone consultado.
+    """
+    ws = obter_worksheet_cadastros()                    # obtém a worksheet 'Cadastros'
+    valores = ws.get_all_values()                       # uma única leitura da aba inteira
+
+    mapa = {}                                           # telefone -> nome
+    for linha in valores[1:]:                           # ignora cabeçalho
+        if not linha:
+            continue
+        telefone = str(linha[0]).strip()                # coluna A = telefone
+        if not telefone or telefone in mapa:            # mantém o primeiro cadastro (mesma regra da busca)
+            continue
+        nome = (linha[1].strip() if len(linha) > 1 else "") or "Paciente sem nome"
+        mapa[telefone] = nome
+
+    import time
+    _cache[_CHAVE_CACHE_CADASTROS] = (time.time(), mapa)  # aproveita a leitura para aquecer o cache
+    return mapa
+
+
+def obter_mapa_nomes_cadastros_cached(ttl_seconds: int = CADASTROS_CACHE_TTL):
+    """Retorna o mapa {telefone: nome} do cache se tiver menos de `ttl_seconds`; senão relê a aba."""
+    import time
+    entry = _cache.get(_CHAVE_CACHE_CADASTROS)
+    if entry and time.time() - entry[0] < ttl_seconds:
+        metrics.CACHE_CONSULTAS.inc(cache='cadastros', resultado='hit')
+        return entry[1]
+    metrics.CACHE_CONSULTAS.inc(cache='cadastros', resultado='miss')
+    return obter_mapa_nomes_cadastros()
+
+
+def buscar_perfil_em_cache(telefone: str, ttl_seconds: int = CADASTROS_CACHE_TTL):
+    """
+    Versão com cache de buscar_perfil_por_telefone, para o caminho quente do webhook.
+
+    Usa o mapa telefone -> nome de obter_mapa_nomes_cadastros_cached(): se o cache
+    ainda não foi carregado (ex.: durante o warmup) ou expirou, a mesma leitura única
+    da aba o recarrega, então o mapa continua valendo depois do primeiro TTL. Um
+    telefone fora de um mapa recém-relido não tem cadastro; fora de um mapa ainda
+    válido (ex.: cadastrado por outro processo depois da leitura), cai na leitura
+    direta da planilha.
+    """
+    import time
+    telefone_str = str(telefone).strip()
+    entry = _cache.get(_CHAVE_CACHE_CADASTROS)
+    fresco = entry is not None and time.time() - entry[0] < ttl_seconds
+    nome = entry[1].get(telefone_str) if fresco else None
+    if nome:
+        metrics.CACHE_CONSULTAS.inc(cache='perfil', resultado='hit')
+        return {"telefone": telefone_str, "nome": nome}
+    metrics.CACHE_CONSULTAS.inc(cache='perfil', resultado='miss')
+    if not fresco:
+        nome = obter_mapa_nomes_cadastros_cached(ttl_seconds).get(telefone_str)
+        return {"telefone": telefone_str, "nome": nome} if nome else None
+    return buscar_perfil_por_telefone(telefone_str)
+
+
 def criar_cadastro_paciente(telefone: str, nome: str, origem: str = "whatsapp_cloud"):
     """
     Cria um novo cadastro na aba 'Cadastros' com telefone e nome informados.
@@ -296,6 +473,9 @@ def criar_cadastro_paciente(telefone: str, nome: str, origem: str = "whatsapp_cl
     logger.debug(                                       # loga a criação do novo cadastro
         f"Novo cadastro criado: telefone={telefone_str}, nome={nome_final}, origem={origem}"
     )
+    entry = _cache.get(_CHAVE_CACHE_CADASTROS)          # o novo paciente entra no mapa de nomes em cache
+    if entry:
+        entry[1].setdefault(telefone_str, nome_final)
     return {"telefone": telefone_str, "nome": nome_final}  # retorna o dicionário de perfil criado
 
 
@@ -303,44 +483,171 @@ def criar_cadastro_paciente(telefone: str, nome: str, origem: str = "whatsapp_cl
 # Funções auxiliares de geração de horários (slots)
 # -------------------------------------------------------
 
+_templates_slots = None                                 # weekday -> tupla de minutos do dia em que começam os slots
+_templates_excecoes = {}                               # date -> tupla de minutos (ScheduleConfig.EXCECOES_POR_DATA)
+
+
+def _minutos_das_janelas(janelas, duracao: int, passo: int) -> tuple:
+    """Minutos (a partir de 00:00) de início de cada slot que cabe inteiro em alguma das janelas."""
+    minutos = []
+    for (h_ini, m_ini), (h_fim, m_fim) in janelas:
+        atual = h_ini * 60 + m_ini
+        limite = h_fim * 60 + m_fim
+        while atual + duracao <= limite:               # consulta precisa terminar dentro da janela
+            minutos.append(atual)
+            atual += passo
+    return tuple(sorted(set(minutos)))
+
+
+def compilar_horarios(config=ScheduleConfig):
+    """
+    Compila a configuração de horários (janelas por dia da semana e exceções por
+    data) em templates de slots: tuplas com o minuto de início de cada slot.
+    Executada no import; chame de novo depois de alterar a configuração.
+    """
+    global _templates_slots, _templates_excecoes, DIAS_UTEIS
+    duracao = config.DURACAO_CONSULTA_MIN
+    passo = config.DURACAO_CONSULTA_MIN + config.INTERVALO_DESCANSO_MIN
+    _templates_slots = tuple(_minutos_das_janelas(config.JANELAS_POR_DIA.get(wd) or (), duracao, passo)
+                             for wd in range(7))
+    _templates_excecoes = {date.fromisoformat(dia): _minutos_das_janelas(janelas or (), duracao, passo)
+                           for dia, janelas in config.EXCECOES_POR_DATA.items()}
+    DIAS_UTEIS = {wd for wd in range(7) if _templates_slots[wd]}
+    return _templates_slots
+
+
+def _templates_por_dia_semana():
+    """Templates de slots por dia da semana (índice = weekday())."""
+    if _templates_slots is None:
+        compilar_horarios()
+    return _templates_slots
+
+
+def template_do_dia(data_dia: date) -> tuple:
+    """Minutos de início dos slots de uma data: exceção da data, se houver, senão o template do dia da semana."""
+    template = _templates_excecoes.get(data_dia)
+    if template is not None:
+        return template
+    return _templates_por_dia_semana()[data_dia.weekday()]
+
+
+def tem_atendimento(data_dia: date) -> bool:
+    """True se a data tem pelo menos um slot (dia da semana com janelas e sem exceção de fechamento)."""
+    return bool(template_do_dia(data_dia))
+
+
+def eh_horario_de_slot(dt: datetime) -> bool:
+    """True se `dt` é o início de um slot previsto na configuração de horários."""
+    return dt.second == 0 and dt.microsecond == 0 and (dt.hour * 60 + dt.minute) in template_do_dia(dt.date())
+
+
 def gerar_slots_para_dia(data_dia: date):
     """
     Gera todos os horários (slots) possíveis para um dia específico,
     respeitando:
-      - dias úteis (DIAS_UTEIS)
-      - janelas de horário (manhã / tarde)
+      - dias com atendimento e exceções por data (ScheduleConfig)
+      - janelas de horário do dia (ex.: manhã / tarde)
       - duração da consulta + intervalo
     Retorna uma lista de datetime (início de cada slot).
     """
-    if data_dia.weekday() not in DIAS_UTEIS:            # se não for dia útil
-        return []                                       # retorna lista vazia
+    template = template_do_dia(data_dia)                # vazio se não houver atendimento
+    base = datetime(data_dia.year, data_dia.month, data_dia.day)
+    return [base + timedelta(minutes=m) for m in template]
+
+
+class GradeSlots:
+    """
+    Todos os slots de um intervalo de datas em arrays numpy (um elemento por slot,
+    em ordem cronológica): `ordinais` (date.toordinal() do dia) e `minutos`
+    (minuto do dia em que o slot começa). A formatação para a planilha é feita
+    por tabela: cada data distinta é formatada uma vez e replicada por índice.
+    """
+
+    def __init__(self, data_inicio: date, dias, indice_dia, minutos):
+        self.data_inicio = data_inicio
+        self.dias = dias                               # ordinais de todos os dias do intervalo
+        self.indice_dia = indice_dia                   # para cada slot, posição do dia em `dias`
+        self.minutos = minutos
+
+    def __len__(self):
+        return len(self.minutos)
+
+    @property
+    def ordinais(self):
+        return self.dias[self.indice_dia]
+
+    def datas_str(self):
+        """'dd/mm/aaaa' de cada slot."""
+        iso = np.datetime_as_string(_ordinais_para_datetime64(self.dias), unit='D')  # 'aaaa-mm-dd'
+        c = iso.astype('U10').view('U1').reshape(-1, 10)
+        barra = np.full((len(iso), 1), '/')
+        tabela = np.concatenate([c[:, 8:10], barra, c[:, 5:7], barra, c[:, 0:4]], axis=1)
+        tabela = tabela.view('U10').ravel()
+        return tabela[self.indice_dia]
+
+    def horas_str(self):
+        """'HH:MM' de cada slot."""
+        return _tabela_horas()[self.minutos]
+
+    def dias_semana(self):
+        """Nome do dia da semana (NOMES_DIAS_PT) de cada slot."""
+        return np.array(NOMES_DIAS_PT)[(self.ordinais - 1) % 7]  # date.fromordinal(1) é uma segunda-feira
+
+    def datetimes(self) -> list:
+        """Lista de datetime (mesmo formato de gerar_slots_para_dia)."""
+        base = datetime(self.data_inicio.year, self.data_inicio.month, self.data_inicio.day)
+        deslocamentos = (self.ordinais - self.data_inicio.toordinal()) * 1440 + self.minutos
+        return [base + timedelta(minutes=int(m)) for m in deslocamentos]
 
-    slots = []                                          # lista de slots
-    passo = timedelta(minutes=PASSO_SLOT_MIN)           # passo entre inícios dos slots
+    def linhas_agenda(self) -> list:
+        """Linhas no formato da aba Agenda: dia_semana, data, hora, "", "", "DISPONIVEL", "", ""."""
+        n = len(self)
+        vazio = np.full(n, '')
+        colunas = [self.dias_semana(), self.datas_str(), self.horas_str(), vazio, vazio,
+                   np.full(n, 'DISPONIVEL'), vazio, vazio]
+        return np.stack(colunas, axis=1).tolist() if n else []
 
-    inicio_manha = datetime.combine(data_dia, HORA_INICIO_MANHA)  # início da manhã
-    fim_manha = datetime.combine(data_dia, HORA_FIM_MANHA)        # fim da manhã
 
-    atual = inicio_manha                               # horário atual da manhã
-    while True:                                        # laço para gerar slots da manhã
-        termino = atual + timedelta(minutes=DURACAO_CONSULTA_MIN)  # término da consulta
-        if termino > fim_manha:                        # se ultrapassar o fim da manhã
-            break                                      # interrompe laço
-        slots.append(atual)                            # adiciona slot
-        atual = atual + passo                          # avança para o próximo início
+def _ordinais_para_datetime64(ordinais):
+    return (ordinais - date(1970, 1, 1).toordinal()).astype('datetime64[D]')
 
-    inicio_tarde = datetime.combine(data_dia, HORA_INICIO_TARDE)  # início da tarde
-    fim_tarde = datetime.combine(data_dia, HORA_FIM_TARDE)        # fim da tarde
 
-    atual = inicio_tarde                               # horário atual da tarde
-    while True:                                        # laço para gerar slots da tarde
-        termino = atual + timedelta(minutes=DURACAO_CONSULTA_MIN)  # término da consulta
-        if termino > fim_tarde:                        # se ultrapassar o fim da tarde
-            break                                      # interrompe laço
-        slots.append(atual)                            # adiciona slot
-        atual = atual + passo                          # avança para o próximo
+_horas_str = None                                      # 'HH:MM' de cada minuto do dia (1440 itens)
 
-    return slots                                       # retorna lista de slots gerados
+
+def _tabela_horas():
+    global _horas_str
+    if _horas_str is None:
+        _horas_str = np.array([f'{m // 60:02d}:{m % 60:02d}' for m in range(1440)])
+    return _horas_str
+
+
+def gerar_grade_slots(data_inicio: date, num_dias: int) -> GradeSlots:
+    """
+    Gera de uma vez todos os slots de `num_dias` dias a partir de `data_inicio`
+    (mesmas regras de gerar_slots_para_dia), sem laço por dia nem por slot.
+    """
+    num_dias = max(num_dias, 0)
+    templates = list(_templates_por_dia_semana())      # linhas 0-6: dias da semana; 7+: exceções do intervalo
+    dias = np.arange(data_inicio.toordinal(), data_inicio.toordinal() + num_dias, dtype=np.int64)
+    linha_template = (dias - 1) % 7                    # date.fromordinal(1) é uma segunda-feira
+    for dia, template in _templates_excecoes.items():
+        posicao = dia.toordinal() - data_inicio.toordinal()
+        if 0 <= posicao < num_dias:
+            linha_template[posicao] = len(templates)
+            templates.append(template)
+
+    largura = max((len(t) for t in templates), default=0)
+    matriz = np.zeros((len(templates), largura), dtype=np.int16)  # minutos de cada template, completados com zeros
+    mascara = np.zeros((len(templates), largura), dtype=bool)     # quais posições de cada linha são slots de verdade
+    for linha, template in enumerate(templates):
+        matriz[linha, :len(template)] = template
+        mascara[linha, :len(template)] = True
+
+    validos = mascara[linha_template]                  # (num_dias, largura)
+    minutos = matriz[linha_template][validos]          # achata em ordem: dia a dia, horário crescente
+    indice_dia = np.nonzero(validos)[0]
+    return GradeSlots(data_inicio, dias, indice_dia, minutos)
 
 
 def obter_nome_dia_semana(data_dia: date) -> str:
@@ -475,13 +782,12 @@ def gerar_slots_semana_atual_a_partir_de_agora():
 
 def obter_primeiro_slot_disponivel():
     """
-    Retorna o primeiro horário teórico disponível da semana atual a partir de agora,
-    baseado apenas na geração teórica de slots (não cruza com planilha).
+    Retorna o primeiro horário DISPONIVEL na Agenda da semana atual a partir de agora
+    (índice de slots livres, ver primeiro_slot_livre), ou None.
     """
-    slots = gerar_slots_semana_atual_a_partir_de_agora()  # gera slots
-    if not slots:                                        # se lista vazia
-        return None                                      # retorna None
-    return slots[0]                                      # retorna primeiro slot
+    _, fim_semana = obter_intervalo_semana_atual_a_partir_de_hoje()  # último dia da semana atual
+    agora = agora_brasil()
+    return primeiro_slot_livre(agora, dias=(fim_semana - agora.date()).days + 1)
 
 
 # -------------------------------------------------------
@@ -506,6 +812,7 @@ def carregar_mapa_slots_existentes(ws):
     return existentes                                   # retorna o conjunto de slots existentes
 
 
+@_serializar_linhas_agenda
 def inicializar_slots_proximos_dias(num_dias: int = NUM_DIAS_GERAR_SLOTS):
     """
     Gera linhas na aba Agenda para todos os slots possíveis
@@ -525,37 +832,9 @@ def inicializar_slots_proximos_dias(num_dias: int = NUM_DIAS_GERAR_SLOTS):
 
     hoje = date.today()                                 # obtém a data de hoje
 
-    novas_linhas = []                                   # lista para acumular linhas a serem inseridas
-
-    for i in range(num_dias):                           # itera de 0 até num_dias-1
-        dia = hoje + timedelta(days=i)                  # calcula a data correspondente
-
-        if dia.weekday() not in DIAS_UTEIS:             # se não for dia útil
-            continue                                    # pula para o próximo dia
-
-        slots = gerar_slots_para_dia(dia)               # gera slots teóricos para esse dia
-
-        for slot in slots:                              # percorre cada datetime de slot
-            data_str = slot.strftime("%d/%m/%Y")        # formata data como dd/mm/aaaa
-            hora_str = slot.strftime("%H:%M")           # formata hora como HH:MM
-
-            if (data_str, hora_str) in existentes:      # se par já existe na planilha
-                continue                                # não cria novamente
-
-            weekday = dia.weekday()                     # índice do dia da semana
-            nome_dia = NOMES_DIAS_PT[weekday]           # nome do dia em português
-
-            nova_linha = [                              # monta linha para esse slot
-                nome_dia,
-                data_str,
-                hora_str,
-                "",
-                "",
-                "DISPONIVEL",
-                "",
-                ""
-            ]
-            novas_linhas.append(nova_linha)             # adiciona à lista de novas linhas
+    # Todos os slots do período de uma vez (dia_semana, data, hora, ..., "DISPONIVEL", ...)
+    linhas = gerar_grade_slots(hoje, num_dias).linhas_agenda()
+    novas_linhas = [linha for linha in linhas if (linha[1], linha[2]) not in existentes]  # não duplica (data, hora)
 
     if novas_linhas:                                    # se há linhas novas para inserir
         primeira_linha_vazia = len(ws.get_all_values()) + 1  # calcula primeira linha livre
@@ -566,11 +845,13 @@ def inicializar_slots_proximos_dias(num_dias: int = NUM_DIAS_GERAR_SLOTS):
             intervalo,
             novas_linhas
         )
+        invalidar_cache_agenda()
         logger.debug(f"Foram criados {len(novas_linhas)} novos slots na Agenda.")  # log de debug
     else:
         logger.debug("Nenhum novo slot precisou ser criado (todos já existiam).")  # log indicando ausência de novos slots
 
 
+@_serializar_linhas_agenda
 def adicionar_slots_dia_futuro():
     """
     Adiciona slots para o dia que está exatamente NUM_DIAS_GERAR_SLOTS dias no futuro.
@@ -601,17 +882,16 @@ def adicionar_slots_dia_futuro():
     hoje = date.today()                                 # obtém a data de hoje
     dia_futuro = hoje + timedelta(days=NUM_DIAS_GERAR_SLOTS)  # calcula dia futuro
 
-    # Se não for dia útil, não há nada a fazer
-    if dia_futuro.weekday() not in DIAS_UTEIS:
-        logger.info('[daily_slots] Dia %s não é dia útil, pulando', dia_futuro.strftime('%d/%m/%Y'))
+    # Se não houver atendimento no dia (fim de semana, exceção de fechamento), não há nada a fazer
+    if not tem_atendimento(dia_futuro):
+        logger.info('[daily_slots] Dia %s não tem atendimento, pulando', dia_futuro.strftime('%d/%m/%Y'))
         return
 
-    slots = gerar_slots_para_dia(dia_futuro)            # gera slots teóricos para esse dia
+    data_str = dia_futuro.strftime('%d/%m/%Y')
     novas_linhas = []                                   # lista para acumular linhas novas
 
-    for slot in slots:                                  # percorre cada datetime de slot
-        data_str = slot.strftime("%d/%m/%Y")            # formata data como dd/mm/aaaa
-        hora_str = slot.strftime("%H:%M")               # formata hora como HH:MM
+    for nova_linha in gerar_grade_slots(dia_futuro, 1).linhas_agenda():  # slots teóricos desse dia
+        hora_str = nova_linha[2]
 
         # Verifica se slot já existe
         if (data_str, hora_str) in slots_existentes_com_status:
@@ -623,19 +903,6 @@ def adicionar_slots_dia_futuro():
             # Se já existir com qualquer outro status, não criar duplicado
             continue
 
-        weekday = dia_futuro.weekday()                  # índice do dia da semana
-        nome_dia = NOMES_DIAS_PT[weekday]               # nome do dia em português
-
-        nova_linha = [                                  # monta linha para esse slot
-            nome_dia,
-            data_str,
-            hora_str,
-            "",
-            "",
-            "DISPONIVEL",
-            "",
-            ""
-        ]
         novas_linhas.append(nova_linha)                 # adiciona à lista de novas linhas
 
     if novas_linhas:                                    # se há linhas novas para inserir
@@ -647,64 +914,659 @@ def adicionar_slots_dia_futuro():
             intervalo,
             novas_linhas
         )
+        invalidar_cache_agenda()
         logger.info('[daily_slots] Criados %d novos slots para %s', len(novas_linhas), data_str)
     else:
         logger.info('[daily_slots] Nenhum novo slot criado para %s (já existiam ou eram folgas)',
                    dia_futuro.strftime('%d/%m/%Y'))
 
 
-def obter_slots_disponiveis_para_data(data_dia: date):
+# -------------------------------------------------------
+# Disponibilidade em bitmap (um bit por slot do template de cada data)
+# -------------------------------------------------------
+
+class IndiceSlotsLivres:
     """
-    Lê a aba Agenda e retorna uma lista de datetime para os slots que:
-      - têm 'data' == data_dia
-      - têm status == 'DISPONIVEL'
-      - ainda não passaram em relação ao horário atual
+    Datetimes de todos os slots DISPONIVEL em ordem crescente, mantido junto com o
+    bitmap: agendamento/cancelamento removem/inserem um item e as consultas são
+    buscas binárias (primeiro livre, próximos k, intervalo) sem varrer a agenda.
     """
-    ws = obter_worksheet_agenda()                       # obtém worksheet da Agenda
+
+    def __init__(self, slots=()):
+        self._slots = sorted(slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def adicionar(self, dt: datetime):
+        i = bisect_left(self._slots, dt)
+        if i == len(self._slots) or self._slots[i] != dt:
+            insort(self._slots, dt)
+
+    def remover(self, dt: datetime):
+        i = bisect_left(self._slots, dt)
+        if i < len(self._slots) and self._slots[i] == dt:
+            del self._slots[i]
+
+    def primeiro_livre(self, apos: datetime, ate: datetime = None):
+        """Primeiro slot livre >= `apos` (e < `ate`, se informado), ou None."""
+        i = bisect_left(self._slots, apos)
+        if i == len(self._slots) or (ate is not None and self._slots[i] >= ate):
+            return None
+        return self._slots[i]
+
+    def proximos(self, apos: datetime, k: int) -> list:
+        """Até `k` slots livres a partir de `apos`."""
+        i = bisect_left(self._slots, apos)
+        return self._slots[i:i + k]
+
+    def no_intervalo(self, inicio: datetime, fim: datetime):
+        """Slots livres em [inicio, fim), em ordem."""
+        i = bisect_left(self._slots, inicio)
+        while i < len(self._slots) and self._slots[i] < fim:
+            yield self._slots[i]
+            i += 1
+
+
+class DisponibilidadeAgenda:
+    """
+    Slots livres da Agenda como um inteiro por data: o bit i indica se o i-ésimo
+    horário do layout da data (template_do_dia, mais horários avulsos que existam
+    na planilha) está DISPONIVEL. Montado do snapshot da aba e atualizado a cada
+    agendamento/cancelamento, responde "quais dias têm vaga" e "quais horários
+    estão livres" sem percorrer as linhas.
+    """
+
+    def __init__(self):
+        self.bits = {}                                 # date -> int
+        self.layouts = {}                              # date -> tupla de minutos, só se diferente do template
+        self.indice = IndiceSlotsLivres()              # mesmos slots livres, em ordem cronológica
+
+    def layout(self, dia: date) -> tuple:
+        return self.layouts.get(dia) or template_do_dia(dia)
+
+    @classmethod
+    def de_linhas(cls, valores: list):
+        """Monta o bitmap a partir das linhas da aba Agenda (get_all_values, com cabeçalho)."""
+        livres = {}                                    # date -> set de minutos DISPONIVEL
+        if isinstance(valores, AgendaSnapshot):        # colunar: sem remontar linhas
+            linhas = valores.filtrar(status='DISPONIVEL')
+            ordinais, minutos = valores.ordinais[linhas].tolist(), valores.minutos[linhas].tolist()
+            for ordinal, minuto in zip(ordinais, minutos):
+                if ordinal >= 0 and minuto >= 0:
+                    livres.setdefault(date.fromordinal(ordinal), set()).add(minuto)
+            valores = ()
+        for linha in valores[1:]:
+            if len(linha) < 6 or linha[5].strip().upper() != 'DISPONIVEL':
+                continue
+            dia = _converter_data(linha[1].strip())    # memoizado: cada data é convertida uma vez
+            minuto = _converter_hora(linha[2])
+            if dia is not None and minuto is not None:
+                livres.setdefault(dia, set()).add(minuto)
+
+        disp = cls()
+        slots = []
+        for dia, minutos in livres.items():
+            disp._definir(dia, minutos)
+            base = datetime(dia.year, dia.month, dia.day)
+            slots.extend(base + timedelta(minutes=m) for m in minutos)
+        disp.indice = IndiceSlotsLivres(slots)
+        return disp
+
+    def _definir(self, dia: date, minutos_livres: set):
+        template = template_do_dia(dia)
+        if minutos_livres.issubset(template):
+            layout = template
+            self.layouts.pop(dia, None)
+        else:                                          # horário avulso na planilha: layout próprio para a data
+            layout = tuple(sorted(set(template) | minutos_livres))
+            self.layouts[dia] = layout
+        bits = 0
+        for i, minuto in enumerate(layout):
+            if minuto in minutos_livres:
+                bits |= 1 << i
+        if bits:
+            self.bits[dia] = bits
+        else:
+            self.bits.pop(dia, None)
+
+    def marcar(self, dt: datetime, livre: bool):
+        """Atualiza um slot depois de um agendamento (livre=False) ou cancelamento (livre=True)."""
+        dia = dt.date()
+        minuto = dt.hour * 60 + dt.minute
+        slot = datetime(dia.year, dia.month, dia.day, dt.hour, dt.minute)
+        if livre:
+            self.indice.adicionar(slot)
+        else:
+            self.indice.remover(slot)
+        layout = self.layout(dia)
+        i = bisect_left(layout, minuto)
+        if i < len(layout) and layout[i] == minuto:
+            if livre:
+                self.bits[dia] = self.bits.get(dia, 0) | (1 << i)
+            elif dia in self.bits:
+                self.bits[dia] &= ~(1 << i)
+                if not self.bits[dia]:
+                    del self.bits[dia]
+        elif livre:                                    # horário fora do layout: refaz a data
+            self._definir(dia, set(self.minutos_livres(dia)) | {minuto})
+
+    def minutos_livres(self, dia: date, a_partir: int = 0) -> list:
+        """Minutos do dia dos slots livres da data, a partir do minuto `a_partir`."""
+        bits = self.bits.get(dia, 0)
+        if not bits:
+            return []
+        layout = self.layout(dia)
+        return [m for i, m in enumerate(layout) if bits >> i & 1 and m >= a_partir]
+
+    def tem_vaga(self, dia: date, a_partir: int = 0) -> bool:
+        bits = self.bits.get(dia, 0)
+        if bits and a_partir > 0:
+            bits >>= bisect_left(self.layout(dia), a_partir)  # descarta os slots antes de `a_partir`
+        return bits != 0
+
+
+@lru_cache(maxsize=8192)
+def _converter_data(data_str: str):
+    try:
+        dia, mes, ano = data_str.split('/')
+        return date(int(ano), int(mes), int(dia))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=2048)
+def _converter_hora(hora_str: str):
+    try:
+        hora, minuto = hora_str.strip().split(':')
+        hora, minuto = int(hora), int(minuto)
+    except ValueError:
+        return None
+    if not (0 <= hora < 24 and 0 <= minuto < 60):
+        return None
+    return hora * 60 + minuto
+
+
+@lru_cache(maxsize=65536)
+def converter_data_hora(data_str: str, hora_str: str):
+    """
+    datetime de uma linha da Agenda a partir das células de data ('DD/MM/AAAA') e
+    hora ('HH:MM'), ou None se alguma não for válida. Substitui o strptime por
+    linha nas varreduras: cada par distinto de células é convertido uma única vez
+    por processo (os datetimes são imutáveis, então podem ser compartilhados).
+    """
+    dia = _converter_data(data_str)
+    minuto = _converter_hora(hora_str)
+    if dia is None or minuto is None:
+        return None
+    return datetime(dia.year, dia.month, dia.day, minuto // 60, minuto % 60)
+
+
+STATUS_AGENDA = ('', 'DISPONIVEL', 'AGENDADO', 'CANCELADO', 'FOLGA', 'LIVRE')  # código de status = posição
+STATUS_OUTRO = len(STATUS_AGENDA)                      # código de qualquer status fora da lista
+
+
+def _ordinal_da_celula(data_str: str) -> int:
+    dia = _converter_data(data_str.strip())
+    return -1 if dia is None else dia.toordinal()
+
+
+def _minuto_da_celula(hora_str: str) -> int:
+    minuto = _converter_hora(hora_str)
+    return -1 if minuto is None else minuto
+
+
+def _codigo_status(status_str: str) -> int:
+    status = status_str.strip().upper()
+    return STATUS_AGENDA.index(status) if status in STATUS_AGENDA else STATUS_OUTRO
+
+
+class AgendaSnapshot(Sequence):
+    """
+    Snapshot colunar da aba Agenda (o resultado de get_all_values guardado em _cache).
+
+    Cada coluna vira um array int32 de códigos numa tabela de strings internadas
+    (datas, horas, status, telefones e nomes se repetem muito ao longo dos anos),
+    mais três colunas tipadas derivadas das tabelas: `ordinais` (date.toordinal,
+    -1 se inválida), `minutos` (minuto do dia, -1 se inválido) e `status` (código
+    em STATUS_AGENDA). As varreduras usam os arrays; para compatibilidade o objeto
+    continua se comportando como a lista de linhas: snapshot[0] é o cabeçalho,
+    snapshot[i] remonta a linha i como lista de strings e snapshot[1:] é uma
+    visão (sem cópia) das linhas de dados.
+    """
+
+    _BLOCO = 4096                                      # linhas remontadas por vez ao iterar
+
+    def __init__(self, cabecalho, codigos, tabelas, larguras=None, faixa=None, numeros=None):
+        self.cabecalho = cabecalho
+        self.codigos = codigos                         # por coluna: array int32 (uma posição por linha de dados)
+        self.tabelas = tabelas                         # por coluna: lista de strings distintas
+        self.larguras = larguras                       # array com o nº de células por linha, ou None se todas iguais
+        self.total = len(codigos[0]) if codigos else 0
+        self.numeros = numeros                         # nº da linha na planilha de cada linha de dados (None = r + 2)
+        if faixa is None:                              # 0 = cabeçalho; aba totalmente vazia = sequência vazia
+            faixa = range(self.total + 1 if cabecalho or codigos else 0)
+        self._faixa = faixa
+        self.ordinais = self._derivar(1, _ordinal_da_celula, np.int32)
+        self.minutos = self._derivar(2, _minuto_da_celula, np.int16)
+        self.status = self._derivar(5, _codigo_status, np.int8)
+
+    @classmethod
+    def de_valores(cls, valores: list) -> 'AgendaSnapshot':
+        """Monta o snapshot a partir do get_all_values (primeira linha = cabeçalho)."""
+        cabecalho = list(valores[0]) if valores else []
+        linhas = valores[1:]
+        codigos, tabelas = [], []
+        for coluna in zip_longest(*linhas, fillvalue=''):
+            indice = dict.fromkeys(coluna)             # strings distintas, na ordem de aparição
+            for codigo, valor in enumerate(indice):
+                indice[valor] = codigo
+            codigos.append(np.fromiter(map(indice.__getitem__, coluna), dtype=np.int32, count=len(linhas)))
+            tabelas.append(list(indice))
+        larguras = np.fromiter(map(len, linhas), dtype=np.int16, count=len(linhas))
+        if not (larguras != len(codigos)).any():
+            larguras = None                            # caso comum: get_all_values devolve linhas do mesmo tamanho
+        return cls(cabecalho, codigos, tabelas, larguras)
+
+    def _derivar(self, coluna, converter, dtype):
+        """Coluna tipada: converte cada string distinta uma vez e espalha pelos códigos."""
+        if coluna >= len(self.codigos):
+            return np.full(self.total, -1, dtype=dtype)
+        tabela = np.array([converter(v) for v in self.tabelas[coluna]], dtype=dtype)
+        return tabela[self.codigos[coluna]] if len(tabela) else np.zeros(0, dtype=dtype)
+
+    # --- visão de linhas (compatibilidade com a lista do get_all_values) ---
+
+    def __len__(self):
+        return len(self._faixa)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            visao = object.__new__(AgendaSnapshot)
+            visao.__dict__.update(self.__dict__)
+            visao._faixa = self._faixa[i]
+            return visao
+        posicao = self._faixa[i]
+        return list(self.cabecalho) if posicao == 0 else self.linha(posicao - 1)
+
+    def __iter__(self):
+        faixa = self._faixa
+        if faixa.step != 1:
+            yield from (self[i] for i in range(len(faixa)))
+            return
+        inicio, fim = faixa.start, faixa.stop
+        if inicio == 0 and fim > 0:
+            yield list(self.cabecalho)
+            inicio = 1
+        for bloco in range(inicio - 1, fim - 1, self._BLOCO):
+            ate = min(bloco + self._BLOCO, fim - 1)
+            colunas = [[tabela[c] for c in codigos[bloco:ate].tolist()]
+                       for codigos, tabela in zip(self.codigos, self.tabelas)]
+            for j, linha in enumerate(zip(*colunas)):
+                yield self._cortar(list(linha), bloco + j)
+
+    def _cortar(self, linha, r):
+        return linha if self.larguras is None else linha[:int(self.larguras[r])]
+
+    def linha(self, r: int) -> list:
+        """Linha de dados `r` (0 = primeira linha após o cabeçalho) como lista de strings."""
+        return self._cortar([tabela[codigos[r]] for codigos, tabela in zip(self.codigos, self.tabelas)], r)
+
+    def numero_linha(self, r: int) -> int:
+        """Número (1-based) na aba Agenda da linha de dados `r`."""
+        return r + 2 if self.numeros is None else int(self.numeros[r])
+
+    def recorte(self, linhas) -> 'AgendaSnapshot':
+        """Snapshot só com as linhas de dados `linhas` (índices), guardando os números de linha da planilha."""
+        linhas = np.asarray(linhas, dtype=np.int64)
+        numeros = linhas + 2 if self.numeros is None else self.numeros[linhas]
+        return AgendaSnapshot(self.cabecalho, [codigos[linhas] for codigos in self.codigos], self.tabelas,
+                              None if self.larguras is None else self.larguras[linhas], numeros=numeros)
+
+    def registro(self, r: int) -> dict:
+        """Linha de dados `r` como dicionário cabeçalho -> valor (como uma linha do get_all_records)."""
+        return dict(zip(self.cabecalho, self.linha(r)))
+
+    # --- consultas sobre as colunas ---
+
+    def codigos_de(self, coluna: int, valor: str) -> list:
+        """Códigos da coluna cujo texto (sem espaços nas pontas) é `valor`."""
+        if coluna >= len(self.tabelas):
+            return []
+        return [c for c, texto in enumerate(self.tabelas[coluna]) if texto.strip() == valor]
+
+    def filtrar(self, status: str = None, telefone: str = None, data: date = None, a_partir: datetime = None,
+                antes_de: date = None, desde: date = None):
+        """
+        Índices (linhas de dados, em ordem) que atendem a todos os filtros informados.
+        `a_partir` mantém só as linhas com data/hora válidas >= a_partir; `antes_de` e
+        `desde`, só as linhas com data válida anterior a / a partir de essa data.
+        """
+        mascara = np.ones(self.total, dtype=bool)
+        if status is not None:
+            mascara &= self.status == _codigo_status(status)
+        if telefone is not None:
+            codigos = self.codigos_de(4, telefone)
+            mascara &= np.isin(self.codigos[4], codigos) if codigos else False
+        if data is not None:
+            mascara &= self.ordinais == data.toordinal()
+        if antes_de is not None:
+            mascara &= (self.ordinais >= 0) & (self.ordinais < antes_de.toordinal())
+        if desde is not None:
+            mascara &= self.ordinais >= desde.toordinal()
+        if a_partir is not None:
+            ordinal, minuto = a_partir.toordinal(), a_partir.hour * 60 + a_partir.minute
+            if a_partir.second or a_partir.microsecond:
+                minuto += 1                            # 10:00 já passou às 10:00:30
+            mascara &= (self.minutos >= 0) & ((self.ordinais > ordinal) |
+                                              ((self.ordinais == ordinal) & (self.minutos >= minuto)))
+        return np.flatnonzero(mascara)
+
+    def datetime_da_linha(self, r: int):
+        """datetime da linha de dados `r`, ou None se data/hora forem inválidas."""
+        ordinal, minuto = int(self.ordinais[r]), int(self.minutos[r])
+        if ordinal < 0 or minuto < 0:
+            return None
+        dia = date.fromordinal(ordinal)
+        return datetime(dia.year, dia.month, dia.day, minuto // 60, minuto % 60)
+
+
+class IndiceLinhasAgenda:
+    """
+    Índice data -> faixas de linhas (1-based, inclusivas) da aba Agenda.
+
+    Os slots são gerados em ordem de data (inicializar_slots_proximos_dias,
+    adicionar_slots_dia_futuro), então cada data ocupa uma faixa contígua; linhas
+    acrescentadas fora de ordem (agendamento avulso) viram faixas extras. `total`
+    é a última linha conhecida: o que aparecer depois dela é lido como "cauda" na
+    próxima leitura parcial e incorporado ao índice, inclusive o que outro processo
+    escreveu.
+    """
+
+    def __init__(self, faixas: dict = None, total: int = 1):
+        self.faixas = faixas if faixas is not None else {}   # ordinal -> [[inicio, fim], ...]
+        self.total = total
+
+    @classmethod
+    def de_snapshot(cls, snapshot: 'AgendaSnapshot') -> 'IndiceLinhasAgenda':
+        indice = cls()
+        indice.incorporar(snapshot.ordinais.tolist(), 2)
+        return indice
+
+    def incorporar(self, ordinais: list, primeira_linha: int):
+        """Registra linhas consecutivas a partir de `primeira_linha` (ordinal -1 = sem data válida)."""
+        for numero, ordinal in enumerate(ordinais, start=primeira_linha):
+            if ordinal < 0:
+                continue
+            faixas = self.faixas.setdefault(ordinal, [])
+            if faixas and faixas[-1][1] == numero - 1:
+                faixas[-1][1] = numero
+            else:
+                faixas.append([numero, numero])
+        self.total = max(self.total, primeira_linha + len(ordinais) - 1)
+
+    def blocos(self, inicio: date, fim: date = None) -> list:
+        """Faixas [inicio, fim] das linhas com datas no período, em ordem e unidas quando adjacentes."""
+        o_ini, o_fim = inicio.toordinal(), fim.toordinal() if fim else None
+        faixas = sorted(faixa for ordinal, lista in self.faixas.items()
+                        if ordinal >= o_ini and (o_fim is None or ordinal <= o_fim) for faixa in lista)
+        blocos = []
+        for a, b in faixas:
+            if blocos and a <= blocos[-1][1] + 1:
+                blocos[-1][1] = max(blocos[-1][1], b)
+            else:
+                blocos.append([a, b])
+        return blocos
+
+    def para_json(self) -> dict:
+        return {"planilha": SPREADSHEET_ID, "total": self.total,
+                "faixas": {str(ordinal): faixas for ordinal, faixas in self.faixas.items()}}
+
+    @classmethod
+    def de_json(cls, dados: dict):
+        if dados.get("planilha") != SPREADSHEET_ID:
+            return None
+        return cls({int(ordinal): faixas for ordinal, faixas in dados["faixas"].items()}, int(dados["total"]))
+
+
+def _carregar_indice_linhas():
+    if not INDICE_LINHAS_ARQUIVO or not os.path.exists(INDICE_LINHAS_ARQUIVO):
+        return None
+    try:
+        with open(INDICE_LINHAS_ARQUIVO, encoding='utf-8') as f:
+            return IndiceLinhasAgenda.de_json(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.warning("[indice_linhas] Arquivo %s inválido; o índice será refeito", INDICE_LINHAS_ARQUIVO)
+        return None
+
+
+def _salvar_indice_linhas(indice: IndiceLinhasAgenda):
+    if not INDICE_LINHAS_ARQUIVO:
+        return
+    try:
+        os.makedirs(os.path.dirname(INDICE_LINHAS_ARQUIVO) or '.', exist_ok=True)
+        tmp = f"{INDICE_LINHAS_ARQUIVO}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(indice.para_json(), f)
+        os.replace(tmp, INDICE_LINHAS_ARQUIVO)         # troca atômica
+    except OSError:
+        logger.warning("[indice_linhas] Falha ao salvar %s", INDICE_LINHAS_ARQUIVO, exc_info=True)
+
+
+def invalidar_indice_linhas():
+    """Linhas removidas/reordenadas na Agenda (arquivamento): o próximo acesso refaz o índice com uma leitura completa."""
+    global _indice_linhas
+    with _lock_indice_linhas:
+        _indice_linhas = None
+        if INDICE_LINHAS_ARQUIVO and os.path.exists(INDICE_LINHAS_ARQUIVO):
+            try:
+                os.remove(INDICE_LINHAS_ARQUIVO)
+            except OSError:
+                pass
+    _cache.pop(_CHAVE_CACHE_AGENDA_FUTURA, None)
+
+
+def _completar_linha(linha: list) -> list:
+    """batch_get corta as células vazias do fim da linha; devolve as 8 colunas como o get_all_values."""
+    return list(linha) + [''] * (len(CABECALHO_AGENDA) - len(linha))
+
+
+def _ler_blocos(ws, indice: IndiceLinhasAgenda, inicio: date, fim: date = None):
+    """
+    Lê num único batch_get as faixas do período (com uma linha de folga de cada lado)
+    e a cauda a partir de `indice.total`. As linhas de folga são a sonda de validade:
+    se alguma linha dentro de uma faixa não é do período, ou uma de folga é, linhas
+    foram inseridas/removidas desde que o índice foi feito e o retorno é None.
+    Retorna (linhas, números de linha) do período.
+
+    Nenhuma faixa passa da última linha conhecida, que existe na grade da aba (uma
+    faixa além da grade é erro na API): a cauda começa nela, e não depois dela, e a
+    faixa que termina nela fica sem a linha de folga de baixo. ws.row_count não
+    serve de limite: o gspread só o atualiza nas escritas deste processo.
+    """
+    o_ini, o_fim = inicio.toordinal(), fim.toordinal() if fim else None
+    ultima = indice.total
+
+    def no_periodo(linha):
+        ordinal = _ordinal_da_celula(linha[1]) if len(linha) > 1 else -1
+        return ordinal >= 0 and ordinal >= o_ini and (o_fim is None or ordinal <= o_fim)
+
+    faixas = [(max(2, a - 1), a, b, min(b + 1, ultima)) for a, b in indice.blocos(inicio, fim)]
+    intervalos = [f"A{primeira}:H{fim_faixa}" for primeira, _, _, fim_faixa in faixas] + [f"A{ultima}:H"]
+    try:
+        respostas = ws.batch_get(intervalos)
+    except Exception:                                  # ex.: linhas removidas da aba: a grade encolheu
+        logger.warning("[indice_linhas] Leitura parcial falhou; caindo para a leitura completa", exc_info=True)
+        return None
+
+    linhas, numeros = [], []
+    for (primeira, a, b, fim_faixa), valores in zip(faixas, respostas):
+        valores = list(valores) + [[]] * (fim_faixa + 1 - primeira - len(valores))  # linhas vazias do fim vêm cortadas
+        for numero, linha in enumerate(valores, start=primeira):
+            if a <= numero <= b:
+                if not no_periodo(linha):
+                    return None
+                linhas.append(_completar_linha(linha))
+                numeros.append(numero)
+            elif no_periodo(linha):
+                return None
+
+    cauda = list(respostas[-1])[1:]                    # a primeira é a última linha conhecida
+    if cauda:
+        primeira = indice.total + 1
+        indice.incorporar([_ordinal_da_celula(l[1]) if len(l) > 1 else -1 for l in cauda], primeira)
+        _salvar_indice_linhas(indice)
+        for numero, linha in enumerate(cauda, start=primeira):
+            if no_periodo(linha):
+                linhas.append(_completar_linha(linha))
+                numeros.append(numero)
+    return linhas, numeros
+
+
+def ler_agenda_por_datas(inicio: date, fim: date = None) -> 'AgendaSnapshot':
+    """
+    Snapshot só das linhas da Agenda com data em [inicio, fim] (fim=None: até a
+    última data), lendo apenas as faixas A1 que as contêm (ex.: A812:H860) em vez
+    do get_all_values: bytes e latência acompanham o período, não a idade da aba.
+    Sem índice, ou com índice desatualizado, faz uma leitura completa e refaz o
+    índice (persistido em AGENDA_ROW_INDEX_FILE). `numero_linha(r)` dá a linha
+    de cada resultado na planilha.
+    """
+    global _indice_linhas
+    ws = obter_worksheet_agenda()
+    with _lock_indice_linhas:
+        if INDICE_LINHAS:
+            if _indice_linhas is None:
+                _indice_linhas = _carregar_indice_linhas()
+            if _indice_linhas is not None:
+                lido = _ler_blocos(ws, _indice_linhas, inicio, fim)
+                if lido is not None:
+                    metrics.CACHE_CONSULTAS.inc(cache='indice_linhas', resultado='hit')
+                    linhas, numeros = lido
+                    snapshot = AgendaSnapshot.de_valores([CABECALHO_AGENDA] + linhas)
+                    snapshot.numeros = np.array(numeros, dtype=np.int64)
+                    return snapshot
+                logger.info("[indice_linhas] Índice desatualizado (linhas inseridas/removidas); refazendo")
+            metrics.CACHE_CONSULTAS.inc(cache='indice_linhas', resultado='miss')
+
+        completo = AgendaSnapshot.de_valores(ws.get_all_values())
+        if INDICE_LINHAS:
+            _indice_linhas = IndiceLinhasAgenda.de_snapshot(completo)
+            _salvar_indice_linhas(_indice_linhas)
+    linhas = completo.filtrar(desde=inicio, antes_de=fim + timedelta(days=1) if fim else None)
+    return completo.recorte(linhas)
+
+
+def obter_agenda_futura_cached(ttl_seconds: int = 5) -> 'AgendaSnapshot':
+    """
+    Como obter_todos_agenda_cached, mas só com as linhas de hoje em diante (lidas
+    por faixa via ler_agenda_por_datas). É o que o fluxo de agendamento, o bitmap
+    de disponibilidade e o resumo do dia consultam.
+    """
+    import time
+    now = time.time()
+    hoje = agora_brasil().date()
+    entry = _cache.get(_CHAVE_CACHE_AGENDA_FUTURA)
+    if entry and entry[1] == hoje and now - entry[0] < ttl_seconds:
+        metrics.CACHE_CONSULTAS.inc(cache='agenda_futura', resultado='hit')
+        return entry[2]
+    metrics.CACHE_CONSULTAS.inc(cache='agenda_futura', resultado='miss')
     try:
-        registros = ws.get_all_records()                # lê registros como dicionários
+        snapshot = ler_agenda_por_datas(hoje)
     except Exception:
-        # Fallback quando o cabeçalho da planilha estiver inconsistente
-        # (gspread lança GSpreadException sobre cabeçalhos duplicados).
-        vals = ws.get_all_values()
-        if not vals or len(vals) < 2:
-            registros = []
+        if entry and entry[1] == hoje:                 # mesmo fallback do obter_todos_agenda_cached
+            return entry[2]
+        raise
+    _cache[_CHAVE_CACHE_AGENDA_FUTURA] = (now, hoje, snapshot)
+    return snapshot
+
+
+def obter_disponibilidade() -> DisponibilidadeAgenda:
+    """Bitmap de disponibilidade do snapshot atual da Agenda, de hoje em diante (refeito só quando o snapshot muda)."""
+    valores = obter_agenda_futura_cached()
+    with _lock_disponibilidade:
+        entry = _cache.get(_CHAVE_CACHE_DISPONIBILIDADE)
+        if entry is None or entry[0] is not valores:
+            metrics.CACHE_CONSULTAS.inc(cache='disponibilidade', resultado='miss')
+            entry = _cache[_CHAVE_CACHE_DISPONIBILIDADE] = (valores, DisponibilidadeAgenda.de_linhas(valores))
         else:
-            # Cabeçalhos esperados em A..H
-            headers = ['dia_semana', 'data', 'hora', 'nome_paciente', 'telefone', 'status', 'origem', 'observacoes']
-            registros = []
-            for row in vals[1:]:
-                rowdict = {headers[i]: (row[i] if i < len(row) else '') for i in range(len(headers))}
-                registros.append(rowdict)
-    agora = agora_brasil()                              # obtém data/hora atual (Brasil GMT-3)
-    data_str_alvo = data_dia.strftime("%d/%m/%Y")       # formata data alvo como string
+            metrics.CACHE_CONSULTAS.inc(cache='disponibilidade', resultado='hit')
+        return entry[1]
 
-    slots = []                                          # lista para acumular slots encontrados
 
-    for reg in registros:                               # percorre cada registro
-        data_str = reg.get("data", "").strip()          # lê campo data
-        hora_str = reg.get("hora", "").strip()          # lê campo hora
-        status = reg.get("status", "").strip().upper()  # lê campo status em maiúsculas
+def _marcar_disponibilidade(dt: datetime, livre: bool):
+    """Reflete no bitmap um agendamento/cancelamento já gravado na planilha."""
+    with _lock_disponibilidade:
+        entry = _cache.get(_CHAVE_CACHE_DISPONIBILIDADE)
+        if entry is not None:
+            entry[1].marcar(dt, livre)
+        else:
+            _cache.pop(_CHAVE_CACHE_AGENDA, None)      # sem bitmap: o próximo nasce de uma leitura nova
+            _cache.pop(_CHAVE_CACHE_AGENDA_FUTURA, None)
 
-        if not data_str or not hora_str:                # se faltar data ou hora
-            continue                                    # ignora
 
-        if data_str != data_str_alvo:                   # se data não for a data alvo
-            continue                                    # ignora
+def invalidar_cache_agenda():
+    """Linhas novas ou removidas na Agenda (geração de slots, arquivamento): snapshot e bitmap são refeitos na próxima consulta."""
+    with _lock_disponibilidade:
+        _cache.pop(_CHAVE_CACHE_DISPONIBILIDADE, None)
+        _cache.pop(_CHAVE_CACHE_AGENDA, None)
+        _cache.pop(_CHAVE_CACHE_AGENDA_FUTURA, None)
 
-        if status != "DISPONIVEL":                      # se não estiver disponível
-            continue                                    # ignora
 
-        try:                                            # tenta converter data+hora em datetime
-            dt_slot = datetime.strptime(f"{data_str} {hora_str}", "%d/%m/%Y %H:%M")
-        except ValueError:                              # se não conseguir converter
-            continue                                    # ignora
+def _minuto_minimo(data_dia: date, agora: datetime):
+    """Primeiro minuto do dia ainda futuro em `data_dia` (None se a data já passou)."""
+    if data_dia > agora.date():
+        return 0
+    if data_dia < agora.date():
+        return None
+    return agora.hour * 60 + agora.minute + (1 if agora.second or agora.microsecond else 0)
+
+
+def obter_slots_disponiveis_para_data(data_dia: date):
+    """
+    Retorna uma lista de datetime (em ordem) para os slots da Agenda que:
+      - têm 'data' == data_dia
+      - têm status == 'DISPONIVEL'
+      - ainda não passaram em relação ao horário atual
+    Consulta o bitmap de disponibilidade (obter_disponibilidade), sem percorrer a aba.
+    """
+    minimo = _minuto_minimo(data_dia, agora_brasil())
+    if minimo is None:
+        return []
+    base = datetime(data_dia.year, data_dia.month, data_dia.day)
+    return [base + timedelta(minutes=m) for m in obter_disponibilidade().minutos_livres(data_dia, minimo)]
 
-        if dt_slot >= agora:                            # considera apenas horários futuros
-            slots.append(dt_slot)                       # adiciona slot à lista
 
-    slots.sort()                                        # ordena slots cronologicamente
-    return slots                                        # retorna lista de slots disponíveis
+def primeiro_slot_livre(apos: datetime = None, dias: int = None):
+    """
+    Primeiro slot DISPONIVEL na Agenda a partir de `apos` (padrão: agora),
+    opcionalmente limitado aos próximos `dias` dias. None se não houver.
+    """
+    apos = apos or agora_brasil()
+    ate = datetime(apos.year, apos.month, apos.day) + timedelta(days=dias) if dias else None
+    return obter_disponibilidade().indice.primeiro_livre(apos, ate)
+
+
+def proximos_slots_livres(k: int = 5, apos: datetime = None) -> list:
+    """Os `k` próximos slots DISPONIVEL a partir de `apos` (padrão: agora)."""
+    return obter_disponibilidade().indice.proximos(apos or agora_brasil(), k)
+
+
+def obter_dias_com_vaga(data_inicio: date, data_fim: date):
+    """Datas entre data_inicio e data_fim (inclusive) com pelo menos um slot DISPONIVEL ainda futuro."""
+    if data_inicio > data_fim:
+        data_inicio, data_fim = data_fim, data_inicio
+    agora = agora_brasil()
+    disp = obter_disponibilidade()
+    dias = []
+    dia = data_inicio
+    while dia <= data_fim:
+        minimo = _minuto_minimo(dia, agora)
+        if minimo is not None and disp.tem_vaga(dia, minimo):
+            dias.append(dia)
+        dia += timedelta(days=1)
+    return dias
+
 
 def obter_slots_disponiveis_no_intervalo(data_inicio: date, data_fim: date):
     """
@@ -724,8 +1586,8 @@ def obter_slots_disponiveis_no_intervalo(data_inicio: date, data_fim: date):
     # Laço que percorre todos os dias até data_fim (inclusive).                # varre o intervalo dia a dia
     while data_dia <= data_fim:                                                # enquanto não ultrapassar a data final
 
-        # Opcional: se você quiser filtrar só dias úteis, pode manter este if.  # aqui respeitamos o conceito de DIAS_UTEIS
-        if data_dia.weekday() in DIAS_UTEIS:                                   # verifica se o dia é útil (seg a sex)
+        # Só dias com atendimento (templates de ScheduleConfig, com exceções).  # evita ler a agenda em dias fechados
+        if tem_atendimento(data_dia):                                          # verifica se o dia tem slots
             # Usa a função já existente para buscar os slots desse dia.        # reaproveita lógica já pronto
             slots_do_dia = obter_slots_disponiveis_para_data(data_dia)         # lê os slots disponíveis na aba Agenda
 
@@ -760,6 +1622,7 @@ def extrair_slots_semana(data_inicio, data_fim):
         data_fim=data_fim                                                       # passa a data final
     )
 
+@_serializar_linhas_agenda
 def registrar_agendamento_google_sheets(
     nome_paciente,
     data_hora_consulta,
@@ -820,6 +1683,7 @@ def registrar_agendamento_google_sheets(
             observacoes,
         ]
         ws.update(intervalo, [nova_linha])              # grava na planilha
+        _marcar_disponibilidade(data_hora_consulta, livre=False)
         return True                                     # retorna sucesso
 
     # Se não encontrou slot existente, cria nova linha com esse horário já como AGENDADO.
@@ -837,6 +1701,7 @@ def registrar_agendamento_google_sheets(
         nova_linha,
         value_input_option="USER_ENTERED"
     )
+    _marcar_disponibilidade(data_hora_consulta, livre=False)
     return True                                         # retorna sucesso
 
 
@@ -853,6 +1718,36 @@ def cancelar_agendamento_por_data_hora(dt_consulta: datetime, telefone_esperado:
     IMPORTANTE: Se telefone_esperado for fornecido, valida se o telefone do agendamento
     bate com o esperado (segurança: evita que um usuário cancele agendamento de outro).
     """
+    telefone_exist = _liberar_slot_por_data_hora(dt_consulta, telefone_esperado)
+    if telefone_exist is None:
+        return False
+
+    # Além de limpar o slot na aba Agenda, marcar lembretes relacionados
+    # como enviados para evitar que sejam reenviados no restart.
+    # (fora da trava de linhas da Agenda: a aba Lembretes não é afetada pelo arquivamento)
+    try:
+        appt_iso = dt_consulta.isoformat()
+        # remove any pending reminders for this appointment and telefone
+        try:
+            remover = remover_lembretes_por_appointment
+            remover(appt_iso, telefone_exist)
+        except Exception:
+            import logging
+            logging.getLogger(__name__).exception('[cancel] failed removing lembretes for appointment=%s tel=%s', appt_iso, telefone_exist)
+    except Exception:
+        import logging
+        logging.getLogger(__name__).exception('[cancel] error while removing lembretes after cancellation')
+
+    return True                                         # retorna sucesso
+
+
+@_serializar_linhas_agenda
+def _liberar_slot_por_data_hora(dt_consulta: datetime, telefone_esperado: str = None):
+    """
+    Parte de cancelar_agendamento_por_data_hora que lê e escreve na Agenda pelo nº
+    de linha. Retorna o telefone do agendamento liberado ('' se a linha não tiver
+    a coluna) ou None se nada foi cancelado.
+    """
     ws = obter_worksheet_agenda()                       # obtém worksheet da Agenda
     todos_valores = ws.get_all_values()                 # lê todas as linhas
 
@@ -879,18 +1774,18 @@ def cancelar_agendamento_por_data_hora(dt_consulta: datetime, telefone_esperado:
             break                                       # interrompe laço
 
     if linha_encontrada is None:                        # se não encontrou linha
-        return False                                    # não há o que cancelar
+        return None                                     # não há o que cancelar
 
     # SEGURANÇA: validar telefone se foi fornecido
     if telefone_esperado:
         telefone_agenda = (linha_conteudo[4].strip() if len(linha_conteudo) > 4 else "")
         if telefone_agenda != telefone_esperado:
             logger.warning("[cancelar_agendamento] Tentativa de cancelar agendamento de outro usuário: esperado=%s encontrado=%s", telefone_esperado, telefone_agenda)
-            return False  # Nega cancelamento de agendamento de outro usuário
+            return None  # Nega cancelamento de agendamento de outro usuário
 
     status_exist = (linha_conteudo[5].strip().upper() if len(linha_conteudo) >= 6 else "")  # status atual
     if status_exist != "AGENDADO":                      # só cancela se estiver AGENDADO
-        return False                                    # caso contrário, retorna False
+        return None                                     # caso contrário, nada cancelado
 
     weekday = dt_consulta.date().weekday()              # obtém índice do dia da semana
     nome_dia = NOMES_DIAS_PT[weekday]                   # nome do dia
@@ -908,24 +1803,8 @@ def cancelar_agendamento_por_data_hora(dt_consulta: datetime, telefone_esperado:
 
     intervalo = f"A{linha_encontrada}:H{linha_encontrada}"  # intervalo da linha inteira
     ws.update(intervalo, [nova_linha])               # atualiza na planilha
-
-    # Além de limpar o slot na aba Agenda, marcar lembretes relacionados
-    # como enviados para evitar que sejam reenviados no restart.
-    try:
-        appt_iso = dt_consulta.isoformat()
-        telefone_exist = (linha_conteudo[4].strip() if len(linha_conteudo) > 4 else None)
-        # remove any pending reminders for this appointment and telefone
-        try:
-            remover = remover_lembretes_por_appointment
-            remover(appt_iso, telefone_exist)
-        except Exception:
-            import logging
-            logging.getLogger(__name__).exception('[cancel] failed removing lembretes for appointment=%s tel=%s', appt_iso, telefone_exist)
-    except Exception:
-        import logging
-        logging.getLogger(__name__).exception('[cancel] error while removing lembretes after cancellation')
-
-    return True                                         # retorna sucesso
+    _marcar_disponibilidade(dt_consulta, livre=True)
+    return linha_conteudo[4].strip() if len(linha_conteudo) > 4 else ""
 
 
 def buscar_proximo_agendamento_por_telefone(telefone: str):
@@ -962,9 +1841,8 @@ def buscar_proximo_agendamento_por_telefone(telefone: str):
         data_str = linha[1].strip()                     # coluna B = data
         hora_str = linha[2].strip()                     # coluna C = hora
 
-        try:
-            dt = datetime.strptime(f"{data_str} {hora_str}", "%d/%m/%Y %H:%M")  # monta datetime
-        except ValueError:
+        dt = converter_data_hora(data_str, hora_str)    # monta datetime (memoizado)
+        if dt is None:
             continue                                    # ignora se não conseguir converter
 
         if dt < agora:                                  # se já passou
@@ -1084,28 +1962,62 @@ def remover_lembrete_por_row(row_index):
         return False
 
 
-def remover_lembretes_por_appointment(appointment_iso, telefone):
-    """Remove todos os lembretes pendentes que correspondam a um appointment_iso + telefone.
-    IMPORTANTE: `telefone` é obrigatório para evitar remover lembretes de outros usuários.
+def remover_lembretes_por_rows(row_indices):
+    """Remove várias linhas da aba Lembretes em UMA única requisição (ver remover_linhas_em_lote).
+    Retorna o número de linhas removidas (0 se nada foi removido ou se falhar).
+    """
+    return remover_linhas_em_lote(obter_worksheet_lembretes(), row_indices)
 
-    A remoção sempre tentará casar por:
-      - telefone (obrigatório)
-      - data + horário do agendamento (formato planilha: `appointment_date` = dd/mm/YYYY, `appointment_time` = HH:MM)
 
-    Retorna o número de linhas removidas.
+def remover_linhas_em_lote(ws, row_indices):
+    """Remove várias linhas (1-based) de uma aba em UMA única requisição (batch_update).
+
+    Linhas consecutivas são agrupadas em um único intervalo e os intervalos são
+    enviados de baixo para cima, para que a remoção de um não desloque os demais.
+    Retorna o número de linhas removidas (0 se nada foi removido ou se falhar).
     """
-    ws = obter_worksheet_lembretes()
-    pend = obter_lembretes_pendentes()
-    rows_to_delete = []
+    linhas = sorted({int(r) for r in row_indices if r and int(r) > 1}, reverse=True)  # nunca remove o cabeçalho
+    if not linhas:
+        return 0
 
-    if not telefone:
-        logger.warning("[remover_lembretes_por_appointment] REJEITADO: telefone obrigatório não fornecido")
+    # agrupa linhas consecutivas em intervalos [inicio, fim] (1-based, inclusivo)
+    intervalos = []
+    for r in linhas:
+        if intervalos and intervalos[-1][0] == r + 1:
+            intervalos[-1][0] = r
+        else:
+            intervalos.append([r, r])
+
+    requests_body = [{
+        "deleteDimension": {
+            "range": {
+                "sheetId": ws.id,
+                "dimension": "ROWS",
+                "startIndex": inicio - 1,              # API usa índice 0-based
+                "endIndex": fim,                       # endIndex exclusivo
+            }
+        }
+    } for inicio, fim in intervalos]
+
+    try:
+        ws.spreadsheet.batch_update({"requests": requests_body})
+    except Exception:
+        logger.exception("[remover_linhas_em_lote] falha ao remover %d linhas de %s", len(linhas), ws.title)
         return 0
+    return len(linhas)
 
+
+def chave_lembrete(appointment_iso, telefone) -> str:
+    """Id estável do job de lembrete no scheduler (telefone + agendamento): reagendar o
+    mesmo lembrete (ex.: reidratação depois de um failover) não cria um segundo job."""
+    return f"lembrete:{telefone}:{appointment_iso}"
+
+
+def _linhas_lembretes_do_agendamento(pendentes, appointment_iso, telefone):
+    """Linhas (1-based) dos lembretes pendentes que casam com telefone + data/hora do agendamento."""
     # normalize target date/time from appointment_iso when possible
     target_date = None
     target_time = None
-    from datetime import datetime
     if appointment_iso:
         try:
             dt = datetime.fromisoformat(appointment_iso)
@@ -1115,7 +2027,8 @@ def remover_lembretes_por_appointment(appointment_iso, telefone):
             target_date = None
             target_time = None
 
-    for p in pend:
+    rows = []
+    for p in pendentes:
         # Ensure the record has expected fields
         appt_date = p.get('appointment_date')
         appt_time = p.get('appointment_time')
@@ -1133,8 +2046,39 @@ def remover_lembretes_por_appointment(appointment_iso, telefone):
         if not match_dt:
             continue
 
-        rows_to_delete.append(p['row'])
+        rows.append(p['row'])
+    return rows
+
+
+def lembrete_pendente(appointment_iso, telefone) -> bool:
+    """True se a aba Lembretes ainda tem lembrete não enviado para appointment_iso + telefone.
+
+    Conferido na hora do envio: False quer dizer que outro processo já enviou (e
+    removeu) o lembrete ou que a consulta foi cancelada.
+    """
+    if not telefone:
+        return False
+    return bool(_linhas_lembretes_do_agendamento(obter_lembretes_pendentes(), appointment_iso, telefone))
+
+
+def remover_lembretes_por_appointment(appointment_iso, telefone):
+    """Remove todos os lembretes pendentes que correspondam a um appointment_iso + telefone.
+    IMPORTANTE: `telefone` é obrigatório para evitar remover lembretes de outros usuários.
+
+    A remoção sempre tentará casar por:
+      - telefone (obrigatório)
+      - data + horário do agendamento (formato planilha: `appointment_date` = dd/mm/YYYY, `appointment_time` = HH:MM)
+
+    Retorna o número de linhas removidas.
+    """
+    ws = obter_worksheet_lembretes()
+    pend = obter_lembretes_pendentes()
+
+    if not telefone:
+        logger.warning("[remover_lembretes_por_appointment] REJEITADO: telefone obrigatório não fornecido")
+        return 0
 
+    rows_to_delete = _linhas_lembretes_do_agendamento(pend, appointment_iso, telefone)
     if not rows_to_delete:
         return 0
     # delete from bottom to top to avoid shifting indices
@@ -1162,6 +2106,34 @@ def cancelar_proximo_agendamento_por_telefone(telefone: str):
       - retorna o datetime do agendamento cancelado
       - se não encontrar nada, retorna None
     """
+    melhor_dt = _liberar_proximo_slot_por_telefone(telefone)
+    if melhor_dt is None:
+        return None
+
+    # Além de limpar o slot na aba Agenda, marcar lembretes relacionados
+    # como enviados para evitar que sejam reenviados no restart.
+    # (fora da trava de linhas da Agenda: a aba Lembretes não é afetada pelo arquivamento)
+    try:
+        appt_iso = melhor_dt.isoformat()
+        try:
+            remover = remover_lembretes_por_appointment
+            remover(appt_iso, telefone)
+        except Exception:
+            import logging
+            logging.getLogger(__name__).exception('[cancel_prox] failed removing lembretes for appointment=%s', appt_iso)
+    except Exception:
+        import logging
+        logging.getLogger(__name__).exception('[cancel_prox] error while removing lembretes after cancellation')
+
+    return melhor_dt                                    # retorna datetime do agendamento cancelado
+
+
+@_serializar_linhas_agenda
+def _liberar_proximo_slot_por_telefone(telefone: str):
+    """
+    Parte de cancelar_proximo_agendamento_por_telefone que lê e escreve na Agenda
+    pelo nº de linha. Retorna o datetime do agendamento liberado ou None.
+    """
     ws = obter_worksheet_agenda()                       # obtém worksheet da Agenda
     todos_valores = ws.get_all_values()                 # lê todas as linhas
 
@@ -1189,9 +2161,8 @@ def cancelar_proximo_agendamento_por_telefone(telefone: str):
         data_str = linha[1].strip()                     # data da linha
         hora_str = linha[2].strip()                     # hora da linha
 
-        try:
-            dt = datetime.strptime(f"{data_str} {hora_str}", "%d/%m/%Y %H:%M")  # monta datetime
-        except ValueError:
+        dt = converter_data_hora(data_str, hora_str)    # monta datetime (memoizado)
+        if dt is None:
             continue                                    # ignora se não converter
 
         if dt < agora:                                  # se já passou
@@ -1220,22 +2191,8 @@ def cancelar_proximo_agendamento_por_telefone(telefone: str):
 
     intervalo = f"A{melhor_linha}:H{melhor_linha}"      # intervalo da linha
     ws.update(intervalo, [nova_linha])                  # atualiza na planilha
-
-    # Além de limpar o slot na aba Agenda, marcar lembretes relacionados
-    # como enviados para evitar que sejam reenviados no restart.
-    try:
-        appt_iso = melhor_dt.isoformat()
-        try:
-            remover = remover_lembretes_por_appointment
-            remover(appt_iso, telefone)
-        except Exception:
-            import logging
-            logging.getLogger(__name__).exception('[cancel_prox] failed removing lembretes for appointment=%s', appt_iso)
-    except Exception:
-        import logging
-        logging.getLogger(__name__).exception('[cancel_prox] error while removing lembretes after cancellation')
-
-    return melhor_dt                                    # retorna datetime do agendamento cancelado
+    _marcar_disponibilidade(melhor_dt, livre=True)
+    return melhor_dt
 
 
 # -------------------------------------------------------
@@ -1246,24 +2203,12 @@ def listar_agendamentos_para_data(data_dia: date):
     """
     Retorna todos os agendamentos com status 'AGENDADO' para uma data específica.
     """
-    ws = obter_worksheet_agenda()                       # obtém a worksheet 'Agenda'
-    registros = ws.get_all_records()                    # lê todos os registros como dicionários
-
-    data_str_alvo = data_dia.strftime("%d/%m/%Y")       # formata a data alvo como string
-    agendamentos = []                                   # lista para armazenar os agendamentos do dia
-
-    for reg in registros:                               # percorre cada registro da planilha
-        data_reg = str(reg.get("data", "")).strip()     # obtém o campo de data
-        status = str(reg.get("status", "")).strip().upper()  # obtém o status em maiúsculas
-
-        if data_reg != data_str_alvo:                   # ignora registros de outras datas
-            continue                                    # passa para o próximo registro
-        if status != "AGENDADO":                        # ignora registros que não estão agendados
-            continue                                    # passa para o próximo registro
-
-        agendamentos.append(reg)                        # adiciona o registro à lista de agendados
-
-    return agendamentos                                 # retorna a lista de agendamentos encontrados
+    if data_dia >= agora_brasil().date():
+        snapshot = obter_agenda_futura_cached()         # só as linhas de hoje em diante (leitura por faixa)
+    else:
+        snapshot = obter_todos_agenda_cached()          # snapshot colunar da aba Agenda inteira
+    linhas = snapshot.filtrar(status="AGENDADO", data=data_dia)  # só as linhas do dia, sem dict por linha
+    return [snapshot.registro(r) for r in linhas.tolist()]  # registros no formato do get_all_records
 
 
 def montar_texto_resumo_dia(data_dia: date):
@@ -1294,3 +2239,14 @@ def montar_texto_resumo_dia(data_dia: date):
         )
 
     return "\n".join(linhas)                                # junta todas as linhas em um único texto
+
+
+compilar_horarios()                                    # templates de slots prontos antes do primeiro uso
+
+# Cada função pública vira um span quando chamada dentro do trace de uma mensagem do webhook
+tracing.instrumentar_modulo(globals(), 'agenda', ignorar={
+    'agora_brasil', 'gerar_slots_para_dia', 'obter_nome_dia_semana', 'compilar_horarios',
+    'template_do_dia', 'tem_atendimento', 'eh_horario_de_slot', 'converter_data_hora', 'invalidar_cache_agenda',
+    'invalidar_indice_linhas', 'chave_lembrete',
+    'obter_intervalo_semana_atual_a_partir_de_hoje', 'obter_intervalo_semana_relativa',
+})
@@ -0,0 +1,246 @@
+"""
+call_budget.py - Contagem de chamadas externas por mensagem recebida.
+
+Cada mensagem do webhook abre um contexto (contextvars) onde são contadas as
+leituras e escritas no Google Sheets e os envios para a Graph API causados por ela.
+Ao final, a contagem vai para o log (linha "[budget]") e para os totais
+acumulados por estado da conversa (`totais()`), usados nas métricas.
+
+As chamadas ao Sheets são contadas por um proxy em volta da planilha/abas
+(`instrumentar_planilha`), então vale para o gspread real e para a planilha fake.
+
+Nos testes, use `coletar()` para capturar os registros e `verificar()` para
+impor um orçamento por passo da conversa:
+
+    with call_budget.coletar() as registros:
+        enviar("1")                                   # confirma o agendamento
+    call_budget.verificar(registros[-1], sheets_leituras=1, sheets_escritas=1)
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# Classificação dos métodos do gspread (mesma da planilha fake em tests/fake_gspread.py)
+METODOS_LEITURA = {
+    "get_all_values", "get_all_records", "get_values", "get", "batch_get", "row_values", "col_values",
+    "acell", "cell", "find", "findall", "range", "worksheet", "worksheets", "open_by_key", "values_get",
+}
+METODOS_ESCRITA = {
+    "update", "update_acell", "update_cell", "update_cells", "batch_update", "batch_clear", "clear",
+    "append_row", "append_rows", "insert_row", "insert_rows", "delete_rows", "delete_row",
+    "add_rows", "resize", "add_worksheet", "values_update", "values_append",
+}
+
+CONTADORES = ("sheets_leituras", "sheets_escritas", "graph_posts")
+
+_atual = contextvars.ContextVar("call_budget_atual", default=None)
+_lock = threading.Lock()
+_totais = {}                # estado -> {"mensagens": n, "sheets_leituras": n, ...}
+_sem_contexto = dict.fromkeys(CONTADORES, 0)  # chamadas feitas fora de uma mensagem (jobs, warmup)
+_coletores = []
+
+
+class OrcamentoExcedido(AssertionError):
+    """Uma mensagem fez mais chamadas externas do que o orçamento do passo permite."""
+
+
+class Orcamento:
+    """Contadores de uma mensagem recebida."""
+
+    def __init__(self, telefone: str = None, estado: str = None):
+        self.telefone = telefone
+        self.estado = estado
+        self.contagem = dict.fromkeys(CONTADORES, 0)
+        self.por_metodo = {}
+        self._inicio = time.perf_counter()
+        self.duracao_ms = None
+
+    def registrar(self, contador: str, metodo: str = None):
+        self.contagem[contador] += 1
+        if metodo:
+            self.por_metodo[metodo] = self.por_metodo.get(metodo, 0) + 1
+
+    def como_dict(self) -> dict:
+        return {"telefone": self.telefone, "estado": self.estado, **self.contagem,
+                "por_metodo": dict(self.por_metodo), "duracao_ms": self.duracao_ms}
+
+
+# -------------------------------------------------------
+# Contexto por mensagem
+# -------------------------------------------------------
+
+@contextmanager
+def contexto_mensagem(telefone: str = None, estado: str = None):
+    """Abre o contexto de contagem de uma mensagem; ao sair, loga e acumula os totais."""
+    orcamento = Orcamento(telefone, str(estado) if estado is not None else None)
+    token = _atual.set(orcamento)
+    try:
+        yield orcamento
+    finally:
+        _atual.reset(token)
+        orcamento.duracao_ms = round((time.perf_counter() - orcamento._inicio) * 1000, 1)
+        _finalizar(orcamento)
+
+
+def atual():
+    """Orçamento da mensagem em andamento (None fora do webhook)."""
+    return _atual.get()
+
+
+def registrar(contador: str, metodo: str = None):
+    """Conta uma chamada externa na mensagem atual (ou em `_sem_contexto`)."""
+    orcamento = _atual.get()
+    if orcamento is not None:
+        orcamento.registrar(contador, metodo)
+    else:
+        with _lock:
+            _sem_contexto[contador] += 1
+
+
+def _finalizar(orcamento: Orcamento):
+    c = orcamento.contagem
+    logger.info("[budget] from=%s estado=%s sheets_leituras=%d sheets_escritas=%d graph_posts=%d duracao_ms=%.1f",
+                orcamento.telefone, orcamento.estado, c["sheets_leituras"], c["sheets_escritas"],
+                c["graph_posts"], orcamento.duracao_ms)
+    with _lock:
+        tot = _totais.setdefault(orcamento.estado or "-", dict.fromkeys(("mensagens",) + CONTADORES, 0))
+        tot["mensagens"] += 1
+        for nome in CONTADORES:
+            tot[nome] += c[nome]
+        coletores = list(_coletores)
+    for nome in CONTADORES:
+        if c[nome]:
+            metrics.CHAMADAS_POR_MENSAGEM.inc(c[nome], estado=orcamento.estado or "-", tipo=nome)
+    registro = orcamento.como_dict()
+    for lista in coletores:
+        lista.append(registro)
+
+
+def totais() -> dict:
+    """Totais acumulados por estado da conversa, mais as chamadas fora de mensagens ('_sem_contexto')."""
+    with _lock:
+        resultado = {estado: dict(v) for estado, v in _totais.items()}
+        resultado["_sem_contexto"] = dict(_sem_contexto)
+    return resultado
+
+
+def zerar():
+    with _lock:
+        _totais.clear()
+        for nome in CONTADORES:
+            _sem_contexto[nome] = 0
+
+
+# -------------------------------------------------------
+# Proxies do gspread
+# -------------------------------------------------------
+
+class _Instrumentado:
+    """Repassa atributos ao objeto original, contando os métodos de leitura/escrita."""
+
+    def __init__(self, alvo, prefixo: str = ""):
+        object.__setattr__(self, "_alvo", alvo)
+        object.__setattr__(self, "_prefixo", prefixo)
+
+    def __getattr__(self, nome):
+        valor = getattr(self._alvo, nome)
+        if not callable(valor):
+            return valor
+        if nome in METODOS_LEITURA:
+            contador = "sheets_leituras"
+        elif nome in METODOS_ESCRITA:
+            contador = "sheets_escritas"
+        else:
+            return valor
+        metodo = self._prefixo + nome
+
+        def _chamar(*args, **kwargs):
+            registrar(contador, metodo)
+            inicio = time.perf_counter()
+            try:
+                return _embrulhar(valor(*args, **kwargs))
+            except Exception as e:
+                metrics.SHEETS_ERROS.inc(funcao=metodo, erro=getattr(e, "code", None) or type(e).__name__)
+                raise
+            finally:
+                metrics.SHEETS_LATENCIA.observar(time.perf_counter() - inicio, funcao=metodo)
+        return _chamar
+
+    def __setattr__(self, nome, valor):
+        setattr(self._alvo, nome, valor)
+
+    def __eq__(self, outro):
+        return self._alvo == getattr(outro, "_alvo", outro)
+
+    def __hash__(self):
+        return hash(self._alvo)
+
+    def __repr__(self):
+        return f"<instrumentado {self._alvo!r}>"
+
+
+class _PlanilhaInstrumentada(_Instrumentado):
+    pass
+
+
+class _AbaInstrumentada(_Instrumentado):
+
+    @property
+    def spreadsheet(self):
+        return _PlanilhaInstrumentada(self._alvo.spreadsheet, "spreadsheet.")
+
+
+def _embrulhar(valor):
+    """Abas devolvidas por worksheet()/add_worksheet()/worksheets() também são contadas."""
+    if isinstance(valor, _Instrumentado):
+        return valor
+    if isinstance(valor, list):
+        return [_embrulhar(v) for v in valor] if valor and _parece_aba(valor[0]) else valor
+    if _parece_aba(valor):
+        return _AbaInstrumentada(valor)
+    return valor
+
+
+def _parece_aba(obj) -> bool:
+    return hasattr(obj, "get_all_values") and hasattr(obj, "row_values")
+
+
+def instrumentar_planilha(planilha):
+    """Proxy da planilha (gspread.Spreadsheet ou fake) que conta as chamadas dela e das abas."""
+    if isinstance(planilha, _Instrumentado):
+        return planilha
+    return _PlanilhaInstrumentada(planilha)
+
+
+# -------------------------------------------------------
+# Apoio aos testes
+# -------------------------------------------------------
+
+@contextmanager
+def coletar():
+    """Captura o registro (dict) de cada mensagem finalizada enquanto o bloco executa."""
+    registros = []
+    with _lock:
+        _coletores.append(registros)
+    try:
+        yield registros
+    finally:
+        with _lock:
+            _coletores.remove(registros)
+
+
+def verificar(registro: dict, sheets_leituras: int = None, sheets_escritas: int = None, graph_posts: int = None):
+    """Levanta OrcamentoExcedido se o registro de uma mensagem passou de algum limite informado."""
+    limites = {"sheets_leituras": sheets_leituras, "sheets_escritas": sheets_escritas, "graph_posts": graph_posts}
+    excedidos = [f"{nome}={registro[nome]} (máx {limite})" for nome, limite in limites.items()
+                 if limite is not None and registro[nome] > limite]
+    if excedidos:
+        raise OrcamentoExcedido(f"estado={registro.get('estado')}: " + ", ".join(excedidos)
+                                + f" | por método: {registro.get('por_metodo')}")
@@ -12,6 +12,7 @@ BUTTON_ID_AGENDAR = '1'
 BUTTON_ID_REAGENDAR = '2'
 BUTTON_ID_CANCELAR = '3'
 BUTTON_ID_VALORES = '4'
+BUTTON_ID_PRIMEIRO_HORARIO = '5'
 
 # IDs de Navegação Universal
 BUTTON_ID_VOLTAR = '0'
@@ -157,20 +158,46 @@ class UniversalActions:
 # ============================================================================
 
 class ScheduleConfig:
-    """Configurações de horários de atendimento."""
+    """
+    Configurações de horários de atendimento (fonte única; o agenda_service
+    compila isto em templates de slots por dia da semana no startup).
 
-    # Horários de funcionamento
+    Cada dia tem uma lista de janelas (início, fim); o intervalo entre duas
+    janelas é a pausa (ex.: almoço 12:00-14:00). Um slot só existe se a
+    consulta inteira couber dentro de uma janela.
+    """
+
+    # Horários de funcionamento padrão
     HORA_INICIO_MANHA = (8, 0)  # 08:00
     HORA_FIM_MANHA = (12, 0)    # 12:00
     HORA_INICIO_TARDE = (14, 0)  # 14:00
     HORA_FIM_TARDE = (17, 0)     # 17:00
 
+    JANELAS_PADRAO = [
+        (HORA_INICIO_MANHA, HORA_FIM_MANHA),
+        (HORA_INICIO_TARDE, HORA_FIM_TARDE),
+    ]
+
     # Duração e intervalos
     DURACAO_CONSULTA_MIN = 50
     INTERVALO_DESCANSO_MIN = 10
 
+    # Janelas por dia da semana (0=segunda ... 6=domingo); dia ausente ou lista vazia = sem atendimento
+    # Ex.: sábado só de manhã -> 5: [((8, 0), (12, 0))]
+    JANELAS_POR_DIA = {
+        0: JANELAS_PADRAO,
+        1: JANELAS_PADRAO,
+        2: JANELAS_PADRAO,
+        3: JANELAS_PADRAO,
+        4: JANELAS_PADRAO,
+    }
+
+    # Exceções por data ('AAAA-MM-DD'), valem no lugar do dia da semana; lista vazia = fechado
+    # Ex.: feriado -> '2026-12-25': [] ; expediente reduzido -> '2026-12-24': [((8, 0), (12, 0))]
+    EXCECOES_POR_DATA = {}
+
     # Dias de trabalho (0=segunda, 4=sexta)
-    DIAS_UTEIS = {0, 1, 2, 3, 4}
+    DIAS_UTEIS = {dia for dia, janelas in JANELAS_POR_DIA.items() if janelas}
 
     # Quantos dias no futuro gerar slots
     NUM_DIAS_GERAR_SLOTS = 30
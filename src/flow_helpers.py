@@ -239,42 +239,14 @@ def get_future_appointments(usuario_id: str = None) -> List[Tuple[datetime, List
     Returns:
         Lista ordenada de tuplas (datetime, linha_sheet)
     """
-    from src.agenda_service import obter_todos_agenda_cached
-    from src.constants import SheetColumns
+    from src.agenda_service import obter_agenda_futura_cached
 
-    todos = obter_todos_agenda_cached()[1:]  # Ignora cabeçalho
+    snapshot = obter_agenda_futura_cached()  # Snapshot colunar da Agenda, de hoje em diante
     agora = agora_brasil()  # Usa horário do Brasil (GMT-3)
-    agendamentos = []
-
-    for linha in todos:
-        # Validação básica
-        if len(linha) < 6:
-            continue
-
-        # Apenas agendamentos confirmados
-        status = linha[SheetColumns.AGENDA_STATUS].strip().upper()
-        if status != SheetColumns.STATUS_AGENDADO:
-            continue
-
-        # Parse data e hora
-        data_str = linha[SheetColumns.AGENDA_DATA].strip()
-        hora_str = linha[SheetColumns.AGENDA_HORA].strip()
-        try:
-            dt = datetime.strptime(f"{data_str} {hora_str}", "%d/%m/%Y %H:%M")
-        except Exception:
-            continue
-
-        # Apenas futuros
-        if dt < agora:
-            continue
-
-        # Filtro opcional por usuário
-        if usuario_id:
-            telefone = linha[SheetColumns.AGENDA_TELEFONE].strip()
-            if telefone != usuario_id:
-                continue
-
-        agendamentos.append((dt, linha))
+
+    # Apenas agendamentos confirmados, futuros e (opcionalmente) do usuário
+    linhas = snapshot.filtrar(status='AGENDADO', telefone=usuario_id or None, a_partir=agora)
+    agendamentos = [(snapshot.datetime_da_linha(r), snapshot.linha(r)) for r in linhas.tolist()]
 
     # Ordenar por data/hora
     agendamentos.sort()
@@ -324,7 +296,9 @@ def build_main_menu() -> Tuple[str, List[Tuple[str, str, str]]]:
         Tupla (texto, items) onde items = [(id, title, description), ...]
     """
     from src import messages as MSG
-    from src.constants import BUTTON_ID_AGENDAR, BUTTON_ID_REAGENDAR, BUTTON_ID_CANCELAR, BUTTON_ID_VALORES
+    from src.constants import (
+        BUTTON_ID_AGENDAR, BUTTON_ID_REAGENDAR, BUTTON_ID_CANCELAR, BUTTON_ID_VALORES, BUTTON_ID_PRIMEIRO_HORARIO,
+    )
 
     texto = f"{MSG.MENU_PROMPT}\n{MSG.LIST_BODY_TEXT}"
     items = [
@@ -332,6 +306,7 @@ def build_main_menu() -> Tuple[str, List[Tuple[str, str, str]]]:
         (BUTTON_ID_REAGENDAR, MSG.MENU_REAGENDAR, ""),
         (BUTTON_ID_CANCELAR, MSG.MENU_CANCELAR, ""),
         (BUTTON_ID_VALORES, MSG.MENU_VALORES, ""),
+        (BUTTON_ID_PRIMEIRO_HORARIO, MSG.MENU_PRIMEIRO_HORARIO, ""),
     ]
     return texto, items
 
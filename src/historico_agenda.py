@@ -0,0 +1,151 @@
+"""
+historico_agenda.py - Separação quente/fria da aba Agenda.
+
+A aba Agenda só cresce: a criação diária de slots acrescenta um dia por noite e
+nada remove as datas passadas, então toda leitura completa da aba fica mais lenta
+e mais cara em cota com o tempo. O arquivamento diário (só no processo líder)
+move as linhas com data anterior a hoje - AGENDA_RETENTION_DAYS para a aba
+'Historico' ou para um arquivo CSV local, numa única escrita em lote, e remove
+essas linhas da Agenda numa única requisição (remover_linhas_em_lote). Slots
+DISPONIVEL que já passaram não têm informação nenhuma e são só descartados.
+
+As leituras do dia a dia continuam na Agenda (agora só com a janela recente e os
+slots futuros); consultas ao passado usam consultar_historico().
+
+Uso:
+    python -m src.historico_agenda                 # arquiva agora (mesma regra do job diário)
+    python -m src.historico_agenda --telefone 5511999990000   # histórico de um telefone
+
+Configuração via .env:
+- AGENDA_ARCHIVE_ENABLED=true/false (padrão: false; o job diário só é agendado se true)
+- AGENDA_RETENTION_DAYS=30 (linhas com data anterior a hoje - N dias saem da Agenda)
+- AGENDA_ARCHIVE_TARGET=sheet|file (padrão: sheet = aba Historico; file = CSV local)
+- AGENDA_ARCHIVE_FILE=logs/agenda_historico.csv
+- AGENDA_ARCHIVE_HOUR=3 (hora do job diário)
+- AGENDA_ARCHIVE_DROP_FREE=true/false (padrão: true; false = arquiva também slots livres passados)
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+from datetime import date, timedelta
+
+from src import agenda_service
+from src import metrics
+from src.agenda_service import AgendaSnapshot
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('AGENDA_ARCHIVE_ENABLED', 'false').lower() == 'true'
+RETENTION_DAYS = int(os.getenv('AGENDA_RETENTION_DAYS', '30'))
+TARGET = os.getenv('AGENDA_ARCHIVE_TARGET', 'sheet').lower()          # sheet | file
+ARCHIVE_FILE = os.getenv('AGENDA_ARCHIVE_FILE', os.path.join('logs', 'agenda_historico.csv'))
+ARCHIVE_HOUR = int(os.getenv('AGENDA_ARCHIVE_HOUR', '3'))
+DROP_FREE = os.getenv('AGENDA_ARCHIVE_DROP_FREE', 'true').lower() == 'true'
+
+CABECALHO = ["dia_semana", "data", "hora", "nome_paciente", "telefone", "status", "origem", "observacoes"]
+
+
+def arquivar_linhas_antigas(hoje: date = None, retencao_dias: int = None, destino: str = None) -> dict:
+    """
+    Move as linhas da Agenda com data anterior a `hoje - retencao_dias` para o
+    histórico (`destino`: 'sheet' ou 'file'). Retorna um resumo:
+      {"limite", "destino", "arquivadas", "descartadas", "removidas"}
+
+    A ordem é gravar no histórico e só depois remover da Agenda: se a remoção
+    falhar, as linhas ficam nos dois lugares (nunca se perdem) e o erro é logado.
+    """
+    hoje = hoje or agenda_service.agora_brasil().date()
+    retencao_dias = RETENTION_DAYS if retencao_dias is None else retencao_dias
+    destino = destino or TARGET
+    limite = hoje - timedelta(days=retencao_dias)
+    resumo = {"limite": limite.strftime('%d/%m/%Y'), "destino": destino, "arquivadas": 0, "descartadas": 0,
+              "removidas": 0}
+
+    ws = agenda_service.obter_worksheet_agenda()
+    with agenda_service._lock_linhas_agenda.exclusiva():  # nenhum registro/cancelamento entre a leitura e a remoção
+        valores = ws.get_all_values()
+        snapshot = AgendaSnapshot.de_valores(valores)
+        antigas = snapshot.filtrar(antes_de=limite).tolist()
+        if not antigas:
+            logger.info('[historico] Nenhuma linha anterior a %s na Agenda', resumo["limite"])
+            return resumo
+
+        livres = set(snapshot.filtrar(status='DISPONIVEL', antes_de=limite).tolist()) if DROP_FREE else set()
+        linhas = [valores[r + 1] for r in antigas if r not in livres]   # +1: cabeçalho
+        if linhas:
+            _gravar_historico(linhas, destino)
+        resumo["arquivadas"], resumo["descartadas"] = len(linhas), len(antigas) - len(linhas)
+
+        resumo["removidas"] = agenda_service.remover_linhas_em_lote(ws, [r + 2 for r in antigas])  # 1-based
+        agenda_service.invalidar_cache_agenda()
+        agenda_service.invalidar_indice_linhas()    # as linhas restantes subiram: faixas antigas não valem mais
+
+    if resumo["removidas"] != len(antigas):
+        logger.error('[historico] %d linha(s) arquivada(s), mas só %d removida(s) da Agenda; '
+                     'o próximo arquivamento vai repeti-las no histórico', len(antigas), resumo["removidas"])
+    metrics.AGENDA_ARQUIVADAS.inc(len(linhas), destino=destino)
+    logger.info('[historico] Agenda: %d linha(s) arquivada(s) em %s e %d slot(s) livre(s) descartado(s) (antes de %s)',
+                resumo["arquivadas"], destino, resumo["descartadas"], resumo["limite"])
+    return resumo
+
+
+def _gravar_historico(linhas: list, destino: str):
+    """Uma única escrita com todas as linhas: append_rows na aba Historico ou append no CSV."""
+    if destino == 'file':
+        novo = not os.path.exists(ARCHIVE_FILE) or os.path.getsize(ARCHIVE_FILE) == 0
+        os.makedirs(os.path.dirname(ARCHIVE_FILE) or '.', exist_ok=True)
+        with open(ARCHIVE_FILE, 'a', newline='', encoding='utf-8') as f:
+            escritor = csv.writer(f)
+            if novo:
+                escritor.writerow(CABECALHO)
+            escritor.writerows(linhas)
+    elif destino == 'sheet':
+        agenda_service.obter_worksheet_historico().append_rows(linhas, value_input_option='RAW')
+    else:
+        raise ValueError(f"AGENDA_ARCHIVE_TARGET inválido: {destino!r} (use sheet ou file)")
+
+
+def _ler_historico(destino: str) -> list:
+    if destino == 'file':
+        if not os.path.exists(ARCHIVE_FILE):
+            return []
+        with open(ARCHIVE_FILE, newline='', encoding='utf-8') as f:
+            return list(csv.reader(f))
+    return agenda_service.obter_worksheet_historico().get_all_values()
+
+
+def consultar_historico(telefone: str = None, data_inicio: date = None, data_fim: date = None,
+                        status: str = None, destino: str = None) -> list:
+    """
+    Linhas arquivadas (fora da aba Agenda), como dicionários no formato do
+    get_all_records, em ordem cronológica. Filtros opcionais: telefone, status e
+    intervalo de datas [data_inicio, data_fim].
+    """
+    snapshot = AgendaSnapshot.de_valores(_ler_historico(destino or TARGET))
+    linhas = snapshot.filtrar(
+        status=status,
+        telefone=telefone,
+        desde=data_inicio,
+        antes_de=data_fim + timedelta(days=1) if data_fim else None,
+    ).tolist()
+    linhas.sort(key=lambda r: (int(snapshot.ordinais[r]), int(snapshot.minutos[r])))
+    return [snapshot.registro(r) for r in linhas]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivamento e consulta do histórico da Agenda")
+    parser.add_argument('--telefone', help="lista o histórico de um telefone em vez de arquivar")
+    parser.add_argument('--retencao', type=int, default=None, help="dias mantidos na Agenda (padrão: .env)")
+    args = parser.parse_args()
+    if args.telefone:
+        resultado = consultar_historico(telefone=args.telefone)
+    else:
+        resultado = arquivar_linhas_antigas(retencao_dias=args.retencao)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
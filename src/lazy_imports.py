@@ -0,0 +1,62 @@
+"""
+lazy_imports.py - Importação tardia (lazy) de módulos pesados ou opcionais.
+
+O módulo real só é importado no primeiro acesso a um atributo, tirando do
+startup o custo de bibliotecas que nem toda requisição usa (gspread/google-auth,
+pyngrok, numpy/pandas para análises, etc.).
+
+Uso:
+    from src.lazy_imports import lazy_import
+    gspread = lazy_import("gspread")   # nada é importado aqui
+
+    gspread.authorize(creds)           # importa gspread neste momento
+"""
+
+import importlib
+import sys
+import threading
+import types
+
+_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """Proxy de módulo que importa o módulo real no primeiro acesso a atributo."""
+
+    def __init__(self, nome: str):
+        super().__init__(nome)
+        self._lazy_nome = nome
+        self._lazy_modulo = None
+
+    def _carregar(self):
+        if self._lazy_modulo is None:
+            with _lock:
+                if self._lazy_modulo is None:
+                    self._lazy_modulo = importlib.import_module(self._lazy_nome)
+        return self._lazy_modulo
+
+    def __getattr__(self, atributo):
+        # só é chamado para atributos que não existem no proxy
+        return getattr(self._carregar(), atributo)
+
+    def __dir__(self):
+        return dir(self._carregar())
+
+    def __repr__(self):
+        estado = "carregado" if self._lazy_modulo is not None else "não carregado"
+        return f"<lazy module '{self._lazy_nome}' ({estado})>"
+
+
+def lazy_import(nome: str):
+    """Retorna o módulo se já estiver importado; senão, um proxy que o importa no primeiro uso."""
+    modulo = sys.modules.get(nome)
+    if modulo is not None:
+        return modulo
+    return LazyModule(nome)
+
+
+def carregado(modulo) -> bool:
+    """True se `modulo` é um módulo real ou um proxy que já foi carregado."""
+    if isinstance(modulo, LazyModule):
+        return modulo._lazy_modulo is not None
+    return True
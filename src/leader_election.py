@@ -0,0 +1,268 @@
+"""
+leader_election.py - Eleição de líder por lease para jobs singleton.
+
+Todos os processos atendem webhooks, mas apenas o LÍDER executa os jobs diários
+e de manutenção (resumo do dono, criação de slots, reidratação de lembretes).
+
+A liderança é um lease gravado em arquivo (LEADER_LEASE_FILE): quem o detém
+precisa renová-lo antes de LEADER_LEASE_TTL segundos; se o líder morrer, o lease
+expira e outro processo assume (failover). As escritas no lease são protegidas
+por uma trava do sistema operacional no arquivo LEADER_LEASE_FILE + '.lock'
+(fcntl.flock; msvcrt no Windows), que o SO solta sozinho se o processo morrer.
+
+Para vários hosts, aponte LEADER_LEASE_FILE para um volume compartilhado.
+
+Configuração via .env:
+- LEADER_ELECTION_ENABLED=true/false (padrão: true; false = processo sempre é líder)
+- LEADER_LEASE_FILE=logs/leader.lease
+- LEADER_LEASE_TTL=60 (segundos)
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('LEADER_ELECTION_ENABLED', 'true').lower() == 'true'
+LEASE_FILE = os.getenv('LEADER_LEASE_FILE', os.path.join('logs', 'leader.lease'))
+LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', '60'))
+
+# Identidade única deste processo (host:pid:aleatório)
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_lider = False
+_lease_expira_em = 0.0
+_callbacks = []
+_thread = None
+_stop_event = threading.Event()
+
+
+# -------------------------------------------------------
+# Acesso ao arquivo de lease (sempre sob a trava)
+# -------------------------------------------------------
+
+def _caminho_trava():
+    # Arquivo separado e permanente: o lease é trocado via os.replace (novo inode),
+    # então uma trava no próprio lease não valeria para quem o abriu depois da troca.
+    return LEASE_FILE + '.lock'
+
+
+def _travar(fd) -> bool:
+    """Uma tentativa, sem bloquear, de travar o arquivo aberto em `fd` com exclusividade."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _adquirir_trava(timeout: float = 5.0):
+    """
+    Trava exclusiva do lease, entre processos e entre threads. Retorna o descritor
+    a passar para _liberar_trava(), ou None se não conseguir em `timeout` segundos.
+    Não há trava órfã: se o processo morrer segurando-a, o SO a solta.
+    """
+    fd = os.open(_caminho_trava(), os.O_CREAT | os.O_RDWR)
+    limite = time.time() + timeout
+    while not _travar(fd):
+        if time.time() >= limite:
+            os.close(fd)
+            return None
+        time.sleep(0.05)
+    return fd
+
+
+def _liberar_trava(fd):
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _ler_lease() -> dict:
+    try:
+        with open(LEASE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _gravar_lease(dados: dict):
+    tmp = f"{LEASE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(tmp, LEASE_FILE)  # troca atômica
+
+
+def _tentar_lease() -> bool:
+    """
+    Uma tentativa de adquirir ou renovar o lease. Retorna True se este processo é o líder.
+    Se a tentativa não chegar a ler o lease (trava ocupada, erro de I/O), nada mudou:
+    o estado atual vale enquanto o lease que já temos não expirar.
+    """
+    global _lease_expira_em
+    trava = _adquirir_trava()
+    if trava is None:
+        logger.warning('[leader] Não foi possível obter a trava do lease')
+        return _lider and time.time() < _lease_expira_em
+    try:
+        dados = _ler_lease()
+        agora = time.time()
+        titular = dados.get('holder')
+        if titular and titular != PROCESS_ID and dados.get('expires_at', 0) > agora:
+            return False  # outro processo detém um lease válido
+        dados.update({
+            'holder': PROCESS_ID,
+            'expires_at': agora + LEASE_TTL,
+            'renewed_at': agora,
+        })
+        if titular != PROCESS_ID:
+            dados['acquired_at'] = agora
+        _gravar_lease(dados)
+        _lease_expira_em = agora + LEASE_TTL
+        return True
+    except Exception:
+        logger.exception('[leader] Erro ao adquirir/renovar lease')
+        return _lider and time.time() < _lease_expira_em
+    finally:
+        _liberar_trava(trava)
+
+
+def _atualizar_lideranca(disparar_callbacks: bool = True):
+    global _lider
+    era_lider = _lider
+    _lider = _tentar_lease()
+    if _lider and not era_lider:
+        logger.info('[leader] Este processo assumiu a liderança (%s)', PROCESS_ID)
+        if disparar_callbacks:
+            for callback in list(_callbacks):
+                try:
+                    callback()
+                except Exception:
+                    logger.exception('[leader] Erro em callback de liderança')
+    elif era_lider and not _lider:
+        logger.warning('[leader] Liderança perdida (%s)', PROCESS_ID)
+
+
+def _loop_renovacao():
+    intervalo = max(1.0, LEASE_TTL / 3)
+    while not _stop_event.wait(intervalo):
+        _atualizar_lideranca()
+
+
+# -------------------------------------------------------
+# API pública
+# -------------------------------------------------------
+
+def iniciar():
+    """
+    Faz a primeira tentativa de liderança (síncrona) e inicia a thread de renovação.
+    Callbacks de ao_assumir_lideranca() NÃO são disparados nesta primeira tentativa,
+    só quando a liderança é assumida depois (failover).
+    """
+    global _thread
+    if not ENABLED:
+        logger.info('[leader] Eleição desabilitada; este processo executa os jobs singleton')
+        return
+    if _thread and _thread.is_alive():
+        return
+    pasta = os.path.dirname(LEASE_FILE)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    _stop_event.clear()
+    _atualizar_lideranca(disparar_callbacks=False)
+    if not _lider:
+        logger.info('[leader] Outro processo é o líder; este processo fica em espera')
+    _thread = threading.Thread(target=_loop_renovacao, name='leader-lease', daemon=True)
+    _thread.start()
+
+
+def parar(liberar: bool = True):
+    """Para a renovação; se `liberar`, expira o lease imediatamente para o failover ser rápido."""
+    global _lider
+    _stop_event.set()
+    if not ENABLED or not _lider:
+        return
+    _lider = False
+    trava = _adquirir_trava() if liberar else None
+    if trava is not None:
+        try:
+            dados = _ler_lease()
+            if dados.get('holder') == PROCESS_ID:
+                dados['expires_at'] = 0
+                _gravar_lease(dados)
+                logger.info('[leader] Lease liberado')
+        except Exception:
+            logger.exception('[leader] Erro ao liberar lease')
+        finally:
+            _liberar_trava(trava)
+
+
+def sou_lider() -> bool:
+    """True se este processo detém um lease ainda válido (ou se a eleição está desabilitada)."""
+    if not ENABLED:
+        return True
+    return _lider and time.time() < _lease_expira_em
+
+
+def ao_assumir_lideranca(callback):
+    """Registra uma função chamada (na thread de renovação) quando este processo assume a liderança."""
+    _callbacks.append(callback)
+
+
+def ja_executou(tarefa: str, chave: str) -> bool:
+    """True se algum processo já registrou a execução de `tarefa` para `chave` (ex.: data de hoje)."""
+    if not ENABLED:
+        return False
+    return _ler_lease().get('execucoes', {}).get(tarefa) == chave
+
+
+def registrar_execucao(tarefa: str, chave: str):
+    """Registra no arquivo de lease que `tarefa` já rodou para `chave`, visível para todos os processos."""
+    if not ENABLED:
+        return
+    trava = _adquirir_trava()
+    if trava is None:
+        logger.warning('[leader] Não foi possível registrar execução de %s', tarefa)
+        return
+    try:
+        dados = _ler_lease()
+        dados.setdefault('execucoes', {})[tarefa] = chave
+        _gravar_lease(dados)
+    except Exception:
+        logger.exception('[leader] Erro ao registrar execução de %s', tarefa)
+    finally:
+        _liberar_trava(trava)
+
+
+def status() -> dict:
+    """Estado da eleição para diagnóstico."""
+    dados = _ler_lease() if ENABLED else {}
+    return {
+        'habilitada': ENABLED,
+        'processo': PROCESS_ID,
+        'lider': sou_lider(),
+        'titular': dados.get('holder'),
+        'expira_em': dados.get('expires_at'),
+    }
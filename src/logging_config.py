@@ -5,13 +5,45 @@ Suporta:
 - Níveis de log configuráveis via variável de ambiente LOG_LEVEL
 - Output para console (stdout) e arquivo (com rotação automática)
 - Formato customizado com timestamp, nível, módulo e mensagem
+- Modo assíncrono (LOG_ASYNC, padrão ligado): o logger raiz só enfileira os
+  registros; console e arquivo rodam numa thread dedicada (QueueListener), então
+  a requisição não faz I/O de arquivo nem checa rotação. A fila é limitada
+  (LOG_QUEUE_SIZE): cheia, registros abaixo de WARNING são descartados e
+  WARNING+ esperam até LOG_QUEUE_TIMEOUT segundos; o total descartado é logado
+  quando a fila volta a ter espaço.
+- Formato JSON (LOG_FORMAT=json): uma linha JSON por registro, com os campos
+  estruturados passados por `log_evento` (telefone_hash, estado, consulta,
+  duracao_ms, ...) e o ID de correlação do tracing.
+
+- Limite por ponto de chamada (LOG_RATE_LIMIT, padrão ligado): cada linha de
+  código que loga (logger + arquivo + linha) tem LOG_RATE_LIMIT_N registros por
+  janela de LOG_RATE_LIMIT_WINDOW segundos; acima disso só 1 a cada
+  1/LOG_SAMPLE_RATE passa. Ao virar a janela, o total suprimido em cada ponto
+  vira uma linha "[logging] ... suprimido(s)". Registros acima de
+  LOG_RATE_LIMIT_LEVEL (padrão: ERROR, ou seja, só CRITICAL) nunca são limitados.
+  Limites por logger: LOG_RATE_LIMIT_LOGGERS=src.whatsapp_webhook=50/0.05,src.scheduler=10/0
+
+Eventos de negócio (lembretes, notificação ao dono) usam `log_evento`: a mensagem
+é formatada só se o nível estiver habilitado e os dados vão em campos, não no texto.
+Com LOG_PRINT_COMPAT=true esses eventos também saem no stdout via print(), como
+antes (formato com emoji).
 """
 
+import atexit
+import copy
+import hashlib
+import json
 import logging
 import logging.handlers
 import os
+import queue
+import threading
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 
+from src import tracing
+
 # Carregar variáveis do arquivo .env
 load_dotenv()
 
@@ -23,6 +55,263 @@ VALID_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
 if LOG_LEVEL not in VALID_LEVELS:
     LOG_LEVEL = 'INFO'
 
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_QUEUE_TIMEOUT = float(os.getenv('LOG_QUEUE_TIMEOUT', '1.0'))
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'texto').lower()           # texto | json
+LOG_PRINT_COMPAT = os.getenv('LOG_PRINT_COMPAT', 'false').lower() == 'true'
+LOG_HASH_SALT = os.getenv('LOG_HASH_SALT', '')
+LOG_RATE_LIMIT = os.getenv('LOG_RATE_LIMIT', 'true').lower() == 'true'
+LOG_RATE_LIMIT_N = int(os.getenv('LOG_RATE_LIMIT_N', '20'))
+LOG_RATE_LIMIT_WINDOW = float(os.getenv('LOG_RATE_LIMIT_WINDOW', '60'))
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+LOG_RATE_LIMIT_LEVEL = os.getenv('LOG_RATE_LIMIT_LEVEL', 'ERROR').upper()
+LOG_RATE_LIMIT_LOGGERS = os.getenv('LOG_RATE_LIMIT_LOGGERS', '')
+
+_listener = None                                       # QueueListener ativo (modo assíncrono)
+_FORMATADOR_EXC = logging.Formatter()                  # só para formatException em FilaLimitadaHandler.prepare
+
+
+class FilaLimitadaHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler com fila limitada e política de descarte: com a fila cheia,
+    registros abaixo de WARNING são descartados na hora e WARNING+ esperam até
+    `timeout` segundos. Quando volta a haver espaço, enfileira um aviso com o
+    total descartado.
+    """
+
+    def __init__(self, fila: queue.Queue, timeout: float = 1.0):
+        super().__init__(fila)
+        self.timeout = timeout
+        self.descartados = 0
+        self._lock_descartes = threading.Lock()
+
+    def prepare(self, record):
+        """
+        Copia o registro com a mensagem já interpolada e o traceback em `exc_text`,
+        sem juntá-lo a `msg` (o `prepare` padrão formata tudo numa string só): assim o
+        formatter do listener decide o layout, e o JSON mantém o campo 'exc'.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _FORMATADOR_EXC.formatException(record.exc_info)
+            record.exc_info = None                     # traceback não é serializável entre threads
+        return record
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=self.timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_descartes:
+                self.descartados += 1
+            return
+        if self.descartados:
+            with self._lock_descartes:
+                descartados, self.descartados = self.descartados, 0
+            aviso = logging.LogRecord('src.logging_config', logging.WARNING, __file__, 0,
+                                      '[logging] %d registro(s) de log descartado(s): fila cheia', (descartados,), None)
+            try:
+                self.queue.put_nowait(self.prepare(aviso))
+            except queue.Full:
+                with self._lock_descartes:
+                    self.descartados += descartados
+
+
+# -------------------------------------------------------
+# Limite e amostragem por ponto de chamada
+# -------------------------------------------------------
+
+def _ler_limites_por_logger(texto: str) -> dict:
+    """'src.a=50/0.05,src.b=10/0' -> {'src.a': (50, 0.05), 'src.b': (10, 0.0)}"""
+    limites = {}
+    for item in filter(None, (p.strip() for p in texto.split(','))):
+        try:
+            nome, valor = item.split('=', 1)
+            n, _, taxa = valor.partition('/')
+            limites[nome.strip()] = (int(n), float(taxa) if taxa else LOG_SAMPLE_RATE)
+        except ValueError:
+            continue                                   # item malformado: ignora em vez de derrubar o logging
+    return limites
+
+
+class LimiteAmostragemFilter(logging.Filter):
+    """
+    Filtro de handler que limita cada ponto de chamada a `por_janela` registros por
+    janela de `janela` segundos e, acima disso, deixa passar 1 a cada 1/`taxa`.
+    Ao fechar a janela de um ponto com registros suprimidos, loga um resumo.
+
+    A decisão fica gravada no registro, então a mesma instância pode estar em
+    vários handlers (modo síncrono) sem contar o registro duas vezes.
+    """
+
+    def __init__(self, por_janela: int = 20, janela: float = 60.0, taxa: float = 0.01,
+                 nivel_maximo: int = logging.ERROR, por_logger: dict = None, relogio=time.monotonic):
+        super().__init__()
+        self.por_janela = por_janela
+        self.janela = janela
+        self.intervalo_amostra = round(1 / taxa) if taxa > 0 else 0
+        self.nivel_maximo = nivel_maximo
+        self.por_logger = {nome: (n, round(1 / t) if t > 0 else 0) for nome, (n, t) in (por_logger or {}).items()}
+        self.relogio = relogio
+        self._pontos = {}                              # (logger, arquivo, linha) -> [inicio_janela, total, suprimidos]
+        self._proxima_varredura = relogio() + janela
+        self._lock = threading.Lock()
+
+    def _limites(self, nome: str):
+        while nome:
+            if nome in self.por_logger:
+                return self.por_logger[nome]
+            nome = nome.rpartition('.')[0]
+        return self.por_janela, self.intervalo_amostra
+
+    def filter(self, record) -> bool:
+        decisao = getattr(record, '_amostragem', None)
+        if decisao is not None:
+            return decisao
+        if record.levelno > self.nivel_maximo or getattr(record, '_resumo_amostragem', False):
+            record._amostragem = True
+            return True
+
+        agora = self.relogio()
+        chave = (record.name, record.pathname, record.lineno)
+        resumos = []
+        with self._lock:
+            if agora >= self._proxima_varredura:
+                resumos = self._fechar_janelas(agora)
+                self._proxima_varredura = agora + self.janela
+            ponto = self._pontos.get(chave)
+            if ponto is None or agora - ponto[0] >= self.janela:
+                if ponto is not None and ponto[2]:
+                    resumos.append((chave, ponto[2]))
+                ponto = self._pontos[chave] = [agora, 0, 0]
+            ponto[1] += 1
+            limite, intervalo = self._limites(record.name)
+            excedente = ponto[1] - limite
+            passa = excedente <= 0 or (intervalo > 0 and excedente % intervalo == 0)
+            if not passa:
+                ponto[2] += 1
+        for (nome, arquivo, linha), suprimidos in resumos:
+            _logger_amostragem.warning('[logging] %d registro(s) suprimido(s) em %s (%s:%d) na última janela de %.0fs',
+                                       suprimidos, nome, os.path.basename(arquivo), linha, self.janela,
+                                       extra={'_resumo_amostragem': True})
+        record._amostragem = passa
+        return passa
+
+    def _fechar_janelas(self, agora: float) -> list:
+        """Pontos com janela vencida: devolve os resumos pendentes e esquece os pontos."""
+        resumos = []
+        for chave, ponto in list(self._pontos.items()):
+            if agora - ponto[0] >= self.janela:
+                if ponto[2]:
+                    resumos.append((chave, ponto[2]))
+                del self._pontos[chave]
+        return resumos
+
+
+_logger_amostragem = logging.getLogger('src.logging_config')
+
+
+class json_preguicoso:
+    """Argumento de log que só serializa o objeto se o registro for de fato formatado."""
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(self.obj, ensure_ascii=False, default=str)
+
+
+# -------------------------------------------------------
+# Eventos estruturados
+# -------------------------------------------------------
+
+_EMOJI_NIVEL = {logging.DEBUG: '🟡', logging.INFO: '🟡', logging.WARNING: '🔴', logging.ERROR: '🔴',
+                logging.CRITICAL: '🔴'}
+
+
+def hash_telefone(telefone) -> str:
+    """Hash curto e estável do telefone (com LOG_HASH_SALT), para correlacionar sem expor o número."""
+    if not telefone:
+        return None
+    return hashlib.sha256(f'{LOG_HASH_SALT}{telefone}'.encode('utf-8')).hexdigest()[:12]
+
+
+def log_evento(log: logging.Logger, nivel: int, mensagem: str, *args, telefone=None, estado=None,
+               consulta=None, duracao_ms=None, exc_info=False, sucesso=False, **campos):
+    """
+    Registra um evento com campos estruturados.
+
+    - `mensagem`/`args` seguem o logging (formatação preguiçosa, só se o nível estiver habilitado)
+    - `telefone` vira `telefone_hash`; `consulta` (datetime) vai em ISO
+    - demais kwargs viram campos do registro (ex.: linha=12, tipo='cancelamento')
+    - `sucesso` só muda o emoji da saída de compatibilidade (LOG_PRINT_COMPAT)
+    """
+    if not log.isEnabledFor(nivel):
+        return
+    if telefone is not None:
+        campos['telefone_hash'] = hash_telefone(telefone)
+    if estado is not None:
+        campos['estado'] = estado
+    if consulta is not None:
+        campos['consulta'] = consulta.isoformat() if hasattr(consulta, 'isoformat') else str(consulta)
+    if duracao_ms is not None:
+        campos['duracao_ms'] = round(duracao_ms, 1)
+    correlacao = tracing.correlacao_atual()
+    if correlacao:
+        campos['correlacao'] = correlacao
+    log.log(nivel, mensagem, *args, exc_info=exc_info, extra={'campos': campos}, stacklevel=2)
+    if LOG_PRINT_COMPAT:
+        texto = mensagem % args if args else mensagem
+        print(f"{'✅' if sucesso else _EMOJI_NIVEL.get(nivel, '🟡')} {texto}", flush=True)
+
+
+class TextoFormatter(logging.Formatter):
+    """Formato texto do projeto; campos de `log_evento` vão ao fim da linha (chave=valor)."""
+
+    def format(self, record):
+        texto = super().format(record)
+        campos = getattr(record, 'campos', None)
+        if campos:
+            texto += ' | ' + ' '.join(f'{k}={v}' for k, v in campos.items())
+        return texto
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro (LOG_FORMAT=json)."""
+
+    def format(self, record):
+        dados = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        campos = getattr(record, 'campos', None)
+        if campos:
+            dados.update(campos)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dados['exc'] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+def _parar_listener():
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()                           # esvazia a fila antes de encerrar
+        except queue.Full:
+            pass                                       # fila cheia até no encerramento: a thread é daemon
+        _listener = None
+
 
 def setup_logging():
     """
@@ -31,29 +320,36 @@ def setup_logging():
     Configuração:
     - Console: todos os logs de todas as módulos
     - Arquivo: logs/app.log com rotação automática (10MB, 5 backups)
-    - Formato: YYYY-MM-DD HH:MM:SS [LEVEL] module - message
+    - Formato: YYYY-MM-DD HH:MM:SS [LEVEL] module - message (ou JSON com LOG_FORMAT=json)
     - Nível: configurável via LOG_LEVEL no .env
+    - LOG_ASYNC=true: handlers na thread do QueueListener (fila limitada, ver docstring do módulo)
     """
+    global _listener
 
     # Criar logger raiz
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, LOG_LEVEL))
 
     # Remover handlers existentes para evitar duplicação
+    _parar_listener()
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
+    handlers = []
 
     # Formato customizado para os logs
-    formatter = logging.Formatter(
-        fmt='%(asctime)s [%(levelname)-8s] %(name)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = TextoFormatter(
+            fmt='%(asctime)s [%(levelname)-8s] %(name)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
 
     # Handler para console (stdout/stderr)
     console_handler = logging.StreamHandler()
     console_handler.setLevel(getattr(logging, LOG_LEVEL))
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # Handler para arquivo com rotação automática
     try:
@@ -70,15 +366,42 @@ def setup_logging():
         )
         file_handler.setLevel(getattr(logging, LOG_LEVEL))
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
 
     except Exception as e:
-        root_logger.warning(f"Não foi possível configurar logging em arquivo: {e}")
+        erro_arquivo = e
+    else:
+        erro_arquivo = None
+
+    if LOG_RATE_LIMIT:
+        # Limite por ponto de chamada antes de enfileirar/formatar (ver docstring do módulo)
+        limite = LimiteAmostragemFilter(LOG_RATE_LIMIT_N, LOG_RATE_LIMIT_WINDOW, LOG_SAMPLE_RATE,
+                                        getattr(logging, LOG_RATE_LIMIT_LEVEL, logging.ERROR),
+                                        _ler_limites_por_logger(LOG_RATE_LIMIT_LOGGERS))
+    else:
+        limite = None
+
+    if LOG_ASYNC:
+        # Requisições só enfileiram; console e arquivo rodam na thread do listener
+        fila = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler_fila = FilaLimitadaHandler(fila, LOG_QUEUE_TIMEOUT)
+        if limite is not None:
+            handler_fila.addFilter(limite)
+        root_logger.addHandler(handler_fila)
+        _listener = logging.handlers.QueueListener(fila, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            if limite is not None:
+                handler.addFilter(limite)
+            root_logger.addHandler(handler)
+
+    if erro_arquivo is not None:
+        root_logger.warning(f"Não foi possível configurar logging em arquivo: {erro_arquivo}")
 
     # Log inicial
-    root_logger.info(f"Sistema de logging inicializado - Nível: {LOG_LEVEL}")
+    root_logger.info(f"Sistema de logging inicializado - Nível: {LOG_LEVEL}"
+                     + (f" (assíncrono, fila {LOG_QUEUE_SIZE})" if LOG_ASYNC else ""))
 
 
-# Configurar logging automaticamente ao importar este módulo
-if __name__ != "__main__":
-    setup_logging()
+atexit.register(_parar_listener)  # grava o que ainda estiver na fila ao encerrar o processo
@@ -13,6 +13,14 @@ def main():
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', 8000))
 
+    # Modo de perfil de startup: relatório do custo de import por módulo
+    if os.getenv('STARTUP_PROFILE', 'false').lower() in ('1', 'true'):
+        from src.profiling import perfil_imports, formatar_relatorio_imports
+        try:
+            print(formatar_relatorio_imports(perfil_imports('src.whatsapp_webhook')))
+        except Exception as e:
+            print(f"[startup-profile] Falha ao gerar perfil de import: {e}")
+
     # Executar uvicorn
     subprocess.run([
         sys.executable,
@@ -18,6 +18,7 @@ MENU_REAGENDAR = "Reagendar"
 MENU_CANCELAR = "Cancelar Agendamento"  # Renomeado para evitar confusão com "Cancelar operação"
 MENU_SAIR = "Sair"
 MENU_VALORES = "Valores e Pagamento"
+MENU_PRIMEIRO_HORARIO = "Primeiro horário livre"
 MENU_LIST_TITLE = "Outras opções"
 
 # Semanas
@@ -73,6 +74,7 @@ Se precisar reagendar, estou à disposição!"""
 # Outros
 NO_DAYS_AVAILABLE = "Nenhum dia disponível nesta semana." 
 NO_HOURS_AVAILABLE = "Nenhum horário disponível neste dia." 
+NO_SLOTS_SOON = "Nenhum horário disponível nos próximos dias."
 
 # Valores e formas de pagamento
 PAYMENT_TITLE = "Valores e Formas de Pagamento"
@@ -0,0 +1,251 @@
+"""
+metrics.py - Métricas no formato texto do Prometheus (endpoint /metrics).
+
+Contadores, histogramas (buckets fixos) e gauges em memória, sem dependências.
+Cada observação custa um lock e algumas somas, então as métricas ficam sempre
+ligadas. Gauges podem ser calculados na hora da coleta (`gauge_funcao`), o que
+evita manter contadores de tamanho de fila/sessões em sincronia.
+
+Uso:
+    from src import metrics
+
+    SHEETS = metrics.histograma('sheets_call_seconds', 'Latência das chamadas ao Sheets', ['funcao'])
+    SHEETS.observar(0.12, funcao='get_all_records')
+
+    with metrics.cronometro(SHEETS, funcao='get_all_values'):
+        ...
+
+    texto = metrics.exportar()   # corpo do GET /metrics
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets padrão (segundos): de 5ms a 30s, cobre Sheets/Graph API e o webhook inteiro
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LE_INF = 'le="+Inf"'
+_registro = {}          # nome -> métrica (ordem de criação = ordem de exportação)
+_lock_registro = threading.Lock()
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes, valores, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _formatar_numero(valor: float) -> str:
+    if valor == math.inf:
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, descricao: str, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _chave(self, valores: dict) -> tuple:
+        return tuple(str(valores.get(r, "")) for r in self.rotulos)
+
+    def zerar(self):
+        with self._lock:
+            self._series.clear()
+
+    def _cabecalho(self) -> list:
+        return [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._series[chave] = self._series.get(chave, 0) + valor
+
+    def valor(self, **rotulos) -> float:
+        with self._lock:
+            return self._series.get(self._chave(rotulos), 0)
+
+    def exportar(self) -> list:
+        with self._lock:
+            series = sorted(self._series.items())
+        return self._cabecalho() + [f"{self.nome}{_formatar_rotulos(self.rotulos, k)} {_formatar_numero(v)}"
+                                    for k, v in series]
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def __init__(self, nome: str, descricao: str, rotulos=(), funcao=None):
+        super().__init__(nome, descricao, rotulos)
+        self._funcao = funcao    # sem rótulos: retorna número; com rótulos: retorna {tupla_de_rotulos: valor}
+
+    def set(self, valor: float, **rotulos):
+        with self._lock:
+            self._series[self._chave(rotulos)] = valor
+
+    def valor(self, **rotulos) -> float:
+        if self._funcao is not None:
+            return dict(self._coletar()).get(self._chave(rotulos), 0)
+        with self._lock:
+            return self._series.get(self._chave(rotulos), 0)
+
+    def _coletar(self) -> list:
+        if self._funcao is None:
+            with self._lock:
+                return sorted(self._series.items())
+        try:
+            resultado = self._funcao()
+        except Exception:
+            return []
+        if isinstance(resultado, dict):
+            return sorted((tuple(str(x) for x in (k if isinstance(k, tuple) else (k,))), v)
+                          for k, v in resultado.items())
+        return [((), resultado)]
+
+    def exportar(self) -> list:
+        return self._cabecalho() + [f"{self.nome}{_formatar_rotulos(self.rotulos, k)} {_formatar_numero(v)}"
+                                    for k, v in self._coletar()]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, descricao: str, rotulos=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * len(self.buckets), 0.0, 0]  # contagens, soma, total
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def contagem(self, **rotulos) -> int:
+        with self._lock:
+            serie = self._series.get(self._chave(rotulos))
+            return serie[2] if serie else 0
+
+    def exportar(self) -> list:
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        linhas = self._cabecalho()
+        for chave, (contagens, soma, total) in series:
+            acumulado = 0
+            for limite, n in zip(self.buckets, contagens):
+                acumulado += n
+                le = f'le="{_formatar_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, le)} {acumulado}")
+            linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, _LE_INF)} {total}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(round(soma, 6))}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {total}")
+        return linhas
+
+
+# -------------------------------------------------------
+# Registro
+# -------------------------------------------------------
+
+def _registrar(classe, nome, *args, **kwargs):
+    """Cria a métrica uma única vez (reimportar o módulo não duplica a série)."""
+    with _lock_registro:
+        metrica = _registro.get(nome)
+        if metrica is None:
+            metrica = _registro[nome] = classe(nome, *args, **kwargs)
+        return metrica
+
+
+def contador(nome: str, descricao: str, rotulos=()) -> Contador:
+    return _registrar(Contador, nome, descricao, rotulos)
+
+
+def histograma(nome: str, descricao: str, rotulos=(), buckets=BUCKETS_LATENCIA) -> Histograma:
+    return _registrar(Histograma, nome, descricao, rotulos, buckets)
+
+
+def gauge(nome: str, descricao: str, rotulos=()) -> Gauge:
+    return _registrar(Gauge, nome, descricao, rotulos)
+
+
+def gauge_funcao(nome: str, descricao: str, funcao, rotulos=()) -> Gauge:
+    """Gauge calculado na coleta: `funcao()` retorna o valor (ou {rótulos: valor})."""
+    metrica = _registrar(Gauge, nome, descricao, rotulos, funcao)
+    metrica._funcao = funcao
+    return metrica
+
+
+@contextmanager
+def cronometro(hist: Histograma, **rotulos):
+    """Observa em `hist` a duração do bloco (em segundos), mesmo se ele levantar exceção."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observar(time.perf_counter() - inicio, **rotulos)
+
+
+def exportar() -> str:
+    with _lock_registro:
+        metricas = list(_registro.values())
+    linhas = []
+    for metrica in metricas:
+        linhas.extend(metrica.exportar())
+    return "\n".join(linhas) + "\n"
+
+
+def zerar():
+    """Zera todas as séries (testes)."""
+    with _lock_registro:
+        metricas = list(_registro.values())
+    for metrica in metricas:
+        metrica.zerar()
+
+
+# -------------------------------------------------------
+# Métricas do bot (definidas aqui para ficarem num só lugar)
+# -------------------------------------------------------
+
+WEBHOOK_REQUESTS = contador("webhook_requests_total", "Requisições POST /webhook por status HTTP", ["status"])
+WEBHOOK_LATENCIA = histograma("webhook_request_duration_seconds", "Duração do tratamento de um POST /webhook")
+FLUXO_LATENCIA = histograma("flow_processar_mensagem_seconds",
+                            "Duração de whatsapp_flow.processar_mensagem por estado da conversa", ["estado"])
+SHEETS_LATENCIA = histograma("sheets_call_duration_seconds", "Latência das chamadas ao Google Sheets", ["funcao"])
+SHEETS_ERROS = contador("sheets_call_errors_total", "Chamadas ao Google Sheets que levantaram exceção",
+                        ["funcao", "erro"])
+GRAPH_LATENCIA = histograma("graph_api_send_duration_seconds", "Latência dos envios para a Graph API")
+GRAPH_RESPOSTAS = contador("graph_api_responses_total", "Respostas da Graph API por status HTTP", ["status"])
+SCHEDULER_ATRASO = histograma("scheduler_firing_lag_seconds", "Atraso entre o horário agendado e a execução do job",
+                              buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0, 300.0, 3600.0))
+CHAMADAS_POR_MENSAGEM = contador("webhook_external_calls_total",
+                                 "Chamadas externas causadas por mensagens do webhook, por estado da conversa",
+                                 ["estado", "tipo"])
+CACHE_CONSULTAS = contador("cache_requests_total", "Consultas aos caches em memória por resultado (hit/miss)",
+                           ["cache", "resultado"])
+AGENDA_ARQUIVADAS = contador("agenda_rows_archived_total",
+                             "Linhas antigas retiradas da aba Agenda pelo arquivamento, por destino", ["destino"])
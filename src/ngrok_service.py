@@ -7,8 +7,9 @@ Configuração via .env:
 - NGROK_REGION=us (região padrão)
 
 Uso:
-    import ngrok_service  # Auto-inicia se NGROK_ENABLED=true
+    import ngrok_service
 
+    ngrok_service.start()  # não faz nada se NGROK_ENABLED=false
     if ngrok_service.is_enabled():
         url = ngrok_service.get_tunnel_url()
         print(f"Webhook: {url}/webhook")
@@ -16,8 +17,10 @@ Uso:
 
 import os
 import logging
-from pyngrok import ngrok
 from dotenv import load_dotenv
+from src.lazy_imports import lazy_import
+
+ngrok = lazy_import("pyngrok.ngrok")  # pyngrok só é carregado quando o túnel é iniciado/parado
 
 # Carregar variáveis de ambiente (recarrega sempre que o módulo é importado)
 load_dotenv(override=True)
@@ -111,8 +114,3 @@ def stop():
         finally:
             _tunnel = None
             _public_url = None
-
-
-# Auto-start ao importar módulo (se habilitado no .env)
-if _enabled:
-    start()
@@ -0,0 +1,218 @@
+"""
+profiling.py - Ferramentas de profiling do bot.
+
+Perfil de startup: mede o custo de importação de cada módulo usando o
+`python -X importtime` em um processo separado (processo limpo, sem cache de
+módulos já importados), e gera um relatório com os módulos mais caros.
+
+Perfil por requisição (opt-in): roda o cProfile em volta do tratamento inteiro
+de uma requisição do /webhook (fluxo, planilha, envios). Requisições acima de
+REQUEST_PROFILE_THRESHOLD_MS geram um arquivo .prof em REQUEST_PROFILE_DIR e
+um resumo das funções mais caras no log. Desligado, custa só um if.
+
+Uso:
+    python -m src.profiling                       # perfil de import de src.whatsapp_webhook
+    python -m src.profiling --top 40 --json       # saída em JSON
+    STARTUP_PROFILE=1 python -m src.main          # imprime o perfil antes de subir o servidor
+    python -m src.profiling --abrir logs/profiles/webhook_....prof   # resumo de um perfil salvo
+
+Configuração via .env (perfil por requisição):
+- REQUEST_PROFILE=true/false (padrão: false; true = perfila todas as requisições)
+- REQUEST_PROFILE_TOKEN=<segredo> (com ele, só perfila requisições com o header X-Profile: <segredo>)
+- REQUEST_PROFILE_THRESHOLD_MS=500
+- REQUEST_PROFILE_DIR=logs/profiles
+- REQUEST_PROFILE_TOP=15
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REQUEST_PROFILE = os.getenv("REQUEST_PROFILE", "false").lower() == "true"
+REQUEST_PROFILE_TOKEN = os.getenv("REQUEST_PROFILE_TOKEN", "")
+REQUEST_PROFILE_THRESHOLD_MS = float(os.getenv("REQUEST_PROFILE_THRESHOLD_MS", "500"))
+REQUEST_PROFILE_DIR = os.getenv("REQUEST_PROFILE_DIR", os.path.join("logs", "profiles"))
+REQUEST_PROFILE_TOP = int(os.getenv("REQUEST_PROFILE_TOP", "15"))
+HEADER_PERFIL = "x-profile"
+
+_perfil_em_andamento = threading.Lock()  # o cProfile é por thread; um perfil por vez evita medições cruzadas
+
+# Formato do -X importtime: "import time: self [us] | cumulative | imported package"
+_LINHA_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def perfil_imports(modulo: str = "src.whatsapp_webhook") -> dict:
+    """
+    Importa `modulo` em um processo novo com `-X importtime` e retorna:
+      {"modulo", "total_ms", "wall_ms", "modulos": [{"nome", "proprio_ms", "acumulado_ms", "nivel"}, ...]}
+    `total_ms` é o tempo acumulado de importação do módulo alvo; `wall_ms` inclui
+    a inicialização do interpretador.
+    """
+    inicio = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, STARTUP_PROFILE="0"),
+    )
+    wall_ms = (time.perf_counter() - inicio) * 1000
+
+    modulos = []
+    for linha in proc.stderr.splitlines():
+        m = _LINHA_IMPORTTIME.match(linha)
+        if not m:
+            continue
+        proprio_us, acumulado_us, indent, nome = m.groups()
+        modulos.append({
+            "nome": nome,
+            "proprio_ms": int(proprio_us) / 1000,
+            "acumulado_ms": int(acumulado_us) / 1000,
+            "nivel": len(indent) // 2,
+        })
+
+    if proc.returncode != 0:
+        erro = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"código {proc.returncode}"
+        raise RuntimeError(f"Falha ao importar {modulo}: {erro}")
+
+    alvo = next((m for m in modulos if m["nome"] == modulo), None)
+    return {
+        "modulo": modulo,
+        "total_ms": alvo["acumulado_ms"] if alvo else sum(m["proprio_ms"] for m in modulos),
+        "wall_ms": round(wall_ms, 1),
+        "modulos": modulos,
+    }
+
+
+def formatar_relatorio_imports(perfil: dict, top: int = 25) -> str:
+    """Relatório legível: módulos de primeiro nível do projeto e os `top` mais caros (acumulado)."""
+    linhas = [
+        "=" * 70,
+        f"PERFIL DE IMPORT: {perfil['modulo']}",
+        "=" * 70,
+        f"Import do módulo: {perfil['total_ms']:.1f} ms | processo completo: {perfil['wall_ms']:.1f} ms",
+        "",
+        f"{'acumulado':>10} {'próprio':>9}  módulo",
+    ]
+    mais_caros = sorted(perfil["modulos"], key=lambda m: m["acumulado_ms"], reverse=True)[:top]
+    for m in mais_caros:
+        linhas.append(f"{m['acumulado_ms']:>8.1f}ms {m['proprio_ms']:>7.1f}ms  {'  ' * m['nivel']}{m['nome']}")
+    return "\n".join(linhas)
+
+
+# -------------------------------------------------------
+# Perfil por requisição
+# -------------------------------------------------------
+
+def _perfil_habilitado(headers) -> bool:
+    if REQUEST_PROFILE_TOKEN:
+        return headers is not None and headers.get(HEADER_PERFIL) == REQUEST_PROFILE_TOKEN
+    return REQUEST_PROFILE
+
+
+def iniciar_perfil_requisicao(headers=None):
+    """
+    Liga o cProfile para a requisição atual se o perfil estiver habilitado (env ou
+    header X-Profile com o token). Retorna o profiler, ou None quando desligado ou
+    quando outro perfil já está em andamento.
+    """
+    if not (REQUEST_PROFILE or REQUEST_PROFILE_TOKEN) or not _perfil_habilitado(headers):
+        return None
+    if not _perfil_em_andamento.acquire(blocking=False):
+        return None
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # outro profiler ativo no processo (ex.: rodando sob cProfile)
+        _perfil_em_andamento.release()
+        return None
+    return profiler
+
+
+def finalizar_perfil_requisicao(profiler, nome: str, duracao_ms: float):
+    """Desliga o profiler; se a requisição passou do limite, salva o .prof e loga as funções mais caras."""
+    try:
+        profiler.disable()
+    finally:
+        _perfil_em_andamento.release()
+    if duracao_ms < REQUEST_PROFILE_THRESHOLD_MS:
+        return None
+    try:
+        os.makedirs(REQUEST_PROFILE_DIR, exist_ok=True)
+        caminho = os.path.join(REQUEST_PROFILE_DIR,
+                               f"{nome}_{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{int(duracao_ms)}ms.prof")
+        profiler.dump_stats(caminho)
+        logger.warning("[profile] %s lenta: %.0f ms (perfil em %s)\n%s", nome, duracao_ms, caminho,
+                       resumo_funcoes(profiler, REQUEST_PROFILE_TOP))
+        return caminho
+    except Exception:
+        logger.exception("[profile] Falha ao salvar perfil da requisição %s", nome)
+        return None
+
+
+def funcoes_mais_caras(perfil, top: int = 15) -> list:
+    """
+    Funções com maior tempo próprio em um cProfile.Profile (ou caminho de .prof):
+      [{"funcao", "arquivo", "linha", "chamadas", "proprio_ms", "acumulado_ms"}, ...]
+    """
+    import pstats
+    stats = pstats.Stats(perfil)
+    funcoes = []
+    for (arquivo, linha, funcao), (_, chamadas, proprio, acumulado, _) in stats.stats.items():
+        funcoes.append({
+            "funcao": funcao,
+            "arquivo": os.path.relpath(arquivo, PROJECT_ROOT) if arquivo.startswith(PROJECT_ROOT) else arquivo,
+            "linha": linha,
+            "chamadas": chamadas,
+            "proprio_ms": round(proprio * 1000, 2),
+            "acumulado_ms": round(acumulado * 1000, 2),
+        })
+    funcoes.sort(key=lambda f: f["proprio_ms"], reverse=True)
+    return funcoes[:top]
+
+
+def resumo_funcoes(perfil, top: int = 15) -> str:
+    linhas = [f"{'próprio':>10} {'acumulado':>11} {'chamadas':>9}  função"]
+    for f in funcoes_mais_caras(perfil, top):
+        linhas.append(f"{f['proprio_ms']:>8.1f}ms {f['acumulado_ms']:>9.1f}ms {f['chamadas']:>9}  "
+                      f"{f['funcao']} ({f['arquivo']}:{f['linha']})")
+    return "\n".join(linhas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perfil de custo de importação por módulo")
+    parser.add_argument("--modulo", default="src.whatsapp_webhook", help="módulo a importar")
+    parser.add_argument("--top", type=int, default=25, help="quantidade de módulos no relatório")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    parser.add_argument("--abrir", metavar="ARQUIVO_PROF", help="resume um perfil de requisição salvo (.prof)")
+    args = parser.parse_args(argv)
+
+    if args.abrir:
+        if args.json:
+            print(json.dumps(funcoes_mais_caras(args.abrir, args.top), ensure_ascii=False, indent=2))
+        else:
+            print(resumo_funcoes(args.abrir, args.top))
+        return 0
+
+    perfil = perfil_imports(args.modulo)
+    if args.json:
+        print(json.dumps(perfil, ensure_ascii=False, indent=2))
+    else:
+        print(formatar_relatorio_imports(perfil, args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
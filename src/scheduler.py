@@ -1,10 +1,11 @@
 import threading
-import time as _time
 from datetime import datetime, timedelta, timezone
 import heapq
 import uuid
 import logging
 
+from src import metrics
+
 logger = logging.getLogger(__name__)
 
 # Timezone do Brasil (GMT-3) - importante para servidor em UTC
@@ -16,77 +17,366 @@ def agora_brasil() -> datetime:
     brazil_now = utc_now + BRAZIL_TZ_OFFSET
     return brazil_now.replace(tzinfo=None)
 
+# Catch-up policies for recurring jobs whose fire time was missed
+# (process asleep, long-running job ahead in the queue, clock jump...)
+CATCH_UP_SKIP = 'skip'          # drop missed runs, wait for the next fire time
+CATCH_UP_RUN_ONCE = 'run_once'  # run once for all missed fire times
+CATCH_UP_RUN_ALL = 'run_all'    # run once per missed fire time (capped at MAX_CATCH_UP_RUNS)
+_CATCH_UP_POLICIES = (CATCH_UP_SKIP, CATCH_UP_RUN_ONCE, CATCH_UP_RUN_ALL)
+MAX_CATCH_UP_RUNS = 100
+# With CATCH_UP_SKIP a run this late is still considered "on time"
+MISFIRE_GRACE_SECONDS = 60
+
 # Min-heap of jobs: (run_at_timestamp, job_id, func, args, kwargs)
+# Cancelled jobs stay in the heap and are discarded when popped (lazy deletion).
 _jobs_heap = []
 _jobs_lock = threading.Lock()
+_jobs_changed = threading.Condition(_jobs_lock)  # wakes the worker when the heap head may have changed
 _stop_event = threading.Event()
+_pending = {}     # job_id -> run_at_timestamp of its live heap entry
+_recurring = {}   # job_id -> RecurringJob
+
+metrics.gauge_funcao("scheduler_queue_depth", "Jobs agendados aguardando execução", lambda: len(_pending))
+
+
+# -------------------------------------------------------
+# Schedule specs
+# -------------------------------------------------------
+
+class IntervalSpec:
+    """Fires every `interval`, aligned to `anchor` (anchor + k * interval)."""
+
+    def __init__(self, interval: timedelta, anchor: datetime):
+        if interval.total_seconds() <= 0:
+            raise ValueError("interval must be positive")
+        self.interval = interval
+        self.anchor = anchor
+
+    def next_after(self, dt: datetime) -> datetime:
+        """First fire time strictly after `dt`."""
+        if dt < self.anchor:
+            return self.anchor
+        steps = int((dt - self.anchor) / self.interval) + 1
+        return self.anchor + steps * self.interval
+
+    def __repr__(self):
+        return f"every {self.interval}"
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> list:
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"invalid cron step: {field}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"cron field out of range: {field}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+
+class CronSpec:
+    """
+    Standard 5-field cron expression: "minute hour day-of-month month day-of-week".
+    Supports '*', lists (1,15), ranges (1-5) and steps (*/15). Day of week: 0 = Sunday.
+    As in cron, when both day-of-month and day-of-week are restricted, either may match.
+    """
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = set(_parse_cron_field(fields[2], 1, 31))
+        self.months = set(_parse_cron_field(fields[3], 1, 12))
+        self.weekdays = {d % 7 for d in _parse_cron_field(fields[4], 0, 7)}  # 7 is also Sunday
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        dom = day.day in self.days
+        dow = (day.weekday() + 1) % 7 in self.weekdays  # python: Monday=0 -> cron: Monday=1
+        if self._any_day:
+            return dow
+        if self._any_weekday:
+            return dom
+        return dom or dow
+
+    def next_after(self, dt: datetime) -> datetime:
+        """First fire time strictly after `dt` (searches day by day, then hour/minute)."""
+        start = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"cron expression never fires: {self.expr!r}")
+
+    def __repr__(self):
+        return f"cron '{self.expr}'"
+
+
+class RecurringJob:
+    """A recurring job: its spec, catch-up policy and bookkeeping."""
+
+    def __init__(self, job_id, spec, func, args, kwargs, catch_up):
+        if catch_up not in _CATCH_UP_POLICIES:
+            raise ValueError(f"unknown catch-up policy: {catch_up}")
+        self.job_id = job_id
+        self.spec = spec
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.catch_up = catch_up
+        self.last_run = None
+        self.run_count = 0
+        self.missed_count = 0
+
+
+# -------------------------------------------------------
+# Worker
+# -------------------------------------------------------
+
+def _push(run_ts, job_id, func, args, kwargs):
+    """Push a heap entry. Caller must hold _jobs_lock."""
+    heapq.heappush(_jobs_heap, (run_ts, job_id, func, args, kwargs))
+    _pending[job_id] = run_ts
+    _jobs_changed.notify()
+
+
+def _plan_recurring(job: RecurringJob, run_ts: float, now: datetime) -> list:
+    """
+    Returns the fire times to execute now for a due recurring job and pushes its next
+    entry. The next fire time comes from the schedule, never from completion time, so
+    runs do not drift and a slow run cannot push the job past its next day.
+    Caller must hold _jobs_lock.
+    """
+    due = [datetime.fromtimestamp(run_ts)]
+    next_run = job.spec.next_after(due[0])
+    while next_run <= now:
+        if len(due) < MAX_CATCH_UP_RUNS:
+            due.append(next_run)
+        next_run = job.spec.next_after(next_run)
+
+    if job.catch_up == CATCH_UP_SKIP:
+        on_time = [d for d in due if (now - d).total_seconds() <= MISFIRE_GRACE_SECONDS]
+        to_run = on_time[-1:]
+    elif job.catch_up == CATCH_UP_RUN_ONCE:
+        to_run = due[-1:]
+    else:
+        to_run = due
+    job.missed_count += len(due) - len(to_run)
+    if len(due) > 1 or not to_run:
+        logger.warning("[scheduler] Recurring job %s missed %d fire time(s) (policy %s, running %d)",
+                       job.job_id, len(due) - 1 if to_run else len(due), job.catch_up, len(to_run))
+
+    _push(next_run.timestamp(), job.job_id, job.func, job.args, job.kwargs)
+    return to_run
+
+
+def _pop_due(now: datetime) -> list:
+    """Pops every due job. Returns (job_id, scheduled_for, func, args, kwargs) runs."""
+    now_ts = now.timestamp()
+    to_run = []
+    with _jobs_lock:
+        while _jobs_heap and _jobs_heap[0][0] <= now_ts:
+            run_ts, job_id, func, args, kwargs = heapq.heappop(_jobs_heap)
+            if _pending.get(job_id) != run_ts:
+                continue  # cancelled (lazy deletion)
+            del _pending[job_id]
+            job = _recurring.get(job_id)
+            if job is None:
+                to_run.append((job_id, datetime.fromtimestamp(run_ts), func, args, kwargs))
+                continue
+            for fire_at in _plan_recurring(job, run_ts, now):
+                to_run.append((job_id, fire_at, func, args, kwargs))
+    return to_run
+
+
+def _run(job_id, scheduled_for, func, args, kwargs):
+    metrics.SCHEDULER_ATRASO.observar(max(0.0, (agora_brasil() - scheduled_for).total_seconds()))
+    try:
+        logger.info("[scheduler] Running job %s scheduled for %s", job_id, scheduled_for)
+        func(*args, **(kwargs or {}))
+    except Exception:
+        logger.exception("[scheduler] Exception executing job %s", job_id)
+    job = _recurring.get(job_id)
+    if job is not None:
+        job.last_run = scheduled_for
+        job.run_count += 1
 
 
 def _worker_loop(poll_interval=30):
     logger.info("[scheduler] Worker started")
     while not _stop_event.is_set():
-        now_ts = agora_brasil().timestamp()  # Usa horário do Brasil
-        to_run = []
+        for run in _pop_due(agora_brasil()):  # Usa horário do Brasil
+            _run(*run)
         with _jobs_lock:
-            while _jobs_heap and _jobs_heap[0][0] <= now_ts:
-                item = heapq.heappop(_jobs_heap)
-                to_run.append(item)
-        for run_at_ts, job_id, func, args, kwargs in to_run:
-            try:
-                logger.info("[scheduler] Running job %s scheduled for %s", job_id, datetime.fromtimestamp(run_at_ts))
-                func(*args, **(kwargs or {}))
-            except Exception:
-                logger.exception("[scheduler] Exception executing job %s", job_id)
-        _time.sleep(poll_interval)
+            if _stop_event.is_set():
+                break
+            timeout = poll_interval
+            if _jobs_heap:
+                timeout = min(poll_interval, max(0.0, _jobs_heap[0][0] - agora_brasil().timestamp()))
+            if timeout > 0:
+                _jobs_changed.wait(timeout)
 
 
 _worker_thread = None
+_start_lock = threading.Lock()  # concurrent first schedule_* calls must not spawn two workers
 
 
 def start(poll_interval=30):
     global _worker_thread
-    if _worker_thread and _worker_thread.is_alive():
-        return
-    _stop_event.clear()
-    _worker_thread = threading.Thread(target=_worker_loop, args=(poll_interval,), daemon=True)
-    _worker_thread.start()
+    with _start_lock:
+        if _worker_thread and _worker_thread.is_alive():
+            return
+        _stop_event.clear()
+        _worker_thread = threading.Thread(target=_worker_loop, args=(poll_interval,), daemon=True)
+        _worker_thread.start()
 
 
 def stop():
     _stop_event.set()
+    with _jobs_lock:
+        _jobs_changed.notify_all()
 
 
-def schedule_at(run_at: datetime, func, *args, **kwargs) -> str:
-    """Schedule func to run at specific datetime. Returns job id."""
+# -------------------------------------------------------
+# Public API
+# -------------------------------------------------------
+
+def schedule_at(run_at: datetime, func, *args, job_id: str = None, **kwargs) -> str:
+    """Schedule func to run at specific datetime. Returns job id.
+
+    With a caller-chosen `job_id` scheduling is idempotent: if that id is already
+    pending for the same time nothing changes; for another time the job is moved.
+    """
+    start()  # worker is started lazily, on the first scheduled job
     run_ts = run_at.timestamp()
-    job_id = str(uuid.uuid4())
+    job_id = job_id or str(uuid.uuid4())
     with _jobs_lock:
-        heapq.heappush(_jobs_heap, (run_ts, job_id, func, args, kwargs))
+        if _pending.get(job_id) == run_ts:
+            return job_id
+        _push(run_ts, job_id, func, args, kwargs)
     logger.info("[scheduler] Scheduled job %s at %s", job_id, run_at)
     return job_id
 
 
+def schedule_many(jobs) -> list:
+    """Schedule several jobs at once, taking the lock a single time.
+
+    `jobs` is an iterable of (run_at, func), (run_at, func, args, kwargs) or
+    (run_at, func, args, kwargs, job_id) tuples; a given job_id is idempotent as in
+    schedule_at. Returns the list of job ids, in the same order.
+    """
+    entries = []
+    for job in jobs:
+        run_at, func = job[0], job[1]
+        args = tuple(job[2]) if len(job) > 2 and job[2] else ()
+        kwargs = job[3] if len(job) > 3 else None
+        job_id = (job[4] if len(job) > 4 else None) or str(uuid.uuid4())
+        entries.append((run_at.timestamp(), job_id, func, args, kwargs))
+    if not entries:
+        return []
+    start()
+    with _jobs_lock:
+        fresh = {}
+        for entry in entries:
+            if _pending.get(entry[1]) != entry[0]:
+                fresh[entry[1]] = entry     # same id twice in the batch: the last one wins
+        _jobs_heap.extend(fresh.values())
+        heapq.heapify(_jobs_heap)
+        for run_ts, job_id, _, _, _ in fresh.values():
+            _pending[job_id] = run_ts
+        _jobs_changed.notify()
+    logger.info("[scheduler] Scheduled %d jobs in bulk (%d already pending)", len(fresh), len(entries) - len(fresh))
+    return [job_id for _, job_id, _, _, _ in entries]
+
+
 def schedule_in(seconds: float, func, *args, **kwargs) -> str:
     return schedule_at(agora_brasil() + timedelta(seconds=seconds), func, *args, **kwargs)
 
 
-def schedule_daily(hour: int, minute: int, func, *args, **kwargs) -> str:
-    """Schedule a job that will run every day at hour:minute (Brasil GMT-3). Returns id of first scheduled run."""
-    now = agora_brasil()  # Usa horário do Brasil
-    run_today = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-    if run_today <= now:
-        run_today = run_today + timedelta(days=1)
+def schedule_recurring(spec, func, *args, catch_up: str = CATCH_UP_RUN_ONCE, **kwargs) -> str:
+    """Schedule func on a recurring spec (IntervalSpec/CronSpec). Returns the job id, stable across runs."""
+    job_id = str(uuid.uuid4())
+    job = RecurringJob(job_id, spec, func, args, kwargs, catch_up)
+    first_run = spec.next_after(agora_brasil())
+    start()
+    with _jobs_lock:
+        _recurring[job_id] = job
+        _push(first_run.timestamp(), job_id, func, args, kwargs)
+    logger.info("[scheduler] Scheduled recurring job %s (%r), first run at %s", job_id, spec, first_run)
+    return job_id
+
+
+def schedule_every(interval, func, *args, start_at: datetime = None,
+                   catch_up: str = CATCH_UP_RUN_ONCE, **kwargs) -> str:
+    """Run func every `interval` (timedelta or seconds), aligned to `start_at` (default: now + interval)."""
+    if not isinstance(interval, timedelta):
+        interval = timedelta(seconds=interval)
+    anchor = start_at or (agora_brasil() + interval)
+    return schedule_recurring(IntervalSpec(interval, anchor), func, *args, catch_up=catch_up, **kwargs)
 
-    def _runner_and_reschedule(*a, **k):
-        try:
-            func(*a, **k)
-        except Exception:
-            logger.exception("[scheduler] daily job exception")
-        # schedule next day (Brasil time)
-        schedule_at(agora_brasil().replace(hour=hour, minute=minute, second=0, microsecond=0) + timedelta(days=1), _runner_and_reschedule, *a, **k)
 
-    return schedule_at(run_today, _runner_and_reschedule, *args, **kwargs)
+def schedule_cron(expr: str, func, *args, catch_up: str = CATCH_UP_RUN_ONCE, **kwargs) -> str:
+    """Run func on a 5-field cron expression (Brasil GMT-3)."""
+    return schedule_recurring(CronSpec(expr), func, *args, catch_up=catch_up, **kwargs)
 
 
-# Start worker automatically when module is imported
-start()
+def schedule_daily(hour: int, minute: int, func, *args, catch_up: str = CATCH_UP_RUN_ONCE, **kwargs) -> str:
+    """Schedule a job that will run every day at hour:minute (Brasil GMT-3). Returns the recurring job id."""
+    return schedule_cron(f"{minute} {hour} * * *", func, *args, catch_up=catch_up, **kwargs)
+
+
+def cancel(job_id: str) -> bool:
+    """Cancel a pending one-off or recurring job. Returns False if the job is unknown or already ran."""
+    with _jobs_lock:
+        found = _pending.pop(job_id, None) is not None
+        found = _recurring.pop(job_id, None) is not None or found
+        if found:
+            _jobs_changed.notify()
+    if found:
+        logger.info("[scheduler] Cancelled job %s", job_id)
+    return found
+
+
+def list_jobs() -> list:
+    """Pending jobs ordered by next run: dicts with id, next_run, func, recurring, schedule, catch_up..."""
+    with _jobs_lock:
+        live = sorted((run_ts, job_id, func) for run_ts, job_id, func, _, _ in _jobs_heap
+                      if _pending.get(job_id) == run_ts)
+        jobs = []
+        for run_ts, job_id, func in live:
+            job = _recurring.get(job_id)
+            jobs.append({
+                'id': job_id,
+                'next_run': datetime.fromtimestamp(run_ts),
+                'func': getattr(func, '__name__', repr(func)),
+                'recurring': job is not None,
+                'schedule': repr(job.spec) if job else None,
+                'catch_up': job.catch_up if job else None,
+                'last_run': job.last_run if job else None,
+                'run_count': job.run_count if job else 0,
+                'missed_count': job.missed_count if job else 0,
+            })
+    return jobs
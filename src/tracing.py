@@ -0,0 +1,305 @@
+"""
+tracing.py - Tracing leve por mensagem recebida (spans com correlation ID).
+
+Cada mensagem do webhook abre um trace (`trace()`); dentro dele, `span()` e o
+decorator `rastrear` registram spans filhos (busca de perfil, processar_mensagem,
+funções do agenda_service, send_*). Todos os spans de uma mensagem compartilham
+o mesmo ID de correlação (`correlacao_atual()`), também usado como traceId no OTLP.
+
+Fora de um trace (jobs, warmup) spans não são registrados: o custo é uma
+leitura de contextvar.
+
+Ao final de cada trace:
+- traces com duração >= TRACING_SLOW_MS ficam num buffer circular em memória
+  (TRACING_BUFFER traces), visível em GET /debug/traces (só com TRACING_DEBUG_TOKEN);
+- se TRACING_EXPORT estiver configurado, o trace é exportado numa thread de
+  background (fila limitada; se encher, o trace é descartado):
+    arquivo -> uma linha JSON por trace em TRACING_FILE
+    otlp    -> POST OTLP/HTTP JSON em TRACING_OTLP_URL (coletor local, Jaeger etc.)
+
+Configuração via .env:
+- TRACING_ENABLED=true/false (padrão: true)
+- TRACING_SLOW_MS=1000
+- TRACING_BUFFER=50
+- TRACING_EXPORT= (vazio/arquivo/otlp)
+- TRACING_FILE=logs/traces.jsonl
+- TRACING_OTLP_URL=http://127.0.0.1:4318/v1/traces
+- TRACING_DEBUG_TOKEN= (vazio: /debug/traces responde 404; definido: exige o header X-Debug-Token)
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+SLOW_MS = float(os.getenv('TRACING_SLOW_MS', '1000'))
+BUFFER = int(os.getenv('TRACING_BUFFER', '50'))
+EXPORT = os.getenv('TRACING_EXPORT', '').lower()
+ARQUIVO = os.getenv('TRACING_FILE', os.path.join('logs', 'traces.jsonl'))
+OTLP_URL = os.getenv('TRACING_OTLP_URL', 'http://127.0.0.1:4318/v1/traces')
+DEBUG_TOKEN = os.getenv('TRACING_DEBUG_TOKEN', '')
+MAX_SPANS = 300  # por trace; acima disso os spans são só contados (laços com muitas chamadas)
+SERVICE_NAME = 'whatsapp-chat-bot'
+
+_trace_atual = contextvars.ContextVar('tracing_trace', default=None)
+_span_atual = contextvars.ContextVar('tracing_span', default=None)
+
+_lentos = deque(maxlen=BUFFER)
+_lock = threading.Lock()
+_fila_export = queue.Queue(maxsize=1000)
+_thread_export = None
+
+
+class Span:
+    __slots__ = ('span_id', 'parent_id', 'nome', 'inicio', 'duracao_ms', 'atributos', 'erro', '_t0')
+
+    def __init__(self, nome: str, parent_id: str = None, atributos: dict = None):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.nome = nome
+        self.inicio = time.time()
+        self.duracao_ms = None
+        self.atributos = dict(atributos or {})
+        self.erro = None
+        self._t0 = time.perf_counter()
+
+    def finalizar(self):
+        self.duracao_ms = round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def como_dict(self) -> dict:
+        return {'span_id': self.span_id, 'parent_id': self.parent_id, 'nome': self.nome,
+                'inicio': self.inicio, 'duracao_ms': self.duracao_ms, 'atributos': self.atributos,
+                'erro': self.erro}
+
+
+class Trace:
+    def __init__(self, nome: str, correlacao: str = None):
+        self.trace_id = correlacao or uuid.uuid4().hex
+        self.nome = nome
+        self.spans = []
+        self.descartados = 0
+
+    @property
+    def raiz(self) -> Span:
+        return self.spans[0]
+
+    def como_dict(self) -> dict:
+        raiz = self.raiz
+        return {'trace_id': self.trace_id, 'nome': self.nome, 'inicio': raiz.inicio,
+                'duracao_ms': raiz.duracao_ms, 'atributos': raiz.atributos,
+                'spans_descartados': self.descartados, 'spans': [s.como_dict() for s in self.spans]}
+
+
+def correlacao_atual():
+    """ID de correlação do trace em andamento (None fora de uma mensagem)."""
+    trace = _trace_atual.get()
+    return trace.trace_id if trace is not None else None
+
+
+# -------------------------------------------------------
+# Spans
+# -------------------------------------------------------
+
+@contextmanager
+def trace(nome: str, correlacao: str = None, **atributos):
+    """Abre o trace de uma mensagem (span raiz). Ao sair, guarda se for lento e exporta."""
+    if not ENABLED:
+        yield None
+        return
+    t = Trace(nome, correlacao)
+    raiz = Span(nome, None, atributos)
+    t.spans.append(raiz)
+    token_trace = _trace_atual.set(t)
+    token_span = _span_atual.set(raiz)
+    try:
+        yield raiz
+    except BaseException as e:
+        raiz.erro = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        raiz.finalizar()
+        _span_atual.reset(token_span)
+        _trace_atual.reset(token_trace)
+        _concluir(t)
+
+
+@contextmanager
+def span(nome: str, **atributos):
+    """Span filho do span atual; sem trace ativo não registra nada."""
+    t = _trace_atual.get()
+    if t is None:
+        yield None
+        return
+    if len(t.spans) >= MAX_SPANS:
+        t.descartados += 1
+        yield None
+        return
+    pai = _span_atual.get()
+    s = Span(nome, pai.span_id if pai is not None else None, atributos)
+    t.spans.append(s)
+    token = _span_atual.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.erro = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        s.finalizar()
+        _span_atual.reset(token)
+
+
+def rastrear(nome: str = None):
+    """Decorator: cada chamada da função vira um span (só dentro de um trace)."""
+    def decorador(func):
+        nome_span = nome or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _trace_atual.get() is None:
+                return func(*args, **kwargs)
+            with span(nome_span):
+                return func(*args, **kwargs)
+        wrapper.__rastreado__ = True
+        return wrapper
+    return decorador
+
+
+def instrumentar_modulo(namespace: dict, prefixo: str, ignorar=()):
+    """
+    Envolve com `rastrear` as funções públicas definidas no módulo (`globals()` dele),
+    exceto as de `ignorar` (utilitários chamados em laço). Chamadas internas do módulo
+    e quem importar as funções depois disso passam a gerar spans.
+    """
+    modulo = namespace.get('__name__')
+    for nome, obj in list(namespace.items()):
+        if (nome.startswith('_') or nome in ignorar or not callable(obj) or isinstance(obj, type)
+                or getattr(obj, '__module__', None) != modulo or getattr(obj, '__rastreado__', False)):
+            continue
+        namespace[nome] = rastrear(f'{prefixo}.{nome}')(obj)
+
+
+# -------------------------------------------------------
+# Conclusão: buffer de lentos e exportação
+# -------------------------------------------------------
+
+def _concluir(t: Trace):
+    if t.raiz.duracao_ms is not None and t.raiz.duracao_ms >= SLOW_MS:
+        with _lock:
+            _lentos.append(t)
+        logger.warning('[tracing] Mensagem lenta: %.0f ms (trace %s, %d spans)',
+                       t.raiz.duracao_ms, t.trace_id, len(t.spans))
+    if EXPORT in ('arquivo', 'otlp'):
+        _iniciar_exportador()
+        try:
+            _fila_export.put_nowait(t)
+        except queue.Full:
+            pass  # exportador atrasado: descarta em vez de segurar a requisição
+
+
+def traces_lentos() -> list:
+    """Resumo dos traces lentos no buffer (mais recente primeiro)."""
+    with _lock:
+        traces = list(_lentos)
+    return [{'trace_id': t.trace_id, 'nome': t.nome, 'inicio': t.raiz.inicio, 'duracao_ms': t.raiz.duracao_ms,
+             'spans': len(t.spans), 'atributos': t.raiz.atributos} for t in reversed(traces)]
+
+
+def obter_trace(trace_id: str):
+    with _lock:
+        for t in _lentos:
+            if t.trace_id == trace_id:
+                return t.como_dict()
+    return None
+
+
+def limpar():
+    with _lock:
+        _lentos.clear()
+
+
+def para_otlp(traces: list) -> dict:
+    """Converte traces para o corpo OTLP/HTTP JSON (ExportTraceServiceRequest)."""
+    def _attrs(d):
+        saida = []
+        for k, v in d.items():
+            if isinstance(v, bool):
+                valor = {'boolValue': v}
+            elif isinstance(v, int):
+                valor = {'intValue': str(v)}
+            elif isinstance(v, float):
+                valor = {'doubleValue': v}
+            else:
+                valor = {'stringValue': str(v)}
+            saida.append({'key': k, 'value': valor})
+        return saida
+
+    spans = []
+    for t in traces:
+        for s in t.spans:
+            inicio_ns = int(s.inicio * 1e9)
+            item = {
+                'traceId': t.trace_id.ljust(32, '0')[:32],
+                'spanId': s.span_id,
+                'name': s.nome,
+                'kind': 2 if s.parent_id is None else 1,  # SERVER na raiz, INTERNAL nos filhos
+                'startTimeUnixNano': str(inicio_ns),
+                'endTimeUnixNano': str(inicio_ns + int((s.duracao_ms or 0) * 1e6)),
+                'attributes': _attrs(s.atributos),
+                'status': {'code': 2, 'message': s.erro} if s.erro else {'code': 1},
+            }
+            if s.parent_id:
+                item['parentSpanId'] = s.parent_id
+            spans.append(item)
+    return {'resourceSpans': [{
+        'resource': {'attributes': _attrs({'service.name': SERVICE_NAME})},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+    }]}
+
+
+def _exportar_lote(traces: list):
+    if EXPORT == 'arquivo':
+        pasta = os.path.dirname(ARQUIVO)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with open(ARQUIVO, 'a', encoding='utf-8') as f:
+            for t in traces:
+                f.write(json.dumps(t.como_dict(), ensure_ascii=False) + '\n')
+    elif EXPORT == 'otlp':
+        import requests
+        r = requests.post(OTLP_URL, json=para_otlp(traces), timeout=5)
+        if r.status_code >= 400:
+            logger.warning('[tracing] Coletor OTLP respondeu %s', r.status_code)
+
+
+def _loop_exportador():
+    while True:
+        lote = [_fila_export.get()]
+        while len(lote) < 100:
+            try:
+                lote.append(_fila_export.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _exportar_lote(lote)
+        except Exception:
+            logger.exception('[tracing] Falha ao exportar %d trace(s)', len(lote))
+
+
+def _iniciar_exportador():
+    global _thread_export
+    if _thread_export is not None:
+        return
+    with _lock:
+        if _thread_export is None:
+            _thread_export = threading.Thread(target=_loop_exportador, name='tracing-export', daemon=True)
+            _thread_export.start()
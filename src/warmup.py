@@ -0,0 +1,107 @@
+"""
+warmup.py - Fase de aquecimento (warmup) da aplicação.
+
+As tarefas de startup que fazem I/O (planilha, envios, túnel ngrok) rodam em
+background, em paralelo, enquanto o servidor já aceita requisições.
+Cada tarefa é um "estágio" com nome; o estado de todos os estágios fica
+disponível para o endpoint de prontidão (/ready).
+
+Uso:
+    tarefas = warmup.iniciar([
+        ("slots", inicializar_slots),
+        ("slots_diarios", agendar_slots_diarios, ["slots"]),  # roda após "slots"
+    ])
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Estados possíveis de um estágio
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+FALHOU = 'falhou'
+
+_estagios = {}  # nome -> {"status", "inicio", "fim", "duracao_ms", "erro"}
+_eventos = {}   # nome -> threading.Event (setado quando o estágio termina, com ou sem erro)
+_lock = threading.Lock()
+
+
+def _atualizar(nome: str, **campos):
+    with _lock:
+        _estagios.setdefault(nome, {}).update(campos)
+
+
+def registrar(nome: str):
+    """Registra um estágio como pendente (aparece em status() antes de começar)."""
+    with _lock:
+        _estagios[nome] = {"status": PENDENTE, "inicio": None, "fim": None, "duracao_ms": None, "erro": None}
+        _eventos[nome] = threading.Event()
+
+
+def executar(nome: str, func, depende_de=None):
+    """
+    Executa `func` como o estágio `nome`, registrando início, fim e erro.
+    Se `depende_de` for informado, aguarda esses estágios terminarem antes.
+    Exceções são registradas e logadas, nunca propagadas.
+    """
+    for dep in depende_de or []:
+        evento = _eventos.get(dep)
+        if evento is not None:
+            evento.wait()
+
+    inicio = time.time()
+    _atualizar(nome, status=EXECUTANDO, inicio=inicio)
+    logger.info('[warmup] Estágio %s iniciado', nome)
+    try:
+        func()
+        status, erro = CONCLUIDO, None
+    except Exception as e:
+        logger.exception('[warmup] Estágio %s falhou', nome)
+        status, erro = FALHOU, f"{type(e).__name__}: {e}"
+    fim = time.time()
+    _atualizar(nome, status=status, fim=fim, duracao_ms=round((fim - inicio) * 1000, 1), erro=erro)
+    logger.info('[warmup] Estágio %s: %s em %.0f ms', nome, status, (fim - inicio) * 1000)
+    evento = _eventos.get(nome)
+    if evento is not None:
+        evento.set()
+
+
+def iniciar(estagios) -> list:
+    """
+    Dispara todos os estágios em paralelo (cada um em uma thread via asyncio.to_thread)
+    sem aguardá-los. Deve ser chamado de dentro do event loop (ex.: lifespan do FastAPI).
+
+    `estagios` é uma lista de (nome, func) ou (nome, func, depende_de).
+    Retorna a lista de asyncio.Task criadas.
+    """
+    for estagio in estagios:
+        registrar(estagio[0])
+    tarefas = []
+    for estagio in estagios:
+        nome, func = estagio[0], estagio[1]
+        depende_de = estagio[2] if len(estagio) > 2 else None
+        tarefas.append(asyncio.create_task(asyncio.to_thread(executar, nome, func, depende_de), name=f"warmup-{nome}"))
+    return tarefas
+
+
+def status() -> dict:
+    """Retorna uma cópia do estado de todos os estágios."""
+    with _lock:
+        return {nome: dict(info) for nome, info in _estagios.items()}
+
+
+def concluido(nome: str) -> bool:
+    """True se o estágio terminou com sucesso."""
+    with _lock:
+        return _estagios.get(nome, {}).get("status") == CONCLUIDO
+
+
+def pronto() -> bool:
+    """True quando todos os estágios registrados terminaram (com sucesso ou falha)."""
+    with _lock:
+        return all(info.get("status") in (CONCLUIDO, FALHOU) for info in _estagios.values())
@@ -0,0 +1,126 @@
+"""
+webhook_capture.py - Gravação do tráfego recebido no /webhook para replay offline.
+
+Com WEBHOOK_CAPTURE=true, cada POST recebido é gravado (uma linha JSON por
+requisição) com o horário de chegada e o tempo de processamento, para ser
+reproduzido depois por `python -m tests.replay_webhook` contra a planilha fake e
+o stub da Graph API (picos reais da manhã, efeito de mudanças de cache etc.).
+
+Os payloads são anonimizados antes de gravar:
+- telefones (from, wa_id, recipient_id) viram pseudônimos estáveis (HMAC), então
+  a sequência de mensagens de cada paciente continua reconhecível;
+- nome do perfil vira "Paciente";
+- texto livre vira "Paciente Anônimo" (dígitos curtos e palavras de menu são mantidos,
+  porque dirigem o fluxo).
+
+O arquivo é rotativo (como logs/app.log): WEBHOOK_CAPTURE_MAX_MB por arquivo,
+WEBHOOK_CAPTURE_BACKUPS arquivos antigos (.1, .2, ...).
+
+Configuração via .env:
+- WEBHOOK_CAPTURE=true/false (padrão: false)
+- WEBHOOK_CAPTURE_FILE=logs/webhook_capture.jsonl
+- WEBHOOK_CAPTURE_MAX_MB=10
+- WEBHOOK_CAPTURE_BACKUPS=5
+- WEBHOOK_CAPTURE_SALT=<segredo> (fixe para manter os pseudônimos entre reinícios e processos)
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import logging.handlers
+import os
+import re
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+ATIVO = os.getenv('WEBHOOK_CAPTURE', 'false').lower() == 'true'
+ARQUIVO = os.getenv('WEBHOOK_CAPTURE_FILE', os.path.join('logs', 'webhook_capture.jsonl'))
+MAX_BYTES = int(float(os.getenv('WEBHOOK_CAPTURE_MAX_MB', '10')) * 1024 * 1024)
+BACKUPS = int(os.getenv('WEBHOOK_CAPTURE_BACKUPS', '5'))
+_SALT = (os.getenv('WEBHOOK_CAPTURE_SALT') or uuid.uuid4().hex).encode('utf-8')
+
+CAMPOS_TELEFONE = {'from', 'wa_id', 'recipient_id'}
+TEXTO_ANONIMO = 'Paciente Anônimo'
+NOME_ANONIMO = 'Paciente'
+# textos que dirigem o fluxo e não identificam ninguém
+_TEXTO_PERMITIDO = re.compile(r'^\s*(\d{1,2}|oi|olá|ola|menu|sim|não|nao|voltar|cancelar|ok)\s*$', re.IGNORECASE)
+
+_capture_logger = None
+_lock = threading.Lock()
+
+
+def _obter_logger():
+    """Logger dedicado (sem propagar para o root) com arquivo rotativo; criado no primeiro uso."""
+    global _capture_logger
+    with _lock:
+        if _capture_logger is None:
+            pasta = os.path.dirname(ARQUIVO)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(ARQUIVO, maxBytes=MAX_BYTES, backupCount=BACKUPS,
+                                                           encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            cap = logging.getLogger('webhook_capture.arquivo')
+            cap.handlers = [handler]
+            cap.setLevel(logging.INFO)
+            cap.propagate = False
+            _capture_logger = cap
+        return _capture_logger
+
+
+# -------------------------------------------------------
+# Anonimização
+# -------------------------------------------------------
+
+def pseudonimo_telefone(telefone: str) -> str:
+    """Telefone fictício estável (55 + 11 dígitos derivados do HMAC do número)."""
+    digest = hmac.new(_SALT, str(telefone).encode('utf-8'), hashlib.sha256).hexdigest()
+    return '55' + str(int(digest[:16], 16))[-11:].zfill(11)
+
+
+def _anonimizar_texto(texto):
+    if not isinstance(texto, str) or _TEXTO_PERMITIDO.match(texto):
+        return texto
+    return TEXTO_ANONIMO
+
+
+def anonimizar(valor, chave_pai: str = None):
+    """Cópia do payload com telefones, nomes e texto livre substituídos."""
+    if isinstance(valor, dict):
+        saida = {}
+        for chave, v in valor.items():
+            if chave in CAMPOS_TELEFONE and isinstance(v, str):
+                saida[chave] = pseudonimo_telefone(v)
+            elif chave == 'name' and chave_pai == 'profile':
+                saida[chave] = NOME_ANONIMO
+            elif chave == 'body' and chave_pai == 'text':
+                saida[chave] = _anonimizar_texto(v)
+            else:
+                saida[chave] = anonimizar(v, chave)
+        return saida
+    if isinstance(valor, list):
+        return [anonimizar(v, chave_pai) for v in valor]
+    return valor
+
+
+# -------------------------------------------------------
+# Gravação
+# -------------------------------------------------------
+
+def registrar(payload: dict, recebido_em: float, duracao_ms: float, status: int = 200):
+    """Grava uma requisição recebida (não faz nada com WEBHOOK_CAPTURE desligado; nunca levanta exceção)."""
+    if not ATIVO:
+        return
+    try:
+        linha = json.dumps({
+            't': round(recebido_em, 3),
+            'duracao_ms': round(duracao_ms, 1),
+            'status': status,
+            'payload': anonimizar(payload),
+        }, ensure_ascii=False)
+        _obter_logger().info(linha)
+    except Exception:
+        logger.exception('[webhook_capture] Falha ao gravar requisição capturada')
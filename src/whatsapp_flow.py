@@ -9,6 +9,7 @@ from src.agenda_service import *
 import re
 from src import messages as MSG
 import logging
+from time import perf_counter  # `time` já vem de agenda_service (datetime.time)
 
 # Imports da refatoração: constantes e helpers
 from src.constants import (
@@ -18,6 +19,7 @@ from src.constants import (
     BUTTON_ID_REAGENDAR,
     BUTTON_ID_CANCELAR,
     BUTTON_ID_VALORES,
+    BUTTON_ID_PRIMEIRO_HORARIO,
     BUTTON_ID_VOLTAR,
     BUTTON_ID_CANCELAR_OPERACAO,
     BUTTON_ID_CONFIRMAR,
@@ -36,6 +38,8 @@ from src.flow_helpers import (
     build_return_to_menu_message,
 )
 
+from src.logging_config import log_evento
+
 logger = logging.getLogger(__name__)
 
 # Helper: weekday names in Portuguese (sem "-feira" para consistência visual)
@@ -159,6 +163,20 @@ def processar_mensagem(usuario_id, mensagem):
             # Mantém o usuário no menu principal após exibir as informações
             return f"{MSG.PAYMENT_TITLE}\n{MSG.PAYMENT_INFO}\n"
 
+        # Opção 5: Primeiro horário livre (atalho direto para a confirmação)
+        elif mensagem == BUTTON_ID_PRIMEIRO_HORARIO:
+            slot = primeiro_slot_livre(dias=NUM_DIAS_GERAR_SLOTS)
+            if slot is None:
+                return build_return_to_menu_message(MSG.NO_SLOTS_SOON)
+            sessoes[SessionKeys.get_user_key(usuario_id, SessionKeys.SEMANA_OFFSET)] = _semana_offset_da_data(slot.date())
+            sessoes[SessionKeys.get_user_key(usuario_id, SessionKeys.DIA_ESCOLHIDO)] = slot.date()
+            sessoes[SessionKeys.get_user_key(usuario_id, SessionKeys.HORARIO_ESCOLHIDO)] = slot
+            sessoes[usuario_id] = CONFIRMAR
+            return MSG.CONFIRM_AGENDAMENTO_TEMPLATE.format(
+                date=format_data_pt(slot),
+                time=slot.strftime('%H:%M')
+            )
+
         # Opção inválida
         else:
             menu_text, _ = exibir_menu_principal()
@@ -421,7 +439,7 @@ def processar_mensagem(usuario_id, mensagem):
 
             # Agendar lembretes
             try:
-                from src.agenda_service import registrar_lembrete_agendamento
+                from src.agenda_service import registrar_lembrete_agendamento, chave_lembrete, lembrete_pendente
                 from src.scheduler import schedule_at
                 from datetime import timedelta
 
@@ -433,15 +451,22 @@ def processar_mensagem(usuario_id, mensagem):
                         horario, reminder_dt, usuario_id, nome_paciente,
                         tipo="patient_reminder", observacoes="Agendado via bot"
                     )
-                    print(f"✅ [confirmacao_agendamento] Lembrete registrado na linha {row_idx}")
-                    logger.info(f"[confirmacao_agendamento] Lembrete registrado na linha {row_idx}")
+                    log_evento(logger, logging.INFO, "[confirmacao_agendamento] Lembrete registrado na linha %s", row_idx,
+                               telefone=usuario_id, consulta=horario, linha=row_idx, sucesso=True)
                 except Exception as e:
-                    print(f"🔴 [confirmacao_agendamento] ERRO ao registrar lembrete: {e}")
-                    logger.exception(f"[confirmacao_agendamento] ERRO ao registrar lembrete: {e}")
+                    log_evento(logger, logging.ERROR, "[confirmacao_agendamento] ERRO ao registrar lembrete: %s", e,
+                               telefone=usuario_id, consulta=horario, exc_info=True)
                     row_idx = None
 
                 def _send_and_mark(row=row_idx, phone=usuario_id, dt=horario, patient=nome_paciente):
-                    print(f"🟡 [_send_and_mark] Iniciando envio de lembrete: row={row}, phone={phone}, dt={dt}")
+                    # Outro processo (líder reidratando) pode já ter enviado, ou a consulta foi cancelada
+                    if row and not lembrete_pendente(dt.isoformat(), phone):
+                        log_evento(logger, logging.INFO, "[_send_and_mark] Lembrete (linha %s) já enviado ou cancelado; ignorando", row,
+                                   telefone=phone, consulta=dt, linha=row)
+                        return
+                    log_evento(logger, logging.INFO, "[_send_and_mark] Iniciando envio de lembrete (linha %s)", row,
+                               telefone=phone, consulta=dt, linha=row)
+                    inicio = perf_counter()
                     try:
                         primeiro = (patient or '').split()[0] if patient else ''
                         greeting = f"Olá, {primeiro}!\n" if primeiro else ''
@@ -451,40 +476,39 @@ def processar_mensagem(usuario_id, mensagem):
                         )
                         action = MSG.REMINDER_ACTION_PROMPT if hasattr(MSG, 'REMINDER_ACTION_PROMPT') else ''
                         text = greeting + appt_text + ("\n" + action if action else "")
-                        print(f"🟡 [_send_and_mark] Enviando lembrete para paciente {phone}")
                         from src import whatsapp_webhook
                         whatsapp_webhook.send_reminder_confirm_buttons(phone, text, dt.isoformat())
-                        print(f"✅ [_send_and_mark] Lembrete enviado com sucesso para {phone}")
-                        logger.info(f"[_send_and_mark] Lembrete enviado com sucesso para {phone}")
+                        log_evento(logger, logging.INFO, "[_send_and_mark] Lembrete enviado com sucesso",
+                                   telefone=phone, consulta=dt, linha=row,
+                                   duracao_ms=(perf_counter() - inicio) * 1000, sucesso=True)
                     except Exception as e:
-                        print(f"🔴 [_send_and_mark] ERRO ao enviar lembrete para {phone}: {e}")
-                        logger.exception(f'[_send_and_mark] ERRO ao enviar lembrete para {phone}: {e}')
+                        log_evento(logger, logging.ERROR, "[_send_and_mark] ERRO ao enviar lembrete: %s", e,
+                                   telefone=phone, consulta=dt, linha=row, exc_info=True)
 
-                    # Tentar deletar o lembrete da planilha
+                    # Tentar deletar o lembrete da planilha: pelo agendamento (telefone + data/hora) e não
+                    # pela linha, pois remoções de outros lembretes desde o registro deslocam os índices
                     try:
-                        if row:
-                            print(f"🟡 [_send_and_mark] Tentando remover lembrete da linha {row}")
-                            removed = remover_lembrete_por_row(row)
-                            if removed:
-                                print(f"✅ [_send_and_mark] Lembrete (linha {row}) removido com SUCESSO")
-                                logger.info(f"[_send_and_mark] Lembrete (linha {row}) removido com SUCESSO")
-                            else:
-                                print(f"🔴 [_send_and_mark] Falha ao remover lembrete (linha {row}) - retornou False")
-                                logger.warning(f"[_send_and_mark] Falha ao remover lembrete (linha {row}) - retornou False")
+                        if dt:
+                            removed = remover_lembretes_por_appointment(dt.isoformat(), phone) > 0
                         else:
-                            print(f"🔴 [_send_and_mark] row_idx é None, não removendo lembrete")
-                            logger.warning(f"[_send_and_mark] row_idx é None, não removendo lembrete")
+                            removed = bool(row) and remover_lembrete_por_row(row)
+                        if removed:
+                            log_evento(logger, logging.INFO, "[_send_and_mark] Lembrete (linha %s) removido com SUCESSO", row,
+                                       telefone=phone, linha=row, sucesso=True)
+                        else:
+                            log_evento(logger, logging.WARNING, "[_send_and_mark] Falha ao remover lembrete (linha %s) - nada removido", row,
+                                       telefone=phone, consulta=dt, linha=row)
                     except Exception as e:
-                        print(f"🔴 [_send_and_mark] ERRO ao remover lembrete (linha {row}): {e}")
-                        logger.exception(f"[_send_and_mark] ERRO ao remover lembrete (linha {row}): {e}")
+                        log_evento(logger, logging.ERROR, "[_send_and_mark] ERRO ao remover lembrete (linha %s): %s", row, e,
+                                   telefone=phone, linha=row, exc_info=True)
 
                 if reminder_dt > agora_brasil():  # Usa horário do Brasil
-                    print(f"🟡 [confirmacao_agendamento] Agendando lembrete para {reminder_dt}")
-                    logger.info(f"[confirmacao_agendamento] Agendando lembrete para {reminder_dt}")
-                    schedule_at(reminder_dt, _send_and_mark)
+                    log_evento(logger, logging.INFO, "[confirmacao_agendamento] Agendando lembrete para %s", reminder_dt,
+                               telefone=usuario_id, consulta=horario)
+                    schedule_at(reminder_dt, _send_and_mark, job_id=chave_lembrete(horario.isoformat(), usuario_id))
                 else:
-                    print(f"🟡 [confirmacao_agendamento] Enviando lembrete imediatamente (já passou da hora de agendamento)")
-                    logger.info(f"[confirmacao_agendamento] Enviando lembrete imediatamente (já passou da hora de agendamento)")
+                    log_evento(logger, logging.INFO, "[confirmacao_agendamento] Enviando lembrete imediatamente (já passou da hora de agendamento)",
+                               telefone=usuario_id, consulta=horario)
                     _send_and_mark()
 
                 # Notificar dono da clínica
@@ -635,13 +659,16 @@ def processar_mensagem(usuario_id, mensagem):
 def exibir_semanas_disponiveis(usuario_id):
     return f"{MSG.WEEKS_PROMPT}\n1️⃣ {MSG.WEEK_THIS}\n2️⃣ {MSG.WEEK_NEXT}\n⬅️ {MSG.LABEL_VOLTA}"
 
+def _semana_offset_da_data(dia):
+    """Offset de semana (0 = atual) que contém `dia`, para o Voltar a partir do atalho de primeiro horário."""
+    inicio, _ = obter_intervalo_semana_relativa(0)
+    return max(0, (dia - inicio).days // 7)
+
 # Função para obter dias disponíveis na semana
 def obter_dias_disponiveis_semana(semana_offset=0):
-    from src.agenda_service import obter_intervalo_semana_relativa, obter_slots_disponiveis_no_intervalo
+    from src.agenda_service import obter_intervalo_semana_relativa, obter_dias_com_vaga
     inicio, fim = obter_intervalo_semana_relativa(semana_offset)
-    slots = obter_slots_disponiveis_no_intervalo(inicio, fim)
-    dias_unicos = sorted(set([slot.date() for slot in slots]))
-    return dias_unicos
+    return obter_dias_com_vaga(inicio, fim)  # consulta o bitmap de disponibilidade
 
 # Função para exibir dias disponíveis
 def exibir_dias_disponiveis(usuario_id, semana_offset=0):
@@ -1,11 +1,15 @@
 from fastapi import FastAPI, Request, HTTPException, Response  # importa FastAPI e tipos Request/HTTPException/Response
 import os  # importa módulo para variáveis de ambiente
+import sys  # acesso a módulos já carregados
 import requests  # importa requests para chamadas HTTP à Graph API
 from dotenv import load_dotenv  # importa load_dotenv para carregar .env
 import logging  # importa logging para logs
-import json  # importa json para serializar payloads de debug
+import threading  # thread de failover do líder
+import time  # horário de chegada e duração das requisições capturadas
+from time import perf_counter  # cronômetro em funções cujo parâmetro `time` esconde o módulo
+from contextlib import asynccontextmanager  # lifespan do FastAPI (warmup em background)
 from datetime import datetime, timezone, timedelta  # tipos de data/hora
-from src.logging_config import setup_logging  # importa configuração centralizada de logging
+from src.logging_config import setup_logging, log_evento, json_preguicoso  # configuração centralizada de logging e eventos estruturados
 
 setup_logging()  # configura logging com handlers de console e arquivo
 logger = logging.getLogger(__name__)  # obtém logger do módulo
@@ -20,10 +24,13 @@ def agora_brasil() -> datetime:
     return brazil_now.replace(tzinfo=None)
 from src.agenda_service import (
     buscar_perfil_por_telefone,
+    buscar_perfil_em_cache,
     criar_cadastro_paciente,
     remover_lembrete_por_row,
     remover_lembretes_por_appointment,
     obter_lembretes_pendentes,
+    chave_lembrete,
+    lembrete_pendente,
 )
 
 
@@ -39,35 +46,110 @@ load_dotenv()  # carrega variáveis de ambiente de um arquivo .env quando presen
 WHATSAPP_TOKEN = os.environ.get("WHATSAPP_TOKEN")  # token do WhatsApp Cloud
 WHATSAPP_PHONE_ID = os.environ.get("WHATSAPP_PHONE_ID")  # id do telefone/container
 VERIFY_TOKEN = os.environ.get("VERIFY_TOKEN")  # token de verificação para webhook
-GRAPH_API_BASE = f"https://graph.facebook.com/v17.0/{WHATSAPP_PHONE_ID}/messages"  # endpoint da Graph API
+GRAPH_API_URL = os.environ.get("GRAPH_API_URL", "https://graph.facebook.com/v17.0")  # base da Graph API (ex.: stub local em testes de carga)
+GRAPH_API_BASE = f"{GRAPH_API_URL.rstrip('/')}/{WHATSAPP_PHONE_ID}/messages"  # endpoint da Graph API
 
 from src import whatsapp_flow as wf  # importa lógica do fluxo conversacional (módulo local)
 from src import messages as MSG
 from src import scheduler
-from src import ngrok_service  # Auto-inicia ngrok se NGROK_ENABLED=true
+from src import warmup
+from src import leader_election
+from src import call_budget
+from src import webhook_capture
+from src import profiling
+from src import metrics
+from src import tracing
 
-app = FastAPI()  # instancia FastAPI
 
-# Log URL do ngrok se habilitado
-if ngrok_service.is_enabled():
+# -------------------------------------------------------
+# Estágios de warmup (executados em background pelo lifespan)
+# -------------------------------------------------------
+
+def _iniciar_ngrok():
+    """Inicia o túnel ngrok (se NGROK_ENABLED=true) e loga a URL do webhook."""
+    from src import ngrok_service
+    if not ngrok_service.is_enabled():
+        return
+    ngrok_service.start()
     tunnel_url = ngrok_service.get_tunnel_url()
     if tunnel_url:
         logger.info('[startup] Ngrok tunnel: %s/webhook', tunnel_url)
 
-# -------------------------------------------------------
-# Inicialização de slots na startup
-# -------------------------------------------------------
-try:
+
+def _inicializar_slots():
+    """Gera na aba Agenda os slots dos próximos NUM_DIAS_GERAR_SLOTS dias (somente no líder)."""
     from src.agenda_service import inicializar_slots_proximos_dias, NUM_DIAS_GERAR_SLOTS
+    if not leader_election.sou_lider():
+        logger.info('[startup] Não é o líder; inicialização de slots fica com o líder')
+        return
     logger.info('[startup] Inicializando slots para os próximos %d dias...', NUM_DIAS_GERAR_SLOTS)
     inicializar_slots_proximos_dias()
     logger.info('[startup] Slots inicializados com sucesso!')
-except Exception:
-    logger.exception('[startup] Falha ao inicializar slots na agenda')
 
 
-def send_text(to: str, text: str):
+def _aquecer_cadastros():
+    """Carrega o mapa telefone -> nome usado pelo webhook e pela reidratação de lembretes."""
+    from src.agenda_service import obter_mapa_nomes_cadastros
+    mapa = obter_mapa_nomes_cadastros()
+    logger.info('[startup] Cache de cadastros carregado (%d telefones)', len(mapa))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Dispara o warmup em background e libera o servidor imediatamente.
+    Enquanto os estágios rodam, os webhooks já são atendidos (caches frios caem
+    na leitura direta da planilha). O progresso fica visível em /ready.
+    Jobs diários e de manutenção só rodam no processo líder (leader_election).
+    """
+    leader_election.iniciar()  # uma tentativa síncrona (I/O local, rápido) antes dos estágios
+    warmup.iniciar([
+        ("ngrok", _iniciar_ngrok),
+        ("slots", _inicializar_slots),
+        ("cadastros", _aquecer_cadastros),
+        ("resumo_diario", _agendar_resumo_diario),
+        ("slots_diarios", _agendar_slots_diarios, ["slots"]),  # ambos escrevem no fim da aba Agenda
+        ("arquivamento", _agendar_arquivamento, ["slots_diarios"]),  # remove linhas: depois de quem escreve
+        ("lembretes", reidratar_lembretes_pendentes, ["cadastros"]),
+    ])
+    yield
+    leader_election.parar()  # libera o lease para outro processo assumir sem esperar o TTL
+    ngrok_service = sys.modules.get('src.ngrok_service')  # só existe se o estágio "ngrok" o importou
+    if ngrok_service is not None:
+        try:
+            ngrok_service.stop()
+        except Exception:
+            logger.exception('[shutdown] Falha ao parar túnel ngrok')
+
+
+app = FastAPI(lifespan=lifespan)  # instancia FastAPI
+
+_graph_session = requests.Session()  # reaproveita conexões HTTP com a Graph API
+_graph_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=20))  # envios concorrentes (lembretes)
+_graph_session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=20))
+
+
+def _post_graph(payload: dict, timeout: float = 15):
+    """POST de uma mensagem na Graph API (GRAPH_API_BASE é lido a cada chamada)."""
     headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}  # headers para autorização e content-type
+    call_budget.registrar('graph_posts', payload.get('type'))  # conta o envio na mensagem atual
+    status = 'erro'  # exceção de rede (timeout, conexão recusada)
+    inicio = time.perf_counter()
+    with tracing.span('graph.post', tipo=payload.get('type')) as sp:
+        try:
+            r = _graph_session.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=timeout)
+            status = r.status_code
+            return r
+        finally:
+            metrics.GRAPH_LATENCIA.observar(time.perf_counter() - inicio)
+            metrics.GRAPH_RESPOSTAS.inc(status=status)
+            if sp is not None:
+                sp.atributos['status'] = status
+
+
+
+@tracing.rastrear()
+def send_text(to: str, text: str):
     payload = {  # payload JSON para mensagem de texto
         "messaging_product": "whatsapp",
         "to": to,
@@ -76,10 +158,10 @@ def send_text(to: str, text: str):
     }
     try:
         logger.info("[send_text] Sending to %s", to)  # log simples do destino
-        r = requests.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=15)  # chama a Graph API
+        r = _post_graph(payload)  # chama a Graph API
         if r.status_code != 200:
             logger.error("[send_text] Error sending to %s - Status: %s | Payload: %s | Response: %s",
-                        to, r.status_code, json.dumps(payload, ensure_ascii=False), r.text)  # log detalhado em caso de erro
+                        to, r.status_code, json_preguicoso(payload), r.text)  # log detalhado em caso de erro
         else:
             logger.info("[send_text] Successfully sent to %s", to)  # log de sucesso
         return r  # retorna o response para o chamador
@@ -88,6 +170,7 @@ def send_text(to: str, text: str):
         raise  # re-levanta exceção para tratamento externo
 
 
+@tracing.rastrear()
 def send_reminder(to: str, text: str):
     """Wrapper to send reminder messages (reuses send_text). Kept as a single place to extend later."""
     try:
@@ -123,6 +206,7 @@ def notify_dev_error(error_msg: str, context: str = ""):
         # Não relançar exceção - se falhar, apenas loga
 
 
+@tracing.rastrear()
 def send_reminder_to_owner(patient_name: str, date: str, time: str, isCancel: bool = False,
                            isReschedule: bool = False, old_date: str = None, old_time: str = None):
     """
@@ -139,12 +223,10 @@ def send_reminder_to_owner(patient_name: str, date: str, time: str, isCancel: bo
     """
     owner = MSG.CLINIC_OWNER_PHONE
     if not owner:
-        print("🔴 [send_reminder_to_owner] CLINIC_OWNER_PHONE NÃO está configurado em messages.py! Pulando notificação para dono")
-        logger.warning("[send_reminder_to_owner] CLINIC_OWNER_PHONE not configured in messages.py; skipping owner notification")
+        log_evento(logger, logging.WARNING,
+                   "[send_reminder_to_owner] CLINIC_OWNER_PHONE not configured in messages.py; skipping owner notification")
         return None
 
-    print(f"🟡 [send_reminder_to_owner] Preparando notificacao para dono: phone={owner}, patient={patient_name}, date={date}, time={time}, isCancel={isCancel}, isReschedule={isReschedule}")
-
     try:
         if isReschedule and old_date and old_time:
             # Reagendamento: mensagem única com info antiga e nova
@@ -155,7 +237,7 @@ def send_reminder_to_owner(patient_name: str, date: str, time: str, isCancel: bo
                 new_date=date,
                 new_time=time
             )
-            print(f"🟡 [send_reminder_to_owner] Tipo: REAGENDAMENTO")
+            tipo = 'reagendamento'
         elif isCancel:
             # Cancelamento simples
             text = MSG.OWNER_REMINDER_CANCEL_TEMPLATE.format(
@@ -163,7 +245,7 @@ def send_reminder_to_owner(patient_name: str, date: str, time: str, isCancel: bo
                 date=date,
                 time=time
             )
-            print(f"🟡 [send_reminder_to_owner] Tipo: CANCELAMENTO")
+            tipo = 'cancelamento'
         else:
             # Novo agendamento
             text = MSG.OWNER_REMINDER_TEMPLATE.format(
@@ -171,64 +253,90 @@ def send_reminder_to_owner(patient_name: str, date: str, time: str, isCancel: bo
                 date=date,
                 time=time
             )
-            print(f"🟡 [send_reminder_to_owner] Tipo: NOVO AGENDAMENTO")
+            tipo = 'novo'
 
-        print(f"🟡 [send_reminder_to_owner] Enviando para {owner}...")
+        inicio = perf_counter()
         result = send_text(owner, text)
-        print(f"✅ [send_reminder_to_owner] Notificacao enviada com SUCESSO para {owner}")
-        logger.info("[send_reminder_to_owner] Notificacao enviada com sucesso para %s", owner)
+        log_evento(logger, logging.INFO, "[send_reminder_to_owner] Notificacao (%s) enviada com sucesso ao dono", tipo,
+                   data=date, hora=time, tipo=tipo, duracao_ms=(perf_counter() - inicio) * 1000, sucesso=True)
         return result
     except Exception as e:
-        print(f"🔴 [send_reminder_to_owner] ERRO ao notificar dono {owner}: {str(e)}")
-        logger.exception("[send_reminder_to_owner] ERRO ao notificar dono %s: %s", owner, str(e))
+        log_evento(logger, logging.ERROR, "[send_reminder_to_owner] ERRO ao notificar dono: %s", e,
+                   data=date, hora=time, exc_info=True)
         return None
 
 
-# Schedule daily summary for owner at configured hour
-try:
-    _owner_summary_sent_dates = set()
+def _ja_executado_hoje(tarefa: str, hoje: str, executados: set) -> bool:
+    """Checa o set local e o registro compartilhado entre processos (lease do líder)."""
+    if hoje in executados:
+        return True
+    if leader_election.ja_executou(tarefa, hoje):
+        executados.add(hoje)
+        return True
+    return False
 
-    def _owner_daily_summary():
-        try:
-            from src.agenda_service import obter_todos_agenda_cached
-            todos = obter_todos_agenda_cached()[1:]
-            hoje_dt = agora_brasil()  # Usa horário do Brasil
-            hoje = hoje_dt.strftime('%d/%m/%Y')
-            if hoje in _owner_summary_sent_dates:
-                logger.info('[daily_summary] already sent for %s, skipping', hoje)
-                return
-            linhas = [l for l in todos if len(l) >= 6 and l[1].strip() == hoje and l[5].strip().upper() == 'AGENDADO']
-            owner = MSG.CLINIC_OWNER_PHONE
-            if not owner:
-                logger.info('[daily_summary] no owner configured, skipping')
-                return
-            if not linhas:
-                logger.info('[daily_summary] no appointments for %s', hoje)
-                # Send an explicit message to the owner stating there are no appointments today
-                try:
-                    send_text(owner, f"Não há agendamentos para hoje ({hoje}).")
-                except Exception:
-                    logger.exception('[daily_summary] failed sending empty summary to owner')
-                _owner_summary_sent_dates.add(hoje)
-                return
-            # build summary text
-            texto = f"Agendamentos para hoje ({hoje}):\n"
-            for ln in linhas:
-                hora = ln[2].strip()
-                paciente = ln[3].strip() or 'Paciente'
-                telefone = ln[4].strip() or ''
-                texto += f"- {hora} {paciente} {telefone}\n"
-            send_text(owner, texto)
-            _owner_summary_sent_dates.add(hoje)
-        except Exception:
-            logger.exception('[daily_summary] error while building owner summary')
 
+def _marcar_executado_hoje(tarefa: str, hoje: str, executados: set):
+    executados.add(hoje)
+    leader_election.registrar_execucao(tarefa, hoje)  # evita repetir após failover
+
+
+# Resumo diário para o dono no horário configurado
+_owner_summary_sent_dates = set()
+
+
+def _owner_daily_summary():
+    try:
+        from src.agenda_service import obter_agenda_futura_cached
+        hoje_dt = agora_brasil()  # Usa horário do Brasil
+        hoje = hoje_dt.strftime('%d/%m/%Y')
+        if not leader_election.sou_lider():
+            logger.info('[daily_summary] not the leader, skipping')
+            return
+        if _ja_executado_hoje('resumo_diario', hoje, _owner_summary_sent_dates):
+            logger.info('[daily_summary] already sent for %s, skipping', hoje)
+            return
+        snapshot = obter_agenda_futura_cached()  # só o líder, e só se o resumo ainda não saiu, lê a Agenda
+        linhas = [snapshot.linha(r) for r in snapshot.filtrar(status='AGENDADO', data=hoje_dt.date()).tolist()]
+        owner = MSG.CLINIC_OWNER_PHONE
+        if not owner:
+            logger.info('[daily_summary] no owner configured, skipping')
+            return
+        if not linhas:
+            logger.info('[daily_summary] no appointments for %s', hoje)
+            # Send an explicit message to the owner stating there are no appointments today
+            try:
+                send_text(owner, f"Não há agendamentos para hoje ({hoje}).")
+            except Exception:
+                logger.exception('[daily_summary] failed sending empty summary to owner')
+            _marcar_executado_hoje('resumo_diario', hoje, _owner_summary_sent_dates)
+            return
+        # build summary text
+        texto = f"Agendamentos para hoje ({hoje}):\n"
+        for ln in linhas:
+            hora = ln[2].strip()
+            paciente = ln[3].strip() or 'Paciente'
+            telefone = ln[4].strip() or ''
+            texto += f"- {hora} {paciente} {telefone}\n"
+        send_text(owner, texto)
+        _marcar_executado_hoje('resumo_diario', hoje, _owner_summary_sent_dates)
+    except Exception:
+        logger.exception('[daily_summary] error while building owner summary')
+
+
+def _agendar_resumo_diario():
+    """Estágio de warmup: agenda o resumo diário e envia o de hoje se o horário já passou."""
     # schedule first daily run
     schedule_hour = int(getattr(MSG, 'OWNER_DAILY_SUMMARY_HOUR', 7))
     scheduler.schedule_daily(schedule_hour, 0, _owner_daily_summary)
 
-    # If current time is past scheduled hour and today's summary not yet sent, send it now
+    _verificar_resumo_de_hoje()
+
+
+def _verificar_resumo_de_hoje():
+    """If current time is past scheduled hour and today's summary not yet sent, send it now."""
     try:
+        schedule_hour = int(getattr(MSG, 'OWNER_DAILY_SUMMARY_HOUR', 7))
         now = agora_brasil()  # Usa horário do Brasil
         if now.hour >= schedule_hour:
             hoje = now.strftime('%d/%m/%Y')
@@ -237,37 +345,80 @@ try:
                 _owner_daily_summary()
     except Exception:
         logger.exception('[daily_summary] error when checking immediate send')
-except Exception:
-    logger.exception('[webhook] Failed to schedule daily owner summary')
-
-# Schedule daily slot creation to maintain rolling window
-try:
-    _daily_slots_created_dates = set()
-
-    def _daily_add_future_slots():
-        """
-        Adiciona slots para o dia que está NUM_DIAS_GERAR_SLOTS dias no futuro.
-        Mantém janela deslizante de slots disponíveis.
-        """
-        try:
-            from src.agenda_service import adicionar_slots_dia_futuro
-            hoje = agora_brasil().strftime('%d/%m/%Y')  # Usa horário do Brasil
 
-            if hoje in _daily_slots_created_dates:
-                logger.info('[daily_slots] slots already created for %s, skipping', hoje)
-                return
 
-            logger.info('[daily_slots] Adding future slots for rolling window...')
-            adicionar_slots_dia_futuro()
-            _daily_slots_created_dates.add(hoje)
-            logger.info('[daily_slots] Future slots added successfully')
-        except Exception:
-            logger.exception('[daily_slots] error while adding future slots')
+# Criação diária de slots para manter a janela deslizante
+_daily_slots_created_dates = set()
+
+
+def _daily_add_future_slots():
+    """
+    Adiciona slots para o dia que está NUM_DIAS_GERAR_SLOTS dias no futuro.
+    Mantém janela deslizante de slots disponíveis.
+    """
+    try:
+        from src.agenda_service import adicionar_slots_dia_futuro
+        hoje = agora_brasil().strftime('%d/%m/%Y')  # Usa horário do Brasil
+
+        if not leader_election.sou_lider():
+            logger.info('[daily_slots] not the leader, skipping')
+            return
+        if _ja_executado_hoje('slots_diarios', hoje, _daily_slots_created_dates):
+            logger.info('[daily_slots] slots already created for %s, skipping', hoje)
+            return
+
+        logger.info('[daily_slots] Adding future slots for rolling window...')
+        adicionar_slots_dia_futuro()
+        _marcar_executado_hoje('slots_diarios', hoje, _daily_slots_created_dates)
+        logger.info('[daily_slots] Future slots added successfully')
+    except Exception:
+        logger.exception('[daily_slots] error while adding future slots')
+
 
+def _agendar_slots_diarios():
+    """Estágio de warmup: agenda a criação diária de slots (00:01) e roda a de hoje se ainda não rodou."""
     # Agendar para rodar à meia-noite todos os dias (00:01)
     scheduler.schedule_daily(0, 1, _daily_add_future_slots)
+    _verificar_slots_de_hoje()
 
-    # Se já passou da meia-noite e ainda não rodou hoje, rodar agora
+
+# Arquivamento diário das linhas antigas da Agenda (src/historico_agenda.py)
+_agenda_archived_dates = set()
+
+
+def _daily_archive_agenda():
+    """Move as linhas antigas da Agenda para o histórico (uma vez por dia, só no líder)."""
+    try:
+        from src import historico_agenda
+        if not historico_agenda.ENABLED:
+            return
+        hoje = agora_brasil().strftime('%d/%m/%Y')
+        if not leader_election.sou_lider():
+            logger.info('[historico] not the leader, skipping')
+            return
+        if _ja_executado_hoje('arquivamento_agenda', hoje, _agenda_archived_dates):
+            logger.info('[historico] already archived for %s, skipping', hoje)
+            return
+        historico_agenda.arquivar_linhas_antigas()
+        _marcar_executado_hoje('arquivamento_agenda', hoje, _agenda_archived_dates)
+    except Exception:
+        logger.exception('[historico] error while archiving old Agenda rows')
+
+
+def _agendar_arquivamento():
+    """Estágio de warmup: agenda o arquivamento diário (opt-in via AGENDA_ARCHIVE_ENABLED).
+
+    Não arquiva durante o startup: só o job agendado ou a CLI
+    (python -m src.historico_agenda) removem linhas da Agenda.
+    """
+    from src import historico_agenda
+    if not historico_agenda.ENABLED:
+        return
+    scheduler.schedule_daily(historico_agenda.ARCHIVE_HOUR, 0, _daily_archive_agenda)
+
+
+def _verificar_slots_de_hoje():
+    """Se já passou da meia-noite e ainda não rodou hoje, rodar agora."""
     try:
         now = agora_brasil()  # Usa horário do Brasil
         hoje = now.strftime('%d/%m/%Y')
@@ -276,16 +427,14 @@ try:
             _daily_add_future_slots()
     except Exception:
         logger.exception('[daily_slots] error when checking immediate slot creation')
-except Exception:
-    logger.exception('[webhook] Failed to schedule daily slot creation')
 
-# (startup pending reminders logic is executed after helper functions are defined)
 
 
+
+@tracing.rastrear()
 def send_menu_buttons(to: str, text: str, items: list = None):
     # Envia o menu principal como uma única lista interativa com 4 opções.
     # `items` (opcional) deve ser uma lista de tuples (id, title, description).
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
 
     # O header de uma lista tem limite de 60 caracteres; usamos apenas a primeira
     # linha do `text` como header. Se essa primeira linha exceder 60 chars,
@@ -350,10 +499,10 @@ def send_menu_buttons(to: str, text: str, items: list = None):
     }
     try:
         logger.info("[send_menu_buttons] Sending to %s", to)  # log simples do destino
-        r = requests.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=15)  # envia para Graph API
+        r = _post_graph(payload)  # envia para Graph API
         if r.status_code != 200:
             logger.error("[send_menu_buttons] Error sending to %s - Status: %s | Payload: %s | Response: %s",
-                        to, r.status_code, json.dumps(payload, ensure_ascii=False), r.text)  # log detalhado em caso de erro
+                        to, r.status_code, json_preguicoso(payload), r.text)  # log detalhado em caso de erro
         else:
             logger.info("[send_menu_buttons] Successfully sent to %s", to)  # log de sucesso
         return r  # retorna response
@@ -362,8 +511,8 @@ def send_menu_buttons(to: str, text: str, items: list = None):
         raise  # re-levanta
 
 
+@tracing.rastrear()
 def send_weeks_buttons(to: str, text: str):
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}  # headers
     # botões de seleção de semana em português
     payload = {  # payload interativo com opções de semana
         "messaging_product": "whatsapp",
@@ -383,10 +532,10 @@ def send_weeks_buttons(to: str, text: str):
     }
     try:
         logger.info("[send_weeks_buttons] Sending to %s", to)  # log simples do destino
-        r = requests.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=15)  # envia
+        r = _post_graph(payload)  # envia
         if r.status_code != 200:
             logger.error("[send_weeks_buttons] Error sending to %s - Status: %s | Payload: %s | Response: %s",
-                        to, r.status_code, json.dumps(payload, ensure_ascii=False), r.text)  # log detalhado em caso de erro
+                        to, r.status_code, json_preguicoso(payload), r.text)  # log detalhado em caso de erro
         else:
             logger.info("[send_weeks_buttons] Successfully sent to %s", to)  # log de sucesso
         return r
@@ -395,9 +544,9 @@ def send_weeks_buttons(to: str, text: str):
         raise
 
 
+@tracing.rastrear()
 def send_list_days(to: str, title: str, items: list):
     # items: list of tuples (id, title, description)
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}  # headers
     sections = [{"title": MSG.LIST_SECTION_TITLE, "rows": []}]  # cria seção principal da lista
     for id_, t, desc in items:  # percorre itens e adiciona como linhas
         # títulos e descrições em português
@@ -416,11 +565,11 @@ def send_list_days(to: str, title: str, items: list):
     }
     try:
         logger.info("[send_list_days] Sending to %s payload header=%s rows=%d", to, title, sum(len(s.get('rows',[])) for s in payload['interactive']['action']['sections']))  # log com número de rows
-        r = requests.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=15)  # envia para Graph API
+        r = _post_graph(payload)  # envia para Graph API
         if r.status_code != 200:
             error_summary = f"Status {r.status_code} ao enviar lista para {to}\nTítulo: {title}\nRows: {sum(len(s.get('rows',[])) for s in payload['interactive']['action']['sections'])}\nResposta: {r.text[:200]}"
             logger.error("[send_list_days] Error sending to %s - Status: %s | Payload: %s | Response: %s",
-                        to, r.status_code, json.dumps(payload, ensure_ascii=False), r.text)  # log detalhado em caso de erro
+                        to, r.status_code, json_preguicoso(payload), r.text)  # log detalhado em caso de erro
             notify_dev_error(error_summary, "send_list_days")
         else:
             logger.info("[send_list_days] Successfully sent to %s", to)  # log de sucesso
@@ -432,12 +581,13 @@ def send_list_days(to: str, title: str, items: list):
         raise  # re-levanta
 
 
+@tracing.rastrear()
 def send_list_times(to: str, title: str, items: list):
     return send_list_days(to, title, items)  # wrapper que reutiliza send_list_days para horários
 
 
+@tracing.rastrear()
 def send_confirm_buttons(to: str, text: str):
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}  # headers
     payload = {  # payload com botões de confirmar/voltar/cancelar
         "messaging_product": "whatsapp",
         "to": to,
@@ -456,10 +606,10 @@ def send_confirm_buttons(to: str, text: str):
     }
     try:
         logger.info("[send_confirm_buttons] Sending to %s", to)  # log simples do destino
-        r = requests.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=15)  # envia
+        r = _post_graph(payload)  # envia
         if r.status_code != 200:
             logger.error("[send_confirm_buttons] Error sending to %s - Status: %s | Payload: %s | Response: %s",
-                        to, r.status_code, json.dumps(payload, ensure_ascii=False), r.text)  # log detalhado em caso de erro
+                        to, r.status_code, json_preguicoso(payload), r.text)  # log detalhado em caso de erro
         else:
             logger.info("[send_confirm_buttons] Successfully sent to %s", to)  # log de sucesso
         return r  # retorna response
@@ -468,9 +618,9 @@ def send_confirm_buttons(to: str, text: str):
         raise  # re-levanta
 
 
+@tracing.rastrear()
 def send_reminder_confirm_buttons(to: str, text: str, appointment_iso: str):
     """Sends confirm buttons for a reminder with custom ids encoding the appointment ISO datetime."""
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
     confirm_id = f"rem_confirm|{appointment_iso}"
     cancel_id = f"rem_cancel|{appointment_iso}"
     payload = {
@@ -490,10 +640,10 @@ def send_reminder_confirm_buttons(to: str, text: str, appointment_iso: str):
     }
     try:
         logger.info("[send_reminder_confirm_buttons] Sending to %s", to)
-        r = requests.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=15)
+        r = _post_graph(payload)
         if r.status_code != 200:
             logger.error("[send_reminder_confirm_buttons] Error sending to %s - Status: %s | Payload: %s | Response: %s",
-                        to, r.status_code, json.dumps(payload, ensure_ascii=False), r.text)
+                        to, r.status_code, json_preguicoso(payload), r.text)
         else:
             logger.info("[send_reminder_confirm_buttons] Successfully sent to %s", to)
         return r
@@ -502,8 +652,8 @@ def send_reminder_confirm_buttons(to: str, text: str, appointment_iso: str):
         raise
 
 
+@tracing.rastrear()
 def send_back_cancel_buttons(to: str, text: str = 'Deseja voltar ou cancelar?'):
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}  # headers
     payload = {  # payload com botões Voltar e Cancelar
         "messaging_product": "whatsapp",
         "to": to,
@@ -521,10 +671,10 @@ def send_back_cancel_buttons(to: str, text: str = 'Deseja voltar ou cancelar?'):
     }
     try:
         logger.info("[send_back_cancel_buttons] Sending to %s", to)  # log simples do destino
-        r = requests.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=15)  # envia
+        r = _post_graph(payload)  # envia
         if r.status_code != 200:
             logger.error("[send_back_cancel_buttons] Error sending to %s - Status: %s | Payload: %s | Response: %s",
-                        to, r.status_code, json.dumps(payload, ensure_ascii=False), r.text)  # log detalhado em caso de erro
+                        to, r.status_code, json_preguicoso(payload), r.text)  # log detalhado em caso de erro
         else:
             logger.info("[send_back_cancel_buttons] Successfully sent to %s", to)  # log de sucesso
         return r  # retorna response
@@ -533,9 +683,9 @@ def send_back_cancel_buttons(to: str, text: str = 'Deseja voltar ou cancelar?'):
         raise  # re-levanta
 
 
+@tracing.rastrear()
 def send_back_only_button(to: str, text: str = 'Voltar'):
     """Envia um único botão 'Voltar' (id '0')."""
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
     payload = {
         "messaging_product": "whatsapp",
         "to": to,
@@ -552,10 +702,10 @@ def send_back_only_button(to: str, text: str = 'Voltar'):
     }
     try:
         logger.info("[send_back_only_button] Sending to %s", to)
-        r = requests.post(GRAPH_API_BASE, headers=headers, json=payload, timeout=15)
+        r = _post_graph(payload)
         if r.status_code != 200:
             logger.error("[send_back_only_button] Error sending to %s - Status: %s | Payload: %s | Response: %s",
-                        to, r.status_code, json.dumps(payload, ensure_ascii=False), r.text)
+                        to, r.status_code, json_preguicoso(payload), r.text)
         else:
             logger.info("[send_back_only_button] Successfully sent to %s", to)
         return r
@@ -564,94 +714,200 @@ def send_back_only_button(to: str, text: str = 'Voltar'):
         raise
 
 
-# On startup, load pending reminders from sheet and schedule/send them
-try:
-    from src.agenda_service import obter_lembretes_pendentes
-    from datetime import datetime
+# -------------------------------------------------------
+# Reidratação de lembretes pendentes no startup
+# -------------------------------------------------------
+LEMBRETES_STARTUP_WORKERS = int(os.environ.get("LEMBRETES_STARTUP_WORKERS", "8"))  # envios simultâneos de lembretes atrasados
+
+
+def _montar_texto_lembrete(nome: str, date_text: str, time_text: str) -> str:
+    """Monta o texto do lembrete ao paciente (saudação personalizada + prompt de ação)."""
+    primeiro = (nome or '').split()[0] if nome else ''
+    greeting = f"Olá, {primeiro}!\n" if primeiro else ''
+    appt_text = MSG.REMINDER_TEMPLATE.format(date=date_text, time=time_text)
+    action = MSG.REMINDER_ACTION_PROMPT if hasattr(MSG, 'REMINDER_ACTION_PROMPT') else ''
+    return greeting + appt_text + ("\n" + action if action else "")
+
+
+def _enviar_lembrete_pendente(lemb: dict, nome: str) -> bool:
+    """Envia um lembrete pendente (botões de confirmar/cancelar). Retorna True se enviado."""
+    row = lemb['row']
+    telefone = lemb['telefone']
+    try:
+        texto = _montar_texto_lembrete(nome, lemb['appointment_date'], lemb['appointment_time'])
+        send_reminder_confirm_buttons(telefone, texto, lemb['appointment_iso'])
+        logger.info('[startup] Lembrete enviado com sucesso para %s (linha %s)', telefone, row)
+        return True
+    except Exception as e:
+        logger.exception('[startup] ERRO ao enviar lembrete imediato row=%s phone=%s: %s', row, telefone, str(e))
+        return False
+
+
+def _enviar_lembrete_agendado(row, phone, date_text, time_text, appt_iso):
+    """Job do scheduler: envia um lembrete reidratado no horário e remove sua linha da aba Lembretes.
+
+    O nome é consultado no momento do envio. A linha é removida pelo agendamento
+    (telefone + data/hora) e não pelo índice, pois a remoção em lote dos lembretes
+    atrasados no startup desloca os índices das linhas restantes. Se a linha já
+    não está pendente (outro processo enviou, ou a consulta foi cancelada), não envia.
+    """
+    if appt_iso and not lembrete_pendente(appt_iso, phone):
+        log_evento(logger, logging.INFO, '[startup._send_and_mark_start] Lembrete (linha %s) já enviado ou cancelado; ignorando', row,
+                   telefone=phone, consulta=appt_iso, linha=row)
+        return
+    log_evento(logger, logging.INFO, '[startup._send_and_mark_start] Iniciando envio de lembrete agendado (linha %s)', row,
+               telefone=phone, consulta=appt_iso, linha=row)
+    inicio = perf_counter()
+    try:
+        try:
+            perfil = buscar_perfil_por_telefone(phone)
+            nome = perfil.get('nome') if perfil else ''
+        except Exception:
+            nome = ''
+        send_reminder_confirm_buttons(phone, _montar_texto_lembrete(nome, date_text, time_text), appt_iso)
+        log_evento(logger, logging.INFO, '[startup._send_and_mark_start] Lembrete enviado com sucesso',
+                   telefone=phone, consulta=appt_iso, linha=row, duracao_ms=(perf_counter() - inicio) * 1000, sucesso=True)
+    except Exception as e:
+        log_evento(logger, logging.ERROR, '[startup._send_and_mark_start] ERRO ao enviar lembrete agendado (linha %s): %s', row, e,
+                   telefone=phone, consulta=appt_iso, linha=row, exc_info=True)
+    try:
+        if appt_iso:
+            removidos = remover_lembretes_por_appointment(appt_iso, phone)
+            removed = removidos > 0
+        else:
+            removed = remover_lembrete_por_row(row)
+        if removed:
+            log_evento(logger, logging.INFO, '[startup._send_and_mark_start] Lembrete (linha %s) removido com SUCESSO', row,
+                       telefone=phone, linha=row, sucesso=True)
+        else:
+            log_evento(logger, logging.WARNING, '[startup._send_and_mark_start] Falha ao remover lembrete (linha %s) - nada removido', row,
+                       telefone=phone, linha=row)
+    except Exception as e:
+        log_evento(logger, logging.ERROR, '[startup._send_and_mark_start] ERRO ao remover lembrete da linha %s: %s', row, e,
+                   telefone=phone, linha=row, exc_info=True)
+
+
+def reidratar_lembretes_pendentes():
+    """
+    Carrega os lembretes pendentes e os reagenda/envia, em uma única passada:
+
+      - lê a aba Lembretes e a aba Cadastros UMA vez cada (mapa telefone -> nome);
+      - agenda todos os lembretes futuros de uma vez no scheduler, com id estável
+        (chave_lembrete), então reidratar de novo (failover) não duplica jobs;
+      - envia os lembretes atrasados em paralelo (LEMBRETES_STARTUP_WORKERS);
+      - remove as linhas dos lembretes atrasados em UMA requisição em lote.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from src.agenda_service import obter_mapa_nomes_cadastros_cached, remover_lembretes_por_rows
+
+    if not leader_election.sou_lider():
+        logger.info('[startup] Não é o líder; reidratação de lembretes fica com o líder')
+        return
+
     pendentes = obter_lembretes_pendentes()  # all pending
-    for lemb in pendentes:
-        sched = lemb['scheduled_dt']
-        row = lemb['row']
-        telefone = lemb['telefone']
-        paciente = lemb['paciente']
-        ag_dt = datetime.fromisoformat(lemb['appointment_iso']) if lemb.get('appointment_iso') else None
-        if sched <= agora_brasil():  # Usa horário do Brasil
-            # send immediately (interactive confirm) and mark
-            print(f"🟡 [startup] Enviando lembrete IMEDIATAMENTE (ja passou da hora): row={row}, phone={telefone}, date={lemb['appointment_date']}, time={lemb['appointment_time']}")
-            logger.info('[startup] Enviando lembrete IMEDIATAMENTE (ja passou da hora): row=%s, phone=%s, date=%s, time=%s', row, telefone, lemb['appointment_date'], lemb['appointment_time'])
-            try:
-                # try to personalize using cadastro
-                try:
-                    perfil = buscar_perfil_por_telefone(telefone)
-                    primeiro = (perfil.get('nome') or '').split()[0] if perfil and perfil.get('nome') else ''
-                except Exception:
-                    primeiro = ''
-                greeting = f"Olá, {primeiro}!\n" if primeiro else ''
-                appt_text = MSG.REMINDER_TEMPLATE.format(date=lemb['appointment_date'], time=lemb['appointment_time'])
-                action = MSG.REMINDER_ACTION_PROMPT if hasattr(MSG, 'REMINDER_ACTION_PROMPT') else ''
-                text = greeting + appt_text + ("\n" + action if action else "")
-                print(f"🟡 [startup] Enviando lembrete para paciente {telefone}")
-                send_reminder_confirm_buttons(telefone, text, lemb['appointment_iso'])
-                print(f"✅ [startup] Lembrete enviado com sucesso para {telefone}")
-                logger.info('[startup] Lembrete enviado com sucesso para %s', telefone)
-            except Exception as e:
-                print(f"🔴 [startup] ERRO ao enviar lembrete imediato row={row} phone={telefone}: {str(e)}")
-                logger.exception('[startup] ERRO ao enviar lembrete imediato row=%s phone=%s: %s', row, telefone, str(e))
-            try:
-                # remove the reminder row after sending
-                print(f"🟡 [startup] Tentando remover lembrete da linha {row}")
-                removed = remover_lembrete_por_row(row)
-                if removed:
-                    print(f"✅ [startup] Lembrete (linha {row}) removido com SUCESSO")
-                    logger.info('[startup] Lembrete (linha %s) removido com SUCESSO', row)
-                else:
-                    print(f"🔴 [startup] Falha ao remover lembrete (linha {row}) - retornou False")
-                    logger.warning('[startup] Falha ao remover lembrete (linha %s) - retornou False', row)
-            except Exception as e:
-                print(f"🔴 [startup] ERRO ao remover lembrete da linha {row}: {str(e)}")
-                logger.exception('[startup] ERRO ao remover lembrete da linha %s: %s', row, str(e))
+    if not pendentes:
+        logger.info('[startup] Nenhum lembrete pendente para reidratar')
+        return
+
+    try:
+        nomes = obter_mapa_nomes_cadastros_cached()
+    except Exception:
+        logger.exception('[startup] Falha ao ler Cadastros; lembretes serão enviados sem nome')
+        nomes = {}
+
+    agora = agora_brasil()  # Usa horário do Brasil
+    atrasados = [lemb for lemb in pendentes if lemb['scheduled_dt'] <= agora]
+    futuros = [lemb for lemb in pendentes if lemb['scheduled_dt'] > agora]
+
+    # Lembretes futuros: um único push em lote no scheduler
+    jobs = []
+    for lemb in futuros:
+        appt_iso = lemb.get('appointment_iso')
+        jobs.append((lemb['scheduled_dt'], _enviar_lembrete_agendado, (
+            lemb['row'], lemb['telefone'], lemb['appointment_date'],
+            lemb['appointment_time'], appt_iso,
+        ), None, chave_lembrete(appt_iso, lemb['telefone']) if appt_iso else None))
+    try:
+        scheduler.schedule_many(jobs)
+    except Exception:
+        logger.exception('[startup] failed to schedule %d pending reminders', len(jobs))
+
+    # Lembretes atrasados: envio concorrente e remoção das linhas em lote
+    if atrasados:
+        logger.info('[startup] Enviando %d lembretes IMEDIATAMENTE (ja passou da hora)', len(atrasados))
+        workers = max(1, min(LEMBRETES_STARTUP_WORKERS, len(atrasados)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lembrete-startup') as pool:
+            list(pool.map(lambda lemb: _enviar_lembrete_pendente(lemb, nomes.get(lemb['telefone'], '')), atrasados))
+        removidos = remover_lembretes_por_rows([lemb['row'] for lemb in atrasados])
+        if removidos == len(atrasados):
+            logger.info('[startup] %d lembretes atrasados removidos com SUCESSO', removidos)
         else:
-            # schedule for future
-            try:
-                from src.scheduler import schedule_at
-                def _send_and_mark_start(row=row, phone=telefone, date_text=lemb['appointment_date'], time_text=lemb['appointment_time'], appt_iso=lemb.get('appointment_iso')):
-                    print(f"🟡 [startup._send_and_mark_start] Iniciando envio de lembrete agendado: row={row}, phone={phone}, date={date_text}, time={time_text}")
-                    logger.info('[startup._send_and_mark_start] Iniciando envio de lembrete agendado: row=%s, phone=%s, date=%s, time=%s', row, phone, date_text, time_text)
-                    try:
-                        # lookup perfil at runtime to personalize
-                        try:
-                            perfil = buscar_perfil_por_telefone(phone)
-                            primeiro = (perfil.get('nome') or '').split()[0] if perfil and perfil.get('nome') else ''
-                        except Exception:
-                            primeiro = ''
-                        greeting = f"Olá, {primeiro}!\n" if primeiro else ''
-                        appt_text = MSG.REMINDER_TEMPLATE.format(date=date_text, time=time_text)
-                        action = MSG.REMINDER_ACTION_PROMPT if hasattr(MSG, 'REMINDER_ACTION_PROMPT') else ''
-                        texto = greeting + appt_text + ("\n" + action if action else "")
-                        print(f"🟡 [startup._send_and_mark_start] Enviando lembrete para paciente {phone}")
-                        send_reminder_confirm_buttons(phone, texto, appt_iso)
-                        print(f"✅ [startup._send_and_mark_start] Lembrete enviado com sucesso para {phone}")
-                        logger.info('[startup._send_and_mark_start] Lembrete enviado com sucesso para %s', phone)
-                    except Exception as e:
-                        print(f"🔴 [startup._send_and_mark_start] ERRO ao enviar lembrete agendado row={row} phone={phone}: {str(e)}")
-                        logger.exception('[startup._send_and_mark_start] ERRO ao enviar lembrete agendado row=%s phone=%s: %s', row, phone, str(e))
-                    try:
-                        print(f"🟡 [startup._send_and_mark_start] Tentando remover lembrete da linha {row}")
-                        removed = remover_lembrete_por_row(row)
-                        if removed:
-                            print(f"✅ [startup._send_and_mark_start] Lembrete (linha {row}) removido com SUCESSO")
-                            logger.info('[startup._send_and_mark_start] Lembrete (linha %s) removido com SUCESSO', row)
-                        else:
-                            print(f"🔴 [startup._send_and_mark_start] Falha ao remover lembrete (linha {row}) - retornou False")
-                            logger.warning('[startup._send_and_mark_start] Falha ao remover lembrete (linha %s) - retornou False', row)
-                    except Exception as e:
-                        print(f"🔴 [startup._send_and_mark_start] ERRO ao remover lembrete da linha {row}: {str(e)}")
-                        logger.exception('[startup._send_and_mark_start] ERRO ao remover lembrete da linha %s: %s', row, str(e))
-                schedule_at(sched, _send_and_mark_start)
-            except Exception:
-                logger.exception('[startup] failed to schedule pending reminder row=%s', row)
-except Exception:
-    logger.exception('[startup] error loading pending reminders')
+            logger.warning('[startup] Removidos %d de %d lembretes atrasados', removidos, len(atrasados))
+
+    logger.info('[startup] Reidratação concluída: %d agendados, %d enviados', len(futuros), len(atrasados))
+
+
+def _assumir_jobs_do_lider():
+    """
+    Failover: este processo acabou de assumir a liderança. Os jobs diários já estão
+    agendados em todos os processos (só o líder os executa); aqui recuperamos o que
+    o líder anterior pode ter deixado para trás.
+    """
+    def _executar():
+        _verificar_slots_de_hoje()
+        _verificar_resumo_de_hoje()
+        reidratar_lembretes_pendentes()
+    # fora da thread de renovação do lease, para não atrasar a renovação
+    threading.Thread(target=_executar, name='leader-failover', daemon=True).start()
+
+
+leader_election.ao_assumir_lideranca(_assumir_jobs_do_lider)
+
+
+@app.get('/ready')
+async def ready():
+    """Prontidão: informa quais estágios do warmup já terminaram."""
+    return {"pronto": warmup.pronto(), "estagios": warmup.status(), "lider": leader_election.sou_lider()}
+
+
+def _contar_sessoes() -> int:
+    """Conversas em memória (chaves de telefone; as auxiliares têm sufixo, ex.: '<tel>_first_name')."""
+    return sum(1 for chave in list(wf.sessoes) if isinstance(chave, str) and chave.isdigit())
+
+
+metrics.gauge_funcao('whatsapp_sessoes_ativas', 'Conversas com estado em memória', _contar_sessoes)
+metrics.gauge_funcao('whatsapp_sessoes_chaves', 'Total de chaves no dicionário de sessões', lambda: len(wf.sessoes))
+
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    """Métricas no formato texto do Prometheus."""
+    return Response(content=metrics.exportar(), media_type=metrics.CONTENT_TYPE)
+
+
+def _checar_token_debug(request: Request):
+    """Endpoints de debug expõem telefones e nomes: sem TRACING_DEBUG_TOKEN eles não existem (404)."""
+    if not tracing.DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail='Not Found')
+    if request.headers.get('x-debug-token') != tracing.DEBUG_TOKEN:
+        raise HTTPException(status_code=403, detail='Forbidden')
+
+
+@app.get('/debug/traces')
+async def debug_traces(request: Request):
+    """Traces lentos (>= TRACING_SLOW_MS) guardados no buffer em memória, mais recentes primeiro."""
+    _checar_token_debug(request)
+    return {"limite_ms": tracing.SLOW_MS, "traces": tracing.traces_lentos()}
+
+
+@app.get('/debug/traces/{trace_id}')
+async def debug_trace(trace_id: str, request: Request):
+    """Todos os spans de um trace lento."""
+    _checar_token_debug(request)
+    t = tracing.obter_trace(trace_id)
+    if t is None:
+        raise HTTPException(status_code=404, detail='Trace não encontrado')
+    return t
 
 
 @app.get('/webhook')
@@ -678,9 +934,322 @@ async def verify(request: Request):
     raise HTTPException(status_code=403, detail='Verification failed')  # se inválido, retorna 403
 
 
-@app.post('/webhook')
-async def webhook(request: Request):
-    data = await request.json()  # lê corpo JSON da requisição
+def _tratar_mensagem(msg: dict):
+    """Processa uma mensagem recebida no webhook (cadastro, respostas de lembrete e fluxo conversacional)."""
+    from_number = msg.get('from')  # número do remetente
+    logger.info("[webhook] Message from=%s type=%s", from_number, msg.get('type'))  # log remetente e tipo
+    # Determine payload text to feed into processar_mensagem
+    texto = None  # valor padronizado que será passado para o fluxo
+    # interactive replies (button or list)
+    if msg.get('type') == 'interactive':  # quando for reply interativo
+        inter = msg.get('interactive', {})  # parte interactive do payload
+        itype = inter.get('type')  # tipo de interativo
+        if itype == 'button_reply':  # resposta por botão
+            texto = inter.get('button_reply', {}).get('id')  # id do reply
+            # intercept reminder-specific reply ids
+            if isinstance(texto, str) and texto.startswith('rem_'):
+                try:
+                    parts = texto.split('|', 1)
+                    action = parts[0]  # rem_confirm / rem_cancel / rem_back
+                    app_iso = parts[1] if len(parts) > 1 else None
+                except Exception:
+                    action = None
+                    app_iso = None
+                # handle reminder actions immediately
+                if action in ('rem_confirm', 'rem_cancel') and app_iso:
+                    try:
+                        from src.agenda_service import cancelar_agendamento_por_data_hora, obter_lembretes_pendentes
+                        from datetime import datetime
+                        if action == 'rem_confirm':
+                            # acknowledge confirmation (personalized)
+                            try:
+                                perfil = buscar_perfil_por_telefone(from_number)
+                                primeiro = (perfil.get('nome') or '').split()[0] if perfil and perfil.get('nome') else ''
+                            except Exception:
+                                primeiro = ''
+                            try:
+                                send_text(from_number, MSG.REMINDER_CONFIRMED_MSG.format(name=primeiro))
+                            except Exception:
+                                logger.exception('[rem_handler] failed sending confirmation message')
+                            # remove any matching lembretes for this appointment
+                            try:
+                                remover_lembretes_por_appointment(app_iso, from_number)
+                            except Exception:
+                                logger.exception('[rem_handler] failed removing lembretes for appointment')
+                            # handled — segue para a próxima mensagem
+                            return
+                        elif action == 'rem_cancel':
+                            try:
+                                dt = datetime.fromisoformat(app_iso)
+                            except Exception:
+                                dt = None
+                            cancelled = False
+                            if dt:
+                                try:
+                                    cancelled = cancelar_agendamento_por_data_hora(dt, telefone_esperado=from_number)
+                                except Exception:
+                                    logger.exception('[rem_handler] fail cancel')
+                            if cancelled:
+                                send_text(from_number, MSG.REMINDER_CANCELLED_MSG)
+                                # Notificar dono sobre o cancelamento via reminder
+                                try:
+                                    perfil = buscar_perfil_por_telefone(from_number)
+                                    nome_paciente = perfil.get('nome', '') if perfil else ''
+                                    send_reminder_to_owner(
+                                        patient_name=nome_paciente,
+                                        date=dt.strftime('%d/%m/%Y') if dt else '',
+                                        time=dt.strftime('%H:%M') if dt else '',
+                                        isCancel=True
+                                    )
+                                    log_evento(logger, logging.INFO, '[rem_handler] Dono notificado do cancelamento via lembrete',
+                                               telefone=from_number, consulta=dt, sucesso=True)
+                                except Exception as e:
+                                    log_evento(logger, logging.ERROR, '[rem_handler] Failed to notify owner about cancellation: %s', e,
+                                               telefone=from_number, consulta=dt, exc_info=True)
+                            else:
+                                send_text(from_number, 'Não foi possível cancelar. Tente novamente.')
+                            # remove matching lembretes
+                            try:
+                                remover_lembretes_por_appointment(app_iso, from_number)
+                            except Exception:
+                                logger.exception('[rem_handler] failed removing lembretes for appointment')
+                            return
+                    except Exception:
+                        logger.exception('[webhook] error handling reminder interactive reply')
+                        # fall through to normal processing if handler fails
+        elif itype == 'list_reply':  # resposta por lista
+            texto = inter.get('list_reply', {}).get('id')  # id selecionado
+    # plain text
+    if texto is None:  # se não foi interativo, tenta texto simples
+        txt = msg.get('text', {})  # parte text do payload
+        texto = txt.get('body') if isinstance(txt, dict) else None  # conteúdo textual
+
+    # sent_wait flag: enviaremos 'Aguarde...' apenas imediatamente antes
+    # de operações que consultam a planilha (dias/horários).
+    # Não enviar de forma genérica ao receber qualquer input.
+    sent_wait = False  # controla se a mensagem de espera já foi enviada
+    # Primeiro-contato / cadastro: se essa for a primeira vez (sessão vazia),
+    # verificar se já existe cadastro no Sheets; se não, solicitar nome completo.
+    try:
+        perfil_existente = buscar_perfil_em_cache(from_number)
+    except Exception:
+        perfil_existente = None
+
+    if wf.sessoes.get(from_number) is None:
+        # Sessão nova: se já estiver cadastrado, armazenar primeiro nome na sessão;
+        # caso contrário, pedir o nome completo e aguardar resposta.
+        if perfil_existente:
+            primeiro_nome = (perfil_existente.get('nome') or '').split()[0] if perfil_existente.get('nome') else None
+            if primeiro_nome:
+                wf.sessoes[from_number + '_first_name'] = primeiro_nome
+            # Inicializa o estado na sessão e envia o menu com saudação
+            wf.sessoes[from_number] = wf.MENU_PRINCIPAL
+            try:
+                saud = f"Olá, {wf.sessoes.get(from_number + '_first_name', '')}!\n"
+                menu_text, menu_items = wf.exibir_menu_principal()
+                send_menu_buttons(from_number, saud + menu_text, menu_items)
+            except Exception:
+                logger.exception('[webhook] Falha ao enviar menu inicial para usuário cadastrado')
+            # Após enviar o menu inicial, não processar a mesma mensagem novamente
+            return
+        else:
+            # Pergunta pelo nome completo e marca estado de espera de cadastro
+            try:
+                send_text(from_number, MSG.ASK_FULL_NAME)
+            except Exception:
+                logger.exception('[webhook] Falha ao enviar pedido de nome no primeiro contato')
+            wf.sessoes[from_number] = 'esperar_nome'
+            # não delegar ao fluxo ainda; próxima mensagem será o nome
+            return
+
+    # Se estamos aguardando o nome do usuário, salvar no Sheets e seguir
+    if wf.sessoes.get(from_number) == 'esperar_nome':
+        nome_completo = (texto or '').strip()
+        if nome_completo:
+            try:
+                perfil = criar_cadastro_paciente(from_number, nome_completo, origem='whatsapp_cloud')
+                primeiro_nome = (perfil.get('nome') or '').split()[0] if perfil.get('nome') else None
+                if primeiro_nome:
+                    wf.sessoes[from_number + '_first_name'] = primeiro_nome
+            except Exception:
+                logger.exception('[webhook] Falha ao criar cadastro de paciente')
+                send_text(from_number, 'Desculpe, não consegui salvar seu cadastro. Tente novamente mais tarde.')
+                wf.sessoes.pop(from_number, None)
+                return
+        # colocar estado no menu principal e mostrar menu
+        wf.sessoes[from_number] = wf.MENU_PRINCIPAL
+        try:
+            saud = f"Olá, {wf.sessoes.get(from_number + '_first_name', '')}!\n"
+            menu_text, menu_items = wf.exibir_menu_principal()
+            send_menu_buttons(from_number, saud + menu_text, menu_items)
+        except Exception:
+            logger.exception('[webhook] Falha ao enviar menu após cadastro')
+        return
+    try:
+        estado_atual = wf.sessoes.get(from_number)  # lê estado atual da sessão
+    except Exception:
+        estado_atual = None  # se houver erro, fica None
+    texto_lower = (str(texto or '')).strip().lower()  # versão minúscula do texto para heurísticas
+
+    # call the flow
+    try:
+        logger.info("[webhook] Estado antes de processar mensagem for %s: estado=%s texto=%s", from_number, estado_atual, texto)
+        with metrics.cronometro(metrics.FLUXO_LATENCIA, estado=estado_atual), \
+                tracing.span('processar_mensagem', estado=str(estado_atual)):
+            resposta = wf.processar_mensagem(from_number, texto)  # delega processamento ao módulo de fluxo
+    except Exception:
+        logger.exception("[webhook] Exception inside processar_mensagem")  # log de erro interno
+        resposta = "Desculpe, ocorreu um erro interno. Tente novamente mais tarde."  # fallback amigável
+
+    logger.info("[webhook] Resposta do fluxo para %s: %s", from_number, resposta)  # log da resposta gerada
+
+    # Decide how to reply: prefer interactive when menu-like
+    # If the response contém as opções do menu principal, envia botões
+    menu_text, menu_items = wf.exibir_menu_principal()
+
+    # IMPORTANT: Detect if response contains BOTH confirmation message AND menu
+    # If yes, send confirmation as text first, then menu buttons separately
+    has_menu = menu_text in resposta or (MSG.MENU_PROMPT in resposta and MSG.LIST_BODY_TEXT in resposta)
+    has_confirmation = '✅' in resposta and any(word in resposta for word in ['confirmado', 'realizado', 'cancelado'])
+
+    if has_menu and has_confirmation:
+        # Split confirmation from menu: send confirmation first as text
+        try:
+            # Find where menu starts in the response
+            menu_start_idx = resposta.find(MSG.MENU_PROMPT)
+            if menu_start_idx > 0:
+                confirmation_part = resposta[:menu_start_idx].strip()
+                # Send confirmation message as text
+                send_text(from_number, confirmation_part)
+                # Then send menu buttons with greeting
+                saud = f"Olá, {wf.sessoes.get(from_number + '_first_name', '')}!\n" if wf.sessoes.get(from_number + '_first_name') else ''
+                send_menu_buttons(from_number, saud + menu_text, menu_items)
+            else:
+                # Fallback: just send as text if we can't split properly
+                send_text(from_number, resposta)
+        except Exception:
+            logger.exception('[webhook] Failed to split confirmation and menu; sending as text')
+            send_text(from_number, resposta)
+    # Verifica se a resposta contém o texto do menu (permite texto adicional antes)
+    elif menu_text in resposta or (MSG.MENU_PROMPT in resposta and MSG.LIST_BODY_TEXT in resposta):
+        # Ao reenviar o menu principal, envie primeiro qualquer texto que
+        # venha antes do menu (ex: mensagem de confirmação/aviso), depois
+        # envie os botões com a saudação + menu.
+        saud = f"Olá, {wf.sessoes.get(from_number + '_first_name', '')}!\n" if wf.sessoes.get(from_number + '_first_name') else ''
+        # procurar início do menu na resposta (prefere o menu_text)
+        menu_start_idx = resposta.find(menu_text)
+        if menu_start_idx == -1:
+            menu_start_idx = resposta.find(MSG.MENU_PROMPT)
+        # se houver texto antes do menu, enviá-lo como texto simples
+        if menu_start_idx > 0:
+            prefix = resposta[:menu_start_idx].strip()
+            try:
+                if prefix:
+                    send_text(from_number, prefix)
+            except Exception:
+                logger.exception('[webhook] Failed to send prefix before menu')
+        # finalmente, enviar os botões com a saudação + menu
+        send_menu_buttons(from_number, saud + menu_text, menu_items)
+    # Some flow branches prepend extra text (e.g. "Escolha a nova data e horário:\n" + exibir_semanas...)
+    # so match more flexibly: if the response mentions 'escolha' and 'semana' or explicit 'nova data'
+    elif ('semana' in resposta.lower() and 'escolh' in resposta.lower()) or ('escolha a nova data' in resposta.lower()) or ('escolha a data' in resposta.lower() and 'horário' in resposta.lower()):
+        # Ao mostrar semanas, apenas exibe o prompt de semanas (não adicionar texto extra)
+        send_weeks_buttons(from_number, MSG.WEEKS_PROMPT)  # envia botões de semana
+    # Flexible match: if the response asks to choose a day (various phrasings), send interactive list
+    elif (('dia' in resposta.lower() and 'escolh' in resposta.lower()) or resposta.lower().startswith('escolha o dia')):  # escolher dia
+        try:
+            if not sent_wait:  # envia mensagem de espera somente agora
+                send_text(from_number, MSG.WAIT_MSG)  # mensagem de aguarde
+                sent_wait = True  # marca como enviada
+        except Exception:
+            logger.exception('[webhook] Falha ao enviar mensagem de aguarde antes de obter dias')  # log se falhar ao enviar aguarde
+        offset = wf.sessoes.get(from_number + '_semana_offset', 0)  # offset da semana salvo na sessão
+        dias = wf.obter_dias_disponiveis_semana(offset)  # obtém dias disponíveis do fluxo
+        # IMPORTANTE: WhatsApp permite no máximo 10 rows por lista interativa
+        # Reservamos 2 slots para Voltar e Cancelar, então limitamos a 8 dias
+        if len(dias) > 8:
+            logger.warning('[webhook] Lista de dias truncada de %d para 8 (limite WhatsApp)', len(dias))
+            dias = dias[:8]
+        items = []  # prepara lista de rows
+        for i, d in enumerate(dias):  # formata cada dia
+            dia_pt = d.strftime('%d/%m/%Y')  # data formatada
+            semana_abrev = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom'][d.weekday()]  # sempre usar abreviação para consistência
+            title = f"{semana_abrev}, {dia_pt}"  # formato: "Seg, 23/12/2025" (sempre cabe em 24 chars)
+            # Usar descrição vazia para evitar duplicação visual
+            items.append((f"{i+1}", title, ""))  # adiciona item sem descrição
+        # acrescenta Voltar/Cancelar como opções de lista (descrição vazia para evitar duplicação)
+        items.append(("0", MSG.LABEL_VOLTA, ""))
+        items.append(("9", MSG.LABEL_CANCEL, ""))
+        send_list_days(from_number, 'Escolha o dia', items)  # envia lista de dias
+    # If the flow requests a confirmation, prefer confirm buttons (precise match before other list branches)
+    elif 'confirma' in resposta.lower() or resposta.lower().startswith('confirmação'):
+        send_confirm_buttons(from_number, resposta)  # envia botões de confirmação para o usuário
+    elif ('agendamento' in resposta.lower() and 'reagend' in resposta.lower()) or resposta.lower().startswith('escolha o agendamento para reagendar'):  # listar agendamentos para reagendar
+        ags = wf.sessoes.get('_lista_agendamentos') or []  # obtém lista salva na sessão
+        items = []  # prepara items
+        for i, (dt, linha) in enumerate(ags):  # formata cada agendamento
+            paciente = (linha[3] or 'Paciente')
+            # Sempre usar abreviação para consistência (Seg, Ter, etc)
+            title = f"{_abbr_weekday(dt.weekday())}, {dt.strftime('%d/%m')}"
+            desc = f"{dt.strftime('%H:%M')} - {paciente}"
+            items.append((f"{i+1}", title, desc))  # adiciona item com descrição
+        items.append(("0", MSG.LABEL_VOLTA, ""))  # Voltar
+        items.append(("9", MSG.LABEL_CANCEL, ""))  # Cancelar
+        send_list_days(from_number, 'Escolha o agendamento', items)  # envia lista de agendamentos
+    elif resposta.lower().startswith('escolha o agendamento para cancelar'):
+        ags = wf.sessoes.get('_lista_agendamentos_cancelar') or []  # lista de agendamentos específicos para cancelamento
+        items = []  # prepara items
+        for i, (dt, linha) in enumerate(ags):  # formata cada agendamento
+            paciente = (linha[3] or 'Paciente')
+            # Sempre usar abreviação para consistência (Seg, Ter, etc)
+            title = f"{_abbr_weekday(dt.weekday())}, {dt.strftime('%d/%m')}"
+            desc = f"{dt.strftime('%H:%M')} - {paciente}"
+            items.append((f"{i+1}", title, desc))  # adiciona com descrição
+        items.append(("0", MSG.LABEL_VOLTA, ""))  # Voltar
+        items.append(("9", MSG.LABEL_CANCEL_APPOINTMENT, ""))  # Cancelar Agendamento (rótulo diferenciado)
+        send_list_days(from_number, 'Escolha o agendamento', items)  # envia lista para o usuário
+    # if the flow asks for any confirmation (agendamento or cancelamento), send confirm buttons
+    elif 'confirma' in resposta.lower() or resposta.lower().startswith('confirmação'):
+        send_confirm_buttons(from_number, resposta)  # envia botões de confirmação para o usuário
+    # Flexible match for choosing a time/hours
+    elif (('horar' in resposta.lower() or 'horário' in resposta.lower() or 'horario' in resposta.lower()) and 'escolh' in resposta.lower()) or resposta.lower().startswith('escolha o horário'):  # escolher horário
+        try:
+            if not sent_wait:  # envia mensagem de espera antes de consultar horários
+                send_text(from_number, MSG.WAIT_MSG)  # mensagem de aguarde
+                sent_wait = True  # marca flag
+        except Exception:
+            logger.exception('[webhook] Falha ao enviar mensagem de aguarde antes de obter horários')  # log erro
+        dia = wf.sessoes.get(from_number + '_dia_escolhido')  # dia previamente escolhido na sessão
+        horarios = wf.obter_horarios_disponiveis_para_dia(dia)  # consulta horários disponíveis no fluxo
+        items = []  # prepara items para lista
+        for i, h in enumerate(horarios):  # formata cada horário
+            items.append((f"{i+1}", h.strftime('%H:%M'), ''))  # adiciona horário com descrição vazia
+        items.append(("0", "Voltar", ""))  # Voltar
+        items.append(("9", "Cancelar", ""))  # Cancelar
+        send_list_times(from_number, 'Escolha o horário', items)  # envia lista de horários
+    else:
+        # Se a resposta for uma indicação de "nenhum dia/horário disponível",
+        # enviar botões interativos Voltar/Cancelar em vez de texto puro.
+        try:
+            # Se for mensagem de "nenhum dia/horário" ou informações de pagamento,
+            # enviar botões Voltar/Cancelar para manter navegação guiada.
+            is_no_days = (MSG.NO_DAYS_AVAILABLE in resposta) or resposta.startswith(MSG.NO_DAYS_AVAILABLE)
+            is_no_hours = (MSG.NO_HOURS_AVAILABLE in resposta) or resposta.startswith(MSG.NO_HOURS_AVAILABLE)
+            is_payment = (hasattr(MSG, 'PAYMENT_TITLE') and MSG.PAYMENT_TITLE in resposta) or (hasattr(MSG, 'PAYMENT_INFO') and MSG.PAYMENT_INFO in resposta)
+            if is_payment:
+                # Na tela de pagamento, só oferecemos Voltar (sem Cancelar)
+                send_back_only_button(from_number, resposta)
+            elif is_no_days or is_no_hours:
+                send_back_cancel_buttons(from_number, resposta)
+            else:
+                send_text(from_number, resposta)  # envia resposta genérica em texto quando não há interativo aplicável
+        except Exception:
+            logger.exception('[webhook] falha ao enviar resposta de disponibilidade; enviando texto fallback')
+            send_text(from_number, resposta)
+
+
+def _processar_payload(data: dict):
+    """Percorre entries/changes/messages do payload do webhook e trata cada mensagem."""
     try:
         logger.info("[webhook] Incoming POST payload keys=%s", list(data.keys()))  # log das chaves do payload
     except Exception:
@@ -696,313 +1265,34 @@ async def webhook(request: Request):
                 continue
             for msg in messages:  # itera cada mensagem presente
                 from_number = msg.get('from')  # número do remetente
-                logger.info("[webhook] Message from=%s type=%s", from_number, msg.get('type'))  # log remetente e tipo
-                # Determine payload text to feed into processar_mensagem
-                texto = None  # valor padronizado que será passado para o fluxo
-                # interactive replies (button or list)
-                if msg.get('type') == 'interactive':  # quando for reply interativo
-                    inter = msg.get('interactive', {})  # parte interactive do payload
-                    itype = inter.get('type')  # tipo de interativo
-                    if itype == 'button_reply':  # resposta por botão
-                        texto = inter.get('button_reply', {}).get('id')  # id do reply
-                        # intercept reminder-specific reply ids
-                        if isinstance(texto, str) and texto.startswith('rem_'):
-                            try:
-                                parts = texto.split('|', 1)
-                                action = parts[0]  # rem_confirm / rem_cancel / rem_back
-                                app_iso = parts[1] if len(parts) > 1 else None
-                            except Exception:
-                                action = None
-                                app_iso = None
-                            # handle reminder actions immediately
-                            if action in ('rem_confirm', 'rem_cancel') and app_iso:
-                                try:
-                                    from src.agenda_service import cancelar_agendamento_por_data_hora, obter_lembretes_pendentes
-                                    from datetime import datetime
-                                    if action == 'rem_confirm':
-                                        # acknowledge confirmation (personalized)
-                                        try:
-                                            perfil = buscar_perfil_por_telefone(from_number)
-                                            primeiro = (perfil.get('nome') or '').split()[0] if perfil and perfil.get('nome') else ''
-                                        except Exception:
-                                            primeiro = ''
-                                        try:
-                                            send_text(from_number, MSG.REMINDER_CONFIRMED_MSG.format(name=primeiro))
-                                        except Exception:
-                                            logger.exception('[rem_handler] failed sending confirmation message')
-                                        # remove any matching lembretes for this appointment
-                                        try:
-                                            remover_lembretes_por_appointment(app_iso, from_number)
-                                        except Exception:
-                                            logger.exception('[rem_handler] failed removing lembretes for appointment')
-                                        # handled — continue to next message
-                                        continue
-                                    elif action == 'rem_cancel':
-                                        try:
-                                            dt = datetime.fromisoformat(app_iso)
-                                        except Exception:
-                                            dt = None
-                                        cancelled = False
-                                        if dt:
-                                            try:
-                                                cancelled = cancelar_agendamento_por_data_hora(dt, telefone_esperado=from_number)
-                                            except Exception:
-                                                logger.exception('[rem_handler] fail cancel')
-                                        if cancelled:
-                                            send_text(from_number, MSG.REMINDER_CANCELLED_MSG)
-                                            # Notificar dono sobre o cancelamento via reminder
-                                            try:
-                                                perfil = buscar_perfil_por_telefone(from_number)
-                                                nome_paciente = perfil.get('nome', '') if perfil else ''
-                                                print(f"🟡 [rem_handler] Enviando notificacao de CANCELAMENTO (via reminder) ao dono")
-                                                send_reminder_to_owner(
-                                                    patient_name=nome_paciente,
-                                                    date=dt.strftime('%d/%m/%Y') if dt else '',
-                                                    time=dt.strftime('%H:%M') if dt else '',
-                                                    isCancel=True
-                                                )
-                                                print(f"✅ [rem_handler] Notificacao de cancelamento enviada com SUCESSO ao dono")
-                                            except Exception as e:
-                                                print(f"🔴 [rem_handler] Erro ao notificar dono sobre cancelamento: {e}")
-                                                logger.exception('[rem_handler] Failed to notify owner about cancellation: %s', e)
-                                        else:
-                                            send_text(from_number, 'Não foi possível cancelar. Tente novamente.')
-                                        # remove matching lembretes
-                                        try:
-                                            remover_lembretes_por_appointment(app_iso, from_number)
-                                        except Exception:
-                                            logger.exception('[rem_handler] failed removing lembretes for appointment')
-                                        continue
-                                except Exception:
-                                    logger.exception('[webhook] error handling reminder interactive reply')
-                                    # fall through to normal processing if handler fails
-                    elif itype == 'list_reply':  # resposta por lista
-                        texto = inter.get('list_reply', {}).get('id')  # id selecionado
-                # plain text
-                if texto is None:  # se não foi interativo, tenta texto simples
-                    txt = msg.get('text', {})  # parte text do payload
-                    texto = txt.get('body') if isinstance(txt, dict) else None  # conteúdo textual
-
-                # sent_wait flag: enviaremos 'Aguarde...' apenas imediatamente antes
-                # de operações que consultam a planilha (dias/horários).
-                # Não enviar de forma genérica ao receber qualquer input.
-                sent_wait = False  # controla se a mensagem de espera já foi enviada
-                # Primeiro-contato / cadastro: se essa for a primeira vez (sessão vazia),
-                # verificar se já existe cadastro no Sheets; se não, solicitar nome completo.
-                try:
-                    perfil_existente = buscar_perfil_por_telefone(from_number)
-                except Exception:
-                    perfil_existente = None
-
-                if wf.sessoes.get(from_number) is None:
-                    # Sessão nova: se já estiver cadastrado, armazenar primeiro nome na sessão;
-                    # caso contrário, pedir o nome completo e aguardar resposta.
-                    if perfil_existente:
-                        primeiro_nome = (perfil_existente.get('nome') or '').split()[0] if perfil_existente.get('nome') else None
-                        if primeiro_nome:
-                            wf.sessoes[from_number + '_first_name'] = primeiro_nome
-                        # Inicializa o estado na sessão e envia o menu com saudação
-                        wf.sessoes[from_number] = wf.MENU_PRINCIPAL
-                        try:
-                            saud = f"Olá, {wf.sessoes.get(from_number + '_first_name', '')}!\n"
-                            menu_text, menu_items = wf.exibir_menu_principal()
-                            send_menu_buttons(from_number, saud + menu_text, menu_items)
-                        except Exception:
-                            logger.exception('[webhook] Falha ao enviar menu inicial para usuário cadastrado')
-                        # Após enviar o menu inicial, não processar a mesma mensagem novamente
-                        continue
-                    else:
-                        # Pergunta pelo nome completo e marca estado de espera de cadastro
-                        try:
-                            send_text(from_number, MSG.ASK_FULL_NAME)
-                        except Exception:
-                            logger.exception('[webhook] Falha ao enviar pedido de nome no primeiro contato')
-                        wf.sessoes[from_number] = 'esperar_nome'
-                        # não delegar ao fluxo ainda; próxima mensagem será o nome
-                        continue
-
-                # Se estamos aguardando o nome do usuário, salvar no Sheets e seguir
-                if wf.sessoes.get(from_number) == 'esperar_nome':
-                    nome_completo = (texto or '').strip()
-                    if nome_completo:
-                        try:
-                            perfil = criar_cadastro_paciente(from_number, nome_completo, origem='whatsapp_cloud')
-                            primeiro_nome = (perfil.get('nome') or '').split()[0] if perfil.get('nome') else None
-                            if primeiro_nome:
-                                wf.sessoes[from_number + '_first_name'] = primeiro_nome
-                        except Exception:
-                            logger.exception('[webhook] Falha ao criar cadastro de paciente')
-                            send_text(from_number, 'Desculpe, não consegui salvar seu cadastro. Tente novamente mais tarde.')
-                            wf.sessoes.pop(from_number, None)
-                            continue
-                    # colocar estado no menu principal e mostrar menu
-                    wf.sessoes[from_number] = wf.MENU_PRINCIPAL
-                    try:
-                        saud = f"Olá, {wf.sessoes.get(from_number + '_first_name', '')}!\n"
-                        menu_text, menu_items = wf.exibir_menu_principal()
-                        send_menu_buttons(from_number, saud + menu_text, menu_items)
-                    except Exception:
-                        logger.exception('[webhook] Falha ao enviar menu após cadastro')
-                    continue
-                try:
-                    estado_atual = wf.sessoes.get(from_number)  # lê estado atual da sessão
-                except Exception:
-                    estado_atual = None  # se houver erro, fica None
-                texto_lower = (str(texto or '')).strip().lower()  # versão minúscula do texto para heurísticas
+                estado = wf.sessoes.get(from_number)
+                # um trace por mensagem (spans de perfil, fluxo, planilha e envios com o mesmo correlation ID)
+                with tracing.trace('webhook.mensagem', tipo=msg.get('type'), estado=str(estado),
+                                   telefone=f"...{str(from_number)[-4:]}") as raiz:
+                    # conta leituras/escritas no Sheets e envios à Graph API causados por esta mensagem
+                    with call_budget.contexto_mensagem(from_number, estado) as orcamento:
+                        _tratar_mensagem(msg)
+                    if raiz is not None:
+                        raiz.atributos.update(orcamento.contagem)
 
-                # call the flow
-                try:
-                    logger.info("[webhook] Estado antes de processar mensagem for %s: estado=%s texto=%s", from_number, estado_atual, texto)
-                    resposta = wf.processar_mensagem(from_number, texto)  # delega processamento ao módulo de fluxo
-                except Exception:
-                    logger.exception("[webhook] Exception inside processar_mensagem")  # log de erro interno
-                    resposta = "Desculpe, ocorreu um erro interno. Tente novamente mais tarde."  # fallback amigável
-
-                logger.info("[webhook] Resposta do fluxo para %s: %s", from_number, resposta)  # log da resposta gerada
-
-                # Decide how to reply: prefer interactive when menu-like
-                # If the response contém as opções do menu principal, envia botões
-                menu_text, menu_items = wf.exibir_menu_principal()
 
-                # IMPORTANT: Detect if response contains BOTH confirmation message AND menu
-                # If yes, send confirmation as text first, then menu buttons separately
-                has_menu = menu_text in resposta or (MSG.MENU_PROMPT in resposta and MSG.LIST_BODY_TEXT in resposta)
-                has_confirmation = '✅' in resposta and any(word in resposta for word in ['confirmado', 'realizado', 'cancelado'])
-
-                if has_menu and has_confirmation:
-                    # Split confirmation from menu: send confirmation first as text
-                    try:
-                        # Find where menu starts in the response
-                        menu_start_idx = resposta.find(MSG.MENU_PROMPT)
-                        if menu_start_idx > 0:
-                            confirmation_part = resposta[:menu_start_idx].strip()
-                            # Send confirmation message as text
-                            send_text(from_number, confirmation_part)
-                            # Then send menu buttons with greeting
-                            saud = f"Olá, {wf.sessoes.get(from_number + '_first_name', '')}!\n" if wf.sessoes.get(from_number + '_first_name') else ''
-                            send_menu_buttons(from_number, saud + menu_text, menu_items)
-                        else:
-                            # Fallback: just send as text if we can't split properly
-                            send_text(from_number, resposta)
-                    except Exception:
-                        logger.exception('[webhook] Failed to split confirmation and menu; sending as text')
-                        send_text(from_number, resposta)
-                # Verifica se a resposta contém o texto do menu (permite texto adicional antes)
-                elif menu_text in resposta or (MSG.MENU_PROMPT in resposta and MSG.LIST_BODY_TEXT in resposta):
-                    # Ao reenviar o menu principal, envie primeiro qualquer texto que
-                    # venha antes do menu (ex: mensagem de confirmação/aviso), depois
-                    # envie os botões com a saudação + menu.
-                    saud = f"Olá, {wf.sessoes.get(from_number + '_first_name', '')}!\n" if wf.sessoes.get(from_number + '_first_name') else ''
-                    # procurar início do menu na resposta (prefere o menu_text)
-                    menu_start_idx = resposta.find(menu_text)
-                    if menu_start_idx == -1:
-                        menu_start_idx = resposta.find(MSG.MENU_PROMPT)
-                    # se houver texto antes do menu, enviá-lo como texto simples
-                    if menu_start_idx > 0:
-                        prefix = resposta[:menu_start_idx].strip()
-                        try:
-                            if prefix:
-                                send_text(from_number, prefix)
-                        except Exception:
-                            logger.exception('[webhook] Failed to send prefix before menu')
-                    # finalmente, enviar os botões com a saudação + menu
-                    send_menu_buttons(from_number, saud + menu_text, menu_items)
-                # Some flow branches prepend extra text (e.g. "Escolha a nova data e horário:\n" + exibir_semanas...)
-                # so match more flexibly: if the response mentions 'escolha' and 'semana' or explicit 'nova data'
-                elif ('semana' in resposta.lower() and 'escolh' in resposta.lower()) or ('escolha a nova data' in resposta.lower()) or ('escolha a data' in resposta.lower() and 'horário' in resposta.lower()):
-                    # Ao mostrar semanas, apenas exibe o prompt de semanas (não adicionar texto extra)
-                    send_weeks_buttons(from_number, MSG.WEEKS_PROMPT)  # envia botões de semana
-                # Flexible match: if the response asks to choose a day (various phrasings), send interactive list
-                elif (('dia' in resposta.lower() and 'escolh' in resposta.lower()) or resposta.lower().startswith('escolha o dia')):  # escolher dia
-                    try:
-                        if not sent_wait:  # envia mensagem de espera somente agora
-                            send_text(from_number, MSG.WAIT_MSG)  # mensagem de aguarde
-                            sent_wait = True  # marca como enviada
-                    except Exception:
-                        logger.exception('[webhook] Falha ao enviar mensagem de aguarde antes de obter dias')  # log se falhar ao enviar aguarde
-                    offset = wf.sessoes.get(from_number + '_semana_offset', 0)  # offset da semana salvo na sessão
-                    dias = wf.obter_dias_disponiveis_semana(offset)  # obtém dias disponíveis do fluxo
-                    # IMPORTANTE: WhatsApp permite no máximo 10 rows por lista interativa
-                    # Reservamos 2 slots para Voltar e Cancelar, então limitamos a 8 dias
-                    if len(dias) > 8:
-                        logger.warning('[webhook] Lista de dias truncada de %d para 8 (limite WhatsApp)', len(dias))
-                        dias = dias[:8]
-                    items = []  # prepara lista de rows
-                    for i, d in enumerate(dias):  # formata cada dia
-                        dia_pt = d.strftime('%d/%m/%Y')  # data formatada
-                        semana_abrev = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom'][d.weekday()]  # sempre usar abreviação para consistência
-                        title = f"{semana_abrev}, {dia_pt}"  # formato: "Seg, 23/12/2025" (sempre cabe em 24 chars)
-                        # Usar descrição vazia para evitar duplicação visual
-                        items.append((f"{i+1}", title, ""))  # adiciona item sem descrição
-                    # acrescenta Voltar/Cancelar como opções de lista (descrição vazia para evitar duplicação)
-                    items.append(("0", MSG.LABEL_VOLTA, ""))
-                    items.append(("9", MSG.LABEL_CANCEL, ""))
-                    send_list_days(from_number, 'Escolha o dia', items)  # envia lista de dias
-                # If the flow requests a confirmation, prefer confirm buttons (precise match before other list branches)
-                elif 'confirma' in resposta.lower() or resposta.lower().startswith('confirmação'):
-                    send_confirm_buttons(from_number, resposta)  # envia botões de confirmação para o usuário
-                elif ('agendamento' in resposta.lower() and 'reagend' in resposta.lower()) or resposta.lower().startswith('escolha o agendamento para reagendar'):  # listar agendamentos para reagendar
-                    ags = wf.sessoes.get('_lista_agendamentos') or []  # obtém lista salva na sessão
-                    items = []  # prepara items
-                    for i, (dt, linha) in enumerate(ags):  # formata cada agendamento
-                        paciente = (linha[3] or 'Paciente')
-                        # Sempre usar abreviação para consistência (Seg, Ter, etc)
-                        title = f"{_abbr_weekday(dt.weekday())}, {dt.strftime('%d/%m')}"
-                        desc = f"{dt.strftime('%H:%M')} - {paciente}"
-                        items.append((f"{i+1}", title, desc))  # adiciona item com descrição
-                    items.append(("0", MSG.LABEL_VOLTA, ""))  # Voltar
-                    items.append(("9", MSG.LABEL_CANCEL, ""))  # Cancelar
-                    send_list_days(from_number, 'Escolha o agendamento', items)  # envia lista de agendamentos
-                elif resposta.lower().startswith('escolha o agendamento para cancelar'):
-                    ags = wf.sessoes.get('_lista_agendamentos_cancelar') or []  # lista de agendamentos específicos para cancelamento
-                    items = []  # prepara items
-                    for i, (dt, linha) in enumerate(ags):  # formata cada agendamento
-                        paciente = (linha[3] or 'Paciente')
-                        # Sempre usar abreviação para consistência (Seg, Ter, etc)
-                        title = f"{_abbr_weekday(dt.weekday())}, {dt.strftime('%d/%m')}"
-                        desc = f"{dt.strftime('%H:%M')} - {paciente}"
-                        items.append((f"{i+1}", title, desc))  # adiciona com descrição
-                    items.append(("0", MSG.LABEL_VOLTA, ""))  # Voltar
-                    items.append(("9", MSG.LABEL_CANCEL_APPOINTMENT, ""))  # Cancelar Agendamento (rótulo diferenciado)
-                    send_list_days(from_number, 'Escolha o agendamento', items)  # envia lista para o usuário
-                # if the flow asks for any confirmation (agendamento or cancelamento), send confirm buttons
-                elif 'confirma' in resposta.lower() or resposta.lower().startswith('confirmação'):
-                    send_confirm_buttons(from_number, resposta)  # envia botões de confirmação para o usuário
-                # Flexible match for choosing a time/hours
-                elif (('horar' in resposta.lower() or 'horário' in resposta.lower() or 'horario' in resposta.lower()) and 'escolh' in resposta.lower()) or resposta.lower().startswith('escolha o horário'):  # escolher horário
-                    try:
-                        if not sent_wait:  # envia mensagem de espera antes de consultar horários
-                            send_text(from_number, MSG.WAIT_MSG)  # mensagem de aguarde
-                            sent_wait = True  # marca flag
-                    except Exception:
-                        logger.exception('[webhook] Falha ao enviar mensagem de aguarde antes de obter horários')  # log erro
-                    dia = wf.sessoes.get(from_number + '_dia_escolhido')  # dia previamente escolhido na sessão
-                    horarios = wf.obter_horarios_disponiveis_para_dia(dia)  # consulta horários disponíveis no fluxo
-                    items = []  # prepara items para lista
-                    for i, h in enumerate(horarios):  # formata cada horário
-                        items.append((f"{i+1}", h.strftime('%H:%M'), ''))  # adiciona horário com descrição vazia
-                    items.append(("0", "Voltar", ""))  # Voltar
-                    items.append(("9", "Cancelar", ""))  # Cancelar
-                    send_list_times(from_number, 'Escolha o horário', items)  # envia lista de horários
-                else:
-                    # Se a resposta for uma indicação de "nenhum dia/horário disponível",
-                    # enviar botões interativos Voltar/Cancelar em vez de texto puro.
-                    try:
-                        # Se for mensagem de "nenhum dia/horário" ou informações de pagamento,
-                        # enviar botões Voltar/Cancelar para manter navegação guiada.
-                        is_no_days = (MSG.NO_DAYS_AVAILABLE in resposta) or resposta.startswith(MSG.NO_DAYS_AVAILABLE)
-                        is_no_hours = (MSG.NO_HOURS_AVAILABLE in resposta) or resposta.startswith(MSG.NO_HOURS_AVAILABLE)
-                        is_payment = (hasattr(MSG, 'PAYMENT_TITLE') and MSG.PAYMENT_TITLE in resposta) or (hasattr(MSG, 'PAYMENT_INFO') and MSG.PAYMENT_INFO in resposta)
-                        if is_payment:
-                            # Na tela de pagamento, só oferecemos Voltar (sem Cancelar)
-                            send_back_only_button(from_number, resposta)
-                        elif is_no_days or is_no_hours:
-                            send_back_cancel_buttons(from_number, resposta)
-                        else:
-                            send_text(from_number, resposta)  # envia resposta genérica em texto quando não há interativo aplicável
-                    except Exception:
-                        logger.exception('[webhook] falha ao enviar resposta de disponibilidade; enviando texto fallback')
-                        send_text(from_number, resposta)
+@app.post('/webhook')
+async def webhook(request: Request):
+    data = await request.json()  # lê corpo JSON da requisição
+    recebido_em = time.time()  # horário de chegada (modo captura)
+    perfil = profiling.iniciar_perfil_requisicao(request.headers)  # None quando o perfil por requisição está desligado
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        _processar_payload(data)
+        status = 200
+    finally:
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        metrics.WEBHOOK_REQUESTS.inc(status=status)
+        metrics.WEBHOOK_LATENCIA.observar(duracao_ms / 1000)
+        if perfil is not None:
+            profiling.finalizar_perfil_requisicao(perfil, 'webhook', duracao_ms)
+        webhook_capture.registrar(data, recebido_em, duracao_ms, status)
     return {'status': 'received'}  # responde 200 OK ao remetente do webhook
 
 
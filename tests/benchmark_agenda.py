@@ -0,0 +1,341 @@
+"""
+benchmark_agenda.py
+
+Microbenchmarks do agenda_service (e de flow_helpers.get_future_appointments) em
+planilhas de tamanho realista, usando a planilha em memória (fake_gspread).
+
+Para cada tamanho de Agenda (padrão: 1k, 10k e 100k linhas, slots de dias úteis
+antes e depois de hoje, ~30% AGENDADO) e uma aba Cadastros com 10k+ pacientes,
+mede cada função pública: tempo (mediana/média/mín/p95) e chamadas à planilha
+por execução. Os caches em memória do agenda_service são limpos antes de cada
+execução (caminho frio), exceto nos casos marcados como "quente".
+
+O resultado é JSON, para comparar commits e enxergar regressões de escala.
+
+Uso:
+    python -m tests.benchmark_agenda                                # 1k, 10k, 100k -> tests/benchmark_agenda_<commit>.json
+    python -m tests.benchmark_agenda --linhas 1000,10000 --repeticoes 10 --saida base.json
+    python -m tests.benchmark_agenda --comparar base.json novo.json   # diferença por função/tamanho
+    python -m tests.benchmark_agenda --comparar base.json novo.json --limite 1.25   # sai com 1 se piorar >25%
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+logging.basicConfig(level=logging.CRITICAL)  # o agenda_service loga por linha em alguns caminhos
+
+from src import agenda_service
+from src import flow_helpers
+from tests.fake_gspread import ClienteFake, instalar_planilha_fake
+
+
+# -------------------------------------------------------
+# Geração das planilhas
+# -------------------------------------------------------
+
+def _horas_do_dia() -> list:
+    """Horários de um dia útil, pela mesma regra do agenda_service."""
+    return [s.strftime("%H:%M") for s in agenda_service.gerar_slots_para_dia(date(2024, 1, 1))]  # segunda-feira
+
+
+def gerar_agenda(num_linhas: int, telefones: list, rnd: random.Random, taxa_agendado: float = 0.3) -> list:
+    """
+    Linhas da aba Agenda (com cabeçalho): slots de dias úteis consecutivos, metade
+    antes e metade depois de hoje, ~taxa_agendado deles AGENDADO para pacientes reais.
+    """
+    horas = _horas_do_dia()
+    dias_uteis = -(-num_linhas // len(horas))
+    dia = date.today() - timedelta(days=int(dias_uteis * 7 / 5 / 2))
+    linhas = [["dia_semana", "data", "hora", "nome_paciente", "telefone", "status", "origem", "observacoes"]]
+    while len(linhas) <= num_linhas:
+        if dia.weekday() in agenda_service.DIAS_UTEIS:
+            nome_dia = agenda_service.NOMES_DIAS_PT[dia.weekday()]
+            data_str = dia.strftime("%d/%m/%Y")
+            for hora in horas:
+                if len(linhas) > num_linhas:
+                    break
+                if rnd.random() < taxa_agendado:
+                    telefone, nome = telefones[rnd.randrange(len(telefones))]
+                    linhas.append([nome_dia, data_str, hora, nome, telefone, "AGENDADO", "whatsapp_cloud", ""])
+                else:
+                    linhas.append([nome_dia, data_str, hora, "", "", "DISPONIVEL", "", ""])
+        dia += timedelta(days=1)
+    return linhas
+
+
+def gerar_cadastros(num: int) -> list:
+    return [(f"55{11 + i % 89:02d}9{i:08d}", f"Paciente {i:05d} Benchmark") for i in range(num)]
+
+
+def gerar_lembretes(num: int, telefones: list, rnd: random.Random) -> list:
+    linhas = [["scheduled_iso", "appointment_iso", "appointment_date", "appointment_time",
+               "telefone", "paciente", "tipo", "sent_at", "created_at", "observacoes"]]
+    agora = datetime.now().replace(second=0, microsecond=0)
+    for i in range(num):
+        consulta = agora + timedelta(days=rnd.randint(-5, 30), hours=rnd.randint(0, 8))
+        telefone, nome = telefones[rnd.randrange(len(telefones))]
+        linhas.append([(consulta - timedelta(hours=24)).isoformat(), consulta.isoformat(),
+                       consulta.strftime("%d/%m/%Y"), consulta.strftime("%H:%M"), telefone, nome,
+                       "patient_reminder", "", agora.isoformat(), ""])
+    return linhas
+
+
+def montar_planilha(num_linhas: int, num_cadastros: int, num_lembretes: int, semente: int) -> ClienteFake:
+    rnd = random.Random(semente)
+    cadastros = gerar_cadastros(num_cadastros)
+    cliente = ClienteFake()
+    planilha = cliente.criar_planilha(agenda_service.SPREADSHEET_ID)
+    agenda = gerar_agenda(num_linhas, cadastros, rnd)
+    planilha.criar_aba(agenda_service.NOME_ABA_AGENDA, agenda, rows=len(agenda), cols=8)
+    hoje = date.today().strftime("%d/%m/%Y")
+    planilha.criar_aba(agenda_service.NOME_ABA_CADASTROS,
+                       [["telefone", "nome", "data_cadastro", "origem", "observacoes"]]
+                       + [[t, n, hoje, "benchmark", ""] for t, n in cadastros],
+                       rows=num_cadastros + 1, cols=5)
+    planilha.criar_aba(agenda_service.NOME_ABA_LEMBRETES, gerar_lembretes(num_lembretes, cadastros, rnd),
+                       rows=num_lembretes + 1, cols=10)
+    instalar_planilha_fake(cliente)
+    return cliente
+
+
+# -------------------------------------------------------
+# Casos
+# -------------------------------------------------------
+
+def _proximo_dia_util(a_partir: date) -> date:
+    dia = a_partir
+    while dia.weekday() not in agenda_service.DIAS_UTEIS:
+        dia += timedelta(days=1)
+    return dia
+
+
+class Contexto:
+    """Dados de apoio aos casos: paciente com agendamentos, datas-alvo e slots livres para escrita."""
+
+    def __init__(self, cliente: ClienteFake):
+        agenda = cliente.criar_planilha(agenda_service.SPREADSHEET_ID)._abas[agenda_service.NOME_ABA_AGENDA]._linhas
+        hoje = date.today()
+        self.dia = _proximo_dia_util(hoje + timedelta(days=1))
+        self.inicio_semana, self.fim_semana = agenda_service.obter_intervalo_semana_relativa(1)
+        agora = datetime.now()
+        futuros_agendados = []
+        self.livres = []
+        for linha in agenda[1:]:
+            dt = datetime.strptime(f"{linha[1]} {linha[2]}", "%d/%m/%Y %H:%M")
+            if dt <= agora + timedelta(days=2):
+                continue
+            if linha[5] == "AGENDADO":
+                futuros_agendados.append(linha[4])
+            else:
+                self.livres.append(dt)
+        self.telefone = futuros_agendados[0] if futuros_agendados else "5511900000000"
+        self.telefone_sem_agendamento = "5599000000000"
+        self._proximo_livre = 0
+
+    def slot_livre(self) -> datetime:
+        dt = self.livres[self._proximo_livre % len(self.livres)]
+        self._proximo_livre += 1
+        return dt
+
+
+def _agendar_e_cancelar(ctx: Contexto):
+    dt = ctx.slot_livre()
+    agenda_service.registrar_agendamento_google_sheets("Benchmark", dt, telefone="5500000000001")
+    agenda_service.cancelar_agendamento_por_data_hora(dt, "5500000000001")
+
+
+def _agendar(ctx: Contexto):
+    dt = ctx.slot_livre()
+    agenda_service.registrar_agendamento_google_sheets("Benchmark", dt, telefone="5500000000002")
+    ctx.ultimo_agendado = dt
+
+
+def _cancelar_ultimo(ctx: Contexto):
+    agenda_service.cancelar_agendamento_por_data_hora(ctx.ultimo_agendado, "5500000000002")
+
+
+# (nome, função(ctx), preparo(ctx) ou None, quente?) - preparo roda antes de cada repetição, fora do tempo
+CASOS = [
+    ("obter_todos_agenda_cached", lambda c: agenda_service.obter_todos_agenda_cached(), None, False),
+    ("ler_agenda_por_datas (semana, índice de linhas)",
+     lambda c: agenda_service.ler_agenda_por_datas(c.inicio_semana, c.fim_semana),
+     lambda c: agenda_service.ler_agenda_por_datas(c.inicio_semana, c.fim_semana), False),
+    ("obter_slots_disponiveis_para_data", lambda c: agenda_service.obter_slots_disponiveis_para_data(c.dia), None, False),
+    ("obter_slots_disponiveis_no_intervalo",
+     lambda c: agenda_service.obter_slots_disponiveis_no_intervalo(c.inicio_semana, c.fim_semana), None, False),
+    ("obter_dias_com_vaga", lambda c: agenda_service.obter_dias_com_vaga(c.inicio_semana, c.fim_semana), None, False),
+    ("obter_slots_disponiveis_semana_atual_a_partir_de_hoje",
+     lambda c: agenda_service.obter_slots_disponiveis_semana_atual_a_partir_de_hoje(), None, False),
+    ("obter_primeiro_slot_disponivel", lambda c: agenda_service.obter_primeiro_slot_disponivel(), None, False),
+    ("primeiro_slot_livre (quente)", lambda c: agenda_service.primeiro_slot_livre(),
+     lambda c: agenda_service.obter_disponibilidade(), True),
+    ("carregar_mapa_slots_existentes",
+     lambda c: agenda_service.carregar_mapa_slots_existentes(agenda_service.obter_worksheet_agenda()), None, False),
+    ("inicializar_slots_proximos_dias", lambda c: agenda_service.inicializar_slots_proximos_dias(), None, False),
+    ("gerar_grade_slots (365 dias)",
+     lambda c: agenda_service.gerar_grade_slots(c.dia, 365).linhas_agenda(), None, False),
+    ("listar_agendamentos_para_data", lambda c: agenda_service.listar_agendamentos_para_data(c.dia), None, False),
+    ("montar_texto_resumo_dia", lambda c: agenda_service.montar_texto_resumo_dia(c.dia), None, False),
+    ("buscar_proximo_agendamento_por_telefone",
+     lambda c: agenda_service.buscar_proximo_agendamento_por_telefone(c.telefone), None, False),
+    ("registrar_agendamento_google_sheets", _agendar, None, False),
+    ("cancelar_agendamento_por_data_hora", _cancelar_ultimo, _agendar, False),
+    ("agendar_e_cancelar", _agendar_e_cancelar, None, False),
+    ("cancelar_proximo_agendamento_por_telefone (sem agendamento)",
+     lambda c: agenda_service.cancelar_proximo_agendamento_por_telefone(c.telefone_sem_agendamento), None, False),
+    ("buscar_perfil_por_telefone", lambda c: agenda_service.buscar_perfil_por_telefone(c.telefone), None, False),
+    ("obter_mapa_nomes_cadastros", lambda c: agenda_service.obter_mapa_nomes_cadastros(), None, False),
+    ("buscar_perfil_em_cache (quente)", lambda c: agenda_service.buscar_perfil_em_cache(c.telefone),
+     lambda c: agenda_service.obter_mapa_nomes_cadastros_cached(), True),
+    ("obter_lembretes_pendentes", lambda c: agenda_service.obter_lembretes_pendentes(), None, False),
+    ("flow_helpers.get_future_appointments", lambda c: flow_helpers.get_future_appointments(c.telefone), None, False),
+]
+
+
+def _limpar_caches():
+    agenda_service._cache.clear()
+
+
+def medir(nome, funcao, preparo, quente, ctx, cliente, repeticoes) -> dict:
+    tempos, leituras, escritas = [], [], []
+    for _ in range(repeticoes):
+        if not quente:
+            _limpar_caches()
+        if preparo:
+            preparo(ctx)
+        cliente.zerar_contadores()
+        inicio = time.perf_counter()
+        funcao(ctx)
+        tempos.append(time.perf_counter() - inicio)
+        stats = cliente.estatisticas()
+        leituras.append(stats["leituras"])
+        escritas.append(stats["escritas"])
+    tempos_ms = sorted(t * 1000 for t in tempos)
+    return {
+        "funcao": nome,
+        "repeticoes": repeticoes,
+        "mediana_ms": round(statistics.median(tempos_ms), 3),
+        "media_ms": round(statistics.fmean(tempos_ms), 3),
+        "min_ms": round(tempos_ms[0], 3),
+        "p95_ms": round(tempos_ms[min(len(tempos_ms) - 1, int(0.95 * len(tempos_ms)))], 3),
+        "leituras_planilha": max(leituras),
+        "escritas_planilha": max(escritas),
+    }
+
+
+def executar(tamanhos: list, num_cadastros: int, num_lembretes: int, repeticoes: int, semente: int,
+             filtro: str = None) -> dict:
+    resultados = []
+    for num_linhas in tamanhos:
+        inicio = time.perf_counter()
+        cliente = montar_planilha(num_linhas, num_cadastros, num_lembretes, semente)
+        ctx = Contexto(cliente)
+        print(f"[benchmark] Agenda {num_linhas} linhas, {num_cadastros} cadastros, "
+              f"{num_lembretes} lembretes (gerada em {time.perf_counter() - inicio:.1f}s)")
+        for nome, funcao, preparo, quente in CASOS:
+            if filtro and filtro not in nome:
+                continue
+            r = medir(nome, funcao, preparo, quente, ctx, cliente, repeticoes)
+            r.update({"linhas_agenda": num_linhas, "cadastros": num_cadastros, "lembretes": num_lembretes})
+            resultados.append(r)
+            print(f"  {nome:<62} {r['mediana_ms']:>10.2f}ms  "
+                  f"(leituras {r['leituras_planilha']}, escritas {r['escritas_planilha']})")
+    return {"meta": _meta(repeticoes, semente), "resultados": resultados}
+
+
+def _meta(repeticoes: int, semente: int) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "repeticoes": repeticoes,
+        "semente": semente,
+    }
+
+
+# -------------------------------------------------------
+# Comparação entre execuções
+# -------------------------------------------------------
+
+def comparar(base: dict, novo: dict, limite: float = None) -> tuple:
+    """Retorna (texto, regressoes): razão novo/base da mediana por (função, linhas)."""
+    chave = lambda r: (r["funcao"], r["linhas_agenda"])
+    base_idx = {chave(r): r for r in base["resultados"]}
+    linhas = [
+        f"base: {base['meta'].get('commit')} ({base['meta'].get('data')})  ->  "
+        f"novo: {novo['meta'].get('commit')} ({novo['meta'].get('data')})",
+        "",
+        f"{'função':<62}{'linhas':>8}{'base ms':>12}{'novo ms':>12}{'razão':>8}  leituras",
+    ]
+    regressoes = []
+    for r in novo["resultados"]:
+        b = base_idx.get(chave(r))
+        if b is None:
+            continue
+        razao = r["mediana_ms"] / b["mediana_ms"] if b["mediana_ms"] else float("inf")
+        marca = ""
+        if limite and razao > limite:
+            marca = "  << REGRESSÃO"
+            regressoes.append({"funcao": r["funcao"], "linhas_agenda": r["linhas_agenda"], "razao": round(razao, 2)})
+        linhas.append(f"{r['funcao']:<62}{r['linhas_agenda']:>8}{b['mediana_ms']:>12.2f}{r['mediana_ms']:>12.2f}"
+                      f"{razao:>8.2f}  {b['leituras_planilha']}->{r['leituras_planilha']}{marca}")
+    return "\n".join(linhas), regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks do agenda_service com planilha em memória")
+    parser.add_argument("--linhas", default="1000,10000,100000", help="tamanhos da aba Agenda, separados por vírgula")
+    parser.add_argument("--cadastros", type=int, default=10000, help="pacientes na aba Cadastros")
+    parser.add_argument("--lembretes", type=int, default=500, help="linhas na aba Lembretes")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--filtro", help="roda só os casos cujo nome contém este texto")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: tests/benchmark_agenda_<commit>.json)")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NOVO"), help="compara dois resultados JSON")
+    parser.add_argument("--limite", type=float, default=None,
+                        help="com --comparar: razão novo/base acima da qual a função é marcada como regressão")
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        with open(args.comparar[0], encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.comparar[1], encoding="utf-8") as f:
+            novo = json.load(f)
+        texto, regressoes = comparar(base, novo, args.limite)
+        print(texto)
+        if regressoes:
+            print(f"\n{len(regressoes)} regressão(ões) acima de {args.limite}x")
+            return 1
+        return 0
+
+    tamanhos = [int(t) for t in args.linhas.split(",") if t.strip()]
+    resultado = executar(tamanhos, args.cadastros, args.lembretes, args.repeticoes, args.semente, args.filtro)
+    saida = args.saida or os.path.join(project_root, "tests",
+                                       f"benchmark_agenda_{resultado['meta']['commit'] or 'local'}.json")
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"\n[OK] Resultados salvos em: {saida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+"""
+carga_webhook.py
+
+Gerador de carga ponta a ponta para o /webhook: N pacientes simulados em paralelo
+enviam payloads reais do WhatsApp Cloud (text, button_reply, list_reply e os botões
+de lembrete rem_confirm/rem_cancel) seguindo roteiros de agendamento,
+reagendamento e cancelamento. Mede vazão e latência (p50/p95/p99) por requisição
+e grava o relatório no mesmo formato JSON/TXT do test_fluxo_conversacional.
+
+Modos:
+  - local (padrão): sobe o app em uvicorn numa porta livre, com a planilha em
+    memória (fake_gspread) e o stub da Graph API (graph_api_stub). Nada externo é acessado.
+  - --url: envia para um servidor já em execução (ex.: http://127.0.0.1:8000).
+
+Uso:
+    python -m tests.carga_webhook --pacientes 20
+    python -m tests.carga_webhook --pacientes 50 --latencia-planilha 0.15 --latencia-graph 0.1
+    python -m tests.carga_webhook --url http://127.0.0.1:8000 --pacientes 10 --roteiros agendar,cancelar
+
+Saída (em tests/relatorio_testes_<data>/, ou na pasta de --saida):
+    - relatorio_testes_<timestamp>.json (resumo + "carga" com vazão/percentis + um teste por paciente)
+    - relatorio_testes_<timestamp>.txt
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+PASTA_TESTES = os.path.join(project_root, "tests")    # relatórios ao lado dos relatorio_testes_* existentes
+
+
+# -------------------------------------------------------
+# Payloads do webhook (formato WhatsApp Cloud API)
+# -------------------------------------------------------
+
+WABA_ID = "100000000000000"
+PHONE_NUMBER_ID = "200000000000000"
+
+
+def _envelope(de: str, nome: str, mensagem: dict) -> dict:
+    mensagem = dict(mensagem, **{
+        "from": de,
+        "id": f"wamid.CARGA{uuid.uuid4().hex}",
+        "timestamp": str(int(time.time())),
+    })
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": WABA_ID,
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "5511900000000", "phone_number_id": PHONE_NUMBER_ID},
+                    "contacts": [{"profile": {"name": nome}, "wa_id": de}],
+                    "messages": [mensagem],
+                },
+            }],
+        }],
+    }
+
+
+def payload_texto(de: str, nome: str, corpo: str) -> dict:
+    return _envelope(de, nome, {"type": "text", "text": {"body": corpo}})
+
+
+def payload_botao(de: str, nome: str, id_botao: str, titulo: str = "") -> dict:
+    return _envelope(de, nome, {
+        "type": "interactive",
+        "interactive": {"type": "button_reply", "button_reply": {"id": id_botao, "title": titulo or id_botao}},
+    })
+
+
+def payload_lista(de: str, nome: str, id_item: str, titulo: str = "") -> dict:
+    return _envelope(de, nome, {
+        "type": "interactive",
+        "interactive": {"type": "list_reply", "list_reply": {"id": id_item, "title": titulo or id_item}},
+    })
+
+
+_CONSTRUTORES = {"text": payload_texto, "button_reply": payload_botao, "list_reply": payload_lista}
+
+
+# -------------------------------------------------------
+# Roteiros dos pacientes: listas de (tipo, valor)
+# -------------------------------------------------------
+
+def _escolher_horario(rnd: random.Random):
+    """Semana que vem (sempre tem dias úteis), dia e horário sorteados entre os primeiros da lista."""
+    return [("button_reply", "2"), ("list_reply", str(rnd.randint(1, 4))), ("list_reply", str(rnd.randint(1, 4)))]
+
+
+def roteiro_cadastro(nome: str) -> list:
+    return [("text", "oi"), ("text", nome)]
+
+
+def roteiro_agendar(rnd: random.Random) -> list:
+    return [("list_reply", "1")] + _escolher_horario(rnd) + [("button_reply", "1")]
+
+
+def roteiro_reagendar(rnd: random.Random) -> list:
+    return [("list_reply", "2"), ("list_reply", "1")] + _escolher_horario(rnd) + [("button_reply", "1")]
+
+
+def roteiro_cancelar(rnd: random.Random) -> list:
+    return [("list_reply", "3"), ("list_reply", "1"), ("button_reply", "1")]
+
+
+ROTEIROS = {
+    # nome -> função (rnd) -> passos após o cadastro; "rem_*" são resolvidos na hora do envio
+    "agendar": lambda rnd: roteiro_agendar(rnd),
+    "reagendar": lambda rnd: roteiro_agendar(rnd) + roteiro_reagendar(rnd),
+    "cancelar": lambda rnd: roteiro_agendar(rnd) + roteiro_cancelar(rnd),
+    "lembrete_confirmar": lambda rnd: roteiro_agendar(rnd) + [("button_reply", "rem_confirm")],
+    "lembrete_cancelar": lambda rnd: roteiro_agendar(rnd) + [("button_reply", "rem_cancel")],
+}
+
+
+# -------------------------------------------------------
+# Servidor local (planilha fake + stub da Graph API)
+# -------------------------------------------------------
+
+class AmbienteLocal:
+    """Sobe o app FastAPI em uvicorn com a planilha em memória e o stub da Graph API."""
+
+    def __init__(self, latencia_planilha: float = 0.0, latencia_graph: float = 0.0, dias_slots: int = 21):
+        self.latencia_planilha = latencia_planilha
+        self.latencia_graph = latencia_graph
+        self.dias_slots = dias_slots
+        self.planilha = None
+        self.stub = None
+        self._servidor = None
+        self.url = None
+
+    def iniciar(self) -> str:
+        import uvicorn
+        from tests.fake_gspread import instalar_planilha_fake
+        from tests.graph_api_stub import GraphApiStub
+        from src import whatsapp_webhook
+
+        logging.getLogger().setLevel(logging.WARNING)  # o webhook loga cada passo; em carga isso domina o tempo
+        self.planilha = instalar_planilha_fake(dias_slots=self.dias_slots, latencia=self.latencia_planilha)
+        self.stub = GraphApiStub(latencia=self.latencia_graph or None)
+        self.stub.iniciar()
+        self.stub.apontar_webhook()
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            porta = s.getsockname()[1]
+        config = uvicorn.Config(whatsapp_webhook.app, host="127.0.0.1", port=porta,
+                                lifespan="off", log_level="warning", access_log=False)
+        self._servidor = uvicorn.Server(config)
+        threading.Thread(target=self._servidor.run, name="carga-uvicorn", daemon=True).start()
+        limite = time.time() + 15
+        while not self._servidor.started:
+            if time.time() > limite:
+                raise RuntimeError("uvicorn não iniciou em 15s")
+            time.sleep(0.05)
+        self.url = f"http://127.0.0.1:{porta}"
+        return self.url
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.should_exit = True
+        if self.stub is not None:
+            self.stub.parar()
+
+    def agendamento_do_paciente(self, telefone: str):
+        from src.agenda_service import buscar_proximo_agendamento_por_telefone
+        return buscar_proximo_agendamento_por_telefone(telefone)
+
+
+# -------------------------------------------------------
+# Execução da carga
+# -------------------------------------------------------
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil pelo método nearest-rank (valores em segundos -> retorno em ms)."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return round(ordenados[min(len(ordenados) - 1, max(0, int(math.ceil(p / 100 * len(ordenados))) - 1))] * 1000, 1)
+
+
+def _resumo_latencias(latencias: list) -> dict:
+    return {
+        "requisicoes": len(latencias),
+        "p50_ms": percentil(latencias, 50),
+        "p95_ms": percentil(latencias, 95),
+        "p99_ms": percentil(latencias, 99),
+        "max_ms": round(max(latencias) * 1000, 1) if latencias else 0.0,
+    }
+
+
+class GeradorCarga:
+    def __init__(self, url: str, pacientes: int, roteiros: list, pausa: float = 0.0,
+                 ambiente: AmbienteLocal = None, semente: int = None):
+        self.url = url.rstrip("/") + "/webhook"
+        self.pacientes = pacientes
+        self.roteiros = roteiros
+        self.pausa = pausa
+        self.ambiente = ambiente
+        self.semente = semente if semente is not None else int(time.time())
+        self.resultados = []
+        self._lock = threading.Lock()
+        self._sessao = requests.Session()
+        self._sessao.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=max(10, pacientes)))
+
+    def _iso_lembrete(self, telefone: str) -> str:
+        dt = self.ambiente.agendamento_do_paciente(telefone) if self.ambiente else None
+        if dt is None:  # servidor remoto: data sintética (o handler responde "não foi possível cancelar")
+            dt = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+        return dt.isoformat()
+
+    def _executar_paciente(self, indice: int) -> dict:
+        rnd = random.Random(self.semente + indice)
+        roteiro = self.roteiros[indice % len(self.roteiros)]
+        telefone = f"55119{indice:08d}"
+        nome = f"Paciente Carga {indice}"
+        passos = roteiro_cadastro(nome) + ROTEIROS[roteiro](rnd)
+
+        resultado = {
+            "nome": f"Paciente {indice} ({roteiro})",
+            "timestamp": datetime.now().isoformat(),
+            "sequencia": [],
+            "respostas": [],
+            "passou": True,
+            "erro": None,
+            "detalhes": "",
+        }
+        for tipo, valor in passos:
+            if valor in ("rem_confirm", "rem_cancel"):
+                rotulo = valor
+                valor = f"{valor}|{self._iso_lembrete(telefone)}"
+            else:
+                rotulo = tipo
+            payload = _CONSTRUTORES[tipo](telefone, nome, valor)
+            inicio = time.perf_counter()
+            try:
+                r = self._sessao.post(self.url, json=payload, timeout=60)
+                status, erro = r.status_code, None if r.status_code == 200 else r.text[:200]
+            except Exception as e:
+                status, erro = None, f"{type(e).__name__}: {e}"
+            duracao = time.perf_counter() - inicio
+
+            resultado["sequencia"].append(valor)
+            resultado["respostas"].append({"tipo": rotulo, "input": valor, "status": status,
+                                           "latencia_ms": round(duracao * 1000, 1), "sucesso": erro is None,
+                                           "erro": erro})
+            if erro is not None:
+                resultado["passou"] = False
+                resultado["erro"] = erro
+                resultado["detalhes"] = f"Falhou na entrada '{valor}': {erro}"
+                break
+            if self.pausa:
+                time.sleep(rnd.uniform(0, 2 * self.pausa))  # "tempo de leitura" do paciente
+        if resultado["passou"]:
+            resultado["detalhes"] = "Sequência executada sem erros"
+        return resultado
+
+    def executar(self) -> dict:
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.pacientes, thread_name_prefix="paciente") as pool:
+            self.resultados = list(pool.map(self._executar_paciente, range(1, self.pacientes + 1)))
+        duracao = time.perf_counter() - inicio
+
+        respostas = [r for t in self.resultados for r in t["respostas"]]
+        ok = [r["latencia_ms"] / 1000 for r in respostas if r["sucesso"]]
+        por_tipo = {}
+        for r in respostas:
+            if r["sucesso"]:
+                por_tipo.setdefault(r["tipo"], []).append(r["latencia_ms"] / 1000)
+
+        carga = {
+            "url": self.url,
+            "pacientes": self.pacientes,
+            "roteiros": self.roteiros,
+            "duracao_s": round(duracao, 2),
+            "requisicoes": len(respostas),
+            "requisicoes_com_erro": len(respostas) - len(ok),
+            "vazao_req_s": round(len(respostas) / duracao, 2) if duracao else 0.0,
+            "latencia": _resumo_latencias(ok),
+            "latencia_por_tipo": {tipo: _resumo_latencias(v) for tipo, v in sorted(por_tipo.items())},
+        }
+        if self.ambiente is not None:
+            carga["planilha"] = self.ambiente.planilha.estatisticas()
+            carga["graph_api"] = self.ambiente.stub.estatisticas()
+        return carga
+
+    def gerar_relatorio(self, carga: dict, salvar_arquivo: bool = True, pasta: str = None) -> str:
+        passou = sum(1 for t in self.resultados if t["passou"])
+        falhou = len(self.resultados) - passou
+        taxa_sucesso = (passou / len(self.resultados) * 100) if self.resultados else 0
+        lat = carga["latencia"]
+
+        relatorio = [
+            "=" * 80,
+            "RELATÓRIO DE CARGA DO WEBHOOK",
+            "=" * 80,
+            f"Data/Hora: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            f"Destino: {carga['url']}",
+            f"Pacientes simultâneos: {carga['pacientes']} | Roteiros: {', '.join(carga['roteiros'])}",
+            f"Total de testes: {len(self.resultados)}",
+            f"[PASSOU] {passou}",
+            f"[FALHOU] {falhou}",
+            "",
+            "=" * 80,
+            "RESUMO",
+            "=" * 80,
+            f"Taxa de sucesso: {taxa_sucesso:.1f}%",
+            f"Requisições: {carga['requisicoes']} em {carga['duracao_s']}s "
+            f"({carga['vazao_req_s']} req/s, {carga['requisicoes_com_erro']} com erro)",
+            f"Latência: p50 {lat['p50_ms']}ms | p95 {lat['p95_ms']}ms | p99 {lat['p99_ms']}ms | max {lat['max_ms']}ms",
+            "",
+            f"{'tipo':<20}{'req':>6}{'p50':>10}{'p95':>10}{'p99':>10}",
+        ]
+        for tipo, l in carga["latencia_por_tipo"].items():
+            relatorio.append(f"{tipo:<20}{l['requisicoes']:>6}{l['p50_ms']:>8.1f}ms{l['p95_ms']:>8.1f}ms{l['p99_ms']:>8.1f}ms")
+        if "planilha" in carga:
+            p, g = carga["planilha"], carga["graph_api"]
+            relatorio.append("")
+            relatorio.append(f"Planilha (fake): {p['total']} chamadas ({p['leituras']} leituras, {p['escritas']} escritas)")
+            relatorio.append(f"Graph API (stub): {g['total']} envios {g['por_status']}")
+
+        relatorio += ["", "=" * 80, "DETALHES DOS TESTES", "=" * 80, ""]
+        for idx, teste in enumerate(self.resultados, 1):
+            status = "[PASSOU]" if teste["passou"] else "[FALHOU]"
+            latencias = [r["latencia_ms"] for r in teste["respostas"]]
+            relatorio.append(f"[{idx}] {status} - {teste['nome']}")
+            relatorio.append(f"    Sequencia: {' -> '.join(teste['sequencia'][:3])}")
+            if len(teste["sequencia"]) > 3:
+                relatorio.append(f"               ... ({len(teste['sequencia'])} inputs no total)")
+            if teste["erro"]:
+                relatorio.append(f"    [ERRO] {teste['erro']}")
+            relatorio.append(f"    Latência total: {sum(latencias):.1f}ms em {len(latencias)} requisições")
+            relatorio.append(f"    Detalhes: {teste['detalhes']}")
+            relatorio.append("")
+
+        texto_relatorio = "\n".join(relatorio)
+
+        if salvar_arquivo:
+            agora = datetime.now()
+            timestamp = agora.strftime("%Y%m%d_%H%M%S")
+            pasta = pasta or os.path.join(PASTA_TESTES, f"relatorio_testes_{agora:%Y%m%d}")
+            os.makedirs(pasta, exist_ok=True)
+            nome_arquivo_txt = os.path.join(pasta, f"relatorio_testes_{timestamp}.txt")
+            with open(nome_arquivo_txt, "w", encoding="utf-8") as f:
+                f.write(texto_relatorio)
+            nome_arquivo_json = os.path.join(pasta, f"relatorio_testes_{timestamp}.json")
+            with open(nome_arquivo_json, "w", encoding="utf-8") as f:
+                json.dump({
+                    "resumo": {
+                        "total": len(self.resultados),
+                        "passou": passou,
+                        "falhou": falhou,
+                        "taxa_sucesso": taxa_sucesso,
+                        "carga": carga,
+                    },
+                    "testes": self.resultados,
+                }, f, indent=2, ensure_ascii=False, default=str)
+            print(f"\n[OK] Relatorio salvo em: {nome_arquivo_txt}")
+            print(f"[OK] Dados JSON salvos em: {nome_arquivo_json}")
+
+        return texto_relatorio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga ponta a ponta do /webhook")
+    parser.add_argument("--url", help="servidor já em execução; sem isso sobe um ambiente local isolado")
+    parser.add_argument("--pacientes", type=int, default=10, help="pacientes simulados em paralelo")
+    parser.add_argument("--roteiros", default=",".join(ROTEIROS),
+                        help=f"roteiros distribuídos entre os pacientes ({', '.join(ROTEIROS)})")
+    parser.add_argument("--pausa", type=float, default=0.0, help="pausa média entre mensagens de um paciente (s)")
+    parser.add_argument("--latencia-planilha", type=float, default=0.0, help="latência por chamada da planilha fake (s)")
+    parser.add_argument("--latencia-graph", type=float, default=0.0, help="latência por envio do stub da Graph API (s)")
+    parser.add_argument("--semente", type=int, default=None, help="semente dos sorteios de dia/horário")
+    parser.add_argument("--saida", help="pasta dos relatórios (padrão: tests/relatorio_testes_<data>)")
+    args = parser.parse_args(argv)
+
+    roteiros = [r.strip() for r in args.roteiros.split(",") if r.strip()]
+    desconhecidos = [r for r in roteiros if r not in ROTEIROS]
+    if desconhecidos:
+        parser.error(f"roteiros desconhecidos: {', '.join(desconhecidos)}")
+
+    ambiente = None
+    url = args.url
+    if not url:
+        ambiente = AmbienteLocal(args.latencia_planilha, args.latencia_graph)
+        url = ambiente.iniciar()
+
+    print(f"Carga: {args.pacientes} pacientes -> {url}/webhook")
+    try:
+        gerador = GeradorCarga(url, args.pacientes, roteiros, pausa=args.pausa, ambiente=ambiente, semente=args.semente)
+        carga = gerador.executar()
+        relatorio = gerador.gerar_relatorio(carga, pasta=args.saida)
+    finally:
+        if ambiente is not None:
+            ambiente.parar()
+
+    try:
+        print(relatorio)
+    except UnicodeEncodeError:
+        print("[RELATORIO GERADO] Veja os arquivos de relatorio para detalhes completos")
+    return 0 if all(t["passou"] for t in gerador.resultados) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,499 @@
+"""
+fake_gspread.py
+
+Planilha em memória que imita a superfície do gspread usada pelo agenda_service
+(cliente -> planilha -> worksheets), para rodar fluxo, benchmarks e testes de
+carga SEM acessar o Google Sheets.
+
+Recursos:
+  - latência configurável por chamada (fixa, por método ou função/distribuição);
+  - simulação de cota (HTTP 429): limite de requisições por minuto, taxa de erro
+    aleatória ou falha forçada das próximas N chamadas;
+  - contagem de chamadas por método, separando leituras e escritas.
+
+Uso:
+    from tests.fake_gspread import instalar_planilha_fake
+
+    cliente = instalar_planilha_fake(latencia=0.05)     # agenda_service passa a usar a fake
+    ...
+    print(cliente.estatisticas())
+"""
+
+import random
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+
+try:
+    from gspread.exceptions import APIError, WorksheetNotFound
+except ImportError:  # gspread ausente: exceções equivalentes só para a fake
+    class APIError(Exception):
+        def __init__(self, response):
+            self.response = response
+            self.error = response.json()["error"]
+            self.code = self.error["code"]
+            super().__init__(self.error)
+
+    class WorksheetNotFound(Exception):
+        pass
+
+
+# Métodos que contam como leitura/escrita na cota do Sheets
+METODOS_LEITURA = {"get_all_values", "get_all_records", "row_values", "acell", "worksheet", "open_by_key",
+                   "batch_get"}
+METODOS_ESCRITA = {"update", "append_row", "append_rows", "delete_rows", "insert_row", "update_acell",
+                   "batch_update", "add_worksheet", "spreadsheet.batch_update"}
+
+_A1 = re.compile(r"^([A-Za-z]+)(\d+)$")
+_FAIXA_A1 = re.compile(r"^([A-Za-z]+)(\d+):([A-Za-z]+)(\d*)$")   # 'A2:H10' ou 'A5:H' (até o fim)
+
+
+def _coluna_para_indice(letras: str) -> int:
+    indice = 0
+    for letra in letras.upper():
+        indice = indice * 26 + (ord(letra) - ord("A") + 1)
+    return indice
+
+
+def _parse_a1(celula: str):
+    """'B5' -> (5, 2) (linha e coluna 1-based)."""
+    m = _A1.match(celula.strip())
+    if not m:
+        raise ValueError(f"Notação A1 não suportada pela planilha fake: {celula!r}")
+    return int(m.group(2)), _coluna_para_indice(m.group(1))
+
+
+def _parse_intervalo(intervalo: str):
+    """'A2:H10' ou 'B5' (opcionalmente com 'Aba!') -> (linha, coluna) da célula inicial."""
+    intervalo = intervalo.split("!")[-1]
+    return _parse_a1(intervalo.split(":")[0])
+
+
+def _numerizar(valor: str):
+    """Mesma conversão do get_all_records do gspread: números viram int/float."""
+    if valor == "":
+        return ""
+    try:
+        return int(valor)
+    except ValueError:
+        pass
+    try:
+        return float(valor)
+    except ValueError:
+        return valor
+
+
+class _RespostaFalsa:
+    """Resposta mínima aceita por gspread.exceptions.APIError."""
+
+    def __init__(self, codigo: int, mensagem: str, status: str):
+        self.status_code = codigo
+        self.text = mensagem
+        self._erro = {"code": codigo, "message": mensagem, "status": status}
+
+    def json(self):
+        return {"error": self._erro}
+
+
+def erro_cota() -> APIError:
+    return APIError(_RespostaFalsa(
+        429, "Quota exceeded for quota metric 'Read requests' (planilha fake)", "RESOURCE_EXHAUSTED"))
+
+
+def erro_grade(intervalo: str, ws) -> APIError:
+    return APIError(_RespostaFalsa(
+        400, f"Range ('{ws.title}'!{intervalo}) exceeds grid limits. Max rows: {ws.row_count}, "
+             f"max columns: {ws.col_count}", "INVALID_ARGUMENT"))
+
+
+class ClienteFake:
+    """
+    Cliente gspread falso. Guarda as planilhas, a configuração de latência/cota
+    e os contadores de chamadas compartilhados por todas as worksheets.
+
+    latencia: segundos por chamada (float), função sem argumentos que retorna
+              segundos (ex.: lambda: random.uniform(0.05, 0.3)) ou None.
+    latencia_por_metodo: {"get_all_values": 0.4, ...} sobrepõe `latencia`.
+    cota_por_minuto: máximo de requisições em janela deslizante de 60s (None = sem limite),
+              como a cota "por minuto por usuário" do Sheets.
+    taxa_erro_429: probabilidade (0..1) de qualquer chamada falhar com 429.
+    """
+
+    def __init__(self, latencia=None, latencia_por_metodo=None, cota_por_minuto=None,
+                 taxa_erro_429=0.0, semente=None):
+        self.latencia = latencia
+        self.latencia_por_metodo = dict(latencia_por_metodo or {})
+        self.cota_por_minuto = cota_por_minuto
+        self.taxa_erro_429 = taxa_erro_429
+        self.chamadas = Counter()
+        self.erros_429 = 0
+        self.tempo_latencia = 0.0
+        self._falhas_forcadas = 0
+        self._janela = deque()
+        self._random = random.Random(semente)
+        self._lock = threading.RLock()
+        self._planilhas = {}
+
+    # ---------------------------------------------------
+    # Latência, cota e contagem
+    # ---------------------------------------------------
+
+    def _registrar_chamada(self, metodo: str):
+        with self._lock:
+            self.chamadas[metodo] += 1
+            agora = time.monotonic()
+            falhar = False
+            if self._falhas_forcadas > 0:
+                self._falhas_forcadas -= 1
+                falhar = True
+            elif self.taxa_erro_429 and self._random.random() < self.taxa_erro_429:
+                falhar = True
+            elif self.cota_por_minuto is not None:
+                while self._janela and agora - self._janela[0] >= 60:
+                    self._janela.popleft()
+                if len(self._janela) >= self.cota_por_minuto:
+                    falhar = True
+                else:
+                    self._janela.append(agora)
+            if falhar:
+                self.erros_429 += 1
+            atraso = self.latencia_por_metodo.get(metodo, self.latencia)
+            if callable(atraso):
+                atraso = atraso()
+            atraso = max(0.0, float(atraso or 0.0))
+            self.tempo_latencia += atraso
+        if atraso:
+            time.sleep(atraso)  # fora do lock: chamadas concorrentes esperam em paralelo, como na API real
+        if falhar:
+            raise erro_cota()
+
+    def falhar_proximas(self, quantidade: int = 1):
+        """As próximas `quantidade` chamadas falham com 429."""
+        with self._lock:
+            self._falhas_forcadas += quantidade
+
+    def zerar_contadores(self):
+        with self._lock:
+            self.chamadas.clear()
+            self.erros_429 = 0
+            self.tempo_latencia = 0.0
+            self._janela.clear()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            chamadas = dict(self.chamadas)
+        return {
+            "total": sum(chamadas.values()),
+            "leituras": sum(n for m, n in chamadas.items() if m in METODOS_LEITURA),
+            "escritas": sum(n for m, n in chamadas.items() if m in METODOS_ESCRITA),
+            "erros_429": self.erros_429,
+            "tempo_latencia_s": round(self.tempo_latencia, 3),
+            "por_metodo": chamadas,
+        }
+
+    # ---------------------------------------------------
+    # Superfície gspread
+    # ---------------------------------------------------
+
+    def criar_planilha(self, chave: str = "fake") -> "PlanilhaFake":
+        with self._lock:
+            planilha = self._planilhas.get(chave)
+            if planilha is None:
+                planilha = self._planilhas[chave] = PlanilhaFake(self, chave)
+            return planilha
+
+    def open_by_key(self, chave: str) -> "PlanilhaFake":
+        self._registrar_chamada("open_by_key")
+        return self.criar_planilha(chave)
+
+
+class PlanilhaFake:
+    """Planilha (spreadsheet) falsa: conjunto de abas por título."""
+
+    def __init__(self, cliente: ClienteFake, chave: str):
+        self.client = cliente
+        self.id = chave
+        self._abas = {}
+        self._proximo_sheet_id = 0
+
+    def worksheet(self, titulo: str) -> "WorksheetFake":
+        self.client._registrar_chamada("worksheet")
+        with self.client._lock:
+            if titulo not in self._abas:
+                raise WorksheetNotFound(titulo)
+            return self._abas[titulo]
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26) -> "WorksheetFake":
+        self.client._registrar_chamada("add_worksheet")
+        return self.criar_aba(title, rows=rows, cols=cols)
+
+    def criar_aba(self, titulo: str, linhas=None, rows: int = 1000, cols: int = 26) -> "WorksheetFake":
+        """Cria (ou substitui) uma aba sem contar chamada; `linhas` já preenchidas (cabeçalho incluso)."""
+        with self.client._lock:
+            ws = WorksheetFake(self, titulo, self._proximo_sheet_id, max(rows, len(linhas or [])), cols)
+            self._proximo_sheet_id += 1
+            ws._linhas = [[str(v) for v in linha] for linha in (linhas or [])]
+            self._abas[titulo] = ws
+            return ws
+
+    def worksheets(self) -> list:
+        with self.client._lock:
+            return list(self._abas.values())
+
+    def batch_update(self, corpo: dict) -> dict:
+        """Suporta as requisições deleteDimension (ROWS) usadas pelo agenda_service."""
+        self.client._registrar_chamada("spreadsheet.batch_update")
+        with self.client._lock:
+            por_id = {ws.id: ws for ws in self._abas.values()}
+            for req in corpo.get("requests", []):
+                if "deleteDimension" not in req:
+                    raise NotImplementedError(f"Requisição não suportada pela planilha fake: {list(req)}")
+                faixa = req["deleteDimension"]["range"]
+                if faixa.get("dimension") != "ROWS":
+                    raise NotImplementedError("Planilha fake só remove linhas (dimension=ROWS)")
+                ws = por_id[faixa["sheetId"]]
+                ws._remover_linhas(faixa["startIndex"], faixa["endIndex"])
+        return {"spreadsheetId": self.id, "replies": [{} for _ in corpo.get("requests", [])]}
+
+
+class WorksheetFake:
+    """Aba falsa. As linhas ficam em `_linhas` (lista de listas de strings, 0-based)."""
+
+    def __init__(self, planilha: PlanilhaFake, titulo: str, sheet_id: int, rows: int, cols: int):
+        self.spreadsheet = planilha
+        self.title = titulo
+        self.id = sheet_id
+        self.row_count = rows
+        self.col_count = cols
+        self._linhas = []
+
+    @property
+    def client(self):
+        return self.spreadsheet.client
+
+    def _chamar(self, metodo: str):
+        self.client._registrar_chamada(metodo)
+
+    def _escrever(self, linha: int, coluna: int, valores):
+        """Escreve a matriz `valores` a partir de (linha, coluna) 1-based, expandindo a aba se preciso."""
+        for i, valores_linha in enumerate(valores):
+            indice = linha - 1 + i
+            while len(self._linhas) <= indice:
+                self._linhas.append([])
+            atual = self._linhas[indice]
+            for j, valor in enumerate(valores_linha):
+                c = coluna - 1 + j
+                while len(atual) <= c:
+                    atual.append("")
+                atual[c] = "" if valor is None else str(valor)
+        self.row_count = max(self.row_count, len(self._linhas))
+
+    def _ultima_linha_preenchida(self) -> int:
+        for i in range(len(self._linhas) - 1, -1, -1):
+            if any(v != "" for v in self._linhas[i]):
+                return i + 1
+        return 0
+
+    # leituras --------------------------------------------------------------
+
+    def get_all_values(self, *args, **kwargs) -> list:
+        self._chamar("get_all_values")
+        with self.client._lock:
+            ultima = self._ultima_linha_preenchida()
+            linhas = self._linhas[:ultima]
+            largura = max((len(l) for l in linhas), default=0)
+            return [list(l) + [""] * (largura - len(l)) for l in linhas]  # retângulo, como o gspread
+
+    def get_all_records(self, *args, head: int = 1, **kwargs) -> list:
+        self._chamar("get_all_records")
+        with self.client._lock:
+            ultima = self._ultima_linha_preenchida()
+            if ultima < head:
+                return []
+            cabecalho = self._linhas[head - 1]
+            registros = []
+            for linha in self._linhas[head:ultima]:
+                linha = list(linha) + [""] * (len(cabecalho) - len(linha))
+                registros.append({c: _numerizar(v) for c, v in zip(cabecalho, linha)})
+            return registros
+
+    def batch_get(self, intervalos: list, *args, **kwargs) -> list:
+        """
+        Worksheet.batch_get: um bloco por intervalo ('A2:H10', ou 'A5:H' até a última
+        linha). Como na API, linhas vazias no fim do bloco e células vazias no fim de
+        cada linha não vêm na resposta, e um intervalo que passa da grade da aba
+        (row_count) é erro 400.
+        """
+        self._chamar("batch_get")
+        blocos = []
+        with self.client._lock:
+            for intervalo in intervalos:
+                m = _FAIXA_A1.match(intervalo.split("!")[-1].strip())
+                if not m:
+                    raise ValueError(f"Notação A1 não suportada pela planilha fake: {intervalo!r}")
+                col_ini, col_fim = _coluna_para_indice(m.group(1)), _coluna_para_indice(m.group(3))
+                lin_ini = int(m.group(2))
+                if lin_ini > self.row_count or (m.group(4) and int(m.group(4)) > self.row_count):
+                    raise erro_grade(intervalo, self)
+                lin_fim = int(m.group(4)) if m.group(4) else len(self._linhas)
+                bloco = []
+                for linha in self._linhas[lin_ini - 1:lin_fim]:
+                    valores = list(linha[col_ini - 1:col_fim])
+                    while valores and valores[-1] == "":
+                        valores.pop()
+                    bloco.append(valores)
+                while bloco and not bloco[-1]:
+                    bloco.pop()
+                blocos.append(bloco)
+        return blocos
+
+    def row_values(self, linha: int, *args, **kwargs) -> list:
+        self._chamar("row_values")
+        with self.client._lock:
+            if linha - 1 >= len(self._linhas):
+                return []
+            valores = list(self._linhas[linha - 1])
+            while valores and valores[-1] == "":
+                valores.pop()
+            return valores
+
+    def acell(self, celula: str, *args, **kwargs):
+        self._chamar("acell")
+        linha, coluna = _parse_a1(celula)
+        with self.client._lock:
+            valores = self._linhas[linha - 1] if linha - 1 < len(self._linhas) else []
+            return type("CelulaFake", (), {"row": linha, "col": coluna,
+                                          "value": valores[coluna - 1] if coluna - 1 < len(valores) else ""})()
+
+    # escritas --------------------------------------------------------------
+
+    def update(self, *args, **kwargs):
+        """Aceita update(intervalo, valores) (gspread < 6) e update(valores, intervalo) (gspread 6)."""
+        self._chamar("update")
+        valores = kwargs.get("values")
+        intervalo = kwargs.get("range_name")
+        for arg in args:
+            if isinstance(arg, str) and intervalo is None:
+                intervalo = arg
+            elif valores is None:
+                valores = arg
+        if not isinstance(valores, list):
+            valores = [[valores]]
+        elif valores and not isinstance(valores[0], list):
+            valores = [valores]
+        linha, coluna = _parse_intervalo(intervalo or "A1")
+        with self.client._lock:
+            self._escrever(linha, coluna, valores)
+        return {"updatedRange": intervalo, "updatedRows": len(valores)}
+
+    def update_acell(self, celula: str, valor):
+        self._chamar("update_acell")
+        linha, coluna = _parse_a1(celula)
+        with self.client._lock:
+            self._escrever(linha, coluna, [[valor]])
+
+    def batch_update(self, dados: list, **kwargs):
+        """Worksheet.batch_update: lista de {"range": ..., "values": [[...]]}."""
+        self._chamar("batch_update")
+        with self.client._lock:
+            for item in dados:
+                linha, coluna = _parse_intervalo(item["range"])
+                self._escrever(linha, coluna, item["values"])
+        return {"totalUpdatedRanges": len(dados)}
+
+    def append_row(self, valores, *args, **kwargs):
+        self._chamar("append_row")
+        with self.client._lock:
+            self._escrever(self._ultima_linha_preenchida() + 1, 1, [valores])
+
+    def append_rows(self, linhas, *args, **kwargs):
+        self._chamar("append_rows")
+        with self.client._lock:
+            self._escrever(self._ultima_linha_preenchida() + 1, 1, linhas)
+
+    def insert_row(self, valores, index: int = 1, *args, **kwargs):
+        self._chamar("insert_row")
+        with self.client._lock:
+            self._linhas.insert(index - 1, ["" if v is None else str(v) for v in valores])
+            self.row_count += 1
+
+    def delete_rows(self, inicio: int, fim: int = None):
+        self._chamar("delete_rows")
+        with self.client._lock:
+            self._remover_linhas(inicio - 1, fim or inicio)
+
+    def _remover_linhas(self, inicio: int, fim: int):
+        """Remove as linhas [inicio, fim) (0-based); como na API, a grade encolhe junto."""
+        del self._linhas[inicio:fim]
+        self.row_count -= max(0, min(fim, self.row_count) - inicio)
+
+    def __repr__(self):
+        return f"<WorksheetFake {self.title!r} id:{self.id} linhas:{len(self._linhas)}>"
+
+
+# -------------------------------------------------------
+# Instalação no agenda_service
+# -------------------------------------------------------
+
+def criar_planilha_clinica(cliente: ClienteFake = None, dias_slots: int = 0, cadastros=None) -> ClienteFake:
+    """
+    Cria no cliente a planilha do SPREADSHEET_ID com as abas Agenda, Cadastros e
+    Lembretes (com cabeçalho). `dias_slots` > 0 preenche a Agenda com os slots
+    DISPONIVEL dos próximos dias; `cadastros` é uma lista de (telefone, nome).
+    """
+    from datetime import date, timedelta
+    from src import agenda_service
+
+    cliente = cliente or ClienteFake()
+    planilha = cliente.criar_planilha(agenda_service.SPREADSHEET_ID)
+
+    agenda = [["dia_semana", "data", "hora", "nome_paciente", "telefone", "status", "origem", "observacoes"]]
+    hoje = date.today()
+    for i in range(dias_slots):
+        dia = hoje + timedelta(days=i)
+        for slot in agenda_service.gerar_slots_para_dia(dia):
+            agenda.append([agenda_service.NOMES_DIAS_PT[dia.weekday()], slot.strftime("%d/%m/%Y"),
+                           slot.strftime("%H:%M"), "", "", "DISPONIVEL", "", ""])
+    planilha.criar_aba(agenda_service.NOME_ABA_AGENDA, agenda, rows=max(500, len(agenda)), cols=8)
+
+    cad = [["telefone", "nome", "data_cadastro", "origem", "observacoes"]]
+    cad += [[tel, nome, hoje.strftime("%d/%m/%Y"), "fake", ""] for tel, nome in (cadastros or [])]
+    planilha.criar_aba(agenda_service.NOME_ABA_CADASTROS, cad, rows=max(100, len(cad)), cols=5)
+
+    planilha.criar_aba(agenda_service.NOME_ABA_LEMBRETES, [[
+        "scheduled_iso", "appointment_iso", "appointment_date", "appointment_time",
+        "telefone", "paciente", "tipo", "sent_at", "created_at", "observacoes",
+    ]], rows=1000, cols=10)
+    return cliente
+
+
+def instalar_planilha_fake(cliente: ClienteFake = None, dias_slots: int = 0, cadastros=None, **config) -> ClienteFake:
+    """
+    Faz o agenda_service usar a planilha fake: substitui o cliente gspread em cache
+    e limpa worksheet/caches. Sem `cliente`, cria um novo com `config`
+    (latencia, cota_por_minuto, ...) e a planilha da clínica.
+    """
+    from src import agenda_service
+
+    if cliente is None:
+        cliente = criar_planilha_clinica(ClienteFake(**config), dias_slots=dias_slots, cadastros=cadastros)
+    agenda_service._gspread_client = cliente
+    agenda_service._worksheet_agenda = None
+    agenda_service._cache.clear()
+    agenda_service._indice_linhas = None
+    agenda_service.INDICE_LINHAS_ARQUIVO = ""          # índice de linhas só em memória: cada teste tem sua planilha
+    return cliente
+
+
+def desinstalar_planilha_fake():
+    """Volta o agenda_service para o cliente real (autenticado no próximo uso)."""
+    from src import agenda_service
+
+    agenda_service._gspread_client = None
+    agenda_service._worksheet_agenda = None
+    agenda_service._cache.clear()
+    agenda_service._indice_linhas = None
+    agenda_service.INDICE_LINHAS_ARQUIVO = os.getenv(
+        'AGENDA_ROW_INDEX_FILE', os.path.join('logs', 'agenda_indice_linhas.json'))
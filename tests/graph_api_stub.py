@@ -0,0 +1,288 @@
+"""
+graph_api_stub.py
+
+Servidor HTTP local que faz o papel da Graph API do WhatsApp (POST .../messages),
+para testar rajadas de lembretes e o fluxo conversacional sem conta do WhatsApp.
+
+Simula:
+  - latência (fixa, uniforme, lognormal ou função própria);
+  - taxa de erro (HTTP 500 com corpo de erro no formato da Graph API);
+  - limite de envio (token bucket; excedente recebe HTTP 429, código 130429);
+e grava todos os payloads recebidos para conferência nos testes.
+
+Uso (servidor avulso):
+    python -m tests.graph_api_stub --porta 8081 --latencia lognormal:0.2:0.5 --taxa-erro 0.01 --limite 80
+    GRAPH_API_URL=http://127.0.0.1:8081/v17.0 python -m src.main
+
+Uso (dentro de um teste):
+    from tests.graph_api_stub import GraphApiStub
+
+    with GraphApiStub(latencia=("uniforme", 0.05, 0.2)) as stub:
+        stub.apontar_webhook()              # whatsapp_webhook passa a enviar para o stub
+        ...
+        assert stub.mensagens(para="5511999990000")
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _criar_gerador_latencia(latencia, rnd: random.Random):
+    """
+    latencia: None, segundos (float), ("fixa", s), ("uniforme", min, max),
+    ("lognormal", mediana, sigma) ou função sem argumentos que retorna segundos.
+    """
+    if latencia is None:
+        return lambda: 0.0
+    if callable(latencia):
+        return latencia
+    if isinstance(latencia, (int, float)):
+        return lambda: float(latencia)
+    tipo, *params = latencia
+    if tipo == "fixa":
+        return lambda: float(params[0])
+    if tipo == "uniforme":
+        return lambda: rnd.uniform(params[0], params[1])
+    if tipo == "lognormal":
+        mediana, sigma = params
+        return lambda: rnd.lognormvariate(math.log(mediana), sigma)
+    raise ValueError(f"Distribuição de latência desconhecida: {tipo}")
+
+
+def _parse_latencia_cli(texto: str):
+    """'0.2' | 'uniforme:0.05:0.3' | 'lognormal:0.2:0.5'"""
+    if not texto:
+        return None
+    partes = texto.split(":")
+    if len(partes) == 1:
+        return float(partes[0])
+    return (partes[0], *[float(p) for p in partes[1:]])
+
+
+class GraphApiStub:
+    """
+    Stand-in da Graph API. `limite_por_segundo` é a taxa sustentada do token bucket
+    (com rajada de até `rajada` mensagens); None desativa o limite.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", porta: int = 0, latencia=None, taxa_erro: float = 0.0,
+                 limite_por_segundo: float = None, rajada: int = None, versao: str = "v17.0", semente=None):
+        self.host = host
+        self.porta = porta
+        self.versao = versao
+        self.taxa_erro = taxa_erro
+        self.limite_por_segundo = limite_por_segundo
+        self.rajada = rajada or (max(1, int(limite_por_segundo)) if limite_por_segundo else None)
+        self._random = random.Random(semente)
+        self._latencia = _criar_gerador_latencia(latencia, self._random)
+        self._lock = threading.Lock()
+        self._tokens = float(self.rajada or 0)
+        self._ultimo_refill = time.monotonic()
+        self._registros = []
+        self._servidor = None
+        self._thread = None
+        self._base_anterior = None
+
+    # ---------------------------------------------------
+    # Ciclo de vida
+    # ---------------------------------------------------
+
+    @property
+    def base_url(self) -> str:
+        """Valor para GRAPH_API_URL (sem o phone id)."""
+        return f"http://{self.host}:{self.porta}/{self.versao}"
+
+    def iniciar(self) -> str:
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como a Graph API
+
+            def do_POST(self):
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                corpo = self.rfile.read(tamanho) if tamanho else b""
+                status, resposta = stub._processar(self.path, dict(self.headers), corpo)
+                dados = json.dumps(resposta).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def log_message(self, *args):
+                pass  # sem log por requisição (atrapalha os testes de carga)
+
+        self._servidor = ThreadingHTTPServer((self.host, self.porta), _Handler)
+        self._servidor.daemon_threads = True
+        self.porta = self._servidor.server_address[1]
+        self._thread = threading.Thread(target=self._servidor.serve_forever, name="graph-api-stub", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def parar(self):
+        self.restaurar_webhook()
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    def apontar_webhook(self):
+        """Faz o whatsapp_webhook (já importado ou não) enviar as mensagens para este stub."""
+        from src import whatsapp_webhook
+        if self._base_anterior is None:
+            self._base_anterior = whatsapp_webhook.GRAPH_API_BASE
+        whatsapp_webhook.GRAPH_API_BASE = f"{self.base_url}/{whatsapp_webhook.WHATSAPP_PHONE_ID}/messages"
+
+    def restaurar_webhook(self):
+        if self._base_anterior is not None:
+            from src import whatsapp_webhook
+            whatsapp_webhook.GRAPH_API_BASE = self._base_anterior
+            self._base_anterior = None
+
+    # ---------------------------------------------------
+    # Simulação
+    # ---------------------------------------------------
+
+    def _consumir_token(self) -> bool:
+        if self.limite_por_segundo is None:
+            return True
+        agora = time.monotonic()
+        self._tokens = min(float(self.rajada), self._tokens + (agora - self._ultimo_refill) * self.limite_por_segundo)
+        self._ultimo_refill = agora
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _processar(self, caminho: str, headers: dict, corpo: bytes):
+        recebido_em = time.time()
+        try:
+            payload = json.loads(corpo or b"{}")
+        except ValueError:
+            payload = None
+
+        with self._lock:
+            atraso = max(0.0, float(self._latencia()))
+            permitido = self._consumir_token()
+            falhar = self._random.random() < self.taxa_erro if self.taxa_erro else False
+
+        if not caminho.rstrip("/").endswith("/messages"):
+            status, resposta = 404, self._erro("Unknown path", 100, "GraphMethodException")
+        elif payload is None:
+            status, resposta = 400, self._erro("Invalid JSON payload", 100, "OAuthException")
+        elif not permitido:
+            status, resposta = 429, self._erro("(#130429) Rate limit hit", 130429, "OAuthException")
+        else:
+            time.sleep(atraso)  # só requisições aceitas "processam"; o 429 volta na hora
+            if falhar:
+                status, resposta = 500, self._erro("(#131000) Something went wrong", 131000, "OAuthException")
+            else:
+                para = payload.get("to", "")
+                status, resposta = 200, {
+                    "messaging_product": "whatsapp",
+                    "contacts": [{"input": para, "wa_id": para}],
+                    "messages": [{"id": f"wamid.STUB{uuid.uuid4().hex}"}],
+                }
+
+        with self._lock:
+            self._registros.append({
+                "recebido_em": recebido_em,
+                "duracao_s": time.time() - recebido_em,
+                "caminho": caminho,
+                "autorizacao": headers.get("Authorization"),
+                "status": status,
+                "payload": payload,
+            })
+        return status, resposta
+
+    @staticmethod
+    def _erro(mensagem: str, codigo: int, tipo: str) -> dict:
+        return {"error": {"message": mensagem, "type": tipo, "code": codigo, "fbtrace_id": uuid.uuid4().hex[:12]}}
+
+    # ---------------------------------------------------
+    # Consulta dos envios
+    # ---------------------------------------------------
+
+    def registros(self) -> list:
+        """Todas as requisições recebidas (inclusive as recusadas), em ordem de chegada."""
+        with self._lock:
+            return list(self._registros)
+
+    def mensagens(self, para: str = None, tipo: str = None) -> list:
+        """Payloads aceitos (HTTP 200), opcionalmente filtrados por destinatário e tipo ('text', 'interactive')."""
+        return [r["payload"] for r in self.registros()
+                if r["status"] == 200
+                and (para is None or r["payload"].get("to") == para)
+                and (tipo is None or r["payload"].get("type") == tipo)]
+
+    def textos(self, para: str = None) -> list:
+        """Corpo de texto de cada mensagem aceita (texto simples ou body de interativos)."""
+        textos = []
+        for p in self.mensagens(para):
+            if p.get("type") == "text":
+                textos.append(p.get("text", {}).get("body", ""))
+            else:
+                textos.append(p.get("interactive", {}).get("body", {}).get("text", ""))
+        return textos
+
+    def limpar(self):
+        with self._lock:
+            self._registros.clear()
+
+    def estatisticas(self) -> dict:
+        registros = self.registros()
+        por_status = {}
+        for r in registros:
+            por_status[r["status"]] = por_status.get(r["status"], 0) + 1
+        duracoes = sorted(r["duracao_s"] for r in registros if r["status"] == 200)
+
+        def _pct(p):
+            if not duracoes:
+                return 0.0
+            return round(duracoes[min(len(duracoes) - 1, int(math.ceil(p / 100 * len(duracoes))) - 1)] * 1000, 1)
+
+        janela = (registros[-1]["recebido_em"] - registros[0]["recebido_em"]) if len(registros) > 1 else 0
+        return {
+            "total": len(registros),
+            "por_status": por_status,
+            "por_segundo": round(len(registros) / janela, 1) if janela else None,
+            "latencia_ms": {"p50": _pct(50), "p95": _pct(95), "p99": _pct(99)},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in local da Graph API do WhatsApp")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8081)
+    parser.add_argument("--latencia", default="", help="'0.2', 'uniforme:0.05:0.3' ou 'lognormal:0.2:0.5' (segundos)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração de respostas HTTP 500 (0..1)")
+    parser.add_argument("--limite", type=float, default=None, help="mensagens por segundo antes de responder 429")
+    args = parser.parse_args(argv)
+
+    stub = GraphApiStub(args.host, args.porta, latencia=_parse_latencia_cli(args.latencia),
+                        taxa_erro=args.taxa_erro, limite_por_segundo=args.limite)
+    print(f"Graph API stub em {stub.iniciar()}  (use GRAPH_API_URL={stub.base_url})")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(stub.estatisticas(), ensure_ascii=False))
+    except KeyboardInterrupt:
+        stub.parar()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+"""
+otlp_stub.py
+
+Coletor OTLP/HTTP (JSON) mínimo para ver localmente os traces exportados pelo
+src/tracing.py (TRACING_EXPORT=otlp), sem subir Jaeger/Collector.
+
+Uso (servidor avulso):
+    python -m tests.otlp_stub --porta 4318
+    TRACING_EXPORT=otlp TRACING_OTLP_URL=http://127.0.0.1:4318/v1/traces python -m src.main
+
+Uso (dentro de um teste):
+    with OtlpStub() as coletor:
+        tracing.OTLP_URL = coletor.url
+        ...
+        coletor.spans()   # spans recebidos, achatados
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class OtlpStub:
+    def __init__(self, host: str = "127.0.0.1", porta: int = 0, ao_receber=None):
+        self.host = host
+        self.porta = porta
+        self.ao_receber = ao_receber
+        self._lock = threading.Lock()
+        self._spans = []
+        self._servidor = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.porta}/v1/traces"
+
+    def iniciar(self) -> str:
+        coletor = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                corpo = self.rfile.read(tamanho) if tamanho else b"{}"
+                status = 200
+                if self.path.rstrip("/") != "/v1/traces":
+                    status = 404
+                else:
+                    try:
+                        coletor._receber(json.loads(corpo))
+                    except ValueError:
+                        status = 400
+                dados = b"{}"
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def log_message(self, *args):
+                pass
+
+        self._servidor = ThreadingHTTPServer((self.host, self.porta), _Handler)
+        self._servidor.daemon_threads = True
+        self.porta = self._servidor.server_address[1]
+        threading.Thread(target=self._servidor.serve_forever, name="otlp-stub", daemon=True).start()
+        return self.url
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    def _receber(self, corpo: dict):
+        novos = []
+        for rs in corpo.get("resourceSpans", []):
+            for ss in rs.get("scopeSpans", []):
+                novos.extend(ss.get("spans", []))
+        with self._lock:
+            self._spans.extend(novos)
+        if self.ao_receber:
+            self.ao_receber(novos)
+
+    def spans(self, trace_id: str = None) -> list:
+        with self._lock:
+            return [s for s in self._spans if trace_id is None or s["traceId"] == trace_id]
+
+    def aguardar(self, quantidade: int = 1, timeout: float = 5.0) -> list:
+        """Espera chegarem pelo menos `quantidade` spans (a exportação é assíncrona)."""
+        limite = time.time() + timeout
+        while time.time() < limite and len(self.spans()) < quantidade:
+            time.sleep(0.02)
+        return self.spans()
+
+
+def _imprimir(spans: list):
+    for s in spans:
+        duracao_ms = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+        print(f"{s['traceId'][:12]}  {duracao_ms:>9.1f}ms  {s['name']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coletor OTLP/HTTP JSON local")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=4318)
+    args = parser.parse_args(argv)
+
+    coletor = OtlpStub(args.host, args.porta, ao_receber=_imprimir)
+    print(f"Coletor OTLP em {coletor.iniciar()}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        coletor.parar()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,182 @@
+"""
+replay_webhook.py
+
+Reproduz no /webhook o tráfego gravado pelo modo captura (src/webhook_capture.py,
+WEBHOOK_CAPTURE=true) respeitando os intervalos originais entre as requisições,
+ou acelerando-os (--velocidade 10 = dez vezes mais rápido; 0 = sem esperas).
+
+As mensagens de um mesmo paciente são enviadas em ordem (uma thread por
+pseudônimo); pacientes diferentes correm em paralelo, como no pico real.
+Sem --url, sobe o app localmente com a planilha fake e o stub da Graph API
+(o mesmo ambiente do carga_webhook), então nada externo é acessado.
+
+Uso:
+    python -m tests.replay_webhook logs/webhook_capture.jsonl
+    python -m tests.replay_webhook logs/webhook_capture.jsonl.1 logs/webhook_capture.jsonl --velocidade 5
+    python -m tests.replay_webhook captura.jsonl --velocidade 0 --latencia-planilha 0.15 --saida replay.json
+    python -m tests.replay_webhook captura.jsonl --url http://127.0.0.1:8000
+
+Saída:
+    resumo no console (vazão, atraso do replay, latência p50/p95/p99 comparada com a
+    original da captura) e, com --saida, o mesmo resumo em JSON.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from tests.carga_webhook import AmbienteLocal, _resumo_latencias
+
+
+def carregar_captura(arquivos: list) -> list:
+    """Lê um ou mais arquivos JSONL da captura e devolve os registros em ordem de chegada."""
+    registros = []
+    for caminho in arquivos:
+        with open(caminho, encoding="utf-8") as f:
+            for numero, linha in enumerate(f, 1):
+                linha = linha.strip()
+                if not linha:
+                    continue
+                try:
+                    registros.append(json.loads(linha))
+                except ValueError:
+                    print(f"[replay] linha {numero} de {caminho} ignorada (JSON inválido)")
+    registros.sort(key=lambda r: r["t"])
+    return registros
+
+
+def remetente(payload: dict) -> str:
+    """Telefone (pseudônimo) da primeira mensagem do payload; status de entrega vão para '_status'."""
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            for msg in change.get("value", {}).get("messages", []):
+                if msg.get("from"):
+                    return msg["from"]
+    return "_status"
+
+
+class Replay:
+    def __init__(self, url: str, registros: list, velocidade: float = 1.0, ambiente: AmbienteLocal = None):
+        self.url = url.rstrip("/") + "/webhook"
+        self.registros = registros
+        self.velocidade = velocidade
+        self.ambiente = ambiente
+        self.resultados = []
+        self._lock = threading.Lock()
+        self._sessao = requests.Session()
+        self._sessao.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=64))
+
+    def _agendado_para(self, registro: dict, inicio: float) -> float:
+        if not self.velocidade:
+            return inicio
+        return inicio + (registro["t"] - self.registros[0]["t"]) / self.velocidade
+
+    def _executar_paciente(self, registros: list, inicio: float):
+        for registro in registros:
+            alvo = self._agendado_para(registro, inicio)
+            espera = alvo - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            enviado = time.perf_counter()
+            try:
+                r = self._sessao.post(self.url, json=registro["payload"], timeout=60)
+                status = r.status_code
+            except requests.RequestException:
+                status = None
+            fim = time.perf_counter()
+            with self._lock:
+                self.resultados.append({
+                    "atraso_s": max(0.0, enviado - alvo),
+                    "latencia_s": fim - enviado,
+                    "sucesso": status == 200,
+                    "latencia_original_s": registro.get("duracao_ms", 0) / 1000,
+                })
+
+    def executar(self) -> dict:
+        por_paciente = OrderedDict()
+        for registro in self.registros:
+            por_paciente.setdefault(remetente(registro["payload"]), []).append(registro)
+
+        inicio = time.perf_counter()
+        threads = [threading.Thread(target=self._executar_paciente, args=(regs, inicio), daemon=True,
+                                    name=f"replay-{i}") for i, regs in enumerate(por_paciente.values())]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duracao = time.perf_counter() - inicio
+
+        ok = [r["latencia_s"] for r in self.resultados if r["sucesso"]]
+        janela_original = self.registros[-1]["t"] - self.registros[0]["t"] if self.registros else 0
+        resumo = {
+            "url": self.url,
+            "requisicoes": len(self.resultados),
+            "requisicoes_com_erro": len(self.resultados) - len(ok),
+            "pacientes": len(por_paciente),
+            "velocidade": self.velocidade,
+            "janela_original_s": round(janela_original, 2),
+            "duracao_s": round(duracao, 2),
+            "vazao_req_s": round(len(self.resultados) / duracao, 2) if duracao else 0.0,
+            "latencia": _resumo_latencias(ok),
+            "latencia_original": _resumo_latencias([r["latencia_original_s"] for r in self.resultados]),
+            "atraso_replay": _resumo_latencias([r["atraso_s"] for r in self.resultados]),
+        }
+        if self.ambiente is not None:
+            from src import call_budget
+            resumo["planilha"] = self.ambiente.planilha.estatisticas()
+            resumo["graph_api"] = self.ambiente.stub.estatisticas()
+            resumo["chamadas_por_estado"] = call_budget.totais()
+        return resumo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay do tráfego capturado no /webhook")
+    parser.add_argument("arquivos", nargs="+", help="arquivos JSONL da captura (ex.: logs/webhook_capture.jsonl)")
+    parser.add_argument("--url", help="servidor já em execução; sem isso sobe um ambiente local isolado")
+    parser.add_argument("--velocidade", type=float, default=1.0,
+                        help="1 = tempo original, 10 = dez vezes mais rápido, 0 = sem esperas")
+    parser.add_argument("--latencia-planilha", type=float, default=0.0, help="latência por chamada da planilha fake (s)")
+    parser.add_argument("--latencia-graph", type=float, default=0.0, help="latência por envio do stub da Graph API (s)")
+    parser.add_argument("--saida", help="grava o resumo em JSON neste arquivo")
+    args = parser.parse_args(argv)
+
+    registros = carregar_captura(args.arquivos)
+    if not registros:
+        print("[replay] nenhuma requisição nos arquivos informados")
+        return 1
+
+    ambiente = None
+    url = args.url
+    if not url:
+        ambiente = AmbienteLocal(args.latencia_planilha, args.latencia_graph)
+        url = ambiente.iniciar()
+
+    print(f"Replay: {len(registros)} requisições (velocidade {args.velocidade}x) -> {url}/webhook")
+    try:
+        resumo = Replay(url, registros, args.velocidade, ambiente).executar()
+    finally:
+        if ambiente is not None:
+            ambiente.parar()
+
+    print(json.dumps(resumo, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resumo, f, indent=2, ensure_ascii=False)
+        print(f"[OK] Resumo salvo em: {args.saida}")
+    return 0 if resumo["requisicoes_com_erro"] == 0 else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
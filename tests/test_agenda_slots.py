@@ -0,0 +1,188 @@
+"""
+test_agenda_slots.py
+
+Geração de slots do agenda_service: grade em lote (`gerar_grade_slots`) igual à
+geração dia a dia, criação das linhas da Agenda sem duplicar slots existentes e
+templates compilados da configuração de horários (janelas por dia, exceções),
+bitmap de disponibilidade por data (`DisponibilidadeAgenda`) e índice ordenado de
+slots livres com o atalho "Primeiro horário livre" do menu, além do parse
+memoizado das células de data/hora (`converter_data_hora`).
+
+Uso:
+    python -m pytest tests/test_agenda_slots.py
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import agenda_service, constants, whatsapp_flow
+from src.constants import ScheduleConfig
+from tests.fake_gspread import desinstalar_planilha_fake, instalar_planilha_fake
+
+
+@pytest.fixture
+def planilha():
+    cliente = instalar_planilha_fake(dias_slots=10)
+    yield cliente
+    desinstalar_planilha_fake()
+
+
+@pytest.fixture
+def horarios(monkeypatch):
+    """Sábado só de manhã, quarta com almoço menor, um feriado e um dia de expediente reduzido."""
+    janelas = dict(ScheduleConfig.JANELAS_POR_DIA)
+    janelas[2] = [((8, 0), (11, 0)), ((12, 0), (15, 0))]
+    janelas[5] = [((8, 0), (12, 0))]
+    monkeypatch.setattr(ScheduleConfig, "JANELAS_POR_DIA", janelas)
+    monkeypatch.setattr(ScheduleConfig, "EXCECOES_POR_DATA", {
+        "2026-04-21": [],                               # terça, feriado
+        "2026-04-20": [((9, 0), (10, 0))],              # segunda, um único horário
+    })
+    agenda_service.compilar_horarios()
+    yield
+    monkeypatch.undo()
+    agenda_service.compilar_horarios()
+
+
+def test_grade_igual_a_geracao_por_dia():
+    inicio = date(2026, 2, 27)                          # atravessa fins de mês, fins de semana e a virada do ano
+    grade = agenda_service.gerar_grade_slots(inicio, 400)
+
+    esperado = []
+    for i in range(400):
+        esperado += agenda_service.gerar_slots_para_dia(inicio + timedelta(days=i))
+    assert grade.datetimes() == esperado
+
+    linhas = grade.linhas_agenda()
+    assert len(linhas) == len(esperado)
+    for linha, slot in zip(linhas[::97], esperado[::97]):
+        assert linha == [agenda_service.NOMES_DIAS_PT[slot.weekday()], slot.strftime("%d/%m/%Y"),
+                         slot.strftime("%H:%M"), "", "", "DISPONIVEL", "", ""]
+
+
+def test_grade_vazia_em_fim_de_semana():
+    sabado = date(2026, 3, 7)
+    assert len(agenda_service.gerar_grade_slots(sabado, 2)) == 0
+    assert agenda_service.gerar_grade_slots(sabado, 0).linhas_agenda() == []
+
+
+def test_inicializar_slots_so_cria_os_que_faltam(planilha):
+    aba = planilha.open_by_key(agenda_service.SPREADSHEET_ID).worksheet(agenda_service.NOME_ABA_AGENDA)
+    antes = aba.get_all_values()
+    agenda_service.inicializar_slots_proximos_dias(20)
+    depois = aba.get_all_values()
+
+    assert depois[:len(antes)] == antes
+    chaves = [(linha[1], linha[2]) for linha in depois[1:]]
+    assert len(chaves) == len(set(chaves))
+    assert len(depois) - 1 == len(agenda_service.gerar_grade_slots(date.today(), 20))
+
+
+def test_templates_por_dia_e_excecoes(horarios):
+    horas = lambda dia: [s.strftime("%H:%M") for s in agenda_service.gerar_slots_para_dia(dia)]
+    assert horas(date(2026, 4, 22)) == ["08:00", "09:00", "10:00", "12:00", "13:00", "14:00"]  # quarta
+    assert horas(date(2026, 4, 25)) == ["08:00", "09:00", "10:00", "11:00"]                    # sábado
+    assert horas(date(2026, 4, 26)) == []                                                      # domingo
+    assert horas(date(2026, 4, 21)) == []                                                      # feriado
+    assert horas(date(2026, 4, 20)) == ["09:00"]
+    assert agenda_service.DIAS_UTEIS == {0, 1, 2, 3, 4, 5}
+    assert not agenda_service.tem_atendimento(date(2026, 4, 21))
+    assert agenda_service.eh_horario_de_slot(datetime(2026, 4, 25, 11, 0))
+    assert not agenda_service.eh_horario_de_slot(datetime(2026, 4, 22, 11, 0))          # pausa da quarta
+
+    inicio = date(2026, 4, 13)
+    grade = agenda_service.gerar_grade_slots(inicio, 21)
+    esperado = []
+    for i in range(21):
+        esperado += agenda_service.gerar_slots_para_dia(inicio + timedelta(days=i))
+    assert grade.datetimes() == esperado
+
+
+def _proximo_dia_util():
+    dia = date.today() + timedelta(days=1)
+    while not agenda_service.tem_atendimento(dia):
+        dia += timedelta(days=1)
+    return dia
+
+
+def test_bitmap_acompanha_agendamento_e_cancelamento(planilha):
+    dia = _proximo_dia_util()
+    livres = agenda_service.obter_slots_disponiveis_para_data(dia)
+    assert livres == agenda_service.gerar_slots_para_dia(dia)
+    assert dia in agenda_service.obter_dias_com_vaga(dia, dia + timedelta(days=6))
+
+    alvo = livres[1]
+    assert agenda_service.registrar_agendamento_google_sheets("Ana", alvo, telefone="5511999990000")
+    assert alvo not in agenda_service.obter_slots_disponiveis_para_data(dia)
+
+    agenda_service.invalidar_cache_agenda()            # remontado da planilha: mesmo resultado
+    assert agenda_service.obter_slots_disponiveis_para_data(dia) == [s for s in livres if s != alvo]
+
+    assert agenda_service.cancelar_agendamento_por_data_hora(alvo, "5511999990000")
+    assert agenda_service.obter_slots_disponiveis_para_data(dia) == livres
+
+
+def test_bitmap_com_horario_avulso_e_dia_lotado():
+    dia = date(2026, 5, 4)                              # segunda
+    cabecalho = ["dia_semana", "data", "hora", "nome_paciente", "telefone", "status", "origem", "observacoes"]
+    linhas = [cabecalho] + [["", "04/05/2026", h, "", "", "DISPONIVEL", "", ""] for h in ("09:00", "12:30")]
+    linhas += [["", "05/05/2026", "08:00", "Ana", "55", "AGENDADO", "", ""]]
+    disp = agenda_service.DisponibilidadeAgenda.de_linhas(linhas)
+
+    assert disp.minutos_livres(dia) == [9 * 60, 12 * 60 + 30]
+    assert disp.tem_vaga(dia, 12 * 60) and not disp.tem_vaga(dia, 13 * 60)
+    assert not disp.tem_vaga(date(2026, 5, 5))
+    disp.marcar(datetime(2026, 5, 4, 12, 30), livre=False)
+    disp.marcar(datetime(2026, 5, 5, 8, 0), livre=True)
+    assert disp.minutos_livres(dia) == [9 * 60]
+    assert disp.minutos_livres(date(2026, 5, 5)) == [8 * 60]
+
+
+def test_indice_de_slots_livres():
+    linhas = [["dia_semana", "data", "hora", "nome_paciente", "telefone", "status", "origem", "observacoes"]]
+    linhas += [["", "04/05/2026", h, "", "", "DISPONIVEL", "", ""] for h in ("14:00", "09:00")]
+    linhas += [["", "05/05/2026", "08:00", "", "", "DISPONIVEL", "", ""]]
+    indice = agenda_service.DisponibilidadeAgenda.de_linhas(linhas).indice
+
+    assert indice.primeiro_livre(datetime(2026, 5, 4, 9, 1)) == datetime(2026, 5, 4, 14, 0)
+    assert indice.primeiro_livre(datetime(2026, 5, 4, 15, 0), ate=datetime(2026, 5, 5)) is None
+    assert indice.proximos(datetime(2026, 5, 1), 2) == [datetime(2026, 5, 4, 9, 0), datetime(2026, 5, 4, 14, 0)]
+    indice.remover(datetime(2026, 5, 4, 9, 0))
+    indice.adicionar(datetime(2026, 5, 4, 14, 0))      # idempotente
+    assert list(indice.no_intervalo(datetime(2026, 5, 4), datetime(2026, 5, 6))) == [
+        datetime(2026, 5, 4, 14, 0), datetime(2026, 5, 5, 8, 0)]
+
+
+def test_atalho_primeiro_horario_vai_para_confirmacao(planilha):
+    wf = whatsapp_flow
+    usuario = "5511988887777"
+    primeiro = agenda_service.primeiro_slot_livre()
+    agenda_service.registrar_agendamento_google_sheets("Ana", primeiro, telefone="5511999990000")
+    esperado = agenda_service.proximos_slots_livres(1)[0]
+    assert esperado > primeiro
+
+    wf.sessoes[usuario] = wf.MENU_PRINCIPAL
+    try:
+        resposta = wf.processar_mensagem(usuario, constants.BUTTON_ID_PRIMEIRO_HORARIO)
+        assert "confirma" in resposta.lower() and esperado.strftime("%H:%M") in resposta
+        assert wf.sessoes[usuario] == wf.CONFIRMAR
+        assert wf.sessoes[wf.SessionKeys.get_user_key(usuario, wf.SessionKeys.HORARIO_ESCOLHIDO)] == esperado
+    finally:
+        wf.sessoes.clear()
+
+
+def test_converter_data_hora_memoizado():
+    agenda_service.converter_data_hora.cache_clear()
+    assert agenda_service.converter_data_hora("04/05/2026", "09:30") == datetime(2026, 5, 4, 9, 30)
+    assert agenda_service.converter_data_hora("04/05/2026", "9:05") == datetime(2026, 5, 4, 9, 5)
+    for data_str, hora_str in (("31/02/2026", "09:00"), ("04/05/2026", "24:00"), ("", ""), ("x", "09:00")):
+        assert agenda_service.converter_data_hora(data_str, hora_str) is None
+    agenda_service.converter_data_hora("04/05/2026", "09:30")
+    assert agenda_service.converter_data_hora.cache_info().hits == 1
@@ -0,0 +1,87 @@
+"""
+test_agenda_snapshot.py
+
+Snapshot colunar da aba Agenda (`AgendaSnapshot`): a visão de linhas reproduz o
+get_all_values original (inclusive linhas curtas), colunas tipadas de data/hora/
+status e os filtros usados pelas varreduras (agendamentos futuros do telefone,
+resumo do dia).
+
+Uso:
+    python -m pytest tests/test_agenda_snapshot.py
+"""
+
+import os
+import sys
+from datetime import date, datetime
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import agenda_service, flow_helpers
+from src.agenda_service import AgendaSnapshot
+from tests.fake_gspread import desinstalar_planilha_fake, instalar_planilha_fake
+
+CABECALHO = ["dia_semana", "data", "hora", "nome_paciente", "telefone", "status", "origem", "observacoes"]
+VALORES = [
+    CABECALHO,
+    ["segunda", "04/05/2026", "09:00", "Ana", "5511999990000", "AGENDADO", "whatsapp", ""],
+    ["segunda", "04/05/2026", "09:40", "", "", "DISPONIVEL", "", ""],
+    ["segunda", "04/05/2026", "10:20", "Bia", " 5511988880000 ", "agendado ", "whatsapp", "retorno"],
+    ["terça", "05/05/2026", "08:00", "Ana", "5511999990000", "AGENDADO", "whatsapp", ""],
+    ["terça", "xx/05/2026", "8h", "", "", "FOLGA"],
+    ["quarta", "06/05/2026", "08:00"],
+]
+
+
+def test_visao_de_linhas_igual_ao_get_all_values():
+    snapshot = AgendaSnapshot.de_valores(VALORES)
+
+    assert len(snapshot) == len(VALORES)
+    assert list(snapshot) == VALORES
+    assert snapshot[0] == CABECALHO and snapshot[-1] == VALORES[-1]
+    dados = snapshot[1:]
+    assert len(dados) == len(VALORES) - 1 and dados[4] == VALORES[5]
+    assert list(dados[::2]) == VALORES[1::2]
+    assert snapshot.registro(0)["nome_paciente"] == "Ana"
+    assert len(snapshot.tabelas[4]) < len(VALORES)        # telefones repetidos são internados
+
+
+def test_colunas_tipadas_e_filtros():
+    snapshot = AgendaSnapshot.de_valores(VALORES)
+
+    assert snapshot.ordinais.tolist()[:4] == [date(2026, 5, 4).toordinal()] * 3 + [date(2026, 5, 5).toordinal()]
+    assert snapshot.ordinais[4] == -1 and snapshot.minutos[4] == -1
+    assert snapshot.datetime_da_linha(2) == datetime(2026, 5, 4, 10, 20)
+    assert snapshot.filtrar(status="AGENDADO").tolist() == [0, 2, 3]
+    assert snapshot.filtrar(status="AGENDADO", telefone="5511988880000").tolist() == [2]
+    assert snapshot.filtrar(status="AGENDADO", data=date(2026, 5, 4)).tolist() == [0, 2]
+    assert snapshot.filtrar(a_partir=datetime(2026, 5, 4, 9, 40, 30)).tolist() == [2, 3, 5]
+    assert snapshot.filtrar(telefone="5500000000000").tolist() == []
+
+
+def test_varreduras_usam_o_snapshot():
+    instalar_planilha_fake(dias_slots=0)
+    try:
+        ws = agenda_service.obter_worksheet_agenda()
+        ws.append_rows([linha for linha in VALORES[1:] if len(linha) == len(CABECALHO)])
+        ws.append_row(["quarta", "06/05/2099", "08:00", "Ana", "5511999990000", "AGENDADO", "whatsapp", ""])
+        agenda_service._cache.clear()
+
+        assert isinstance(agenda_service.obter_todos_agenda_cached(), AgendaSnapshot)
+        futuros = flow_helpers.get_future_appointments("5511999990000")
+        assert [dt for dt, _ in futuros] == [datetime(2099, 5, 6, 8, 0)]
+        assert futuros[0][1][3] == "Ana"
+        assert [r["hora"] for r in agenda_service.listar_agendamentos_para_data(date(2026, 5, 4))] == ["09:00", "10:20"]
+    finally:
+        desinstalar_planilha_fake()
+
+
+@pytest.mark.parametrize("valores", [[], [CABECALHO]])
+def test_agenda_vazia(valores):
+    snapshot = AgendaSnapshot.de_valores(valores)
+    assert list(snapshot) == valores
+    assert snapshot.filtrar(status="AGENDADO").tolist() == []
+    assert agenda_service.DisponibilidadeAgenda.de_linhas(snapshot).bits == {}
@@ -0,0 +1,110 @@
+"""
+test_call_budget.py
+
+Orçamento de chamadas externas (leituras/escritas no Sheets e envios à Graph API)
+por passo da conversa, medido pelo src/call_budget.py com o webhook real rodando
+sobre a planilha fake e o stub da Graph API.
+
+Os limites abaixo são o teto atual de cada passo: se uma mudança fizer um passo
+ler mais a planilha, o teste falha mostrando as chamadas por método. Ao otimizar
+um passo, baixe o limite correspondente.
+
+Uso:
+    python -m pytest tests/test_call_budget.py
+"""
+
+import logging
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from fastapi.testclient import TestClient
+
+from src import call_budget, scheduler, whatsapp_webhook
+from tests.carga_webhook import payload_botao, payload_lista, payload_texto
+from tests.fake_gspread import desinstalar_planilha_fake, instalar_planilha_fake
+from tests.graph_api_stub import GraphApiStub
+
+TELEFONE = "5511988887777"
+
+# (descrição, payload, limites) - agendamento completo de um paciente novo
+PASSOS_AGENDAMENTO = [
+    ("primeiro contato", lambda: payload_texto(TELEFONE, "Ana", "oi"),
+     dict(sheets_leituras=4, sheets_escritas=0, graph_posts=1)),
+    ("cadastro do nome", lambda: payload_texto(TELEFONE, "Ana", "Ana Souza"),
+     dict(sheets_leituras=7, sheets_escritas=1, graph_posts=1)),
+    ("menu: agendar", lambda: payload_lista(TELEFONE, "Ana", "1"),
+     dict(sheets_leituras=4, sheets_escritas=0, graph_posts=1)),
+    ("escolher semana", lambda: payload_botao(TELEFONE, "Ana", "2"),
+     dict(sheets_leituras=8, sheets_escritas=0, graph_posts=2)),
+    ("escolher dia", lambda: payload_lista(TELEFONE, "Ana", "1"),
+     dict(sheets_leituras=4, sheets_escritas=0, graph_posts=2)),
+    ("escolher horário", lambda: payload_lista(TELEFONE, "Ana", "1"),
+     dict(sheets_leituras=4, sheets_escritas=0, graph_posts=1)),
+    ("confirmar agendamento", lambda: payload_botao(TELEFONE, "Ana", "1"),
+     dict(sheets_leituras=9, sheets_escritas=2, graph_posts=3)),
+]
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    # lembretes agendados na confirmação ficam num scheduler isolado, sem worker
+    monkeypatch.setattr(scheduler, "start", lambda *a, **k: None)
+    monkeypatch.setattr(scheduler, "_jobs_heap", [])
+    monkeypatch.setattr(scheduler, "_pending", {})
+    monkeypatch.setattr(scheduler, "_recurring", {})
+    nivel = logging.getLogger().level
+    logging.getLogger().setLevel(logging.WARNING)
+    planilha = instalar_planilha_fake(dias_slots=21)
+    with GraphApiStub() as stub:
+        stub.apontar_webhook()
+        yield TestClient(whatsapp_webhook.app), planilha
+    desinstalar_planilha_fake()
+    whatsapp_webhook.wf.sessoes.clear()
+    logging.getLogger().setLevel(nivel)
+
+
+def test_orcamento_por_passo_do_agendamento(cliente):
+    http, planilha = cliente
+    planilha.zerar_contadores()
+    with call_budget.coletar() as registros:
+        for _, payload, _ in PASSOS_AGENDAMENTO:
+            assert http.post("/webhook", json=payload()).status_code == 200
+
+    assert len(registros) == len(PASSOS_AGENDAMENTO)
+    for (descricao, _, limites), registro in zip(PASSOS_AGENDAMENTO, registros):
+        assert registro["telefone"] == TELEFONE
+        try:
+            call_budget.verificar(registro, **limites)
+        except call_budget.OrcamentoExcedido as erro:
+            pytest.fail(f"{descricao}: {erro}")
+
+    # a contagem por mensagem bate com o que a planilha fake registrou
+    stats = planilha.estatisticas()
+    assert sum(r["sheets_leituras"] for r in registros) == stats["leituras"]
+    assert sum(r["sheets_escritas"] for r in registros) == stats["escritas"]
+
+
+def test_totais_acumulam_por_estado(cliente):
+    http, _ = cliente
+    call_budget.zerar()
+    http.post("/webhook", json=payload_texto(TELEFONE, "Ana", "oi"))
+    http.post("/webhook", json=payload_texto(TELEFONE, "Ana", "Ana Souza"))
+
+    totais = call_budget.totais()
+    assert totais["-"]["mensagens"] == 1                  # primeira mensagem: sessão ainda não existe
+    assert totais["esperar_nome"]["sheets_escritas"] == 1
+    assert totais["esperar_nome"]["graph_posts"] == 1
+
+
+def test_verificar_aponta_o_excesso():
+    registro = {"estado": "escolher_dia", "sheets_leituras": 3, "sheets_escritas": 0, "graph_posts": 1,
+                "por_metodo": {"get_all_records": 3}}
+    call_budget.verificar(registro, sheets_leituras=3, graph_posts=1)
+    with pytest.raises(call_budget.OrcamentoExcedido, match="sheets_leituras=3 \\(máx 1\\)"):
+        call_budget.verificar(registro, sheets_leituras=1)
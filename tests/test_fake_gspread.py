@@ -0,0 +1,113 @@
+"""
+test_fake_gspread.py
+
+Confere que o agenda_service roda sobre a planilha em memória (tests/fake_gspread.py)
+e que a contagem de chamadas e a simulação de cota funcionam.
+
+Uso:
+    python -m pytest tests/test_fake_gspread.py
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import agenda_service
+from tests.fake_gspread import APIError, instalar_planilha_fake, desinstalar_planilha_fake
+
+
+@pytest.fixture
+def planilha():
+    cliente = instalar_planilha_fake(dias_slots=14, cadastros=[("5511999990000", "Maria")])
+    yield cliente
+    desinstalar_planilha_fake()
+
+
+def _proximo_dia_util():
+    dia = date.today() + timedelta(days=1)
+    while dia.weekday() not in agenda_service.DIAS_UTEIS:
+        dia += timedelta(days=1)
+    return dia
+
+
+def test_agendar_e_cancelar_na_planilha_fake(planilha):
+    dia = _proximo_dia_util()
+    slots = agenda_service.obter_slots_disponiveis_para_data(dia)
+    assert slots, "a planilha fake deveria ter slots para o próximo dia útil"
+
+    slot = slots[0]
+    assert agenda_service.registrar_agendamento_google_sheets("Maria", slot, telefone="5511999990000")
+    assert slot not in agenda_service.obter_slots_disponiveis_para_data(dia)
+    assert agenda_service.cancelar_agendamento_por_data_hora(slot, "5511999990000")
+    assert slot in agenda_service.obter_slots_disponiveis_para_data(dia)
+
+    stats = planilha.estatisticas()
+    assert stats["escritas"] == 2
+    assert stats["leituras"] >= 3
+
+
+def test_perfil_e_lembretes_na_planilha_fake(planilha):
+    assert agenda_service.buscar_perfil_por_telefone("5511999990000")["nome"] == "Maria"
+
+    consulta = datetime.combine(_proximo_dia_util(), datetime.min.time()).replace(hour=9)
+    agenda_service.registrar_lembrete_agendamento(consulta, consulta - timedelta(hours=24), "5511999990000", "Maria")
+    agenda_service.registrar_lembrete_agendamento(consulta, consulta - timedelta(hours=1), "5511999990000", "Maria")
+    pendentes = agenda_service.obter_lembretes_pendentes()
+    assert len(pendentes) == 2
+
+    assert agenda_service.remover_lembretes_por_rows([l["row"] for l in pendentes]) == 2
+    assert agenda_service.obter_lembretes_pendentes() == []
+
+
+def test_cache_de_perfis_se_recarrega_depois_do_ttl(planilha):
+    agenda_service.obter_mapa_nomes_cadastros()
+    chave = agenda_service._CHAVE_CACHE_CADASTROS
+    agenda_service._cache[chave] = (0.0, agenda_service._cache[chave][1])     # TTL vencido
+    planilha.zerar_contadores()
+
+    assert agenda_service.buscar_perfil_em_cache("5511999990000")["nome"] == "Maria"   # recarrega o mapa
+    assert agenda_service.buscar_perfil_em_cache("5511999990000")["nome"] == "Maria"   # do mapa recarregado
+    por_metodo = planilha.estatisticas()["por_metodo"]
+    assert por_metodo.get("get_all_values") == 1 and "get_all_records" not in por_metodo
+
+    agenda_service.criar_cadastro_paciente("5511988880000", "Bia")
+    planilha.zerar_contadores()
+    assert agenda_service.buscar_perfil_em_cache("5511988880000")["nome"] == "Bia"
+    por_metodo = planilha.estatisticas()["por_metodo"]
+    assert "get_all_values" not in por_metodo and "get_all_records" not in por_metodo
+
+
+def test_cota_e_falhas_forcadas(planilha):
+    ws = agenda_service.obter_worksheet_agenda()
+    planilha.falhar_proximas(1)
+    with pytest.raises(APIError) as erro:
+        ws.get_all_values()
+    assert erro.value.code == 429
+    assert ws.get_all_values()
+
+    planilha.zerar_contadores()
+    planilha.cota_por_minuto = 2
+    ws.get_all_values()
+    ws.row_values(1)
+    with pytest.raises(APIError):
+        ws.get_all_values()
+    assert planilha.estatisticas()["erros_429"] == 1
+
+
+def test_batch_get_respeita_a_grade(planilha):
+    ws = agenda_service.obter_worksheet_agenda()
+    ws.row_count = len(ws.get_all_values())
+    assert ws.batch_get([f"A{ws.row_count}:H"]) and ws.batch_get([f"A2:H{ws.row_count}"])
+    for intervalo in (f"A{ws.row_count + 1}:H", f"A2:H{ws.row_count + 1}"):
+        with pytest.raises(APIError) as erro:
+            ws.batch_get([intervalo])
+        assert erro.value.code == 400
+
+    ws.delete_rows(2)                                           # a grade encolhe junto com as linhas
+    assert ws.row_count == len(ws.get_all_values())
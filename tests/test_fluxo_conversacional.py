@@ -8,6 +8,7 @@ SEM enviar mensagens reais para WhatsApp.
 Uso:
     python tests/test_fluxo_conversacional.py
     ou de root: python -m tests.test_fluxo_conversacional
+    python -m tests.test_fluxo_conversacional --planilha-fake   # sem Google Sheets (tests/fake_gspread.py)
 
 Saída:
     - tests/relatorio_testes_<timestamp>.json (dados estruturados)
@@ -17,6 +18,7 @@ Saída:
 import sys
 import os
 import json
+import argparse
 import logging
 from datetime import datetime
 from typing import List, Dict, Tuple, Any
@@ -345,8 +347,19 @@ class GeradorTestesFluxo:
         ]
 
 
-def main():
+def main(argv=None):
     """Função principal - executa todos os testes."""
+    parser = argparse.ArgumentParser(description="Testes do fluxo conversacional")
+    parser.add_argument("--planilha-fake", action="store_true",
+                        help="usa a planilha em memória (tests/fake_gspread.py) no lugar do Google Sheets")
+    parser.add_argument("--latencia", type=float, default=0.0,
+                        help="latência simulada por chamada à planilha fake, em segundos")
+    args = parser.parse_args(argv)
+
+    planilha_fake = None
+    if args.planilha_fake:
+        from tests.fake_gspread import instalar_planilha_fake
+        planilha_fake = instalar_planilha_fake(dias_slots=30, latencia=args.latencia)
 
     print("\n" + "="*80)
     print("INICIANDO TESTES DO FLUXO CONVERSACIONAL")
@@ -391,6 +404,11 @@ def main():
         # Fallback para terminal Windows que não suporta Unicode
         print("[RELATORIO GERADO] Veja os arquivos de relatorio para detalhes completos")
 
+    if planilha_fake is not None:
+        stats = planilha_fake.estatisticas()
+        print(f"Planilha fake: {stats['total']} chamadas ({stats['leituras']} leituras, "
+              f"{stats['escritas']} escritas), {stats['tempo_latencia_s']}s de latência simulada")
+
     print("\n" + "="*80)
     print("TESTES CONCLUÍDOS")
     print("="*80 + "\n")
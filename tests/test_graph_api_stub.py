@@ -0,0 +1,61 @@
+"""
+test_graph_api_stub.py
+
+Envios do whatsapp_webhook contra o stand-in local da Graph API (tests/graph_api_stub.py).
+
+Uso:
+    python -m pytest tests/test_graph_api_stub.py
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import whatsapp_webhook
+from tests.graph_api_stub import GraphApiStub
+
+
+@pytest.fixture
+def stub():
+    with GraphApiStub(semente=1) as s:
+        s.apontar_webhook()
+        yield s
+
+
+def test_envios_sao_gravados_no_stub(stub):
+    r = whatsapp_webhook.send_text("5511999990000", "Olá!")
+    assert r.status_code == 200
+    whatsapp_webhook.send_confirm_buttons("5511999990000", "Confirma?")
+
+    assert stub.textos("5511999990000") == ["Olá!", "Confirma?"]
+    [botoes] = stub.mensagens(tipo="interactive")
+    assert [b["reply"]["id"] for b in botoes["interactive"]["action"]["buttons"]] == ["1", "0", "9"]
+    assert stub.registros()[0]["autorizacao"].startswith("Bearer ")
+
+
+def test_rajada_de_lembretes_respeita_limite(stub):
+    stub.limite_por_segundo, stub.rajada, stub._tokens = 0.01, 5, 5.0   # reposição desprezível durante a rajada
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        respostas = list(pool.map(lambda i: whatsapp_webhook.send_reminder(f"55119999{i:05d}", "Lembrete"), range(20)))
+
+    codigos = sorted(r.status_code for r in respostas)
+    assert codigos.count(200) == 5
+    assert codigos.count(429) == 15
+    assert stub.estatisticas()["por_status"] == {200: 5, 429: 15}
+
+
+def test_taxa_de_erro_e_restauracao_da_url(stub):
+    stub.taxa_erro = 1.0
+    assert whatsapp_webhook.send_text("5511999990000", "x").status_code == 500
+    assert stub.mensagens() == []
+
+    base_stub = whatsapp_webhook.GRAPH_API_BASE
+    stub.restaurar_webhook()
+    assert whatsapp_webhook.GRAPH_API_BASE != base_stub
+    assert whatsapp_webhook.GRAPH_API_BASE.startswith(whatsapp_webhook.GRAPH_API_URL.rstrip("/"))
@@ -0,0 +1,118 @@
+"""
+test_historico_agenda.py
+
+Arquivamento da aba Agenda (src/historico_agenda.py): linhas antigas saem da
+Agenda em lote (uma escrita no histórico, uma remoção), slots livres passados
+são descartados, o snapshot em cache é invalidado e consultar_historico() lê o
+destino (aba Historico ou CSV local). Registros e cancelamentos só esperam pelo
+arquivamento (trava compartilhada/exclusiva), e a limpeza da aba Lembretes no
+cancelamento fica fora da trava.
+
+Uso:
+    python -m pytest tests/test_historico_agenda.py
+"""
+
+import os
+import sys
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import agenda_service, historico_agenda
+from tests.fake_gspread import desinstalar_planilha_fake, instalar_planilha_fake
+
+HOJE = date(2026, 6, 15)
+
+
+def _linha(dia: date, hora: str, status: str, nome: str = "", telefone: str = ""):
+    return [agenda_service.NOMES_DIAS_PT[dia.weekday()], dia.strftime("%d/%m/%Y"), hora, nome, telefone,
+            status, "whatsapp" if nome else "", ""]
+
+
+@pytest.fixture
+def planilha(monkeypatch, tmp_path):
+    monkeypatch.setattr(historico_agenda, "ARCHIVE_FILE", str(tmp_path / "historico.csv"))
+    cliente = instalar_planilha_fake()
+    ws = agenda_service.obter_worksheet_agenda()
+    ws.append_rows([
+        _linha(date(2026, 4, 1), "08:00", "AGENDADO", "Ana", "5511999990000"),
+        _linha(date(2026, 4, 1), "08:40", "DISPONIVEL"),
+        _linha(date(2026, 5, 2), "09:20", "CANCELADO", "Bia", "5511988880000"),
+        _linha(date(2026, 5, 20), "10:00", "AGENDADO", "Ana", "5511999990000"),   # dentro da retenção
+        _linha(HOJE + timedelta(days=3), "08:00", "DISPONIVEL"),
+    ])
+    agenda_service.obter_todos_agenda_cached()          # snapshot em cache, que precisa ser invalidado
+    cliente.zerar_contadores()
+    yield cliente
+    desinstalar_planilha_fake()
+
+
+@pytest.mark.parametrize("destino", ["sheet", "file"])
+def test_arquivamento_move_linhas_antigas_em_lote(planilha, destino):
+    resumo = historico_agenda.arquivar_linhas_antigas(hoje=HOJE, retencao_dias=30, destino=destino)
+
+    assert resumo == {"limite": "16/05/2026", "destino": destino, "arquivadas": 2, "descartadas": 1, "removidas": 3}
+    assert [l[1] for l in agenda_service.obter_todos_agenda_cached()[1:]] == [
+        "20/05/2026", (HOJE + timedelta(days=3)).strftime("%d/%m/%Y")]
+    por_metodo = planilha.estatisticas()["por_metodo"]
+    assert por_metodo["spreadsheet.batch_update"] == 1
+    assert por_metodo.get("append_rows", 0) == (1 if destino == "sheet" else 0)
+
+    historico = historico_agenda.consultar_historico(destino=destino)
+    assert [(r["data"], r["status"]) for r in historico] == [("01/04/2026", "AGENDADO"), ("02/05/2026", "CANCELADO")]
+    assert historico_agenda.consultar_historico(telefone="5511988880000", destino=destino)[0]["nome_paciente"] == "Bia"
+    assert historico_agenda.consultar_historico(data_inicio=date(2026, 4, 2), data_fim=date(2026, 5, 2),
+                                                destino=destino)[0]["data"] == "02/05/2026"
+
+    assert historico_agenda.arquivar_linhas_antigas(hoje=HOJE, retencao_dias=30, destino=destino)["removidas"] == 0
+
+
+def test_registro_aponta_a_linha_certa_depois_do_arquivamento(planilha):
+    historico_agenda.arquivar_linhas_antigas(hoje=HOJE, retencao_dias=30)
+    futuro = agenda_service.converter_data_hora((HOJE + timedelta(days=3)).strftime("%d/%m/%Y"), "08:00")
+
+    assert agenda_service.registrar_agendamento_google_sheets("Carla", futuro, telefone="5511977776666")
+    linha = agenda_service.obter_todos_agenda_cached()[-1]
+    assert linha[3:6] == ["Carla", "5511977776666", "AGENDADO"]
+
+
+def test_trava_compartilhada_so_espera_pelo_arquivamento():
+    trava = agenda_service._TravaLinhasAgenda()
+    outro_entrou, liberar, arquivou = threading.Event(), threading.Event(), threading.Event()
+
+    def registrar():
+        with trava.compartilhada():
+            outro_entrou.set()
+            liberar.wait(1)
+
+    def arquivar():
+        with trava.exclusiva():
+            arquivou.set()
+
+    with trava.compartilhada():
+        registro = threading.Thread(target=registrar)
+        registro.start()
+        assert outro_entrou.wait(1)                     # outro registro não espera
+        arquivamento = threading.Thread(target=arquivar)
+        arquivamento.start()
+        assert not arquivou.wait(0.1)                   # o arquivamento espera os registros em andamento
+    liberar.set()
+    assert arquivou.wait(1)
+    registro.join(1)
+    arquivamento.join(1)
+
+
+def test_cancelamento_limpa_lembretes_fora_da_trava(planilha, monkeypatch):
+    travados = []
+    monkeypatch.setattr(agenda_service, "remover_lembretes_por_appointment",
+                        lambda iso, tel: travados.append(agenda_service._lock_linhas_agenda._compartilhados))
+    futuro = agenda_service.converter_data_hora((HOJE + timedelta(days=3)).strftime("%d/%m/%Y"), "08:00")
+    agenda_service.registrar_agendamento_google_sheets("Carla", futuro, telefone="5511977776666")
+
+    assert agenda_service.cancelar_agendamento_por_data_hora(futuro, "5511977776666")
+    assert travados == [0]
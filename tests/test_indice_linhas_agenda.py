@@ -0,0 +1,120 @@
+"""
+test_indice_linhas_agenda.py
+
+Índice data -> faixas de linhas da Agenda (`IndiceLinhasAgenda`): depois da
+primeira leitura completa, as consultas de hoje em diante leem só as faixas do
+período num batch_get; linhas acrescentadas no fim entram pela cauda, linhas
+inseridas/removidas no meio são detectadas pela sonda e o índice é refeito;
+nenhuma faixa passa da grade da aba; o índice persistido sobrevive a um reinício.
+
+Uso:
+    python -m pytest tests/test_indice_linhas_agenda.py
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import agenda_service
+from tests.fake_gspread import desinstalar_planilha_fake, instalar_planilha_fake
+
+
+def _linhas_dos_dias(inicio: date, dias: int) -> list:
+    linhas = []
+    for i in range(dias):
+        dia = inicio + timedelta(days=i)
+        for slot in agenda_service.gerar_slots_para_dia(dia):
+            linhas.append([agenda_service.NOMES_DIAS_PT[dia.weekday()], slot.strftime("%d/%m/%Y"),
+                           slot.strftime("%H:%M"), "", "", "DISPONIVEL", "", ""])
+    return linhas
+
+
+@pytest.fixture
+def agenda():
+    """Agenda com 120 dias passados e 10 futuros, em ordem de data (como a geração de slots deixa)."""
+    cliente = instalar_planilha_fake()
+    hoje = agenda_service.agora_brasil().date()
+    linhas = [agenda_service.CABECALHO_AGENDA] + _linhas_dos_dias(hoje - timedelta(days=120), 130)
+    ws = cliente.criar_planilha(agenda_service.SPREADSHEET_ID).criar_aba(agenda_service.NOME_ABA_AGENDA, linhas)
+    yield cliente, ws, hoje
+    desinstalar_planilha_fake()
+
+
+def _futuras(ws, hoje):
+    """(nº da linha, linha) das linhas de hoje em diante, direto da aba fake."""
+    return [(n, l) for n, l in enumerate(ws._linhas[1:], start=2)
+            if agenda_service.converter_data_hora(l[1], "00:00").date() >= hoje]
+
+
+def _ler(cliente, hoje):
+    agenda_service.invalidar_cache_agenda()
+    cliente.zerar_contadores()
+    snapshot = agenda_service.obter_agenda_futura_cached()
+    linhas = [(snapshot.numero_linha(r), snapshot.linha(r)) for r in range(snapshot.total)]
+    return linhas, cliente.estatisticas()["por_metodo"]
+
+
+def test_leitura_parcial_depois_do_indice(agenda):
+    cliente, ws, hoje = agenda
+    esperado = _futuras(ws, hoje)
+
+    linhas, chamadas = _ler(cliente, hoje)                      # frio: leitura completa, monta o índice
+    assert linhas == esperado and chamadas.get("get_all_values") == 1
+
+    linhas, chamadas = _ler(cliente, hoje)                      # só as faixas do período
+    assert linhas == esperado
+    assert chamadas.get("batch_get") == 1 and "get_all_values" not in chamadas
+
+    ws.append_row(["", (hoje + timedelta(days=1)).strftime("%d/%m/%Y"), "07:15", "Ana", "5511999990000",
+                   "AGENDADO", "whatsapp", ""])                 # avulso fora de ordem, entra pela cauda
+    linhas, chamadas = _ler(cliente, hoje)
+    assert linhas == _futuras(ws, hoje) and "get_all_values" not in chamadas
+    assert agenda_service.listar_agendamentos_para_data(hoje + timedelta(days=1))[0]["hora"] == "07:15"
+
+
+def test_grade_cheia_nao_le_alem_da_ultima_linha(agenda):
+    """Grade do tamanho exato dos dados (append com INSERT_ROWS): nenhuma faixa pode passar dela."""
+    cliente, ws, hoje = agenda
+    ws.row_count = len(ws._linhas)
+    _ler(cliente, hoje)
+
+    linhas, chamadas = _ler(cliente, hoje)
+    assert linhas == _futuras(ws, hoje) and "get_all_values" not in chamadas
+    ws.append_row(["", (hoje + timedelta(days=2)).strftime("%d/%m/%Y"), "07:15", "Ana", "5511999990000",
+                   "AGENDADO", "whatsapp", ""])                 # a grade cresce uma linha
+    linhas, chamadas = _ler(cliente, hoje)
+    assert linhas == _futuras(ws, hoje) and "get_all_values" not in chamadas
+
+
+def test_linhas_removidas_no_meio_refazem_o_indice(agenda):
+    cliente, ws, hoje = agenda
+    _ler(cliente, hoje)
+    ws.delete_rows(50)                                          # dono apagou uma linha antiga: tudo sobe uma linha
+
+    linhas, chamadas = _ler(cliente, hoje)
+    assert linhas == _futuras(ws, hoje)
+    assert chamadas.get("batch_get") == 1 and chamadas.get("get_all_values") == 1
+    _, chamadas = _ler(cliente, hoje)
+    assert "get_all_values" not in chamadas
+
+
+def test_indice_persistido(agenda, tmp_path, monkeypatch):
+    cliente, ws, hoje = agenda
+    monkeypatch.setattr(agenda_service, "INDICE_LINHAS_ARQUIVO", str(tmp_path / "indice.json"))
+    _ler(cliente, hoje)
+    assert os.path.exists(agenda_service.INDICE_LINHAS_ARQUIVO)
+
+    agenda_service._indice_linhas = None                        # reinício do processo
+    linhas, chamadas = _ler(cliente, hoje)
+    assert linhas == _futuras(ws, hoje) and "get_all_values" not in chamadas
+
+    agenda_service.invalidar_indice_linhas()                    # arquivamento
+    assert not os.path.exists(agenda_service.INDICE_LINHAS_ARQUIVO)
+    _, chamadas = _ler(cliente, hoje)
+    assert chamadas.get("get_all_values") == 1
@@ -0,0 +1,82 @@
+"""
+test_leader_election.py
+
+Eleição de líder por lease em arquivo (src/leader_election.py): um segundo
+processo não assume um lease válido, e uma renovação que não consegue a trava
+(ex.: disco lento) não derruba a liderança enquanto o lease não expira, nem
+dispara de novo os callbacks de failover. A trava do lease é exclusiva entre
+descritores e volta a ficar livre ao ser liberada.
+
+Uso:
+    python -m pytest tests/test_leader_election.py
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import leader_election
+
+
+@pytest.fixture
+def lease(monkeypatch, tmp_path):
+    monkeypatch.setattr(leader_election, "ENABLED", True)
+    monkeypatch.setattr(leader_election, "LEASE_FILE", str(tmp_path / "leader.lease"))
+    monkeypatch.setattr(leader_election, "_lider", False)
+    monkeypatch.setattr(leader_election, "_lease_expira_em", 0.0)
+    monkeypatch.setattr(leader_election, "_callbacks", [])
+    return monkeypatch
+
+
+def test_outro_processo_nao_assume_lease_valido(lease):
+    leader_election._atualizar_lideranca()
+    assert leader_election.sou_lider()
+
+    lease.setattr(leader_election, "PROCESS_ID", "outro-host:1:abcd")
+    lease.setattr(leader_election, "_lider", False)
+    assert leader_election._tentar_lease() is False
+
+
+def _trava_ocupada(lease, ocupada: list):
+    """Enquanto `ocupada` não estiver vazia, a trava do lease não é obtida (como num timeout)."""
+    original = leader_election._adquirir_trava
+    lease.setattr(leader_election, "_adquirir_trava", lambda timeout=5.0: None if ocupada else original(timeout))
+
+
+def test_trava_ocupada_nao_derruba_lease_valido(lease):
+    assumiu, ocupada = [], []
+    leader_election.ao_assumir_lideranca(lambda: assumiu.append(1))
+    _trava_ocupada(lease, ocupada)
+    leader_election._atualizar_lideranca()
+    assert leader_election.sou_lider() and assumiu == [1]
+
+    ocupada.append(1)
+    leader_election._atualizar_lideranca()                      # renovação falhou, mas o lease ainda vale
+    assert leader_election.sou_lider()
+    ocupada.clear()
+    leader_election._atualizar_lideranca()
+    assert leader_election.sou_lider() and assumiu == [1]       # sem failover repetido
+
+
+def test_trava_ocupada_com_lease_expirado_perde_lideranca(lease):
+    leader_election._atualizar_lideranca()
+    lease.setattr(leader_election, "_lease_expira_em", time.time() - 1)
+    _trava_ocupada(lease, [1])
+    leader_election._atualizar_lideranca()
+    assert not leader_election._lider
+
+
+def test_trava_exclusiva_e_liberada(lease):
+    trava = leader_election._adquirir_trava()
+    assert trava is not None
+    assert leader_election._adquirir_trava(timeout=0.1) is None    # outro descritor (thread/processo) espera
+    leader_election._liberar_trava(trava)
+    segunda = leader_election._adquirir_trava(timeout=0.1)
+    assert segunda is not None
+    leader_election._liberar_trava(segunda)
@@ -0,0 +1,99 @@
+"""
+test_lembretes_reidratacao.py
+
+Reidratação de lembretes (whatsapp_webhook.reidratar_lembretes_pendentes): os
+jobs têm id estável por telefone + agendamento, então reidratar de novo (ex.:
+failover de liderança) não duplica lembretes, e o envio confere na aba Lembretes
+que o lembrete ainda está pendente (não enviado por outro processo, não cancelado)
+e remove a própria linha pelo agendamento, mesmo que as linhas tenham subido.
+
+Uso:
+    python -m pytest tests/test_lembretes_reidratacao.py
+"""
+
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import agenda_service, leader_election, scheduler, whatsapp_webhook
+from tests.fake_gspread import desinstalar_planilha_fake, instalar_planilha_fake
+
+TELEFONE = "5511999990000"
+
+
+@pytest.fixture
+def lembrete(monkeypatch):
+    """Um lembrete futuro na aba Lembretes, processo líder e scheduler sem worker."""
+    monkeypatch.setattr(leader_election, "ENABLED", False)
+    monkeypatch.setattr(scheduler, "start", lambda *a, **k: None)
+    monkeypatch.setattr(scheduler, "_jobs_heap", [])
+    monkeypatch.setattr(scheduler, "_pending", {})
+    enviados = []
+    monkeypatch.setattr(whatsapp_webhook, "send_reminder_confirm_buttons",
+                        lambda telefone, texto, appt_iso: enviados.append((telefone, appt_iso)))
+    instalar_planilha_fake()
+    consulta = (agenda_service.agora_brasil() + timedelta(days=2)).replace(hour=9, minute=0, second=0, microsecond=0)
+    agenda_service.registrar_lembrete_agendamento(consulta, consulta - timedelta(hours=24), TELEFONE, "Ana")
+    yield consulta, enviados
+    desinstalar_planilha_fake()
+
+
+def _executar_jobs():
+    for _, _, func, args, kwargs in list(scheduler._jobs_heap):
+        func(*args, **(kwargs or {}))
+
+
+def test_reidratar_duas_vezes_agenda_um_job(lembrete):
+    consulta, enviados = lembrete
+    whatsapp_webhook.reidratar_lembretes_pendentes()
+    whatsapp_webhook.reidratar_lembretes_pendentes()           # failover: o novo líder reidrata de novo
+
+    [job] = scheduler.list_jobs()
+    assert job["id"] == agenda_service.chave_lembrete(consulta.isoformat(), TELEFONE)
+    _executar_jobs()
+    assert enviados == [(TELEFONE, consulta.isoformat())]
+    assert agenda_service.obter_lembretes_pendentes() == []
+
+
+def test_envio_confere_se_lembrete_ainda_esta_pendente(lembrete):
+    consulta, enviados = lembrete
+    whatsapp_webhook.reidratar_lembretes_pendentes()
+    agenda_service.remover_lembretes_por_appointment(consulta.isoformat(), TELEFONE)   # outro processo já enviou
+
+    _executar_jobs()
+    assert enviados == []
+
+
+def test_lembrete_do_fluxo_remove_a_propria_linha_apos_deslocamento(lembrete):
+    """Outra linha removida acima desloca os índices: o job do agendamento não pode apagar o lembrete vizinho."""
+    from fastapi.testclient import TestClient
+    from tests.carga_webhook import payload_botao, payload_lista, payload_texto
+    from tests.graph_api_stub import GraphApiStub
+
+    consulta_outro, _ = lembrete                                # linha 2: lembrete de outro paciente
+    telefone = "5511977776666"
+    agenda_service.inicializar_slots_proximos_dias()
+    with GraphApiStub() as stub:
+        stub.apontar_webhook()
+        cliente = TestClient(whatsapp_webhook.app)
+        for payload in (payload_texto(telefone, "Carla", "oi"), payload_texto(telefone, "Carla", "Carla Dias"),
+                        payload_lista(telefone, "Carla", "1"), payload_botao(telefone, "Carla", "2"),
+                        payload_lista(telefone, "Carla", "1"), payload_lista(telefone, "Carla", "1"),
+                        payload_botao(telefone, "Carla", "1")):
+            cliente.post("/webhook", json=payload)
+    whatsapp_webhook.wf.sessoes.clear()
+    assert [j for j in scheduler.list_jobs() if j["id"].startswith(f"lembrete:{telefone}:")]
+    vizinho = agenda_service.agora_brasil() + timedelta(days=20)
+    agenda_service.registrar_lembrete_agendamento(vizinho, vizinho - timedelta(hours=24), "5511955554444", "Bia")
+
+    agenda_service.remover_lembretes_por_appointment(consulta_outro.isoformat(), TELEFONE)  # linhas sobem uma
+    _executar_jobs()
+
+    assert [(p["telefone"], p["appointment_iso"]) for p in agenda_service.obter_lembretes_pendentes()] == [
+        ("5511955554444", vizinho.isoformat())]
@@ -0,0 +1,190 @@
+"""
+test_logging_config.py
+
+Pipeline de logging (src/logging_config.py): fila limitada com descarte de
+registros de baixa prioridade e aviso do total descartado; eventos estruturados
+(`log_evento`) no formato JSON e saída de compatibilidade com print(); limite
+e amostragem de registros por ponto de chamada.
+
+Uso:
+    python -m pytest tests/test_logging_config.py
+"""
+
+import io
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from datetime import datetime
+
+from src import logging_config
+from src.logging_config import (
+    FilaLimitadaHandler,
+    JsonFormatter,
+    LimiteAmostragemFilter,
+    hash_telefone,
+    json_preguicoso,
+    log_evento,
+)
+
+
+def _logger_com_fila(tamanho: int):
+    fila = queue.Queue(maxsize=tamanho)
+    handler = FilaLimitadaHandler(fila, timeout=0.01)
+    log = logging.getLogger(f"teste_fila_{tamanho}")
+    log.handlers = [handler]
+    log.propagate = False
+    log.setLevel(logging.DEBUG)
+    return log, handler, fila
+
+
+def test_fila_cheia_descarta_info_e_avisa_o_total():
+    log, handler, fila = _logger_com_fila(2)
+    for i in range(5):
+        log.info("mensagem %d", i)
+    assert fila.qsize() == 2 and handler.descartados == 3
+
+    fila.get_nowait()
+    fila.get_nowait()
+    log.info("depois")                                  # volta a ter espaço: entra + aviso dos descartes
+    mensagens = [fila.get_nowait().getMessage() for _ in range(fila.qsize())]
+    assert mensagens[0] == "depois"
+    assert "3 registro(s) de log descartado(s)" in mensagens[1]
+    assert handler.descartados == 0
+
+
+def test_listener_grava_com_o_formato_dos_handlers(tmp_path):
+    log, _, fila = _logger_com_fila(100)
+    arquivo = logging.handlers.RotatingFileHandler(tmp_path / "app.log", maxBytes=1024, backupCount=1,
+                                                   encoding="utf-8")
+    arquivo.setFormatter(logging.Formatter("[%(levelname)s] %(name)s - %(message)s"))
+    listener = logging.handlers.QueueListener(fila, arquivo, respect_handler_level=True)
+    listener.start()
+    log.warning("consulta %s", "confirmada")
+    listener.stop()
+    arquivo.close()
+    assert (tmp_path / "app.log").read_text(encoding="utf-8") == "[WARNING] teste_fila_100 - consulta confirmada\n"
+
+
+def test_json_pela_fila_mantem_msg_e_exc_separados():
+    log, _, fila = _logger_com_fila(100)
+    saida = io.StringIO()
+    console = logging.StreamHandler(saida)
+    console.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(fila, console, respect_handler_level=True)
+    listener.start()
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.exception("falhou %d", 1)
+    listener.stop()
+
+    registro = json.loads(saida.getvalue())
+    assert registro["msg"] == "falhou 1"
+    assert "Traceback" in registro["exc"] and "ValueError: boom" in registro["exc"]
+
+
+def _logger_json():
+    saida = io.StringIO()
+    handler = logging.StreamHandler(saida)
+    handler.setFormatter(JsonFormatter())
+    log = logging.getLogger("teste_json")
+    log.handlers = [handler]
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    return log, saida
+
+
+def test_evento_json_com_campos_estruturados(capsys):
+    log, saida = _logger_json()
+    log_evento(log, logging.INFO, "[lembrete] enviado (linha %s)", 7, telefone="5511999990000",
+               consulta=datetime(2026, 3, 2, 9, 0), duracao_ms=12.345, linha=7, sucesso=True)
+
+    registro = json.loads(saida.getvalue())
+    assert registro["msg"] == "[lembrete] enviado (linha 7)"
+    assert registro["nivel"] == "INFO" and registro["logger"] == "teste_json"
+    assert registro["telefone_hash"] == hash_telefone("5511999990000") != "5511999990000"
+    assert registro["consulta"] == "2026-03-02T09:00:00"
+    assert registro["duracao_ms"] == 12.3 and registro["linha"] == 7
+    assert "5511999990000" not in saida.getvalue()
+    assert capsys.readouterr().out == ""                 # sem LOG_PRINT_COMPAT não há print()
+
+
+def test_evento_abaixo_do_nivel_nao_formata(monkeypatch, capsys):
+    log, saida = _logger_json()
+    monkeypatch.setattr(logging_config, "LOG_PRINT_COMPAT", True)
+
+    class Caro:
+        def __str__(self):
+            raise AssertionError("formatado sem necessidade")
+
+    log_evento(log, logging.DEBUG, "detalhe %s", Caro())
+    assert saida.getvalue() == "" and capsys.readouterr().out == ""
+
+    log_evento(log, logging.WARNING, "[lembrete] falha (linha %s)", 3)
+    assert capsys.readouterr().out == "🔴 [lembrete] falha (linha 3)\n"
+
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def test_limite_por_ponto_de_chamada_com_amostragem_e_resumo():
+    relogio = _Relogio()
+    filtro = LimiteAmostragemFilter(por_janela=5, janela=60, taxa=0.1, relogio=relogio)
+    log, _, fila = _logger_com_fila(1000)
+    log.handlers[0].addFilter(filtro)
+    resumos = []
+    coletor = logging.Handler()
+    coletor.emit = resumos.append
+    logging.getLogger("src.logging_config").addHandler(coletor)
+    try:
+        for i in range(105):
+            log.info("rajada %d", i)                        # mesmo ponto de chamada
+        log.info("outro ponto")
+        log.critical("nunca limitado")
+        # 5 primeiros + 1 a cada 10 do excedente (10 de 100) + outro ponto + critical
+        assert fila.qsize() == 5 + 10 + 2
+        assert resumos == []
+
+        relogio.agora = 61                                  # nova janela: resumo dos suprimidos
+        log.info("rajada depois")
+        assert len(resumos) == 1
+        assert "90 registro(s) suprimido(s) em teste_fila_1000" in resumos[0].getMessage()
+        assert fila.qsize() == 5 + 10 + 2 + 1
+    finally:
+        logging.getLogger("src.logging_config").removeHandler(coletor)
+
+
+def test_limite_por_logger_e_filtro_compartilhado():
+    filtro = LimiteAmostragemFilter(por_janela=100, taxa=0.5, por_logger={"src.whatsapp_webhook": (2, 0)},
+                                    relogio=_Relogio())
+    registro = lambda nome: logging.LogRecord(nome, logging.INFO, "arq.py", 10, "x", None, None)
+    decisoes = [filtro.filter(registro("src.whatsapp_webhook")) for _ in range(4)]
+    assert decisoes == [True, True, False, False]           # taxa 0: nada passa após o limite
+
+    r = registro("src.outro")
+    assert filtro.filter(r) and filtro.filter(r)            # mesmo registro em dois handlers conta uma vez
+    assert filtro._pontos[("src.outro", "arq.py", 10)][1] == 1
+
+
+def test_json_preguicoso_so_serializa_quando_formatado():
+    class Caro(dict):
+        def items(self):
+            raise AssertionError("serializado sem necessidade")
+
+    log, saida = _logger_json()
+    log.debug("payload %s", json_preguicoso(Caro()))
+    log.error("payload %s", json_preguicoso({"to": "x"}))
+    assert json.loads(saida.getvalue())["msg"] == 'payload {"to": "x"}'
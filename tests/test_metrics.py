@@ -0,0 +1,56 @@
+"""
+test_metrics.py
+
+Métricas no formato do Prometheus (src/metrics.py) e o endpoint /metrics.
+
+Uso:
+    python -m pytest tests/test_metrics.py
+"""
+
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from fastapi.testclient import TestClient
+
+from src import metrics
+
+
+def test_histograma_exporta_buckets_acumulados():
+    hist = metrics.Histograma("teste_latencia_seconds", "Teste", ["funcao"], buckets=(0.1, 1.0))
+    hist.observar(0.05, funcao="a")
+    hist.observar(0.5, funcao="a")
+    hist.observar(3, funcao="a")
+
+    linhas = hist.exportar()
+    assert '# TYPE teste_latencia_seconds histogram' in linhas
+    assert 'teste_latencia_seconds_bucket{funcao="a",le="0.1"} 1' in linhas
+    assert 'teste_latencia_seconds_bucket{funcao="a",le="1"} 2' in linhas
+    assert 'teste_latencia_seconds_bucket{funcao="a",le="+Inf"} 3' in linhas
+    assert 'teste_latencia_seconds_sum{funcao="a"} 3.55' in linhas
+    assert 'teste_latencia_seconds_count{funcao="a"} 3' in linhas
+
+
+def test_contador_escapa_rotulos_e_gauge_calculado_na_coleta():
+    cont = metrics.Contador("teste_total", "Teste", ["erro"])
+    cont.inc(erro='falha "x"')
+    cont.inc(2, erro='falha "x"')
+    assert cont.exportar()[-1] == 'teste_total{erro="falha \\"x\\""} 3'
+
+    fila = []
+    g = metrics.Gauge("teste_fila", "Teste", funcao=lambda: len(fila))
+    fila.extend([1, 2])
+    assert g.exportar()[-1] == "teste_fila 2"
+
+
+def test_endpoint_metrics():
+    from src import whatsapp_webhook
+    resposta = TestClient(whatsapp_webhook.app).get("/metrics")
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for nome in ("webhook_requests_total", "sheets_call_duration_seconds", "graph_api_send_duration_seconds",
+                 "scheduler_queue_depth", "whatsapp_sessoes_ativas", "cache_requests_total"):
+        assert f"# TYPE {nome} " in resposta.text
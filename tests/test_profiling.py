@@ -0,0 +1,60 @@
+"""
+test_profiling.py
+
+Perfil por requisição (src/profiling.py): liga só quando habilitado (env ou header
+com token) e salva o .prof apenas para requisições acima do limite.
+
+Uso:
+    python -m pytest tests/test_profiling.py
+"""
+
+import logging
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import profiling
+
+
+def _trabalho():
+    return sum(sorted(range(20000), key=lambda x: -x))
+
+
+def test_desligado_nao_cria_profiler(monkeypatch):
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE", False)
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE_TOKEN", "")
+    assert profiling.iniciar_perfil_requisicao({profiling.HEADER_PERFIL: "qualquer"}) is None
+
+
+def test_header_com_token_gera_perfil_da_requisicao_lenta(monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE", False)
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE_TOKEN", "segredo")
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE_THRESHOLD_MS", 0)
+
+    assert profiling.iniciar_perfil_requisicao({profiling.HEADER_PERFIL: "errado"}) is None
+    perfil = profiling.iniciar_perfil_requisicao({profiling.HEADER_PERFIL: "segredo"})
+    assert perfil is not None
+    assert profiling.iniciar_perfil_requisicao({profiling.HEADER_PERFIL: "segredo"}) is None  # um perfil por vez
+    _trabalho()
+    with caplog.at_level(logging.WARNING, logger="src.profiling"):
+        caminho = profiling.finalizar_perfil_requisicao(perfil, "webhook", 12.0)
+
+    assert caminho and os.path.exists(caminho) and os.path.basename(caminho).startswith("webhook_")
+    assert "_trabalho" in caplog.text or "sorted" in caplog.text
+    assert any(f["funcao"] == "<lambda>" for f in profiling.funcoes_mais_caras(caminho, top=50))
+
+
+def test_requisicao_rapida_nao_salva_arquivo(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE", True)
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE_TOKEN", "")
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "REQUEST_PROFILE_THRESHOLD_MS", 10_000)
+
+    perfil = profiling.iniciar_perfil_requisicao()
+    assert perfil is not None
+    assert profiling.finalizar_perfil_requisicao(perfil, "webhook", 5.0) is None
+    assert list(tmp_path.iterdir()) == []
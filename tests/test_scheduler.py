@@ -0,0 +1,117 @@
+"""
+test_scheduler.py
+
+Testes do motor de jobs recorrentes do scheduler (cálculo do próximo disparo,
+políticas de catch-up, listagem e cancelamento), sem subir a thread do worker.
+
+Uso:
+    python -m pytest tests/test_scheduler.py
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import scheduler
+
+
+@pytest.fixture(autouse=True)
+def scheduler_limpo(monkeypatch):
+    """Estado do scheduler isolado por teste e worker desligado (os jobs vencidos são disparados via _pop_due)."""
+    monkeypatch.setattr(scheduler, "start", lambda *a, **k: None)
+    monkeypatch.setattr(scheduler, "_jobs_heap", [])
+    monkeypatch.setattr(scheduler, "_pending", {})
+    monkeypatch.setattr(scheduler, "_recurring", {})
+
+
+def _executar_vencidos(now):
+    execucoes = scheduler._pop_due(now)
+    for run in execucoes:
+        scheduler._run(*run)
+    return [fire_at for _, fire_at, _, _, _ in execucoes]
+
+
+def test_cron_diario_proximo_disparo():
+    spec = scheduler.CronSpec("1 0 * * *")
+    assert spec.next_after(datetime(2026, 3, 10, 0, 0)) == datetime(2026, 3, 10, 0, 1)
+    assert spec.next_after(datetime(2026, 3, 10, 0, 1)) == datetime(2026, 3, 11, 0, 1)
+    assert spec.next_after(datetime(2026, 12, 31, 23, 59)) == datetime(2027, 1, 1, 0, 1)
+
+
+def test_cron_dias_uteis_e_passo():
+    spec = scheduler.CronSpec("*/30 8-9 * * 1-5")
+    sexta = datetime(2026, 3, 13, 9, 45)
+    assert spec.next_after(sexta) == datetime(2026, 3, 16, 8, 0)  # pula o fim de semana
+    assert spec.next_after(datetime(2026, 3, 16, 8, 0)) == datetime(2026, 3, 16, 8, 30)
+
+
+def test_intervalo_alinhado_na_ancora():
+    spec = scheduler.IntervalSpec(timedelta(minutes=15), datetime(2026, 3, 10, 8, 0))
+    assert spec.next_after(datetime(2026, 3, 10, 7, 0)) == datetime(2026, 3, 10, 8, 0)
+    assert spec.next_after(datetime(2026, 3, 10, 8, 20)) == datetime(2026, 3, 10, 8, 30)
+
+
+def test_proximo_disparo_vem_da_agenda_e_nao_do_fim_da_execucao(monkeypatch):
+    """Uma execução que termina depois da meia-noite não pode pular o dia seguinte."""
+    monkeypatch.setattr(scheduler, "agora_brasil", lambda: datetime(2026, 3, 10, 12, 0))
+    chamadas = []
+    scheduler.schedule_daily(23, 59, chamadas.append, "ok")
+
+    assert _executar_vencidos(datetime(2026, 3, 11, 0, 2)) == [datetime(2026, 3, 10, 23, 59)]
+    assert chamadas == ["ok"]
+    [job] = scheduler.list_jobs()
+    assert job["next_run"] == datetime(2026, 3, 11, 23, 59)
+    assert job["run_count"] == 1
+
+
+@pytest.mark.parametrize("politica, esperado", [
+    (scheduler.CATCH_UP_SKIP, 0),
+    (scheduler.CATCH_UP_RUN_ONCE, 1),
+    (scheduler.CATCH_UP_RUN_ALL, 4),
+])
+def test_politicas_de_catch_up(monkeypatch, politica, esperado):
+    monkeypatch.setattr(scheduler, "agora_brasil", lambda: datetime(2026, 3, 10, 7, 0))
+    chamadas = []
+    inicio = datetime(2026, 3, 10, 8, 0)
+    scheduler.schedule_every(timedelta(hours=1), chamadas.append, 1, start_at=inicio, catch_up=politica)
+
+    _executar_vencidos(datetime(2026, 3, 10, 11, 30))  # perdeu 08h, 09h, 10h e 11h
+    assert len(chamadas) == esperado
+    [job] = scheduler.list_jobs()
+    assert job["next_run"] == datetime(2026, 3, 10, 12, 0)
+    assert job["missed_count"] == 4 - esperado
+
+
+def test_cancelamento_remove_job_recorrente_e_avulso():
+    chamadas = []
+    recorrente = scheduler.schedule_every(60, chamadas.append, "r")
+    avulso = scheduler.schedule_at(datetime(2026, 3, 10, 8, 0), chamadas.append, "a")
+    assert {j["id"] for j in scheduler.list_jobs()} == {recorrente, avulso}
+
+    assert scheduler.cancel(recorrente) is True
+    assert scheduler.cancel(avulso) is True
+    assert scheduler.cancel(avulso) is False
+    assert scheduler.list_jobs() == []
+    _executar_vencidos(datetime(2100, 1, 1))
+    assert chamadas == []
+
+
+def test_job_id_estavel_e_idempotente():
+    chamadas = []
+    quando = datetime(2026, 3, 10, 8, 0)
+    assert scheduler.schedule_at(quando, chamadas.append, "a", job_id="lembrete:1") == "lembrete:1"
+    scheduler.schedule_many([(quando, chamadas.append, ("b",), None, "lembrete:1"),
+                             (quando, chamadas.append, ("c",), None, "lembrete:2")])
+    assert sorted(j["id"] for j in scheduler.list_jobs()) == ["lembrete:1", "lembrete:2"]
+
+    scheduler.schedule_at(quando + timedelta(hours=1), chamadas.append, "d", job_id="lembrete:2")  # movido
+    _executar_vencidos(quando)
+    assert chamadas == ["a"]
+    _executar_vencidos(quando + timedelta(hours=1))
+    assert chamadas == ["a", "d"]
@@ -0,0 +1,98 @@
+"""
+test_tracing.py
+
+Tracing por mensagem (src/tracing.py): spans de perfil, fluxo, planilha e envios
+sob o mesmo correlation ID, buffer de traces lentos em /debug/traces e exportação
+OTLP para o coletor local (tests/otlp_stub.py).
+
+Uso:
+    python -m pytest tests/test_tracing.py
+"""
+
+import logging
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from fastapi.testclient import TestClient
+
+from src import scheduler, tracing, whatsapp_webhook
+from tests.carga_webhook import payload_lista, payload_texto
+from tests.fake_gspread import desinstalar_planilha_fake, instalar_planilha_fake
+from tests.graph_api_stub import GraphApiStub
+from tests.otlp_stub import OtlpStub
+
+TELEFONE = "5511977776666"
+TOKEN = "token-de-teste"
+DEBUG = {"X-Debug-Token": TOKEN}
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(scheduler, "start", lambda *a, **k: None)
+    monkeypatch.setattr(scheduler, "_jobs_heap", [])
+    monkeypatch.setattr(scheduler, "_pending", {})
+    monkeypatch.setattr(tracing, "SLOW_MS", 0)       # todo trace entra no buffer
+    monkeypatch.setattr(tracing, "DEBUG_TOKEN", TOKEN)
+    tracing.limpar()
+    nivel = logging.getLogger().level
+    logging.getLogger().setLevel(logging.ERROR)
+    instalar_planilha_fake(dias_slots=14, cadastros=[(TELEFONE, "Carla Dias")])
+    with GraphApiStub() as stub:
+        stub.apontar_webhook()
+        yield TestClient(whatsapp_webhook.app)
+    desinstalar_planilha_fake()
+    whatsapp_webhook.wf.sessoes.clear()
+    tracing.limpar()
+    logging.getLogger().setLevel(nivel)
+
+
+def test_spans_da_mensagem_compartilham_correlacao(cliente):
+    cliente.post("/webhook", json=payload_texto(TELEFONE, "Carla", "oi"))
+    cliente.post("/webhook", json=payload_lista(TELEFONE, "Carla", "1"))
+
+    lista = cliente.get("/debug/traces", headers=DEBUG).json()["traces"]
+    assert len(lista) == 2
+    detalhe = cliente.get(f"/debug/traces/{lista[0]['trace_id']}", headers=DEBUG).json()   # mais recente: menu -> agendar
+
+    nomes = [s["nome"] for s in detalhe["spans"]]
+    assert nomes[0] == "webhook.mensagem"
+    assert "agenda.buscar_perfil_em_cache" in nomes
+    assert "processar_mensagem" in nomes
+    assert "send_menu_buttons" in nomes or "send_weeks_buttons" in nomes or "send_text" in nomes
+    assert "graph.post" in nomes
+    ids = {s["span_id"] for s in detalhe["spans"]}
+    assert all(s["parent_id"] in ids for s in detalhe["spans"][1:])     # árvore completa sob a raiz
+    assert detalhe["atributos"]["telefone"] == "...6666"
+    assert "graph_posts" in detalhe["atributos"]
+    assert cliente.get("/debug/traces/naoexiste", headers=DEBUG).status_code == 404
+
+
+def test_debug_traces_exige_token(cliente, monkeypatch):
+    assert cliente.get("/debug/traces").status_code == 403
+    assert cliente.get("/debug/traces", headers={"X-Debug-Token": "errado"}).status_code == 403
+    monkeypatch.setattr(tracing, "DEBUG_TOKEN", "")             # sem token configurado o endpoint não existe
+    assert cliente.get("/debug/traces").status_code == 404
+
+
+def test_exportacao_otlp(cliente, monkeypatch):
+    with OtlpStub() as coletor:
+        monkeypatch.setattr(tracing, "EXPORT", "otlp")
+        monkeypatch.setattr(tracing, "OTLP_URL", coletor.url)
+        cliente.post("/webhook", json=payload_texto(TELEFONE, "Carla", "oi"))
+        spans = coletor.aguardar(3)
+
+    raiz = [s for s in spans if "parentSpanId" not in s]
+    assert len(raiz) == 1 and raiz[0]["name"] == "webhook.mensagem"
+    assert {s["traceId"] for s in spans} == {raiz[0]["traceId"]}
+
+
+def test_sem_trace_ativo_nao_registra():
+    with tracing.span("fora") as s:
+        assert s is None
+    assert tracing.correlacao_atual() is None
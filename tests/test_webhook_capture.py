@@ -0,0 +1,55 @@
+"""
+test_webhook_capture.py
+
+Modo captura do webhook (src/webhook_capture.py): anonimização dos payloads e
+gravação em JSONL lida de volta pelo tests/replay_webhook.py.
+
+Uso:
+    python -m pytest tests/test_webhook_capture.py
+"""
+
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src import webhook_capture
+from tests.carga_webhook import payload_botao, payload_texto
+from tests.replay_webhook import carregar_captura, remetente
+
+
+def test_anonimizacao_preserva_fluxo_e_remove_dados_pessoais():
+    nome = webhook_capture.anonimizar(payload_texto("5511999990000", "Maria Silva", "Maria da Silva Souza"))
+    menu = webhook_capture.anonimizar(payload_texto("5511999990000", "Maria Silva", "2"))
+    botao = webhook_capture.anonimizar(payload_botao("5511999990000", "Maria Silva", "rem_confirm|2026-03-10T09:00"))
+
+    texto = str(nome)
+    assert "5511999990000" not in texto and "Maria" not in texto
+    assert remetente(nome) == remetente(menu) == remetente(botao)     # mesmo paciente, mesmo pseudônimo
+    assert remetente(nome) != webhook_capture.pseudonimo_telefone("5511999990001")
+
+    valor = menu["entry"][0]["changes"][0]["value"]
+    assert valor["messages"][0]["text"]["body"] == "2"
+    assert valor["contacts"][0]["profile"]["name"] == webhook_capture.NOME_ANONIMO
+    assert nome["entry"][0]["changes"][0]["value"]["messages"][0]["text"]["body"] == webhook_capture.TEXTO_ANONIMO
+    assert botao["entry"][0]["changes"][0]["value"]["messages"][0]["interactive"]["button_reply"]["id"] \
+        == "rem_confirm|2026-03-10T09:00"
+
+
+def test_registrar_grava_jsonl_rotativo(tmp_path, monkeypatch):
+    arquivo = tmp_path / "captura.jsonl"
+    monkeypatch.setattr(webhook_capture, "ATIVO", True)
+    monkeypatch.setattr(webhook_capture, "ARQUIVO", str(arquivo))
+    monkeypatch.setattr(webhook_capture, "_capture_logger", None)
+
+    webhook_capture.registrar(payload_texto("5511999990000", "Maria", "oi"), 1000.5, 12.34)
+    webhook_capture.registrar(payload_texto("5511999990000", "Maria", "1"), 1000.0, 5.0, status=500)
+    for handler in webhook_capture._capture_logger.handlers:
+        handler.close()
+
+    registros = carregar_captura([str(arquivo)])
+    assert [r["t"] for r in registros] == [1000.0, 1000.5]          # replay ordena por chegada
+    assert registros[0]["status"] == 500 and registros[1]["duracao_ms"] == 12.3
+    assert "5511999990000" not in arquivo.read_text(encoding="utf-8")